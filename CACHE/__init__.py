@@ -0,0 +1,4 @@
+"""
+Caches locaux des données Légifrance : ils permettent de répondre sans
+refaire les appels à l'API lorsque les mêmes textes ont déjà été récupérés.
+"""
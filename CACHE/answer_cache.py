@@ -0,0 +1,338 @@
+"""
+Cache des réponses complètes (question -> synthèse), invalidé par les versions des sources.
+
+Une question déjà traitée est servie sans payload, sans recherche et sans synthèse
+tant que les textes dont sa réponse est issue n'ont pas changé. Chaque entrée conserve
+la synthèse et, pour chaque extrait transmis à la synthèse, son identifiant, son
+`legalStatus` et la `dateVersion` de sa section. Dans LEGI, un identifiant LEGIARTI
+désigne une version précise d'un article : une modification crée une nouvelle version
+et fait passer l'ancienne de VIGUEUR à MODIFIE (ou ABROGE). Une entrée est invalidée
+dès qu'une de ses sources est modifiée ou abrogée:
+- À chaque recherche : les extraits renvoyés par /search sont comparés aux sources des
+  réponses en cache (`AnswerCache.observe`)
+- Au service d'une réponse vérifiée depuis plus de `verify_interval` secondes : l'état
+  courant de chaque article source est relu par /consult/getArticle ; tant que la
+  vérification n'aboutit pas, la réponse n'est pas servie
+
+Les réponses contiennent les questions en clair : comme le journal des requêtes, elles ne
+sont persistées que si JERRY_ANSWER_CACHE désigne un fichier JSON (par défaut, cache en
+mémoire uniquement). Les écritures sont regroupées en arrière-plan et atomiques (voir
+CACHE/persistence.py). Les réponses partielles (échéance dépassée) et les échecs de
+synthèse ne sont pas conservés.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from CACHE.persistence import DeferredSaver, atomic_write
+from CACHE.process_cache import normalize_question
+from CACHE.version_index import version_day
+from PERF.deadline import submit_in_context
+
+ANSWER_CACHE_ENABLED = os.getenv("JERRY_ANSWER_CACHE_ENABLED", "1").lower() not in ("0", "false", "non", "no")
+
+# Fichier de persistance (vide, par défaut : cache en mémoire uniquement ; les questions y
+# sont en clair, la persistance est donc à activer explicitement, ex: cache/answers.json)
+DEFAULT_PATH = os.getenv("JERRY_ANSWER_CACHE", "")
+
+# Durée (en secondes) pendant laquelle une réponse vérifiée est servie sans relire ses sources
+VERIFY_INTERVAL = float(os.getenv("JERRY_ANSWER_VERIFY_INTERVAL", "3600"))
+
+# Nombre maximal de réponses conservées (les moins récemment servies sont évincées)
+MAX_ENTRIES = int(os.getenv("JERRY_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# Articles relus en parallèle lors d'une vérification
+VERIFY_MAX_WORKERS = 4
+
+# Seuls les articles de LEGI ont des versions ; les autres sources (décisions, sections) sont stables
+VERSIONED_PREFIX = "LEGIARTI"
+
+# Synthèses qui signalent un échec et ne sont pas mises en cache
+UNCACHEABLE_PREFIXES = ("Impossible de générer une synthèse", "Aucun document juridique")
+
+Source = Dict[str, Optional[str]]
+
+
+def answer_sources(api_results: List[dict]) -> List[Source]:
+    """
+    Sources d'une réponse : identifiant, statut et version de chaque extrait des documents
+
+    Args:
+        api_results (List[dict]): Documents normalisés renvoyés par search_call
+
+    Returns:
+        List[Source]: Sources distinctes {"id", "legalStatus", "dateVersion"} ; la version
+            est celle de la section (les extraits normalisés n'en portent pas), de même que
+            le statut à défaut de celui de l'extrait
+    """
+    sources: Dict[str, Source] = {}
+    for document in api_results:
+        for section in document.get("sections", []):
+            for extract in section.get("extracts", []):
+                source_id = extract.get("id")
+                if not source_id or source_id in sources:
+                    continue
+                sources[source_id] = {
+                    "id": source_id,
+                    "legalStatus": extract.get("legalStatus") or section.get("legalStatus"),
+                    "dateVersion": version_day(extract.get("dateVersion") or section.get("dateVersion")),
+                }
+    return list(sources.values())
+
+
+def source_changed(source: Source, current: Source) -> bool:
+    """True si le statut (ex: VIGUEUR -> MODIFIE ou ABROGE) ou la version d'une source a changé."""
+    if current.get("legalStatus") and current["legalStatus"] != source.get("legalStatus"):
+        return True
+    return bool(current.get("dateVersion") and source.get("dateVersion")
+                and current["dateVersion"] != source["dateVersion"])
+
+
+def fetch_source_version(source_id: str) -> Optional[Source]:
+    """
+    État courant d'un article source, relu par /consult/getArticle (sans cache)
+
+    Seul l'état est comparé : la date de début de l'article ne correspond pas à la
+    `dateVersion` de sa section conservée avec la réponse.
+
+    Returns:
+        Optional[Source]: {"id", "legalStatus", "dateVersion": None}, ou None si l'article est indisponible
+    """
+    from LEGIFRANCE_UTILS.display_article.get_article_from_id import fetch_article
+
+    article = (fetch_article(source_id) or {}).get("article")
+    if not article:
+        return None
+    return {"id": source_id, "legalStatus": article.get("etat"), "dateVersion": None}
+
+
+class AnswerCache:
+    """
+    Réponses complètes par question, valides tant que leurs sources n'ont pas changé.
+
+    Args:
+        path (Optional[str]): Fichier de persistance (None : cache en mémoire uniquement)
+        verify_interval (float): Durée pendant laquelle une réponse vérifiée est servie sans
+            relire ses sources
+        max_entries (int): Nombre maximal de réponses conservées
+        fetch_version (Callable[[str], Optional[Source]]): Lecture de l'état courant d'un article
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_PATH, verify_interval: float = VERIFY_INTERVAL,
+                 max_entries: int = MAX_ENTRIES,
+                 fetch_version: Callable[[str], Optional[Source]] = fetch_source_version):
+        self.path = path or None
+        self.verify_interval = verify_interval
+        self.max_entries = max_entries
+        self.fetch_version = fetch_version
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_source: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "verifications": 0, "invalidations": 0}
+        self._saver = DeferredSaver(self._write, name="cache des réponses")
+
+    def __contains__(self, question: str) -> bool:
+        """True si une réponse est en cache pour la question (sans vérification de ses sources)."""
+        with self._lock:
+            return normalize_question(question) in self.entries
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH, **kwargs: Any) -> "AnswerCache":
+        """Charge les réponses persistées dans `path` (cache vide si le fichier n'existe pas)."""
+        cache = cls(path=path, **kwargs)
+        if path and os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    entries = json.load(file)
+                for entry in entries:
+                    cache._add(entry)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"ERREUR: Cache des réponses illisible ({path}): {e}")
+        return cache
+
+    def _save(self) -> None:
+        """Programme la persistance des réponses (écritures regroupées en arrière-plan)."""
+        if self.path:
+            self._saver.schedule()
+
+    def flush(self) -> None:
+        """Effectue sans attendre la sauvegarde programmée, s'il y en a une."""
+        self._saver.flush()
+
+    def _write(self) -> None:
+        with self._lock:
+            content = json.dumps(list(self.entries.values()), ensure_ascii=False)
+        atomic_write(self.path, lambda file: file.write(content))
+
+    def _add(self, entry: Dict[str, Any]) -> None:
+        """Ajoute une entrée et l'indexe par source (appelant : verrou tenu ou chargement)."""
+        key = entry["question"]
+        self._discard(key)
+        self.entries[key] = entry
+        for source in entry["sources"]:
+            self._by_source.setdefault(source["id"], set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._discard(next(iter(self.entries)))
+
+    def _discard(self, key: str) -> bool:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        for source in entry["sources"]:
+            keys = self._by_source.get(source["id"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_source[source["id"]]
+        return True
+
+    def invalidate(self, question: str) -> bool:
+        """Retire la réponse d'une question ; True si elle était en cache."""
+        with self._lock:
+            removed = self._discard(normalize_question(question))
+            if removed:
+                self._stats["invalidations"] += 1
+        if removed:
+            self._save()
+        return removed
+
+    def _verify(self, entry: Dict[str, Any]) -> Optional[bool]:
+        """
+        Relit l'état courant des articles sources d'une réponse
+
+        Returns:
+            Optional[bool]: True si aucune source n'a changé, False si une source a été
+                modifiée ou abrogée, None si un article n'a pas pu être relu
+        """
+        sources = [source for source in entry["sources"] if source["id"].startswith(VERSIONED_PREFIX)]
+        if not sources:
+            return True
+        with ThreadPoolExecutor(max_workers=min(VERIFY_MAX_WORKERS, len(sources))) as executor:
+            futures = [submit_in_context(executor, self.fetch_version, source["id"]) for source in sources]
+            currents = [future.result() for future in futures]
+        for source, current in zip(sources, currents):
+            if current is None:
+                return None
+            if source_changed(source, current):
+                print(f"INFO: Source {source['id']} modifiée ({source.get('legalStatus')} -> "
+                      f"{current.get('legalStatus')}), réponse en cache invalidée")
+                return False
+        return True
+
+    def get(self, question: str) -> Optional[str]:
+        """
+        Réponse en cache d'une question, si ses sources n'ont pas changé
+
+        Les sources d'une réponse vérifiée depuis plus de `verify_interval` secondes sont
+        relues avant qu'elle soit servie.
+
+        Args:
+            question (str): Question de l'utilisateur
+
+        Returns:
+            Optional[str]: La synthèse, ou None (absente, source modifiée ou non vérifiable)
+        """
+        key = normalize_question(question)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            fresh = time.time() - entry["verified_at"] <= self.verify_interval
+        if not fresh:
+            with self._lock:
+                self._stats["verifications"] += 1
+            valid = self._verify(entry)
+            if valid is False:
+                self.invalidate(key)
+            if not valid:
+                with self._lock:
+                    self._stats["misses"] += 1
+                return None
+            with self._lock:
+                entry["verified_at"] = time.time()
+            self._save()
+        with self._lock:
+            self._stats["hits"] += 1
+        return entry["synthesis"]
+
+    def put(self, question: str, synthesis: Optional[str], sources: List[Source]) -> bool:
+        """
+        Conserve la réponse d'une question avec les sources dont elle est issue
+
+        Args:
+            question (str): Question de l'utilisateur
+            synthesis (Optional[str]): Synthèse produite
+            sources (List[Source]): Sources de la synthèse (voir answer_sources)
+
+        Returns:
+            bool: True si la réponse a été conservée (les échecs de synthèse ne le sont pas)
+        """
+        if not synthesis or not sources or synthesis.startswith(UNCACHEABLE_PREFIXES):
+            return False
+        now = time.time()
+        entry = {
+            "question": normalize_question(question),
+            "synthesis": synthesis,
+            "sources": sources,
+            "stored_at": now,
+            "verified_at": now,
+        }
+        with self._lock:
+            self._add(entry)
+        self._save()
+        return True
+
+    def observe(self, api_results: List[dict]) -> int:
+        """
+        Invalide les réponses dont une source apparaît modifiée ou abrogée dans des résultats /search
+
+        Args:
+            api_results (List[dict]): Documents normalisés d'une recherche
+
+        Returns:
+            int: Nombre de réponses invalidées
+        """
+        stale = set()
+        with self._lock:
+            for current in answer_sources(api_results):
+                for key in self._by_source.get(current["id"], ()):
+                    stored = next(source for source in self.entries[key]["sources"] if source["id"] == current["id"])
+                    if source_changed(stored, current):
+                        stale.add(key)
+            for key in stale:
+                self._discard(key)
+            self._stats["invalidations"] += len(stale)
+        if stale:
+            print(f"INFO: {len(stale)} réponse(s) en cache invalidée(s) par des sources modifiées")
+            self._save()
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """Réponses et sources suivies, réponses servies (hits), absentes ou invalides (misses)."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entrees": len(self.entries),
+                "sources": len(self._by_source),
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+            }
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Cache des réponses du processus, chargé depuis DEFAULT_PATH au premier appel."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache.load(DEFAULT_PATH)
+        return _cache
@@ -0,0 +1,255 @@
+"""
+Tables des matières locales des codes.
+
+Ce module fournit:
+- Un index par code (identifiant LEGITEXT) associant chaque numéro d'article à
+  l'identifiant de sa version en vigueur, construit une fois depuis
+  /consult/legi/tableMatieres puis persisté sur disque (un fichier JSON par code)
+- La résolution d'un numéro d'article en identifiant, sans appel réseau si le
+  numéro est connu ; les numéros absents sont résolus par /consult/getArticleWithIdAndNum
+  et ajoutés à l'index (mise à jour incrémentale)
+- La construction en arrière-plan des tables manquantes et le rafraîchissement
+  des tables plus anciennes que `ttl`
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+from LEGIFRANCE_UTILS.credential_pool import legifrance_request
+from LEGIFRANCE_UTILS.legifrance_init import LEGIFRANCE_BASE_URL
+from PERF.scheduler import BATCH, use_traffic_class
+
+# Chemin par défaut de l'index
+DEFAULT_PATH = "cache/code_toc"
+
+# Âge (en secondes) au-delà duquel une table est reconstruite en arrière-plan
+DEFAULT_TTL = 7 * 24 * 3600
+
+HEADERS = {"Content-Type": "application/json"}
+
+
+def _iter_toc_articles(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Articles d'un nœud de table des matières et de ses sections, récursivement."""
+    yield from node.get("articles") or []
+    for section in node.get("sections") or []:
+        yield from _iter_toc_articles(section)
+
+
+def parse_toc(toc: Dict[str, Any]) -> Dict[str, Dict[str, str]]:
+    """
+    Numéros d'articles d'une table des matières
+
+    Lorsqu'un numéro apparaît plusieurs fois (versions successives), la version en
+    vigueur est retenue.
+
+    Args:
+        toc (Dict[str, Any]): Réponse de /consult/legi/tableMatieres
+
+    Returns:
+        Dict[str, Dict[str, str]]: Numéro -> {"id": identifiant LEGIARTI, "etat": état}
+    """
+    articles: Dict[str, Dict[str, str]] = {}
+    for article in _iter_toc_articles(toc):
+        num, article_id = article.get("num"), article.get("id")
+        if not num or not article_id:
+            continue
+        etat = article.get("etat") or ""
+        known = articles.get(num)
+        if known is None or (etat == "VIGUEUR" and known["etat"] != "VIGUEUR"):
+            articles[num] = {"id": article_id, "etat": etat}
+    return articles
+
+
+class CodeTocIndex:
+    """
+    Index local numéro d'article -> identifiant, par code.
+
+    Usage:
+        index = CodeTocIndex.load("cache/code_toc")
+        article_id = index.resolve("LEGITEXT000006070721", "1240")
+
+    Args:
+        path (Optional[str]): Répertoire de persistance (None : index en mémoire uniquement)
+        ttl (float): Âge maximal d'une table avant son rafraîchissement en arrière-plan
+        build_missing (bool): Si True, la table d'un code jamais vu est construite en
+            arrière-plan dès sa première demande (sinon seuls les articles demandés sont
+            résolus, un par un)
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_PATH, ttl: float = DEFAULT_TTL, build_missing: bool = True):
+        self.path = path
+        self.ttl = ttl
+        self.build_missing = build_missing
+        self.codes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._stats = {"hits": 0, "misses": 0, "builds": 0, "refreshes": 0}
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH, **kwargs: Any) -> "CodeTocIndex":
+        """Charge les tables persistées dans `path` (index vide si le répertoire n'existe pas)."""
+        index = cls(path=path, **kwargs)
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(path, name), "r", encoding="utf-8") as file:
+                        table = json.load(file)
+                    index.codes[table["code_id"]] = table
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"ERREUR: Table des matières illisible ({name}): {e}")
+        return index
+
+    def _save(self, code_id: str) -> None:
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            content = json.dumps(self.codes[code_id], ensure_ascii=False)
+        file_path = os.path.join(self.path, f"{code_id}.json")
+        with open(file_path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(file_path + ".tmp", file_path)
+
+    def build(self, code_id: str) -> bool:
+        """
+        Construit (ou reconstruit) la table d'un code depuis /consult/legi/tableMatieres
+
+        Les articles résolus individuellement depuis la construction précédente sont conservés
+        s'ils ne figurent pas dans la nouvelle table.
+
+        Returns:
+            bool: True si la table a été construite
+        """
+        payload = {"textId": code_id, "date": datetime.date.today().isoformat(), "nature": "CODE"}
+        try:
+            response = legifrance_request(
+                "POST", f"{LEGIFRANCE_BASE_URL}/consult/legi/tableMatieres", json=payload, headers=HEADERS
+            )
+        except requests.RequestException as e:
+            print(f"ERREUR: Table des matières de {code_id} indisponible: {e}")
+            return False
+        if response.status_code != 200:
+            print(f"ERREUR: Table des matières de {code_id}: HTTP {response.status_code}")
+            return False
+
+        articles = parse_toc(response.json())
+        with self._lock:
+            previous = self.codes.get(code_id, {}).get("articles", {})
+            self.codes[code_id] = {
+                "code_id": code_id,
+                "built_at": time.time(),
+                "articles": {**previous, **articles},
+            }
+            self._stats["builds"] += 1
+        self._save(code_id)
+        print(f"INFO: Table des matières de {code_id} construite ({len(articles)} articles).")
+        return True
+
+    def _refresh_in_background(self, code_id: str) -> None:
+        with self._lock:
+            if code_id in self._refreshing:
+                return
+            self._refreshing.add(code_id)
+            self._stats["refreshes"] += 1
+
+        def refresh():
+            try:
+                # Hors de l'échéance de la question ; priorité basse face aux appels interactifs
+                with use_traffic_class(BATCH):
+                    self.build(code_id)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(code_id)
+
+        threading.Thread(target=refresh, name=f"code-toc-{code_id}", daemon=True).start()
+
+    def _fetch_by_num(self, code_id: str, num: str) -> Optional[Dict[str, str]]:
+        """Résout un numéro absent de la table par /consult/getArticleWithIdAndNum."""
+        try:
+            response = legifrance_request(
+                "POST",
+                f"{LEGIFRANCE_BASE_URL}/consult/getArticleWithIdAndNum",
+                json={"id": code_id, "num": num},
+                headers=HEADERS,
+            )
+        except requests.RequestException as e:
+            print(f"ERREUR: Article {num} de {code_id} indisponible: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        article = (response.json() or {}).get("article") or {}
+        if not article.get("id"):
+            return None
+        return {"id": article["id"], "etat": article.get("etat") or ""}
+
+    def update(self, code_id: str, num: str, article_id: str, etat: str = "") -> None:
+        """Enregistre (ou corrige) l'identifiant d'un article et persiste la table du code."""
+        with self._lock:
+            table = self.codes.setdefault(code_id, {"code_id": code_id, "built_at": 0.0, "articles": {}})
+            if table["articles"].get(num) == {"id": article_id, "etat": etat}:
+                return
+            table["articles"][num] = {"id": article_id, "etat": etat}
+        self._save(code_id)
+
+    def resolve(self, code_id: str, num: str) -> Optional[str]:
+        """
+        Identifiant de l'article `num` du code `code_id`
+
+        Args:
+            code_id (str): Identifiant LEGITEXT du code
+            num (str): Numéro de l'article au format Legifrance ("1240", "L1221-1")
+
+        Returns:
+            Optional[str]: Identifiant LEGIARTI, ou None si l'article est introuvable
+        """
+        with self._lock:
+            table = self.codes.get(code_id)
+        # La construction d'une table complète ne retarde jamais la question en cours
+        if table is None or not table.get("built_at"):
+            if self.build_missing:
+                self._refresh_in_background(code_id)
+        elif time.time() - table["built_at"] > self.ttl:
+            self._refresh_in_background(code_id)
+
+        with self._lock:
+            entry = self.codes.get(code_id, {}).get("articles", {}).get(num)
+            self._stats["hits" if entry else "misses"] += 1
+        if entry:
+            return entry["id"]
+
+        entry = self._fetch_by_num(code_id, num)
+        if entry is None:
+            return None
+        self.update(code_id, num, entry["id"], entry["etat"])
+        return entry["id"]
+
+    def stats(self) -> Dict[str, Any]:
+        """Nombre de codes et d'articles indexés, résolutions locales (hits) et par l'API (misses)."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "codes": len(self.codes),
+                "articles": sum(len(table["articles"]) for table in self.codes.values()),
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+            }
+
+
+_index: Optional[CodeTocIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_code_toc_index() -> CodeTocIndex:
+    """Index des tables des matières du processus, chargé depuis DEFAULT_PATH au premier appel."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CodeTocIndex.load(DEFAULT_PATH)
+        return _index
@@ -0,0 +1,103 @@
+"""
+Écriture sûre des fichiers de cache persistés.
+
+Ce module fournit:
+- L'écriture atomique d'un fichier : contenu écrit dans un fichier temporaire unique
+  du même répertoire (tempfile.mkstemp) puis substitué par os.replace ; deux écritures
+  simultanées, de threads ou de processus différents, ne s'entremêlent jamais
+- Une sauvegarde différée en arrière-plan : les demandes de sauvegarde reçues pendant
+  `delay` secondes sont regroupées en une seule écriture, hors du chemin des requêtes ;
+  les sauvegardes d'un même fichier sont sérialisées et la dernière est faite à la
+  sortie du processus
+"""
+import atexit
+import os
+import tempfile
+import threading
+from typing import IO, Any, Callable, Optional
+
+# Délai (en secondes) de regroupement des sauvegardes différées
+SAVE_DELAY = float(os.getenv("JERRY_CACHE_SAVE_DELAY", "5"))
+
+
+def atomic_write(path: str, write: Callable[[IO[Any]], None], binary: bool = False) -> None:
+    """
+    Écrit un fichier de façon atomique : fichier temporaire unique, vidé sur disque (fsync),
+    puis remplacement du fichier
+
+    Args:
+        path (str): Fichier à écrire
+        write (Callable[[IO[Any]], None]): Écrit le contenu dans le fichier temporaire ouvert
+        binary (bool): Ouvre le fichier temporaire en mode binaire (texte UTF-8 sinon)
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with (os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding="utf-8")) as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
+        raise
+
+
+class DeferredSaver:
+    """
+    Sauvegarde différée et regroupée d'un cache persisté.
+
+    Args:
+        save (Callable[[], None]): Écrit l'état courant du cache (appelée sous verrou d'écriture)
+        delay (float): Délai de regroupement des demandes de sauvegarde (0 : écriture immédiate)
+        name (str): Nom du cache, pour les messages d'erreur
+    """
+
+    def __init__(self, save: Callable[[], None], delay: float = SAVE_DELAY, name: str = "cache"):
+        self._save = save
+        self.delay = delay
+        self.name = name
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self._registered = False
+
+    def schedule(self) -> None:
+        """Demande une sauvegarde ; sans effet si une sauvegarde est déjà programmée."""
+        if self.delay <= 0:
+            self.save_now()
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.delay, self._run)
+            self._timer.daemon = True
+            if not self._registered:
+                atexit.register(self.flush)
+                self._registered = True
+            self._timer.start()
+
+    def _run(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.save_now()
+
+    def save_now(self) -> None:
+        """Écrit immédiatement l'état courant (les sauvegardes sont sérialisées)."""
+        with self.write_lock:
+            try:
+                self._save()
+            except (OSError, ValueError, TypeError) as e:
+                print(f"ERREUR: Écriture du {self.name} impossible: {e}")
+
+    def flush(self) -> None:
+        """Effectue sans attendre la sauvegarde programmée, s'il y en a une."""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+            self.save_now()
@@ -0,0 +1,155 @@
+"""
+Préchargement des caches du processus à partir du journal des requêtes.
+
+Après un déploiement ou un redémarrage, les questions et les articles les plus
+fréquents du journal (PERF/request_log.py) sont rejoués dans les caches de
+CACHE/process_cache.py : payloads, résultats /search et articles. Les premiers
+utilisateurs trouvent ainsi les caches déjà remplis.
+
+Le préchargement est borné:
+- En durée : une échéance (PERF/deadline.py) couvre l'ensemble du préchargement
+- En quota : nombres maximaux d'appels Gemini (génération des payloads) et d'appels
+  Légifrance ; ces derniers sont comptés sur le pool d'identifiants, trafic simultané
+  compris, ce qui rend le budget prudent
+Les appels sont faits en classe de trafic "batch" : ils laissent la priorité aux
+questions des utilisateurs.
+
+Les caches étant propres au processus, le préchargement est lancé par le processus
+qui sert les questions, au démarrage (voir PERF/warmup.py, start_warm_up).
+"""
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+from CACHE.process_cache import (
+    article_cache, cached_create_payload, cached_fetch_article, cached_search_call,
+    normalize_question, payload_cache, payload_key, search_cache
+)
+from PERF.deadline import Deadline, DeadlineExceeded, use_deadline
+from PERF.request_log import ARTICLE, QUESTION, most_frequent, read_request_log
+from PERF.scheduler import BATCH, use_traffic_class
+
+# Budgets par défaut du préchargement
+PREFETCH_TIME_BUDGET = float(os.getenv("JERRY_PREFETCH_BUDGET", "60"))  # Secondes
+PREFETCH_MAX_GEMINI_CALLS = int(os.getenv("JERRY_PREFETCH_MAX_GEMINI", "20"))
+PREFETCH_MAX_LEGIFRANCE_CALLS = int(os.getenv("JERRY_PREFETCH_MAX_LEGIFRANCE", "100"))
+
+# Nombre maximal de questions et d'articles rejoués (chacun)
+PREFETCH_TOP = int(os.getenv("JERRY_PREFETCH_TOP", "20"))
+
+# Appels Légifrance minimaux d'une recherche (ping puis /search)
+SEARCH_MIN_CALLS = 2
+
+
+def _legifrance_calls() -> int:
+    from LEGIFRANCE_UTILS.credential_pool import get_credential_pool
+
+    return sum(credential["requetes"] for credential in get_credential_pool().report())
+
+
+def prefetch_from_log(
+    log_path: Optional[str] = None,
+    time_budget: float = PREFETCH_TIME_BUDGET,
+    max_gemini_calls: int = PREFETCH_MAX_GEMINI_CALLS,
+    max_legifrance_calls: int = PREFETCH_MAX_LEGIFRANCE_CALLS,
+    top: int = PREFETCH_TOP,
+    search_kwargs: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Rejoue les questions et les articles les plus fréquents du journal dans les caches du processus
+
+    Les éléments sont rejoués par fréquence décroissante ; ceux déjà en cache ne coûtent
+    aucun appel. Les questions citant directement des articles sont ignorées : elles ne
+    passent ni par le payload ni par /search, et leurs articles figurent dans le journal.
+
+    Args:
+        log_path (Optional[str]): Journal des requêtes (défaut: JERRY_REQUEST_LOG)
+        time_budget (float): Durée maximale du préchargement, en secondes
+        max_gemini_calls (int): Nombre maximal de payloads générés
+        max_legifrance_calls (int): Nombre maximal d'appels à l'API Légifrance
+        top (int): Nombre maximal de questions et d'articles rejoués (chacun)
+        search_kwargs (Optional[Dict[str, Any]]): Options de search_call, identiques à celles de
+            l'appelant pour que les clés de cache correspondent (ex: {"relax": True} pour Streamlit)
+
+    Returns:
+        Dict[str, Any]: Questions et articles préchargés, éléments déjà en cache, échecs,
+            appels consommés, durée et motif d'arrêt
+    """
+    from LEGIFRANCE_UTILS.citation.detect_citation import detect_citations
+
+    search_kwargs = search_kwargs or {}
+    report: Dict[str, Any] = {
+        "questions": 0, "articles": 0, "deja_en_cache": 0, "echecs": 0,
+        "appels_gemini": 0, "appels_legifrance": 0, "duree": 0.0, "arret": "journal épuisé",
+    }
+    items = most_frequent(read_request_log(log_path), top)
+    if not items:
+        report["arret"] = "journal vide"
+        return report
+
+    start = time.monotonic()
+    legifrance_start = _legifrance_calls()
+    with use_traffic_class(BATCH), use_deadline(Deadline(time_budget)) as deadline:
+        for kind, value, _ in items:
+            report["appels_legifrance"] = _legifrance_calls() - legifrance_start
+            legifrance_left = max_legifrance_calls - report["appels_legifrance"]
+            if deadline.expired():
+                report["arret"] = "budget de temps épuisé"
+                break
+            try:
+                if kind == ARTICLE:
+                    if value in article_cache:
+                        report["deja_en_cache"] += 1
+                        continue
+                    if legifrance_left < 1:
+                        report["arret"] = "quota Légifrance atteint"
+                        break
+                    if cached_fetch_article(value) is None:
+                        report["echecs"] += 1
+                    else:
+                        report["articles"] += 1
+                    continue
+
+                if kind != QUESTION or detect_citations(value):
+                    continue
+                question = normalize_question(value)
+                payload_cached = question in payload_cache
+                if not payload_cached and report["appels_gemini"] >= max_gemini_calls:
+                    report["arret"] = "quota Gemini atteint"
+                    break
+                if legifrance_left < SEARCH_MIN_CALLS:
+                    report["arret"] = "quota Légifrance atteint"
+                    break
+                payload = cached_create_payload(question)
+                if not payload_cached:
+                    report["appels_gemini"] += 1
+                json_payload = json.loads(payload)
+                if not json_payload:
+                    report["echecs"] += 1
+                    continue
+                if payload_cached and payload_key(json_payload, **search_kwargs) in search_cache:
+                    report["deja_en_cache"] += 1
+                    continue
+                _, error = cached_search_call(json_payload, **search_kwargs)
+                if error:
+                    report["echecs"] += 1
+                else:
+                    report["questions"] += 1
+            except DeadlineExceeded:
+                report["arret"] = "budget de temps épuisé"
+                break
+            except Exception as e:
+                print(f"ERREUR: Préchargement de {kind} impossible: {e}")
+                report["echecs"] += 1
+
+    report["appels_legifrance"] = _legifrance_calls() - legifrance_start
+    report["duree"] = round(time.monotonic() - start, 3)
+    print(
+        f"INFO: Préchargement : {report['questions']} question(s), {report['articles']} article(s), "
+        f"{report['deja_en_cache']} déjà en cache, {report['echecs']} échec(s), "
+        f"{report['appels_gemini']} appel(s) Gemini, {report['appels_legifrance']} appel(s) Légifrance "
+        f"en {report['duree']:.1f}s ({report['arret']})"
+    )
+    return report
+
@@ -0,0 +1,227 @@
+"""
+Caches en mémoire du processus pour les sessions longues (REPL de main.py, service).
+
+Ce module fournit:
+- Un cache LRU à durée de vie (TTL), sûr entre threads, avec ses statistiques
+- Les caches du pipeline : payloads (par question), résultats /search (par payload)
+  et articles (par identifiant), aux mêmes durées de vie que l'application Streamlit
+- Des variantes mises en cache de create_payload, search_call et fetch_article ;
+  les échecs (payload vide, erreur de recherche, article introuvable) ne sont pas conservés.
+  Un calcul en cours pour une clé (préchargement, préparation anticipée de Streamlit)
+  est attendu plutôt que refait
+- La lecture, en cas d'absence, d'un instantané en lecture seule (CACHE/snapshot.py) :
+  un nouveau processus démarre avec les caches d'un processus déjà chaud
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Durée de vie (en secondes) des entrées et taille maximale de chaque cache
+PAYLOAD_CACHE_TTL = 24 * 3600
+SEARCH_CACHE_TTL = 6 * 3600
+ARTICLE_CACHE_TTL = 24 * 3600
+CACHE_MAX_ENTRIES = int(os.getenv("JERRY_PROCESS_CACHE_MAX_ENTRIES", "500"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache LRU dont les entrées expirent après `ttl` secondes.
+
+    Args:
+        name (str): Nom du cache (statistiques)
+        ttl (float): Durée de vie d'une entrée
+        max_entries (int): Nombre maximal d'entrées (les moins récemment utilisées sont évincées)
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "snapshot_hits": 0}
+        self._pending: Dict[Hashable, threading.Event] = {}
+        self._snapshot: Any = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return True
+        snapshot = self._snapshot
+        return snapshot is not None and snapshot.remaining_ttl(self.name, key, self.ttl) > 0
+
+    @property
+    def snapshot(self) -> Any:
+        """Instantané rattaché au cache (None : aucun)."""
+        return self._snapshot
+
+    def attach_snapshot(self, snapshot: Any) -> None:
+        """Lit les entrées absentes dans `snapshot` (voir CACHE.snapshot.CacheSnapshot ; None : détache)."""
+        self._snapshot = snapshot
+
+    def _from_snapshot(self, key: Hashable) -> Any:
+        """Entrée de l'instantané encore valide, copiée dans le cache pour sa durée de vie restante."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return _MISSING
+        remaining = snapshot.remaining_ttl(self.name, key, self.ttl)
+        if remaining <= 0:
+            return _MISSING
+        value = snapshot.get(self.name, key, _MISSING)
+        if value is not _MISSING:
+            self.set(key, value, ttl=remaining)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        value = self._from_snapshot(key)
+        with self._lock:
+            if value is _MISSING:
+                self._stats["misses"] += 1
+                return default
+            self._stats["hits"] += 1
+            self._stats["snapshot_hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any],
+                       cacheable: Callable[[Any], bool] = lambda value: value is not None) -> Any:
+        """
+        Valeur en cache, sinon calculée puis conservée si `cacheable(valeur)`.
+        
+        Si un autre thread calcule déjà la même clé, son résultat est attendu ; s'il
+        n'a pas été conservé (échec), la valeur est calculée à nouveau.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = threading.Event()
+        if not owner:
+            pending.wait()
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            value = compute()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        try:
+            value = compute()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def items(self) -> List[Tuple[Hashable, Any, float]]:
+        """Entrées valides : (clé, valeur, durée de vie restante en secondes)."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value, expiry - now) for key, (expiry, value) in self._entries.items() if expiry > now]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entrees": len(self._entries),
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+            }
+
+
+payload_cache = TTLCache("payload", PAYLOAD_CACHE_TTL)
+search_cache = TTLCache("search", SEARCH_CACHE_TTL)
+article_cache = TTLCache("article", ARTICLE_CACHE_TTL)
+
+
+def normalize_question(question: str) -> str:
+    """Clé de cache stable d'une question (espaces normalisés)."""
+    return " ".join(question.split())
+
+
+def payload_key(payload: dict, **kwargs: Any) -> str:
+    """Clé de cache d'une recherche : payload et options en JSON canonique."""
+    return json.dumps({"payload": payload, **kwargs}, sort_keys=True, ensure_ascii=False)
+
+
+def cached_create_payload(question: str) -> str:
+    """create_payload, mis en cache par question."""
+    from LEGIFRANCE_UTILS.payload.payload_generator import create_payload
+
+    key = normalize_question(question)
+    return payload_cache.get_or_compute(
+        key, lambda: create_payload(user_input=key), cacheable=lambda payload: bool(payload and payload.strip())
+    )
+
+
+def cached_search_call(payload: dict, **kwargs: Any) -> Tuple[List[dict], str]:
+    """
+    search_call, mis en cache par payload et options ; les erreurs ne sont pas conservées.
+
+    La réponse brute n'est pas sauvegardée : ces recherches (préchargement, spéculation,
+    synthèse groupée) sont concurrentes, et resultats_legifrance.json sert de fixture aux
+    benchmarks (PERF/microbench.py, PERF/load_test.py).
+    """
+    from SEARCH.search_call import search_call
+
+    return search_cache.get_or_compute(
+        payload_key(payload, **kwargs),
+        lambda: search_call(payload, save_raw=False, **kwargs),
+        cacheable=lambda outcome: not outcome[1],
+    )
+
+
+def cached_fetch_article(article_id: str) -> Optional[Dict[str, Any]]:
+    """
+    fetch_article, mis en cache par identifiant ; un article introuvable n'est pas conservé.
+    
+    Les versions de chaque article récupéré sont inscrites dans l'index des versions
+    (CACHE/version_index.py).
+    """
+    from CACHE.version_index import get_version_index
+    from LEGIFRANCE_UTILS.display_article.get_article_from_id import fetch_article
+
+    def fetch() -> Optional[Dict[str, Any]]:
+        article_data = fetch_article(article_id)
+        get_version_index().record_article(article_data)
+        return article_data
+
+    return article_cache.get_or_compute(article_id, fetch)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Statistiques des caches du processus, par nom."""
+    return {cache.name: cache.stats() for cache in (payload_cache, search_cache, article_cache)}
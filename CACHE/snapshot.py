@@ -0,0 +1,274 @@
+"""
+Instantané en lecture seule des caches du processus, pour le démarrage à chaud.
+
+Un nouveau processus (mise à l'échelle, redémarrage) démarre avec des caches vides et
+multiplie les appels à PISTE et à Gemini le temps de les remplir. Ce module fournit:
+- L'export des caches d'un processus chaud (CACHE/process_cache.py) : articles de
+  fetch_article, résultats /search normalisés et payloads par question
+- L'ouverture d'un instantané par memory-mapping : seul l'index est lu au démarrage ;
+  chaque entrée est décompressée et décodée à sa première lecture, puis copiée dans le
+  cache du processus pour sa durée de vie restante
+- La construction d'un instantané depuis le journal des requêtes (ligne de commande)
+
+Format (version SNAPSHOT_VERSION), little-endian:
+- En-tête de HEADER_SIZE octets : "JERRYSNP", version, réservé, position et taille de
+  l'index, date de création
+- Les entrées, chacune en JSON compressé (zlib)
+- L'index, en JSON compressé : {cache: {clé: [position, taille, date d'enregistrement]}}
+
+Les entrées gardent leur date d'enregistrement : une entrée plus ancienne que la durée
+de vie de son cache n'est pas servie. Un instantané d'une autre version est ignoré.
+
+Usage:
+    python -m CACHE.snapshot build --relax   # préchargement depuis JERRY_REQUEST_LOG puis export
+    python -m CACHE.snapshot info
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence
+
+from CACHE.persistence import atomic_write
+from CACHE.process_cache import TTLCache, article_cache, payload_cache, search_cache
+
+# Chemin par défaut de l'instantané, ouvert au démarrage s'il existe (voir PERF/warmup.py)
+DEFAULT_PATH = os.getenv("JERRY_CACHE_SNAPSHOT", "cache/snapshot.bin")
+
+MAGIC = b"JERRYSNP"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<8sIIQQd")
+HEADER_SIZE = _HEADER.size
+
+# Niveau de compression zlib des entrées et de l'index
+COMPRESSION_LEVEL = 6
+
+# Caches exportés
+CACHES: Sequence[TTLCache] = (payload_cache, search_cache, article_cache)
+
+# Conversion des valeurs relues (JSON) vers leur type dans le cache
+_DECODERS = {search_cache.name: tuple}
+
+
+def _encode(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                         COMPRESSION_LEVEL)
+
+
+class CacheSnapshot:
+    """
+    Instantané ouvert en lecture seule par memory-mapping.
+
+    Args:
+        path (str): Fichier de l'instantané
+
+    Raises:
+        ValueError: Si le fichier n'est pas un instantané de la version SNAPSHOT_VERSION
+        OSError: Si le fichier ne peut pas être ouvert
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mmap) < HEADER_SIZE:
+                raise ValueError("fichier tronqué")
+            magic, version, _, index_offset, index_length, created_at = _HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError("ce fichier n'est pas un instantané des caches")
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(f"version {version} (attendue : {SNAPSHOT_VERSION})")
+            self.created_at = created_at
+            self.index: Dict[str, Dict[str, List[float]]] = json.loads(
+                zlib.decompress(self._mmap[index_offset:index_offset + index_length])
+            )
+        except (ValueError, zlib.error, struct.error):
+            self._mmap.close()
+            raise
+
+    def remaining_ttl(self, cache: str, key: Any, ttl: float) -> float:
+        """Durée de vie restante (en secondes) de l'entrée `key` d'un cache de durée de vie `ttl` (0 : absente)."""
+        entry = self.index.get(cache, {}).get(key) if isinstance(key, str) else None
+        if entry is None:
+            return 0.0
+        return max(0.0, entry[2] + ttl - time.time())
+
+    def raw(self, cache: str, key: str) -> Optional[bytes]:
+        """Entrée compressée, telle qu'enregistrée (None : absente)."""
+        entry = self.index.get(cache, {}).get(key)
+        if entry is None:
+            return None
+        offset, length = int(entry[0]), int(entry[1])
+        return self._mmap[offset:offset + length]
+
+    def get(self, cache: str, key: Any, default: Any = None) -> Any:
+        """Valeur de l'entrée `key`, décompressée et décodée à la lecture."""
+        data = self.raw(cache, key) if isinstance(key, str) else None
+        if data is None:
+            return default
+        try:
+            value = json.loads(zlib.decompress(data))
+        except (ValueError, zlib.error) as e:
+            print(f"ERREUR: Entrée illisible dans l'instantané ({cache}): {e}")
+            return default
+        decode = _DECODERS.get(cache)
+        return decode(value) if decode else value
+
+    def stats(self) -> Dict[str, Any]:
+        """Version, date de création, taille et nombre d'entrées par cache."""
+        return {
+            "version": SNAPSHOT_VERSION,
+            "cree_le": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created_at)),
+            "taille_ko": round(len(self._mmap) / 1024, 1),
+            "entrees": {cache: len(entries) for cache, entries in self.index.items()},
+        }
+
+    def close(self) -> None:
+        self._mmap.close()
+
+
+def export_snapshot(path: str = DEFAULT_PATH, caches: Sequence[TTLCache] = CACHES) -> Dict[str, int]:
+    """
+    Écrit un instantané des caches du processus
+
+    Les entrées encore valides de l'instantané ouvert par le processus, absentes des caches
+    en mémoire, sont reprises telles quelles. L'instantané est remplacé atomiquement : les
+    processus qui lisent l'ancien continuent de le lire.
+
+    Args:
+        path (str): Fichier de l'instantané
+        caches (Sequence[TTLCache]): Caches exportés
+
+    Returns:
+        Dict[str, int]: Nombre d'entrées exportées par cache
+    """
+    now = time.time()
+    index: Dict[str, Dict[str, List[float]]] = {}
+
+    def write_snapshot(file: BinaryIO) -> None:
+        file.write(b"\0" * HEADER_SIZE)
+        offset = HEADER_SIZE
+
+        def write(cache_name: str, key: str, data: bytes, stored_at: float) -> None:
+            nonlocal offset
+            file.write(data)
+            index.setdefault(cache_name, {})[key] = [offset, len(data), stored_at]
+            offset += len(data)
+
+        for cache in caches:
+            index.setdefault(cache.name, {})
+            for key, value, remaining in cache.items():
+                if not isinstance(key, str):
+                    continue
+                try:
+                    data = _encode(value)
+                except (TypeError, ValueError):
+                    continue
+                write(cache.name, key, data, now + remaining - cache.ttl)
+            # Entrées de l'instantané ouvert jamais lues par ce processus
+            snapshot = cache.snapshot
+            if snapshot is None:
+                continue
+            for key, entry in snapshot.index.get(cache.name, {}).items():
+                if key not in index[cache.name] and entry[2] + cache.ttl > now:
+                    write(cache.name, key, snapshot.raw(cache.name, key), entry[2])
+
+        index_data = zlib.compress(json.dumps(index, ensure_ascii=False).encode("utf-8"), COMPRESSION_LEVEL)
+        file.write(index_data)
+        file.seek(0)
+        file.write(_HEADER.pack(MAGIC, SNAPSHOT_VERSION, 0, offset, len(index_data), now))
+
+    # Fichier temporaire unique puis remplacement : deux exports simultanés ne se mélangent pas
+    atomic_write(path, write_snapshot, binary=True)
+
+    counts = {cache: len(entries) for cache, entries in index.items()}
+    print(f"INFO: Instantané des caches écrit dans {path} ({counts}, {os.path.getsize(path) / 1024:.0f} Ko)")
+    return counts
+
+
+_attached: Optional[CacheSnapshot] = None
+_attach_lock = threading.Lock()
+
+
+def attach_snapshot(path: Optional[str] = None, caches: Sequence[TTLCache] = CACHES) -> Optional[CacheSnapshot]:
+    """
+    Ouvre l'instantané et le rattache aux caches du processus (une seule fois par processus)
+
+    Args:
+        path (Optional[str]): Fichier de l'instantané (défaut: JERRY_CACHE_SNAPSHOT)
+        caches (Sequence[TTLCache]): Caches qui lisent l'instantané
+
+    Returns:
+        Optional[CacheSnapshot]: L'instantané ouvert, ou None s'il est absent ou illisible
+    """
+    global _attached
+    path = path or DEFAULT_PATH
+    with _attach_lock:
+        if _attached is not None:
+            return _attached
+        if not path or not os.path.isfile(path):
+            return None
+        start = time.perf_counter()
+        try:
+            snapshot = CacheSnapshot(path)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"ERREUR: Instantané des caches ignoré ({path}): {e}")
+            return None
+        for cache in caches:
+            cache.attach_snapshot(snapshot)
+        _attached = snapshot
+    print(f"INFO: Instantané des caches ouvert en {time.perf_counter() - start:.3f}s ({snapshot.stats()['entrees']})")
+    return snapshot
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Instantané des caches pour le démarrage à chaud")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Précharger les caches depuis le journal des requêtes puis exporter")
+    build.add_argument("--path", default=DEFAULT_PATH, help="Fichier de l'instantané")
+    build.add_argument("--log", default=None, help="Journal des requêtes (défaut: JERRY_REQUEST_LOG)")
+    build.add_argument("--relax", action="store_true",
+                       help="Recherches assouplies, comme l'application Streamlit (les clés de cache en dépendent)")
+    build.add_argument("--budget", type=float, default=None, help="Durée maximale du préchargement (secondes)")
+    build.add_argument("--top", type=int, default=None, help="Questions et articles rejoués, chacun")
+
+    info = commands.add_parser("info", help="Afficher le contenu d'un instantané")
+    info.add_argument("--path", default=DEFAULT_PATH, help="Fichier de l'instantané")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "info":
+        try:
+            snapshot = CacheSnapshot(args.path)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"ERREUR: Instantané illisible ({args.path}): {e}")
+            return 1
+        print(json.dumps(snapshot.stats(), indent=2, ensure_ascii=False))
+        snapshot.close()
+        return 0
+
+    from CACHE.prefetch import prefetch_from_log
+
+    # L'instantané existant est complété plutôt que remplacé
+    attach_snapshot(args.path)
+    options: Dict[str, Any] = {"search_kwargs": {"relax": True} if args.relax else None}
+    if args.budget is not None:
+        options["time_budget"] = args.budget
+    if args.top is not None:
+        options["top"] = args.top
+    prefetch_from_log(args.log, **options)
+    export_snapshot(args.path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
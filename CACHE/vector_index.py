@@ -0,0 +1,408 @@
+"""
+Index vectoriel local des extraits déjà récupérés.
+
+Ce module fournit:
+- Un embedder local par hachage de termes (aucun appel réseau), remplaçable
+  par tout objet exposant `dim`, `name` et `embed(texts)`
+- Un index en mémoire (matrice NumPy float32) de tous les extraits normalisés vus,
+  persisté sur disque (sauvegardes regroupées en arrière-plan, voir CACHE/persistence.py)
+  et rechargé par memory-mapping
+- Une recherche des plus proches voisins d'une question, utilisée pour répondre
+  sans générer de payload ni appeler /search lorsque les voisins sont assez proches
+- Le suivi du taux de réussite (hit rate) et du rappel de l'index
+"""
+import json
+import os
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from CACHE.persistence import DeferredSaver, atomic_write
+from SEARCH.metadata import build_metadata_list
+from SEARCH.text_utils import tokenize
+
+# Paramètres par défaut de l'index
+EMBEDDING_DIM = 4096
+# Similarité cosinus minimale du plus proche voisin : sur des extraits de /search, les questions
+# qu'ils traitent obtiennent de 0.12 à 0.55, les questions sans rapport au plus 0.07
+SIMILARITY_THRESHOLD = float(os.getenv("JERRY_VECTOR_THRESHOLD", "0.1"))
+TOP_K = 3
+
+# Répertoire de l'index du processus (vide : index désactivé)
+DEFAULT_PATH = os.getenv("JERRY_VECTOR_INDEX", "")
+
+# Fichiers de persistance
+VECTORS_FILE = "vectors.f32"
+EXTRACTS_FILE = "extracts.json"
+META_FILE = "meta.json"
+
+
+class HashingEmbedder:
+    """
+    Embedder local par hachage des termes et bigrammes (« hashing trick »).
+
+    Chaque terme est projeté dans un des `dim` compartiments avec un signe, pondéré
+    par 1 + log(tf), puis le vecteur est normalisé (norme L2). Le hachage crc32 est
+    stable d'un processus à l'autre, ce qui permet de persister les vecteurs.
+
+    Args:
+        dim (int): Dimension des vecteurs
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Dict[str, int]:
+        tokens = tokenize(text)
+        features: Dict[str, int] = {}
+        for token in tokens:
+            features[token] = features.get(token, 0) + 1
+        for first, second in zip(tokens, tokens[1:]):
+            bigram = f"{first} {second}"
+            features[bigram] = features.get(bigram, 0) + 1
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Calcule les vecteurs normalisés d'une liste de textes
+
+        Returns:
+            np.ndarray: Matrice float32 de forme (len(texts), dim)
+        """
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                matrix[row, digest % self.dim] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class ExtractVectorIndex:
+    """
+    Index des extraits Légifrance déjà récupérés, interrogeable par similarité.
+
+    Usage:
+        index = ExtractVectorIndex.load_or_create("cache/vector_index")
+        metadata_list = index.lookup(question)
+        if metadata_list is None:
+            api_results, error = search_call(payload)
+            index.add_documents(api_results)
+            index.schedule_save()
+
+    Args:
+        path (Optional[str]): Répertoire de persistance (None : index en mémoire uniquement)
+        embedder (Optional[Any]): Embedder local (défaut: HashingEmbedder)
+        threshold (float): Similarité minimale du plus proche voisin pour éviter la recherche
+        top_k (int): Nombre de voisins retenus pour la synthèse
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        embedder: Optional[Any] = None,
+        threshold: float = SIMILARITY_THRESHOLD,
+        top_k: int = TOP_K
+    ):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.top_k = top_k
+        self.records: List[Dict[str, Any]] = []
+        self._ids: Dict[str, int] = {}
+        self._vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "recall_checks": 0, "recall_sum": 0.0}
+        self._saver = DeferredSaver(self._write, name="index vectoriel")
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    def _append_vectors(self, vectors: np.ndarray) -> None:
+        """Ajoute des lignes à la matrice (capacité doublée si nécessaire)."""
+        needed = self._size + len(vectors)
+        if needed > len(self._vectors) or not self._vectors.flags.writeable:
+            capacity = max(needed, 2 * len(self._vectors), 64)
+            grown = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        self._vectors[self._size:needed] = vectors
+        self._size = needed
+
+    def add_documents(self, api_results: List[dict]) -> int:
+        """
+        Indexe les extraits de documents normalisés (résultats de search_call)
+
+        Args:
+            api_results (List[dict]): Documents normalisés
+
+        Returns:
+            int: Nombre d'extraits ajoutés (les extraits déjà indexés sont ignorés)
+        """
+        new_records = []
+        new_ids = set()
+        for metadata in build_metadata_list(api_results):
+            document = {key: value for key, value in metadata.items() if key != "extracts"}
+            for extract in metadata["extracts"]:
+                if not extract["id"] or not extract["text"]:
+                    continue
+                if extract["id"] in self._ids or extract["id"] in new_ids:
+                    continue
+                new_ids.add(extract["id"])
+                new_records.append(dict(extract, document=document))
+
+        if not new_records:
+            return 0
+
+        vectors = self.embedder.embed([
+            f"{record['document']['title']} {record['section_title']} {record['title']} {record['text']}"
+            for record in new_records
+        ])
+        with self._lock:
+            for record in new_records:
+                self._ids[record["id"]] = len(self.records)
+                self.records.append(record)
+            self._append_vectors(vectors)
+        return len(new_records)
+
+    def search(self, question: str, k: Optional[int] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Plus proches voisins d'une question
+
+        Args:
+            question (str): Question juridique
+            k (Optional[int]): Nombre de voisins (défaut: top_k)
+
+        Returns:
+            List[Tuple[float, Dict[str, Any]]]: (similarité cosinus, extrait), par similarité décroissante
+        """
+        k = k or self.top_k
+        query = self.embedder.embed([question])[0]
+        with self._lock:
+            if not self._size:
+                return []
+            scores = self.vectors @ query
+            k = min(k, self._size)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(float(scores[i]), self.records[i]) for i in best]
+
+    def _hit(self, question: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Extraits voisins de la question si le plus proche dépasse le seuil (None sinon),
+        comptés dans les statistiques ; les voisins sans aucun terme commun sont écartés.
+        """
+        neighbours = self.search(question)
+        hit = bool(neighbours) and neighbours[0][0] >= self.threshold
+        with self._lock:
+            self._stats["lookups"] += 1
+            if hit:
+                self._stats["hits"] += 1
+        return [record for score, record in neighbours if score > 0] if hit else None
+
+    def lookup(self, question: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Métadonnées prêtes pour synthesize_legal_response si les voisins sont assez proches
+
+        Args:
+            question (str): Question juridique
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: Métadonnées des top_k voisins groupées par document,
+                ou None si le plus proche ne dépasse pas le seuil de similarité
+        """
+        records = self._hit(question)
+        return self.to_metadata_list(records) if records is not None else None
+
+    def lookup_results(self, question: str) -> Optional[List[dict]]:
+        """
+        Comme lookup, mais au format des documents normalisés de search_call : les extraits
+        peuvent ainsi être filtrés selon leur vigueur (voir LEGIFRANCE_UTILS/temporal)
+        avant build_metadata_list et la synthèse
+        """
+        records = self._hit(question)
+        return self.to_results(records) if records is not None else None
+
+    @staticmethod
+    def to_metadata_list(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Regroupe des extraits indexés par document, au format de build_metadata_list."""
+        documents: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            document = record["document"]
+            key = document.get("cid") or document.get("id") or document.get("title")
+            if key not in documents:
+                documents[key] = dict(document, extracts=[])
+            extract = {name: value for name, value in record.items() if name != "document"}
+            documents[key]["extracts"].append(extract)
+        return list(documents.values())
+
+    @staticmethod
+    def to_results(records: List[Dict[str, Any]]) -> List[dict]:
+        """Regroupe des extraits indexés en documents normalisés (une section par titre de section)."""
+        documents: Dict[str, dict] = {}
+        for metadata in ExtractVectorIndex.to_metadata_list(records):
+            key = metadata.get("cid") or metadata.get("id") or metadata.get("title")
+            document = documents.setdefault(key, {
+                "titles": [{"title": metadata.get("title"), "cid": metadata.get("cid"), "id": metadata.get("id")}],
+                "type": metadata.get("type"),
+                "nature": metadata.get("nature"),
+                "origin": metadata.get("origin"),
+                "date": metadata.get("date"),
+                "sections": [],
+            })
+            sections: Dict[Any, dict] = {section["title"]: section for section in document["sections"]}
+            for extract in metadata["extracts"]:
+                section = sections.get(extract.get("section_title"))
+                if section is None:
+                    section = {"id": None, "title": extract.get("section_title"), "dateVersion": None,
+                               "legalStatus": None, "extracts": []}
+                    sections[section["title"]] = section
+                    document["sections"].append(section)
+                section["extracts"].append({
+                    "id": extract["id"], "title": extract.get("title"), "num": None, "legalStatus": None,
+                    "values": [extract["text"]] if extract.get("text") else [],
+                })
+        return list(documents.values())
+
+    def record_recall(self, question: str, api_results: List[dict]) -> float:
+        """
+        Mesure le rappel de l'index par rapport à une recherche réelle
+
+        Les extraits renvoyés par /search pour la question sont comparés aux
+        `top_k` voisins que l'index aurait proposés.
+
+        Returns:
+            float: Part des extraits de la recherche présents parmi les voisins
+        """
+        live_ids = {
+            extract["id"]
+            for metadata in build_metadata_list(api_results)
+            for extract in metadata["extracts"] if extract["id"]
+        }
+        if not live_ids:
+            return 0.0
+        retrieved = {record["id"] for _, record in self.search(question, k=max(self.top_k, len(live_ids)))}
+        recall = len(live_ids & retrieved) / len(live_ids)
+        with self._lock:
+            self._stats["recall_checks"] += 1
+            self._stats["recall_sum"] += recall
+        return recall
+
+    def stats(self) -> Dict[str, Any]:
+        """Taille de l'index, taux de réussite et rappel moyen mesuré."""
+        with self._lock:
+            lookups = self._stats["lookups"]
+            checks = self._stats["recall_checks"]
+            return {
+                "extraits": self._size,
+                "lookups": lookups,
+                "hits": self._stats["hits"],
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "recall_checks": checks,
+                "recall": self._stats["recall_sum"] / checks if checks else None,
+            }
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Persiste l'index : matrice float32 brute (memory-mappable) et extraits en JSON
+
+        Les sauvegardes sont sérialisées et chaque fichier est remplacé atomiquement.
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError("Aucun répertoire de persistance défini pour l'index vectoriel.")
+        with self._saver.write_lock:
+            self._write(path)
+
+    def schedule_save(self) -> None:
+        """
+        Programme la persistance de l'index en arrière-plan
+
+        Les demandes reçues pendant le délai de regroupement (JERRY_CACHE_SAVE_DELAY) donnent
+        une seule écriture, faite hors du traitement de la question ; la dernière est faite à
+        la sortie du processus.
+        """
+        if self.path:
+            self._saver.schedule()
+
+    def flush(self) -> None:
+        """Effectue sans attendre la sauvegarde programmée, s'il y en a une."""
+        self._saver.flush()
+
+    def _write(self, path: Optional[str] = None) -> None:
+        """Écrit les fichiers de l'index (appelant : verrou d'écriture tenu)."""
+        path = path or self.path
+        with self._lock:
+            # Copie : la matrice peut être memory-mappée depuis le fichier à remplacer
+            vectors = np.array(self.vectors, dtype=np.float32, copy=True)
+            records = list(self.records)
+        meta = {"dim": self.embedder.dim, "count": len(records), "embedder": self.embedder.name}
+
+        # Fichiers temporaires uniques puis remplacement atomique ; meta.json en dernier
+        atomic_write(os.path.join(path, VECTORS_FILE), vectors.tofile, binary=True)
+        atomic_write(os.path.join(path, EXTRACTS_FILE), lambda file: json.dump(records, file, ensure_ascii=False))
+        atomic_write(os.path.join(path, META_FILE), lambda file: json.dump(meta, file))
+
+    @classmethod
+    def load_or_create(cls, path: str, embedder: Optional[Any] = None, **kwargs: Any) -> "ExtractVectorIndex":
+        """
+        Recharge un index persisté (matrice memory-mappée en lecture seule) ou en crée un vide
+
+        Un index construit avec un autre embedder est ignoré : ses vecteurs ne sont pas comparables.
+        """
+        index = cls(path=path, embedder=embedder, **kwargs)
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            return index
+
+        with open(meta_path, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("embedder") != index.embedder.name or meta.get("dim") != index.embedder.dim:
+            print(f"INFO: Index vectoriel ignoré (embedder {meta.get('embedder')} incompatible)")
+            return index
+
+        with open(os.path.join(path, EXTRACTS_FILE), "r", encoding="utf-8") as file:
+            index.records = json.load(file)
+        index._ids = {record["id"]: position for position, record in enumerate(index.records)}
+        index._size = meta["count"]
+        if index._size:
+            index._vectors = np.memmap(
+                os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r",
+                shape=(index._size, meta["dim"])
+            )
+        print(f"INFO: Index vectoriel chargé ({index._size} extraits)")
+        return index
+
+
+_index: Optional[ExtractVectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index(path: Optional[str] = None) -> Optional[ExtractVectorIndex]:
+    """
+    Index vectoriel du processus, chargé au premier appel
+
+    Args:
+        path (Optional[str]): Répertoire de l'index (défaut: JERRY_VECTOR_INDEX)
+
+    Returns:
+        Optional[ExtractVectorIndex]: L'index, ou None s'il n'est pas activé (aucun répertoire)
+    """
+    global _index
+    path = path or DEFAULT_PATH
+    if not path:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = ExtractVectorIndex.load_or_create(path)
+        return _index
@@ -0,0 +1,402 @@
+"""
+Index local des versions des articles (intervalles de vigueur).
+
+Dans LEGI, chaque version d'un article a son propre identifiant LEGIARTI, un état
+(VIGUEUR, MODIFIE, ABROGE...) et un intervalle de vigueur [dateDebut, dateFin[ ; les
+versions d'un même article partagent son `cid`. Ce module fournit:
+- Un index de ces versions, alimenté par les articles récupérés (/consult/getArticle
+  renvoie aussi la liste `articleVersions` de l'article) et par l'état et l'intervalle
+  de vigueur (dateDebut, dateFin, dateVersion) des sections et des extraits renvoyés par
+  /search, persisté dans un fichier JSON (écritures regroupées en
+  arrière-plan, voir CACHE/persistence.py)
+- La version d'un article en vigueur à une date, sans appel réseau
+- Le filtrage des extraits de recherche selon leur vigueur à une période (aujourd'hui
+  par défaut), avant la synthèse : un extrait hors vigueur est remplacé par la version
+  de l'article en vigueur pendant la période
+"""
+import datetime
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from CACHE.persistence import DeferredSaver, atomic_write
+
+# Chemin par défaut de l'index
+DEFAULT_PATH = os.getenv("JERRY_VERSION_INDEX", "cache/article_versions.json")
+
+# États d'une version qui n'est plus (ou pas encore) applicable
+NOT_IN_FORCE_PREFIXES = ("ABROGE", "MODIFIE", "PERIME", "ANNULE", "TRANSFERE", "DISJOINT")
+
+# États d'une version applicable aujourd'hui
+IN_FORCE_STATES = ("VIGUEUR",)
+
+# Mention ajoutée au titre d'un extrait conservé bien qu'il ne soit pas en vigueur à la date visée
+NOT_IN_FORCE_NOTE = "[version non en vigueur à la date visée]"
+
+Day = datetime.date
+
+
+def version_day(value: Any) -> Optional[str]:
+    """
+    Date d'une version au format AAAA-MM-JJ
+
+    /search renvoie des dates ISO ("2007-01-01T00:00:00.000+0000") et /consult des
+    horodatages en millisecondes, correspondant à minuit (heure de Paris ou UTC) : ils
+    sont décalés de 12 heures avant d'être ramenés au jour, pour tomber sur le bon jour
+    dans les deux cas.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.lstrip("-").isdigit()):
+        timestamp = int(value) / 1000 + 12 * 3600
+        return (datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=timestamp)).date().isoformat()
+    return str(value)[:10]
+
+
+def _as_day(value: Any) -> Optional[Day]:
+    if isinstance(value, Day):
+        return value
+    text = version_day(value)
+    try:
+        return datetime.date.fromisoformat(text) if text else None
+    except ValueError:
+        return None
+
+
+def not_in_force_state(etat: Optional[str]) -> bool:
+    """True si l'état désigne une version abrogée, modifiée ou périmée."""
+    return bool(etat) and etat.upper().startswith(NOT_IN_FORCE_PREFIXES)
+
+
+def _search_version(item: dict) -> Optional[Dict[str, Optional[str]]]:
+    """Version décrite par une section ou un extrait de résultat /search (None si rien n'est connu)."""
+    if not item.get("id"):
+        return None
+    version = {
+        "id": item["id"],
+        "etat": item.get("legalStatus"),
+        "debut": version_day(item.get("dateDebut") or item.get("dateVersion")),
+        "fin": version_day(item.get("dateFin")),
+    }
+    if all(version[field] is None for field in ("etat", "debut", "fin")):
+        return None
+    return version
+
+
+class ArticleVersionIndex:
+    """
+    Versions connues des articles, par identifiant de version et par article (cid).
+
+    Chaque version est enregistrée sous la forme {"id", "cid", "num", "etat", "debut", "fin"}
+    (dates AAAA-MM-JJ, None si inconnues).
+
+    Args:
+        path (Optional[str]): Fichier de persistance (None : index en mémoire uniquement)
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_PATH):
+        self.path = path or None
+        self.versions: Dict[str, Dict[str, Optional[str]]] = {}
+        self._by_cid: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "resolved": 0, "filtered": 0, "replaced": 0}
+        self._saver = DeferredSaver(self._write, name="index des versions")
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH) -> "ArticleVersionIndex":
+        """Charge l'index persisté dans `path` (index vide si le fichier n'existe pas)."""
+        index = cls(path=path)
+        if path and os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    for version in json.load(file)["versions"]:
+                        index._add(version)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"ERREUR: Index des versions illisible ({path}): {e}")
+        return index
+
+    def _save(self) -> None:
+        """Programme la persistance de l'index (écritures regroupées en arrière-plan)."""
+        if self.path:
+            self._saver.schedule()
+
+    def flush(self) -> None:
+        """Effectue sans attendre la sauvegarde programmée, s'il y en a une."""
+        self._saver.flush()
+
+    def _write(self) -> None:
+        with self._lock:
+            content = json.dumps({"versions": list(self.versions.values())}, ensure_ascii=False)
+        atomic_write(self.path, lambda file: file.write(content))
+
+    def _add(self, version: Dict[str, Optional[str]]) -> bool:
+        """Ajoute ou complète une version (appelant : verrou tenu ou chargement) ; True si l'index a changé."""
+        known = self.versions.get(version["id"])
+        merged = dict(known or {"id": version["id"], "cid": None, "num": None, "etat": None, "debut": None, "fin": None})
+        for field, value in version.items():
+            if value is not None:
+                merged[field] = value
+        if merged == known:
+            return False
+        self.versions[version["id"]] = merged
+        if merged["cid"]:
+            self._by_cid.setdefault(merged["cid"], set()).add(merged["id"])
+        return True
+
+    def record_article(self, article_data: Optional[Dict[str, Any]]) -> int:
+        """
+        Enregistre un article récupéré par /consult/getArticle et ses autres versions
+
+        Returns:
+            int: Nombre de versions ajoutées ou mises à jour
+        """
+        article = (article_data or {}).get("article") or {}
+        if not article.get("id"):
+            return 0
+        cid = article.get("cid") or article["id"]
+        versions = [{
+            "id": article["id"], "cid": cid, "num": article.get("num"), "etat": article.get("etat"),
+            "debut": version_day(article.get("dateDebut")), "fin": version_day(article.get("dateFin")),
+        }]
+        for version in article.get("articleVersions") or []:
+            if version.get("id"):
+                versions.append({
+                    "id": version["id"], "cid": cid, "num": version.get("numero") or version.get("num"),
+                    "etat": version.get("etat"),
+                    "debut": version_day(version.get("dateDebut")), "fin": version_day(version.get("dateFin")),
+                })
+        with self._lock:
+            changed = sum(self._add(version) for version in versions)
+        if changed:
+            self._save()
+        return changed
+
+    def record_results(self, api_results: List[dict]) -> int:
+        """
+        Enregistre les versions des sections et des extraits de résultats /search normalisés
+
+        Chaque section et chaque extrait est enregistré avec son état (legalStatus) et son
+        intervalle de vigueur [dateDebut, dateFin[, dateVersion tenant lieu de début à défaut
+        de dateDebut : la vigueur d'un extrait à une date se déduit alors des résultats de
+        recherche, sans récupérer l'article.
+
+        Returns:
+            int: Nombre de versions ajoutées ou mises à jour
+        """
+        versions = []
+        for document in api_results:
+            for section in document.get("sections", []):
+                for item in [section, *section.get("extracts", [])]:
+                    version = _search_version(item)
+                    if version is not None:
+                        versions.append(version)
+        with self._lock:
+            changed = sum(self._add(version) for version in versions)
+        if changed:
+            self._save()
+        return changed
+
+    def versions_of(self, article_id: str) -> List[Dict[str, Optional[str]]]:
+        """Versions connues de l'article auquel appartient la version `article_id`, par date de début."""
+        with self._lock:
+            version = self.versions.get(article_id)
+            if version is None:
+                return []
+            ids = self._by_cid.get(version["cid"], {article_id}) if version["cid"] else {article_id}
+            versions = [self.versions[version_id] for version_id in ids]
+        return sorted(versions, key=lambda item: item["debut"] or "")
+
+    def version_at(self, article_id: str, day: Any = None) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Version en vigueur à une date de l'article auquel appartient `article_id`
+
+        Args:
+            article_id (str): Identifiant d'une version de l'article (LEGIARTI) ou son cid
+            day (Any): Date (datetime.date, "AAAA-MM-JJ" ou horodatage ; défaut: aujourd'hui)
+
+        Returns:
+            Optional[Dict[str, Optional[str]]]: La version, ou None si aucune version connue ne
+                couvre cette date
+        """
+        day = (_as_day(day) or datetime.date.today()).isoformat()
+        with self._lock:
+            self._stats["lookups"] += 1
+            ids = self._by_cid.get(article_id)
+        candidates = [self.versions[version_id] for version_id in ids] if ids else self.versions_of(article_id)
+        for version in candidates:
+            if version["debut"] and version["debut"] <= day and (not version["fin"] or day < version["fin"]):
+                with self._lock:
+                    self._stats["resolved"] += 1
+                return version
+        return None
+
+    def in_force(self, article_id: str, start: Optional[Day] = None, end: Optional[Day] = None) -> Optional[bool]:
+        """
+        Vigueur d'une version pendant la période [start, end[ (défaut: aujourd'hui)
+
+        Returns:
+            Optional[bool]: True ou False si l'index permet de conclure, None sinon (version
+                inconnue, ou seul son état est connu pour une période passée)
+        """
+        today = datetime.date.today()
+        start = start or today
+        end = end or start + datetime.timedelta(days=1)
+        with self._lock:
+            version = self.versions.get(article_id)
+        if version is None:
+            return None
+        if version["debut"]:
+            if version["debut"] >= end.isoformat():
+                return False
+            # Une version encore en vigueur peut avoir une date de fin lointaine (2999-01-01)
+            if version["fin"]:
+                return start.isoformat() < version["fin"]
+            # Fin inconnue : seul l'état permet de conclure, et seulement pour aujourd'hui
+            if not not_in_force_state(version["etat"]):
+                return True
+        if start <= today < end:
+            if not_in_force_state(version["etat"]):
+                return False
+            if version["etat"] in IN_FORCE_STATES:
+                return True
+        return None
+
+    def version_during(self, article_id: str, start: Optional[Day] = None,
+                       end: Optional[Day] = None) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Version de l'article auquel appartient `article_id` en vigueur pendant la période
+        [start, end[ (défaut: aujourd'hui) ; la plus récente si plusieurs la recoupent
+
+        Returns:
+            Optional[Dict[str, Optional[str]]]: La version, ou None si aucune version connue
+                ne couvre la période
+        """
+        covering = [version for version in self.versions_of(article_id)
+                    if self.in_force(version["id"], start, end)]
+        return covering[-1] if covering else None
+
+    def unknown_versions(self, api_results: List[dict], start: Optional[Day] = None,
+                         end: Optional[Day] = None) -> List[str]:
+        """
+        Extraits hors vigueur pendant la période dont l'article n'a jamais été récupéré : ses
+        autres versions (et donc celle qui couvre la période) ne sont pas encore connues
+        """
+        unknown: List[str] = []
+        for document in api_results:
+            for section in document.get("sections", []):
+                for extract in section.get("extracts", []):
+                    if not extract.get("id") or self.in_force(extract["id"], start, end) is not False:
+                        continue
+                    with self._lock:
+                        version = self.versions.get(extract["id"])
+                    if version is not None and not version["cid"] and extract["id"] not in unknown:
+                        unknown.append(extract["id"])
+        return unknown
+
+    def replacements_needed(self, api_results: List[dict], start: Optional[Day] = None,
+                            end: Optional[Day] = None) -> List[str]:
+        """Identifiants des versions qui remplaceront les extraits hors vigueur pendant la période."""
+        needed: List[str] = []
+        for document in api_results:
+            for section in document.get("sections", []):
+                for extract in section.get("extracts", []):
+                    if not extract.get("id") or self.in_force(extract["id"], start, end) is not False:
+                        continue
+                    version = self.version_during(extract["id"], start, end)
+                    if version is not None and version["id"] not in needed:
+                        needed.append(version["id"])
+        return needed
+
+    def _resolve_extract(self, extract: dict, start: Optional[Day], end: Optional[Day],
+                         replace: Optional[Callable[[dict, Dict[str, Optional[str]]], Optional[dict]]]
+                         ) -> Tuple[Optional[dict], str]:
+        """Extrait à transmettre à la place d'un extrait, et ce qui lui est arrivé ("kept", "replaced", "tagged", "removed")."""
+        if not extract.get("id") or self.in_force(extract["id"], start, end) is not False:
+            return extract, "kept"
+        version = self.version_during(extract["id"], start, end)
+        if version is None:
+            return None, "removed"
+        replacement = replace(extract, version) if replace else None
+        if replacement is not None:
+            return replacement, "replaced"
+        # Texte de la bonne version indisponible : l'extrait reste, signalé comme hors vigueur
+        title = extract.get("title") or extract.get("num") or "Sans titre"
+        return {**extract, "title": f"{title} {NOT_IN_FORCE_NOTE}", "inForce": False}, "tagged"
+
+    def filter_results(self, api_results: List[dict], start: Optional[Day] = None, end: Optional[Day] = None,
+                       replace: Optional[Callable[[dict, Dict[str, Optional[str]]], Optional[dict]]] = None
+                       ) -> Tuple[List[dict], int, int]:
+        """
+        Remplace ou écarte les extraits qui n'étaient pas en vigueur pendant la période [start, end[
+
+        Un extrait hors vigueur dont l'article a une version connue couvrant la période est
+        remplacé par cette version (`replace`) ; si son texte n'est pas disponible, l'extrait est
+        conservé avec la mention NOT_IN_FORCE_NOTE. Il n'est écarté que si aucune version connue
+        ne couvre la période. Les extraits dont la vigueur est inconnue sont conservés, de même
+        que les documents sans extrait (décisions, textes entiers). Les documents sont copiés :
+        les résultats mis en cache ne sont pas modifiés.
+
+        Args:
+            api_results (List[dict]): Documents normalisés renvoyés par search_call
+            start (Optional[Day]): Début de la période (défaut: aujourd'hui)
+            end (Optional[Day]): Fin de la période, exclue (défaut: lendemain de `start`)
+            replace (Optional[Callable]): (extrait, version) -> extrait de cette version, ou None
+                si son texte n'est pas disponible
+
+        Returns:
+            Tuple[List[dict], int, int]: Documents filtrés, nombres d'extraits écartés et remplacés
+        """
+        removed = 0
+        replaced = 0
+        filtered: List[dict] = []
+        for document in api_results:
+            sections = []
+            had_extracts = False
+            document_changed = False
+            for section in document.get("sections", []):
+                extracts = section.get("extracts", [])
+                had_extracts = had_extracts or bool(extracts)
+                kept = []
+                section_changed = False
+                for extract in extracts:
+                    result, outcome = self._resolve_extract(extract, start, end, replace)
+                    if outcome != "kept":
+                        section_changed = True
+                    if outcome == "removed":
+                        removed += 1
+                        continue
+                    replaced += outcome == "replaced"
+                    kept.append(result)
+                document_changed = document_changed or section_changed
+                if kept or not extracts:
+                    sections.append({**section, "extracts": kept} if section_changed else section)
+            if had_extracts and not any(section.get("extracts") for section in sections):
+                continue
+            filtered.append({**document, "sections": sections} if document_changed else document)
+        with self._lock:
+            self._stats["filtered"] += removed
+            self._stats["replaced"] += replaced
+        return filtered, removed, replaced
+
+    def stats(self) -> Dict[str, Any]:
+        """Articles et versions indexés, recherches de version (lookups, resolved), extraits écartés et remplacés."""
+        with self._lock:
+            return {
+                "articles": len(self._by_cid),
+                "versions": len(self.versions),
+                **self._stats,
+            }
+
+
+_index: Optional[ArticleVersionIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_version_index() -> ArticleVersionIndex:
+    """Index des versions du processus, chargé depuis DEFAULT_PATH au premier appel."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ArticleVersionIndex.load(DEFAULT_PATH)
+        return _index
@@ -0,0 +1,4 @@
+"""
+Détection des articles de code cités dans une question et récupération directe
+de ces articles, sans recherche.
+"""
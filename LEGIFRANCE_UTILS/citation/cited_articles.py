@@ -0,0 +1,132 @@
+"""
+Raccourci des questions citant directement des articles de code.
+
+Lorsqu'une question cite des articles ("Que dit l'article 1240 du Code civil ?"),
+les articles sont résolus par la table des matières locale (CACHE.code_toc) puis
+récupérés par /consult/getArticle, sans génération de payload ni appel à /search.
+Les métadonnées obtenues ont le format de SEARCH.metadata.build_metadata_list et
+sont transmises telles quelles à la synthèse.
+
+Les articles récupérés sont conservés dans le cache du processus (CACHE/process_cache.py)
+et inscrits au journal des requêtes, d'où le préchargement des caches les rejoue.
+
+La version retenue est celle en vigueur à la date visée par la question ("au 1er janvier
+2015"), aujourd'hui par défaut, d'après l'index local des versions (CACHE/version_index.py).
+"""
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from CACHE.code_toc import CodeTocIndex, get_code_toc_index
+from CACHE.process_cache import cached_fetch_article
+from CACHE.version_index import get_version_index
+from LEGIFRANCE_UTILS.citation.detect_citation import Citation, detect_citations
+from LEGIFRANCE_UTILS.display_article.get_article_from_id import Article, extract_text_title, fetch_article
+from LEGIFRANCE_UTILS.temporal.point_in_time import question_period
+from PERF.deadline import submit_in_context
+from PERF.request_log import log_article
+
+
+def _current_version(article_data: Article, day: Optional[datetime.date] = None) -> Article:
+    """
+    Version d'un article en vigueur à la date `day` (aujourd'hui par défaut ; l'article lui-même à défaut)
+
+    La version est choisie dans l'index des versions ; sans date, l'état des versions
+    listées par l'article sert de repli si l'index ne connaît pas leurs intervalles.
+    """
+    article = article_data.get("article") or {}
+    index = get_version_index()
+    index.record_article(article_data)
+    version = index.version_at(article["id"], day) if article.get("id") else None
+    if version is not None:
+        if version["id"] == article["id"]:
+            return article_data
+        target = cached_fetch_article(version["id"])
+        if target and target.get("article"):
+            return target
+    if day is not None or article.get("etat") == "VIGUEUR":
+        return article_data
+    for version in article.get("articleVersions") or []:
+        if version.get("etat") == "VIGUEUR" and version.get("id") and version["id"] != article.get("id"):
+            current = fetch_article(version["id"])
+            if current and current.get("article"):
+                return current
+    return article_data
+
+
+def _fetch_cited_article(citation: Citation, index: CodeTocIndex,
+                         day: Optional[datetime.date] = None) -> Optional[Dict[str, Any]]:
+    article_id = index.resolve(citation.code_id, citation.num)
+    if article_id is None:
+        print(f"INFO: Article {citation.num} du {citation.code_name} introuvable.")
+        return None
+    log_article(article_id)
+    article_data = cached_fetch_article(article_id)
+    if not article_data or not article_data.get("article"):
+        return None
+
+    article_data = _current_version(article_data, day)
+    article = article_data["article"]
+    if day is None and article.get("id") and article["id"] != article_id:
+        # L'index pointait vers une version remplacée
+        index.update(citation.code_id, citation.num, article["id"], article.get("etat") or "")
+
+    return article_metadata(article_data, default_title=citation.code_name, default_num=citation.num)
+
+
+def article_metadata(article_data: Article, default_title: str = "Titre inconnu",
+                     default_num: str = "") -> Dict[str, Any]:
+    """
+    Métadonnées d'un article récupéré par /consult/getArticle, au format de build_metadata_list
+
+    Args:
+        article_data (Article): Réponse de fetch_article
+        default_title (str): Titre retenu si celui du texte est introuvable
+        default_num (str): Numéro retenu si l'article n'en indique pas
+    """
+    article = article_data.get("article") or {}
+    title = extract_text_title(article_data)
+    if title == "Titre du texte introuvable":
+        title = default_title
+    return {
+        "title": title,
+        "id": article.get("id", ""),
+        "cid": article.get("cid", ""),
+        "type": "article",
+        "nature": "CODE",
+        "origin": "LEGI",
+        "date": article.get("dateDebut"),
+        "extracts": [{
+            "id": article.get("id", ""),
+            "title": f"Article {article.get('num') or default_num}",
+            "section_title": article.get("etat") or "",
+            "text": article.get("texte") or "",
+        }],
+    }
+
+
+def fetch_cited_articles(question: str, index: Optional[CodeTocIndex] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Métadonnées des articles de code cités dans une question
+
+    Args:
+        question (str): Question de l'utilisateur
+        index (Optional[CodeTocIndex]): Tables des matières (défaut: index du processus)
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: Métadonnées au format de build_metadata_list, ou None
+            si la question ne cite aucun article ou si aucun article cité n'a pu être récupéré
+            (la recherche classique prend alors le relais)
+    """
+    citations = detect_citations(question)
+    if not citations:
+        return None
+    print(f"INFO: Articles cités: {', '.join(f'{c.num} ({c.code_name})' for c in citations)}")
+    index = index or get_code_toc_index()
+    period = question_period(question)
+    day = period[0] if period else None
+
+    with ThreadPoolExecutor(max_workers=len(citations)) as executor:
+        futures = [submit_in_context(executor, _fetch_cited_article, citation, index, day) for citation in citations]
+        metadata_list = [metadata for metadata in (future.result() for future in futures) if metadata]
+    return metadata_list or None
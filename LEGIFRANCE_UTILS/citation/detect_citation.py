@@ -0,0 +1,118 @@
+"""
+Détection des citations d'articles de code dans une question.
+
+Ce module fournit:
+- La liste des codes reconnus (noms usuels et abréviations -> identifiant LEGITEXT)
+- La détection des numéros d'articles cités ("article 1240", "art. L. 1221-1",
+  "articles 1240 et 1241") et du code auquel ils se rapportent
+- La normalisation des numéros d'articles au format de Legifrance ("L1221-1")
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from SEARCH.text_utils import normalize_text
+
+# Codes reconnus : identifiant LEGITEXT -> (nom officiel, alias normalisés)
+CODES: Dict[str, Tuple[str, List[str]]] = {
+    "LEGITEXT000006070721": ("Code civil", ["code civil", "c. civ", "c civ", "cciv"]),
+    "LEGITEXT000006070719": ("Code pénal", ["code penal", "c. pen", "c pen"]),
+    "LEGITEXT000006072050": ("Code du travail", ["code du travail", "c. trav", "c trav"]),
+    "LEGITEXT000005634379": ("Code de commerce", ["code de commerce", "c. com", "c com"]),
+    "LEGITEXT000006070716": ("Code de procédure civile", ["code de procedure civile", "cpc"]),
+    "LEGITEXT000006071154": ("Code de procédure pénale", ["code de procedure penale", "cpp"]),
+    "LEGITEXT000006069565": ("Code de la consommation", ["code de la consommation", "c. conso", "c conso"]),
+    "LEGITEXT000006069577": ("Code général des impôts", ["code general des impots", "cgi"]),
+    "LEGITEXT000006073189": ("Code de la sécurité sociale", ["code de la securite sociale", "css"]),
+    "LEGITEXT000006074220": ("Code de l'environnement", ["code de l'environnement", "code de l environnement"]),
+    "LEGITEXT000006074228": ("Code de la route", ["code de la route"]),
+    "LEGITEXT000006072665": ("Code de la santé publique", ["code de la sante publique", "csp"]),
+    "LEGITEXT000006074075": ("Code de l'urbanisme", ["code de l'urbanisme", "code de l urbanisme"]),
+    "LEGITEXT000006069414": ("Code de la propriété intellectuelle", ["code de la propriete intellectuelle", "cpi"]),
+    "LEGITEXT000006073984": ("Code des assurances", ["code des assurances"]),
+    "LEGITEXT000006072026": ("Code monétaire et financier", ["code monetaire et financier", "comofi"]),
+    "LEGITEXT000006070633": ("Code général des collectivités territoriales",
+                             ["code general des collectivites territoriales", "cgct"]),
+    "LEGITEXT000006070933": ("Code de justice administrative", ["code de justice administrative", "cja"]),
+    "LEGITEXT000006074096": ("Code de la construction et de l'habitation",
+                             ["code de la construction et de l'habitation", "cch"]),
+    "LEGITEXT000006071367": ("Code rural et de la pêche maritime", ["code rural et de la peche maritime", "code rural"]),
+    "LEGITEXT000006071191": ("Code de l'éducation", ["code de l'education", "code de l education"]),
+}
+
+# Nombre maximal d'articles cités traités par le raccourci
+MAX_CITED_ARTICLES = 5
+
+# Distance maximale (en caractères) entre les articles cités et le nom du code
+CODE_WINDOW = 80
+
+# Numéro d'article : préfixe éventuel (L, R, D, A), chiffres et tirets, suffixe latin éventuel
+_NUM = r"(?:[lrda]\s*\.?\s*\*?\s*)?\d+(?:\s*-\s*\d+)*(?:\s+(?:bis|ter|quater|quinquies|sexies))?"
+_ARTICLES_RE = re.compile(
+    rf"\bart(?:icle)?s?\b\.?\s*(?P<nums>{_NUM}(?:\s*(?:,|et|ou|&)\s*{_NUM})*)"
+)
+_NUM_RE = re.compile(_NUM)
+
+# Alias triés du plus long au plus court (le plus précis l'emporte)
+_ALIASES = sorted(
+    ((alias, code_id) for code_id, (_, aliases) in CODES.items() for alias in aliases),
+    key=lambda item: -len(item[0])
+)
+_ALIAS_RE = re.compile(
+    r"(?<![a-z])(" + "|".join(re.escape(alias) for alias, _ in _ALIASES) + r")(?![a-z])"
+)
+_ALIAS_TO_CODE = {alias: code_id for alias, code_id in _ALIASES}
+
+
+class Citation(NamedTuple):
+    """Article cité : code (identifiant et nom) et numéro au format Legifrance."""
+    code_id: str
+    code_name: str
+    num: str
+
+
+def normalize_article_num(num: str) -> str:
+    """
+    Numéro d'article au format de Legifrance
+
+    Exemples : "L. 1221-1" -> "L1221-1", "r 4127 - 2" -> "R4127-2", "515-14 bis" -> "515-14 bis"
+    """
+    num = re.sub(r"\s*-\s*", "-", num.strip())
+    match = re.match(r"^([lrdaLRDA])\s*\.?\s*\*?\s*(\d.*)$", num)
+    if match:
+        num = match.group(1).upper() + match.group(2)
+    return re.sub(r"\s+", " ", num)
+
+
+def _codes_in(text: str) -> List[Tuple[int, str]]:
+    return [(match.start(), _ALIAS_TO_CODE[match.group(1)]) for match in _ALIAS_RE.finditer(text)]
+
+
+def detect_citations(question: str) -> List[Citation]:
+    """
+    Articles de code cités dans une question
+
+    Le code d'un groupe d'articles est le premier code nommé dans les CODE_WINDOW
+    caractères qui suivent ; à défaut, le seul code nommé dans la question.
+
+    Args:
+        question (str): Question de l'utilisateur
+
+    Returns:
+        List[Citation]: Articles cités (sans doublon, au plus MAX_CITED_ARTICLES) ; vide si
+            aucun article n'est cité ou si le code ne peut pas être déterminé
+    """
+    text = normalize_text(question).replace("’", "'")
+    codes = _codes_in(text)
+    citations: List[Citation] = []
+    for match in _ARTICLES_RE.finditer(text):
+        following = [code_id for position, code_id in codes if match.end() <= position <= match.end() + CODE_WINDOW]
+        code_id: Optional[str] = following[0] if following else None
+        if code_id is None and len({code_id for _, code_id in codes}) == 1:
+            code_id = codes[0][1]
+        if code_id is None:
+            continue
+        for num in _NUM_RE.findall(match.group("nums")):
+            citation = Citation(code_id, CODES[code_id][0], normalize_article_num(num))
+            if citation not in citations:
+                citations.append(citation)
+    return citations[:MAX_CITED_ARTICLES]
@@ -0,0 +1,344 @@
+"""
+Pool d'identifiants PISTE pour les appels à l'API Legifrance.
+
+Ce module fournit:
+- Un token OAuth mis en cache par paire d'identifiants (renouvelé avant expiration)
+- Un budget de débit par identifiant (seau à jetons : LEGIFRANCE_RATE_LIMIT requêtes
+  par seconde, rafales de LEGIFRANCE_RATE_BURST requêtes)
+- Le routage de chaque appel /search ou /consult vers l'identifiant le moins chargé
+- La mise à l'écart temporaire des identifiants limités (HTTP 429) ou en échec
+- Le suivi de l'utilisation de chaque identifiant
+
+Les paires d'identifiants sont lues par LEGIFRANCE_UTILS.legifrance_init.load_credentials.
+"""
+import contextlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from LEGIFRANCE_UTILS import http_client
+from LEGIFRANCE_UTILS.legifrance_init import load_credentials, request_token
+from PERF.deadline import current_deadline
+
+# Budget de débit par identifiant
+DEFAULT_RATE_LIMIT = float(os.getenv("LEGIFRANCE_RATE_LIMIT", "10"))  # Requêtes par seconde
+DEFAULT_BURST = int(os.getenv("LEGIFRANCE_RATE_BURST", "10"))
+
+# Renouvellement du token avant son expiration (en secondes)
+TOKEN_EXPIRY_MARGIN = 60
+
+# Mise à l'écart des identifiants limités ou en échec (en secondes)
+THROTTLE_COOLDOWN = 10.0
+FAILURE_THRESHOLD = 3  # Échecs consécutifs avant mise à l'écart
+FAILURE_COOLDOWN = 30.0
+
+# Attente maximale d'un identifiant disponible, hors échéance (en secondes)
+MAX_ACQUIRE_WAIT = 30.0
+
+
+class NoCredentialAvailable(requests.RequestException):
+    """Aucun identifiant n'est disponible (tous limités, en échec ou sans token)."""
+
+
+class Credential:
+    """
+    Paire d'identifiants PISTE, avec son token, son budget de débit et ses statistiques.
+
+    Args:
+        client_id (Optional[str]): Identifiant de l'application
+        client_secret (Optional[str]): Secret de l'application
+        name (str): Nom affiché dans les rapports (le secret n'y figure jamais)
+        rate_limit (float): Requêtes autorisées par seconde
+        burst (int): Taille maximale d'une rafale
+    """
+
+    def __init__(self, client_id: Optional[str], client_secret: Optional[str], name: str,
+                 rate_limit: float = DEFAULT_RATE_LIMIT, burst: int = DEFAULT_BURST):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.name = name
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.token: Optional[str] = None
+        self.token_expires_at = 0.0
+        self.allowance = float(burst)
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "tokens": 0, "busy_time": 0.0}
+        self.token_lock = threading.Lock()
+
+    def refill(self, now: float) -> None:
+        self.allowance = min(float(self.burst), self.allowance + (now - self.last_refill) * self.rate_limit)
+        self.last_refill = now
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until and self.allowance >= 1.0
+
+    def ready_at(self, now: float) -> float:
+        """Instant à partir duquel l'identifiant pourra de nouveau être utilisé."""
+        budget_ready = now + max(0.0, 1.0 - self.allowance) / self.rate_limit
+        return max(self.cooldown_until, budget_ready)
+
+    def valid_token(self) -> Optional[str]:
+        if self.token and time.monotonic() < self.token_expires_at:
+            return self.token
+        return None
+
+
+class CredentialPool:
+    """
+    Répartit les appels à l'API Legifrance entre plusieurs paires d'identifiants.
+
+    Usage:
+        pool = get_credential_pool()
+        response = pool.request("POST", f"{LEGIFRANCE_BASE_URL}/search", headers=headers, json=payload)
+        print(pool.report())
+
+    Args:
+        credentials (List[Tuple[str, str]]): Paires (client_id, client_secret) ; sans paire,
+            un identifiant vide est utilisé (l'obtention du token échouera comme auparavant)
+        rate_limit (float): Requêtes autorisées par seconde et par identifiant
+        burst (int): Taille maximale d'une rafale par identifiant
+    """
+
+    def __init__(self, credentials: List[Tuple[str, str]], rate_limit: float = DEFAULT_RATE_LIMIT,
+                 burst: int = DEFAULT_BURST):
+        pairs = credentials or [(None, None)]
+        self.credentials = [
+            Credential(client_id, client_secret, f"identifiant-{number}", rate_limit, burst)
+            for number, (client_id, client_secret) in enumerate(pairs, 1)
+        ]
+        self.started_at = time.monotonic()
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    def acquire(self, exclude: Optional[List[Credential]] = None) -> Credential:
+        """
+        Réserve l'identifiant disponible le moins chargé, en attendant si nécessaire
+
+        L'identifiant retenu est celui qui a le moins d'appels en cours, puis le plus de
+        budget restant. L'attente est bornée par l'échéance courante ou MAX_ACQUIRE_WAIT.
+
+        Args:
+            exclude (Optional[List[Credential]]): Identifiants à ne pas utiliser (déjà essayés)
+
+        Raises:
+            NoCredentialAvailable: Si aucun identifiant ne se libère à temps
+        """
+        deadline = current_deadline()
+        limit = time.monotonic() + (deadline.remaining() if deadline is not None else MAX_ACQUIRE_WAIT)
+        eligible = [credential for credential in self.credentials if credential not in (exclude or [])]
+        if not eligible:
+            raise NoCredentialAvailable("Tous les identifiants Legifrance ont déjà été essayés")
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                for credential in eligible:
+                    credential.refill(now)
+                candidates = [credential for credential in eligible if credential.available(now)]
+                if candidates:
+                    credential = min(candidates, key=lambda c: (c.in_flight, -c.allowance, c.stats["requests"]))
+                    credential.allowance -= 1.0
+                    credential.in_flight += 1
+                    credential.stats["requests"] += 1
+                    return credential
+
+                ready_at = min(credential.ready_at(now) for credential in eligible)
+                if ready_at > limit:
+                    raise NoCredentialAvailable("Aucun identifiant Legifrance disponible (quotas atteints ou identifiants en échec)")
+                self._condition.wait(ready_at - now)
+
+    def release(self, credential: Credential, status_code: Optional[int] = None, elapsed: float = 0.0,
+                failed: bool = False, retry_after: Optional[float] = None) -> None:
+        """
+        Libère un identifiant et tient compte du résultat de l'appel
+
+        Args:
+            credential (Credential): Identifiant réservé par acquire
+            status_code (Optional[int]): Code HTTP de la réponse
+            elapsed (float): Durée de l'appel, en secondes
+            failed (bool): True si l'appel a échoué (connexion, token, erreur serveur)
+            retry_after (Optional[float]): Délai demandé par l'API après un HTTP 429
+        """
+        with self._condition:
+            now = time.monotonic()
+            credential.in_flight -= 1
+            credential.stats["busy_time"] += elapsed
+            if status_code == 429:
+                credential.stats["throttled"] += 1
+                credential.cooldown_until = now + (retry_after or THROTTLE_COOLDOWN)
+                print(f"INFO: {credential.name} limité par l'API, mis à l'écart {retry_after or THROTTLE_COOLDOWN:.0f}s")
+            elif failed:
+                credential.stats["errors"] += 1
+                credential.consecutive_failures += 1
+                if credential.consecutive_failures >= FAILURE_THRESHOLD:
+                    credential.cooldown_until = now + FAILURE_COOLDOWN
+                    credential.consecutive_failures = 0
+                    print(f"INFO: {credential.name} en échec, mis à l'écart {FAILURE_COOLDOWN:.0f}s")
+            else:
+                credential.consecutive_failures = 0
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator[Credential]:
+        """Réserve un identifiant le temps d'un bloc (appel compté comme réussi s'il ne lève pas)."""
+        credential = self.acquire()
+        start = time.monotonic()
+        failed = False
+        try:
+            yield credential
+        except requests.RequestException:
+            failed = True
+            raise
+        finally:
+            self.release(credential, elapsed=time.monotonic() - start, failed=failed)
+
+    def token(self, credential: Optional[Credential] = None) -> Optional[str]:
+        """
+        Token OAuth d'un identifiant (mis en cache jusqu'à son expiration)
+
+        Args:
+            credential (Optional[Credential]): Identifiant (défaut : le moins chargé du pool)
+
+        Returns:
+            Optional[str]: Le token, ou None en cas d'échec d'authentification
+        """
+        if credential is None:
+            with self.lease() as leased:
+                return self.token(leased)
+
+        with credential.token_lock:
+            token = credential.valid_token()
+            if token:
+                return token
+            token, expires_in, _ = request_token(credential.client_id, credential.client_secret)
+            if token:
+                credential.token = token
+                credential.token_expires_at = time.monotonic() + max(0, expires_in - TOKEN_EXPIRY_MARGIN)
+                credential.stats["tokens"] += 1
+            return token
+
+    def invalidate_token(self, credential: Credential) -> None:
+        with credential.token_lock:
+            credential.token = None
+            credential.token_expires_at = 0.0
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                tolerated_statuses: Tuple[int, ...] = (), **kwargs: Any) -> requests.Response:
+        """
+        Envoie une requête authentifiée avec l'identifiant le moins chargé
+
+        Une réponse 401 (token expiré) est rejouée une fois avec un nouveau token ; une réponse
+        429 ou un échec d'authentification est rejoué avec un autre identifiant.
+
+        Args:
+            method (str): Méthode HTTP
+            url (str): URL appelée
+            headers (Optional[Dict[str, str]]): Headers de la requête (le header Authorization est ajouté)
+            tolerated_statuses (Tuple[int, ...]): Codes d'erreur attendus, non comptés comme échecs
+                (ex: 500 pour /search/ping)
+            **kwargs: Arguments de http_client.request (json, stream, timeout...)
+
+        Returns:
+            requests.Response: La réponse de l'API
+
+        Raises:
+            NoCredentialAvailable: Si aucun identifiant ne peut être utilisé
+            requests.RequestException: En cas d'échec de connexion
+        """
+        response = None
+        tried: List[Credential] = []
+        renewed: List[Credential] = []
+        while len(tried) < len(self.credentials):
+            credential = self.acquire(exclude=tried)
+            start = time.monotonic()
+            try:
+                token = self.token(credential)
+                if not token:
+                    self.release(credential, elapsed=time.monotonic() - start, failed=True)
+                    tried.append(credential)
+                    continue
+                call_headers = dict(headers or {}, Authorization=f"Bearer {token}")
+                response = http_client.request(method, url, headers=call_headers, **kwargs)
+            except requests.RequestException:
+                self.release(credential, elapsed=time.monotonic() - start, failed=True)
+                raise
+            except BaseException:
+                self.release(credential, elapsed=time.monotonic() - start)
+                raise
+
+            elapsed = time.monotonic() - start
+            status = response.status_code
+            if status == 401 and credential not in renewed:
+                self.invalidate_token(credential)
+                self.release(credential, status, elapsed, failed=True)
+                renewed.append(credential)
+                response.close()
+                continue
+            if status == 429:
+                retry_after = response.headers.get("Retry-After")
+                self.release(credential, status, elapsed,
+                             retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+                tried.append(credential)
+                if len(tried) < len(self.credentials):
+                    response.close()
+                continue
+            self.release(credential, status, elapsed, failed=status >= 500 and status not in tolerated_statuses)
+            return response
+
+        if response is None:
+            raise NoCredentialAvailable("Échec d'obtention du token pour tous les identifiants Legifrance")
+        return response
+
+    def report(self) -> List[Dict[str, Any]]:
+        """
+        Utilisation de chaque identifiant depuis la création du pool
+
+        Returns:
+            List[Dict[str, Any]]: Par identifiant : requêtes, part du trafic, erreurs, limitations (429),
+                tokens obtenus, appels en cours, taux d'occupation et état
+        """
+        with self._condition:
+            now = time.monotonic()
+            elapsed = max(now - self.started_at, 1e-9)
+            total = sum(credential.stats["requests"] for credential in self.credentials) or 1
+            return [
+                {
+                    "identifiant": credential.name,
+                    "requetes": credential.stats["requests"],
+                    "part": round(credential.stats["requests"] / total, 3),
+                    "erreurs": credential.stats["errors"],
+                    "limitations": credential.stats["throttled"],
+                    "tokens": credential.stats["tokens"],
+                    "en_cours": credential.in_flight,
+                    "occupation": round(credential.stats["busy_time"] / elapsed, 3),
+                    "disponible": now >= credential.cooldown_until,
+                }
+                for credential in self.credentials
+            ]
+
+
+_pool: Optional[CredentialPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_credential_pool() -> CredentialPool:
+    """Pool d'identifiants du processus, construit depuis l'environnement au premier appel."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CredentialPool(load_credentials())
+            print(f"INFO: Pool de {len(_pool)} identifiant(s) Legifrance")
+        return _pool
+
+
+def legifrance_request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """Envoie une requête authentifiée via le pool d'identifiants du processus (voir CredentialPool.request)."""
+    return get_credential_pool().request(method, url, **kwargs)
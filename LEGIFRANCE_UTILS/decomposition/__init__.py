@@ -0,0 +1,4 @@
+"""
+Décomposition des questions composées en sous-questions indépendantes, recherchées
+en parallèle avant une synthèse unique.
+"""
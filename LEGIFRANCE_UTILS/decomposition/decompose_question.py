@@ -0,0 +1,123 @@
+"""
+Décomposition d'une question composée en sous-questions.
+
+Une question qui porte sur plusieurs points ("conditions du licenciement économique
+et indemnités dues au salarié") produit un payload surchargé, aux résultats médiocres.
+Ce module fournit:
+- Un filtre local (`looks_compound`) : seules les questions assez longues et contenant
+  une coordination ("et", "ainsi que", ";", plusieurs "?"...) sont soumises au LLM
+- La décomposition par un modèle rapide en sous-questions autonomes, chacune
+  recherchée séparément (voir sub_searches.py)
+
+La décomposition est facultative : elle est activée par JERRY_DECOMPOSE=1 ou par le
+paramètre `decompose` de tool.search_legifrance. En cas d'échec, la question est
+traitée telle quelle.
+"""
+import json
+import os
+import re
+from typing import List
+
+from LEGIFRANCE_UTILS.payload.parse_payload import parse_json_model_output
+from LEGIFRANCE_UTILS.payload.payload_generator import llm
+from PERF.deadline import DeadlineExceeded
+from SEARCH.text_utils import normalize_text
+
+DECOMPOSE_ENABLED = os.getenv("JERRY_DECOMPOSE", "").lower() in ("1", "true", "oui", "yes")
+
+# Modèle rapide utilisé pour la décomposition
+DECOMPOSITION_MODEL_NAME = os.getenv("JERRY_DECOMPOSITION_MODEL", "gemini-2.0-flash-lite-001")
+
+# Nombre maximal de sous-questions (chacune coûte un payload et une recherche)
+MAX_SUB_QUESTIONS = int(os.getenv("JERRY_MAX_SUB_QUESTIONS", "3"))
+
+# Longueur minimale (en mots) d'une question composée
+MIN_COMPOUND_WORDS = 8
+
+# Coordinations qui signalent une question composée (texte normalisé)
+_COMPOUND_RE = re.compile(r"\b(?:et|ainsi que|de meme que|puis|ou encore|mais aussi)\b|;|\?.*\S.*\?")
+
+DECOMPOSITION_PROMPT = """Tu prépares des recherches dans la base juridique Légifrance.
+Si la question de l'utilisateur porte sur plusieurs points de droit distincts, découpe-la en
+sous-questions indépendantes, une par point de droit.
+
+INSTRUCTIONS:
+- Chaque sous-question doit se suffire à elle-même : reprends le contexte utile (qui, quelle
+  situation, quel domaine du droit) au lieu des pronoms.
+- Ne découpe pas une notion unique ("vente et achat de biens", "code monétaire et financier")
+  ni une question dont les parties ne se comprennent qu'ensemble.
+- Au plus {max_sub_questions} sous-questions, sans ajouter de point absent de la question.
+- Réponds uniquement par un tableau JSON de chaînes. Si la question porte sur un seul point
+  de droit, réponds par un tableau contenant la question d'origine.
+
+Exemple:
+Question: Quelles sont les conditions du licenciement économique et quelles indemnités sont dues au salarié ?
+["Quelles sont les conditions du licenciement économique ?", "Quelles indemnités sont dues au salarié licencié pour motif économique ?"]
+"""
+
+
+def looks_compound(question: str) -> bool:
+    """True si la question peut porter sur plusieurs points (filtre avant l'appel au LLM)."""
+    text = normalize_text(question)
+    return len(text.split()) >= MIN_COMPOUND_WORDS and _COMPOUND_RE.search(text) is not None
+
+
+def parse_sub_questions(text: str, max_sub_questions: int = MAX_SUB_QUESTIONS) -> List[str]:
+    """
+    Sous-questions lues dans la réponse du modèle (tableau JSON, éventuellement entre balises ```json)
+
+    Returns:
+        List[str]: Sous-questions distinctes et non vides (au plus `max_sub_questions`)
+
+    Raises:
+        ValueError: Si la réponse n'est pas un tableau de chaînes
+    """
+    items = json.loads(parse_json_model_output(text).strip())
+    if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+        raise ValueError("un tableau JSON de chaînes est attendu")
+    sub_questions: List[str] = []
+    seen = set()
+    for item in items:
+        sub_question = " ".join(item.split())
+        key = normalize_text(sub_question)
+        if sub_question and key not in seen:
+            seen.add(key)
+            sub_questions.append(sub_question)
+    return sub_questions[:max_sub_questions]
+
+
+def decompose_question(question: str, max_sub_questions: int = MAX_SUB_QUESTIONS) -> List[str]:
+    """
+    Découpe une question composée en sous-questions indépendantes
+
+    Args:
+        question (str): Question de l'utilisateur
+        max_sub_questions (int): Nombre maximal de sous-questions
+
+    Returns:
+        List[str]: Les sous-questions, ou [question] si la question porte sur un seul point
+            ou si la décomposition échoue
+
+    Raises:
+        DeadlineExceeded: Si l'échéance de la requête expire pendant l'appel
+    """
+    if max_sub_questions < 2 or not looks_compound(question):
+        return [question]
+
+    messages = [
+        {"role": "model", "parts": [{"text": DECOMPOSITION_PROMPT.format(max_sub_questions=max_sub_questions)}]},
+        {"role": "user", "parts": [{"text": f"Question: {question}"}]},
+    ]
+    try:
+        response = llm.models.generate_content(model=DECOMPOSITION_MODEL_NAME, contents=messages)
+        sub_questions = parse_sub_questions(response.text or "", max_sub_questions)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"ERREUR: Décomposition de la question impossible: {e}")
+        return [question]
+
+    if len(sub_questions) < 2:
+        return [question]
+    print(f"INFO: Question décomposée en {len(sub_questions)} sous-questions: {' | '.join(sub_questions)}")
+    return sub_questions
@@ -0,0 +1,139 @@
+"""
+Recherche parallèle des sous-questions d'une question composée.
+
+Chaque sous-question reçoit son propre payload puis sa propre recherche /search ; les
+branches s'exécutent simultanément, de sorte que la durée totale est proche de celle
+de la branche la plus lente. Les documents sont ensuite fusionnés et dédupliqués
+(par cid, comme la recherche répartie par fond) pour une synthèse unique.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from PERF.deadline import DeadlineExceeded, submit_in_context
+from SEARCH.search_call import NO_RESULT_ERROR, document_key, merge_documents
+
+
+def _default_create_payload(question: str) -> str:
+    from LEGIFRANCE_UTILS.payload.payload_generator import create_payload
+
+    return create_payload(user_input=question)
+
+
+def _default_search(payload: dict, **kwargs: Any) -> Tuple[List[dict], str]:
+    from SEARCH.search_call import search_call
+
+    return search_call(payload, **kwargs)
+
+
+def _search_branch(
+    sub_question: str,
+    create_payload: Callable[[str], str],
+    search: Callable[..., Tuple[List[dict], str]],
+    search_kwargs: Dict[str, Any]
+) -> Tuple[List[dict], str]:
+    """Payload puis recherche d'une sous-question."""
+    start = time.perf_counter()
+    try:
+        payload = json.loads(create_payload(sub_question))
+    except json.JSONDecodeError:
+        return [], "Le LLM n'a pas généré de JSON valide pour l'appel à l'API."
+    if not payload:
+        return [], "Le payload JSON n'est pas valide."
+    documents, error = search(payload, **search_kwargs)
+    print(f"INFO: Sous-question « {sub_question} » : {len(documents)} document(s) en {time.perf_counter() - start:.2f}s")
+    return documents, error
+
+
+def merge_branch_results(branches: List[List[dict]]) -> List[dict]:
+    """
+    Fusionne les documents des branches en alternant les branches (premier document de
+    chaque branche, puis deuxième, etc.) : les documents les plus pertinents de chaque
+    sous-question restent en tête. Les doublons sont fusionnés dans une copie de leur première
+    occurrence : les documents des branches, partagés avec le cache des recherches, ne sont
+    pas modifiés.
+
+    Args:
+        branches (List[List[dict]]): Documents normalisés de chaque branche, par pertinence
+
+    Returns:
+        List[dict]: Documents dédupliqués
+    """
+    merged: List[dict] = []
+    by_key: Dict[str, dict] = {}
+    for rank in range(max((len(documents) for documents in branches), default=0)):
+        for documents in branches:
+            if rank >= len(documents):
+                continue
+            document = documents[rank]
+            key = document_key(document)
+            if key and key in by_key:
+                merge_documents(by_key[key], document)
+                continue
+            if key:
+                document = {**document, "sections": list(document.get("sections", []))}
+                by_key[key] = document
+            merged.append(document)
+    return merged
+
+
+def search_sub_questions(
+    sub_questions: List[str],
+    create_payload: Optional[Callable[[str], str]] = None,
+    search: Optional[Callable[..., Tuple[List[dict], str]]] = None,
+    **search_kwargs: Any
+) -> Tuple[List[dict], str]:
+    """
+    Recherche en parallèle chaque sous-question puis fusionne les documents
+
+    Args:
+        sub_questions (List[str]): Sous-questions (voir decompose_question)
+        create_payload (Optional[Callable[[str], str]]): Génération du payload d'une question
+            (défaut: create_payload ; ex: CACHE.process_cache.cached_create_payload)
+        search (Optional[Callable]): Recherche d'un payload, même signature que search_call
+            (défaut: search_call ; ex: CACHE.process_cache.cached_search_call)
+        **search_kwargs: Options de la recherche (fonds, relax...)
+
+    Returns:
+        Tuple[List[dict], str]: Documents fusionnés et dédupliqués, message d'erreur si toutes
+            les branches ont échoué (une branche sans résultat n'est pas un échec)
+
+    Raises:
+        DeadlineExceeded: Si l'échéance expire avant qu'une branche ait abouti
+    """
+    create_payload = create_payload or _default_create_payload
+    search = search or _default_search
+
+    branches: List[List[dict]] = []
+    errors: List[str] = []
+    deadline_hit: Optional[DeadlineExceeded] = None
+    with ThreadPoolExecutor(max_workers=max(1, len(sub_questions))) as executor:
+        futures = [
+            submit_in_context(executor, _search_branch, sub_question, create_payload, search, search_kwargs)
+            for sub_question in sub_questions
+        ]
+        for sub_question, future in zip(sub_questions, futures):
+            try:
+                documents, error = future.result()
+            except DeadlineExceeded as e:
+                deadline_hit = e
+                continue
+            except (requests.RequestException, ValueError) as e:
+                documents, error = [], f"Erreur de connexion: {e}"
+            if error and error != NO_RESULT_ERROR:
+                print(f"ERREUR: Sous-question « {sub_question} » : {error}")
+                errors.append(error)
+            branches.append(documents)
+
+    documents = merge_branch_results(branches)
+    if documents:
+        print(f"INFO: {len(documents)} document(s) fusionnés depuis {len(sub_questions)} sous-questions")
+        return documents, ""
+    if deadline_hit is not None:
+        raise deadline_hit
+    if errors and len(errors) == len(branches):
+        return [], errors[0]
+    return [], ""
@@ -12,9 +12,10 @@ disponibles dans la base de données Legifrance.
 """
 import requests
 from typing import Dict, List, Optional, Any, Union, Tuple
-import datetime, json, time
-# Pour récupérer le token d'authentification
-from LEGIFRANCE_UTILS.legifrance_init import obtain_legifrance_token
+import json
+# Appels authentifiés via le pool d'identifiants (token et débit gérés par identifiant)
+from LEGIFRANCE_UTILS.credential_pool import legifrance_request
+from CACHE.version_index import get_version_index, version_day
 
 # Configuration des URLs d'API
 LEGIFRANCE_BASE_URL = "https://sandbox-api.piste.gouv.fr/dila/legifrance/lf-engine-app"
@@ -38,17 +39,8 @@ def fetch_article(article_id: str) -> Optional[Article]:
         ConnectionError: En cas d'échec de connexion à l'API
     """
 
-    time.sleep(0.05)
-    
-    token = obtain_legifrance_token()
-    
-    if not token:
-        print("Échec d'authentification: impossible d'obtenir un token Legifrance")
-        return None
-    
-    # Configuration de la requête
+    # Configuration de la requête (le token est ajouté par le pool d'identifiants)
     headers = {
-        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
     }
     
@@ -56,7 +48,8 @@ def fetch_article(article_id: str) -> Optional[Article]:
     
     # Envoi de la requête
     try:
-        response = requests.post(
+        response = legifrance_request(
+            "POST",
             f"{LEGIFRANCE_BASE_URL}/consult/getArticle",
             json=payload,
             headers=headers,
@@ -163,17 +156,19 @@ def extract_text_title(article_data: Optional[Article]) -> str:
     return "Titre du texte introuvable"
 
 
-def get_article_metadata(article_id: str) -> Dict[str, str]:
+def get_article_metadata(article_id: str, article_data: Optional[Article] = None) -> Dict[str, str]:
     """
     Récupère et extrait toutes les métadonnées d'un article.
     
     Args:
         article_id (str): Identifiant technique de l'article
+        article_data (Optional[Article]): Article déjà récupéré (sinon récupéré par fetch_article)
     
     Returns:
         Dict[str, str]: Dictionnaire des métadonnées de l'article
     """
-    article_data = fetch_article(article_id)
+    if article_data is None:
+        article_data = fetch_article(article_id)
     
     if not article_data:
         return {
@@ -201,18 +196,25 @@ def get_article_metadata(article_id: str) -> Dict[str, str]:
     return metadata
 
 
-def print_article(article_id: str, short_text: bool = False) -> None:
+def print_article(article_id: str, short_text: bool = False, article_data: Optional[Article] = None) -> None:
     """
     Récupère et affiche les informations d'un article de manière formatée.
     
     Args:
         article_id (str): Identifiant technique de l'article
         short_text (bool): Si True, affiche seulement un extrait du texte (défaut: False)
+        article_data (Optional[Article]): Article déjà récupéré (sinon récupéré par fetch_article)
     
     Returns:
         None: La fonction affiche les informations sans retourner de valeur
     """
-    metadata = get_article_metadata(article_id)
+    # Un seul appel à l'API pour les métadonnées et les dates
+    if article_data is None:
+        article_data = fetch_article(article_id)
+    if not article_data:
+        print("Erreur: Article introuvable ou erreur lors de la récupération")
+        return
+    metadata = get_article_metadata(article_id, article_data)
     
     # Vérification des erreurs
     if "error" in metadata:
@@ -226,25 +228,13 @@ def print_article(article_id: str, short_text: bool = False) -> None:
     status_indicator = "[ABROGÉ] " if est_abroge else ("[INITIALE] " if est_initiale else "")
     
     # Extraire les dates importantes depuis les données de l'article (si disponibles)
-    article_data = fetch_article(article_id)
     date_debut = "Non disponible"
     date_fin = "Non disponible"
     
     if article_data and "article" in article_data:
-        # Conversion timestamp en date lisible
-        if "dateDebut" in article_data["article"]:
-            try:
-                timestamp = int(article_data["article"]["dateDebut"]) / 1000
-                date_debut = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
-            except (ValueError, TypeError):
-                date_debut = article_data["article"]["dateDebut"]
-                
-        if "dateFin" in article_data["article"]:
-            try:
-                timestamp = int(article_data["article"]["dateFin"]) / 1000
-                date_fin = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
-            except (ValueError, TypeError):
-                date_fin = article_data["article"]["dateFin"]
+        # Conversion timestamp en date lisible (jour de Paris, comme l'index des versions)
+        date_debut = version_day(article_data["article"].get("dateDebut")) or date_debut
+        date_fin = version_day(article_data["article"].get("dateFin")) or date_fin
     
     # Affichage des informations de base
     print(f">{status_indicator}ID de l'article : {metadata['article_id']}")
@@ -261,6 +251,16 @@ def print_article(article_id: str, short_text: bool = False) -> None:
         else:
             print(f">Date de fin : {date_fin if date_fin != 'Non disponible' and date_fin != date_debut else 'En vigueur'}")
     
+    # Historique des versions, depuis l'index local (sans appel à l'API)
+    index = get_version_index()
+    index.record_article(article_data)
+    versions = index.versions_of(article_id)
+    if len(versions) > 1:
+        print(">Versions de l'article :")
+        for version in versions:
+            marker = " (affichée)" if version["id"] == article_id else ""
+            print(f"  - {version['debut'] or '?'} → {version['fin'] or '?'} : {version['etat'] or '?'} {version['id']}{marker}")
+    
     
     # Préparation du texte (complet ou extrait)
     texte = metadata['texte']
@@ -0,0 +1,68 @@
+"""
+Client HTTP partagé pour les appels à l'API Legifrance (PISTE).
+
+Tous les appels (OAuth, /search, /consult) passent par ce module, qui:
+- Réutilise une session requests et son pool de connexions (TLS conservé)
+- Enregistre ou rejoue les échanges lorsqu'une cassette est active (voir PERF/cassette.py)
+- Applique à chaque appel un timeout déduit de l'échéance courante (voir PERF/deadline.py)
+- Borne les appels simultanés et les ordonne par classe de trafic (voir PERF/scheduler.py)
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+from PERF.cassette import get_active_cassette
+from PERF.deadline import DeadlineExceeded, current_stage, deadline_expired, http_timeout
+from PERF.scheduler import get_scheduler
+
+# Taille du pool de connexions (appels parallèles, par exemple la recherche répartie par fond)
+POOL_MAXSIZE = 16
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE))
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Envoie une requête HTTP via la session partagée
+    
+    L'appel attend d'abord un créneau de l'ordonnanceur "legifrance" selon la classe de
+    trafic courante. Sans timeout explicite, le timeout est ensuite le budget restant de
+    l'échéance courante, plafonné par les timeouts par défaut de PERF/deadline.py.
+    
+    Args:
+        method (str): Méthode HTTP ("GET", "POST"...)
+        url (str): URL appelée
+        **kwargs: Arguments de requests (json, data, headers, stream, timeout...)
+    
+    Returns:
+        requests.Response: La réponse (ou sa version rejouée depuis la cassette active)
+    
+    Raises:
+        DeadlineExceeded: Si l'échéance courante est passée avant ou pendant l'appel
+        requests.RequestException: En cas d'échec de l'appel (dont les timeouts hors échéance)
+    """
+    with get_scheduler("legifrance").slot():
+        return _send(method, url, **kwargs)
+
+
+def _send(method: str, url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", http_timeout())
+    cassette = get_active_cassette()
+    try:
+        if cassette is None:
+            return _session.request(method, url, **kwargs)
+        return cassette.http(method, url, kwargs, lambda: _session.request(method, url, **kwargs))
+    except (requests.Timeout, TimeoutError) as e:
+        if deadline_expired():
+            raise DeadlineExceeded(current_stage()) from e
+        if isinstance(e, requests.Timeout):
+            raise
+        raise requests.Timeout(str(e)) from e
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
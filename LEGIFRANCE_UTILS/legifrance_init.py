@@ -1,6 +1,8 @@
-import requests
 import os
 from dotenv import load_dotenv
+from typing import List, Optional, Tuple
+
+from LEGIFRANCE_UTILS import http_client
 
 # Chargement des variables d'environnement
 load_dotenv()
@@ -11,27 +13,61 @@ LEGIFRANCE_CLIENT_SECRET = os.getenv("LEGIFRANCE_CLIENT_SECRET")
 LEGIFRANCE_BASE_URL = "https://sandbox-api.piste.gouv.fr/dila/legifrance/lf-engine-app"
 LEGIFRANCE_OAUTH_URL = "https://sandbox-oauth.piste.gouv.fr/api/oauth/token"
 
+# Nombre maximal de paires d'identifiants supplémentaires lues (LEGIFRANCE_CLIENT_ID_2...)
+MAX_CREDENTIALS = 32
 
-def obtain_legifrance_token():
-    """Obtient un token OAuth pour l'API Legifrance."""
-    url = LEGIFRANCE_OAUTH_URL
-    
+
+def load_credentials() -> List[Tuple[str, str]]:
+    """
+    Paires (client_id, client_secret) configurées dans l'environnement
+
+    La paire LEGIFRANCE_CLIENT_ID / LEGIFRANCE_CLIENT_SECRET est complétée par les paires
+    numérotées LEGIFRANCE_CLIENT_ID_2 / LEGIFRANCE_CLIENT_SECRET_2, _3, etc.
+
+    Returns:
+        List[Tuple[str, str]]: Paires d'identifiants, sans doublon
+    """
+    credentials = []
+    if LEGIFRANCE_CLIENT_ID and LEGIFRANCE_CLIENT_SECRET:
+        credentials.append((LEGIFRANCE_CLIENT_ID, LEGIFRANCE_CLIENT_SECRET))
+    for number in range(2, MAX_CREDENTIALS + 1):
+        client_id = os.getenv(f"LEGIFRANCE_CLIENT_ID_{number}")
+        client_secret = os.getenv(f"LEGIFRANCE_CLIENT_SECRET_{number}")
+        if client_id and client_secret and (client_id, client_secret) not in credentials:
+            credentials.append((client_id, client_secret))
+    return credentials
+
+
+def request_token(client_id: Optional[str], client_secret: Optional[str]) -> Tuple[Optional[str], int, int]:
+    """
+    Demande un token OAuth pour une paire d'identifiants
+
+    Returns:
+        Tuple[Optional[str], int, int]: Token (ou None), durée de validité en secondes, code HTTP
+    """
     payload = {
         "grant_type": "client_credentials",
-        "client_id": LEGIFRANCE_CLIENT_ID,
-        "client_secret": LEGIFRANCE_CLIENT_SECRET,
+        "client_id": client_id,
+        "client_secret": client_secret,
         "scope": "openid"
     }
-    
+
     headers = {
         "Content-Type": "application/x-www-form-urlencoded"
     }
-    
-    response = requests.post(url, data=payload, headers=headers)
-    
+
+    response = http_client.post(LEGIFRANCE_OAUTH_URL, data=payload, headers=headers)
+
     if response.status_code == 200:
-        return response.json()["access_token"]
+        data = response.json()
+        return data["access_token"], int(data.get("expires_in", 3600)), response.status_code
     else:
         print(f"Erreur d'authentification: {response.status_code} - {response.text}")
-        return None
+        return None, 0, response.status_code
+
+
+def obtain_legifrance_token():
+    """Obtient un token OAuth pour l'API Legifrance (identifiant le moins chargé du pool)."""
+    from LEGIFRANCE_UTILS.credential_pool import get_credential_pool
 
+    return get_credential_pool().token()
@@ -0,0 +1,405 @@
+"""
+Synthèse groupée de plusieurs questions, pour les traitements hors ligne.
+
+Chaque appel à synthesize_legal_response renvoie le prompt système complet : pour une
+série de questions (fichier de questions, évaluation, remplissage du cache des réponses),
+ce module regroupe plusieurs questions et leurs documents dans un seul appel Gemini :
+1. Les questions sont réparties, dans l'ordre, en lots d'au plus `batch_size` questions et
+   `max_input_tokens` tokens estimés de documents ; une question dont les documents
+   relèvent du map-reduce (voir map_reduce.py) est synthétisée seule
+2. Le modèle rédige une réponse par question, entre des balises numérotées
+3. La réponse est découpée par question : chaque partie doit contenir "## RÉPONSE :" et
+   "## SOURCES:". Une question dont la partie manque ou est mal formée, ou dont le lot a
+   échoué, est synthétisée seule par synthesize_legal_response
+
+Les lots sont traités en parallèle, dans la limite de l'ordonnanceur "gemini".
+
+Usage:
+    python -m LEGIFRANCE_UTILS.synthetize.batch_synthesis run --questions questions.txt --output reponses.jsonl
+    python -m LEGIFRANCE_UTILS.synthetize.batch_synthesis fake --questions 12   # modèle local simulé
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from LEGIFRANCE_UTILS.synthetize import synthetize_response
+from LEGIFRANCE_UTILS.synthetize.synthetize_response import (
+    MAP_REDUCE_THRESHOLD_TOKENS, MODEL_NAME, SYSTEM_PROMPT, estimate_tokens, format_documents,
+    select_documents, synthesize_legal_response
+)
+from PERF.deadline import DeadlineExceeded, submit_in_context
+from PERF.scheduler import SERVICE_CAPACITY
+
+# Nombre maximal de questions d'un lot
+BATCH_SIZE = int(os.getenv("JERRY_SYNTHESIS_BATCH_SIZE", "4"))
+
+# Taille maximale (en tokens estimés) des documents d'un lot
+BATCH_MAX_INPUT_TOKENS = int(os.getenv("JERRY_SYNTHESIS_BATCH_TOKENS", "32000"))
+
+# Longueur maximale de la réponse d'un lot (toutes les questions du lot)
+BATCH_MAX_OUTPUT_TOKENS = 8192
+
+# Lots synthétisés simultanément
+BATCH_WORKERS = SERVICE_CAPACITY["gemini"]
+
+BATCH_PROMPT = SYSTEM_PROMPT + """
+TRAITEMENT GROUPÉ:
+Tu reçois plusieurs questions indépendantes, chacune suivie de ses propres documents.
+   - Réponds à chaque question séparément, à partir de ses seuls documents, en appliquant les instructions ci-dessus.
+   - Commence la réponse à la question n par la ligne "=== QUESTION n ===" et termine-la par la ligne "=== FIN QUESTION n ===".
+   - Chaque réponse contient ses propres sections "## RÉPONSE :" et "## SOURCES:".
+   - Réponds à toutes les questions, dans l'ordre, sans aucun texte en dehors des balises.
+"""
+
+# Balises de début et de fin d'une réponse dans la réponse d'un lot
+_ANSWER_START_RE = re.compile(r"^[ \t]*=+[ \t]*QUESTION[ \t]+(\d+)[ \t]*=+[ \t]*$", re.MULTILINE)
+_ANSWER_END_RE = re.compile(r"^[ \t]*=+[ \t]*FIN QUESTION[ \t]+\d+[ \t]*=+[ \t]*$", re.MULTILINE)
+
+# Question d'un lot dans le prompt : (position dans la liste d'origine, question, documents formatés)
+BatchItem = Tuple[int, str, str]
+
+
+def pack_batches(items: Sequence[BatchItem], batch_size: int = BATCH_SIZE,
+                 max_input_tokens: int = BATCH_MAX_INPUT_TOKENS) -> List[List[BatchItem]]:
+    """
+    Répartit les questions, dans l'ordre, en lots d'au plus `batch_size` questions et
+    `max_input_tokens` tokens estimés de documents (un lot contient au moins une question)
+    """
+    batches: List[List[BatchItem]] = []
+    current: List[BatchItem] = []
+    size = 0
+    for item in items:
+        tokens = estimate_tokens(item[2])
+        if current and (len(current) >= batch_size or size + tokens > max_input_tokens):
+            batches.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(batch: Sequence[BatchItem]) -> str:
+    """Prompt utilisateur d'un lot : chaque question numérotée, suivie de ses documents."""
+    prompt = f"Voici {len(batch)} questions, chacune suivie de ses documents juridiques pertinents.\n"
+    for number, (_, question, documents) in enumerate(batch, 1):
+        prompt += f"\n##### QUESTION {number} : {question}\n\nDocuments de la question {number} :\n{documents}"
+    prompt += (f"\nEn te basant sur les documents de chaque question, réponds aux {len(batch)} questions, "
+               f"chacune entre ses balises \"=== QUESTION n ===\" et \"=== FIN QUESTION n ===\".")
+    return prompt
+
+
+def split_batch_response(text: str, count: int) -> Dict[int, str]:
+    """
+    Découpe la réponse d'un lot par question
+
+    Args:
+        text (str): Réponse du modèle
+        count (int): Nombre de questions du lot
+
+    Returns:
+        Dict[int, str]: Réponse de chaque question (numérotées à partir de 1) dont la partie
+            est bien formée ("## RÉPONSE :" puis "## SOURCES:") ; les autres sont absentes
+    """
+    starts = list(_ANSWER_START_RE.finditer(text or ""))
+    answers: Dict[int, str] = {}
+    for position, match in enumerate(starts):
+        number = int(match.group(1))
+        if not 1 <= number <= count or number in answers:
+            continue
+        end = starts[position + 1].start() if position + 1 < len(starts) else len(text)
+        part = _ANSWER_END_RE.split(text[match.end():end], maxsplit=1)[0].strip()
+        answer_at = part.find("## RÉPONSE")
+        if answer_at < 0 or part.find("## SOURCES", answer_at) < 0:
+            continue
+        answers[number] = part[answer_at:]
+    return answers
+
+
+def _synthesize_batch(batch: Sequence[BatchItem]) -> Dict[int, str]:
+    """Réponses d'un lot, par position d'origine (questions dont la réponse est bien formée)."""
+    messages = [
+        {"role": "model", "parts": [{"text": BATCH_PROMPT}]},
+        {"role": "user", "parts": [{"text": build_batch_prompt(batch)}]},
+    ]
+    response = synthetize_response.llm.models.generate_content(
+        model=MODEL_NAME,
+        contents=messages,
+        config={"max_output_tokens": BATCH_MAX_OUTPUT_TOKENS},
+    )
+    answers = split_batch_response(response.text or "", len(batch))
+    return {batch[number - 1][0]: answer for number, answer in answers.items()}
+
+
+def synthesize_batch(
+    items: Sequence[Tuple[str, List[Dict[str, Any]]]],
+    batch_size: int = BATCH_SIZE,
+    max_input_tokens: int = BATCH_MAX_INPUT_TOKENS,
+    max_workers: int = BATCH_WORKERS
+) -> List[str]:
+    """
+    Synthétise les réponses de plusieurs questions en regroupant leurs synthèses par lots
+
+    Args:
+        items (Sequence[Tuple[str, List[Dict[str, Any]]]]): (question, métadonnées des documents)
+            de chaque question, au format de build_metadata_list
+        batch_size (int): Nombre maximal de questions d'un lot (1 : synthèses individuelles)
+        max_input_tokens (int): Taille maximale (en tokens estimés) des documents d'un lot
+        max_workers (int): Lots synthétisés simultanément
+
+    Returns:
+        List[str]: La réponse de chaque question, dans l'ordre de `items`
+
+    Raises:
+        DeadlineExceeded: Si l'échéance courante expire
+    """
+    answers: List[Optional[str]] = [None] * len(items)
+    pending: List[BatchItem] = []
+    single: List[int] = []
+    for position, (question, metadata_list) in enumerate(items):
+        documents, message = select_documents(metadata_list)
+        if message is not None:
+            answers[position] = message
+            continue
+        formatted = format_documents(documents)
+        if batch_size <= 1 or estimate_tokens(formatted) > MAP_REDUCE_THRESHOLD_TOKENS:
+            single.append(position)
+        else:
+            pending.append((position, question, formatted))
+
+    batches = pack_batches(pending, batch_size, max_input_tokens)
+    single += [batch[0][0] for batch in batches if len(batch) == 1]
+    batches = [batch for batch in batches if len(batch) > 1]
+
+    def synthesize_single(position: int) -> str:
+        return synthesize_legal_response(*items[position])
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # Lots et questions synthétisées seules, en parallèle
+        batch_futures = [submit_in_context(executor, _synthesize_batch, batch) for batch in batches]
+        single_futures = {position: submit_in_context(executor, synthesize_single, position) for position in single}
+        fallback: List[int] = []
+        for batch, future in zip(batches, batch_futures):
+            try:
+                batch_answers = future.result()
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                print(f"ERREUR: Synthèse groupée de {len(batch)} questions impossible: {e}")
+                batch_answers = {}
+            for position, _, _ in batch:
+                if position in batch_answers:
+                    answers[position] = batch_answers[position]
+                else:
+                    fallback.append(position)
+        if fallback:
+            print(f"INFO: {len(fallback)} question(s) sans réponse exploitable dans leur lot, synthétisées seules")
+
+        # Repli : synthèse individuelle des questions que le découpage n'a pas pu servir
+        single_futures.update({position: submit_in_context(executor, synthesize_single, position)
+                               for position in fallback})
+        for position, future in single_futures.items():
+            answers[position] = future.result()
+
+    batched = sum(len(batch) for batch in batches) - len(fallback)
+    print(f"INFO: Synthèse groupée : {batched} question(s) en {len(batches)} appel(s), "
+          f"{len(single_futures)} synthèse(s) individuelle(s)")
+    return answers
+
+
+class FakeBatchLLM:
+    """
+    Modèle local simulé, compatible avec llm.models.generate_content
+
+    Chaque question d'un prompt groupé reçoit une réponse qui la reprend, entre ses balises ;
+    avec une probabilité `split_failure_rate`, une réponse du lot est rendue mal formée pour
+    exercer le repli. Les appels et les tokens estimés des prompts sont comptés.
+
+    Args:
+        latency (float): Durée simulée d'un appel (secondes)
+        split_failure_rate (float): Probabilité qu'un lot contienne une réponse mal formée
+        seed (int): Graine du générateur aléatoire
+    """
+
+    _QUESTION_RE = re.compile(r"^##### QUESTION (\d+) : (.*)$", re.MULTILINE)
+
+    def __init__(self, latency: float = 0.0, split_failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.split_failure_rate = split_failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.models = self
+
+    def generate_content(self, model: str, contents: Any, **kwargs: Any) -> Any:
+        time.sleep(self.latency)
+        system, user = (message["parts"][0]["text"] for message in contents)
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(system) + estimate_tokens(user)
+        questions = self._QUESTION_RE.findall(user)
+        if not questions:
+            question = user.split("\n", 1)[0].replace("Question: ", "")
+            return SimpleNamespace(text=self._answer(question))
+        broken = self.random.randrange(len(questions)) if self.random.random() < self.split_failure_rate else None
+        parts = []
+        for index, (number, question) in enumerate(questions):
+            answer = self._answer(question)
+            if index == broken:
+                answer = answer.split("## SOURCES:")[0]
+            parts.append(f"=== QUESTION {number} ===\n{answer}\n=== FIN QUESTION {number} ===")
+        return SimpleNamespace(text="\n\n".join(parts))
+
+    @staticmethod
+    def _answer(question: str) -> str:
+        return f"## RÉPONSE :\nRéponse simulée à « {question} ».\n\n## SOURCES:\n* Code civil"
+
+
+def _gather(question: str, search_kwargs: Dict[str, Any]) -> Tuple[List[dict], Optional[str]]:
+    """Documents en vigueur d'une question (payload puis /search), ou la réponse à fournir sans synthèse."""
+    from CACHE.process_cache import cached_create_payload, cached_search_call
+    from LEGIFRANCE_UTILS.temporal.point_in_time import filter_for_question
+
+    payload = cached_create_payload(question)
+    try:
+        json_payload = json.loads(payload)
+    except ValueError:
+        return [], "Impossible de générer une synthèse. Erreur: payload invalide"
+    if not json_payload:
+        return [], "Impossible de générer une synthèse. Erreur: payload vide"
+    api_results, error = cached_search_call(json_payload, **search_kwargs)
+    if error:
+        return [], f"Impossible de générer une synthèse. Erreur: {error}"
+    if not api_results:
+        return [], "Aucun résultat juridique trouvé pour cette question."
+    api_results = filter_for_question(api_results, question)
+    if not api_results:
+        return [], "Aucun texte en vigueur trouvé pour cette question."
+    return api_results, None
+
+
+def answer_questions(questions: Sequence[str], batch_size: int = BATCH_SIZE,
+                     search_kwargs: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Répond hors ligne à une série de questions : recherches en parallèle, puis synthèse groupée
+
+    Les recherches passent par les caches du processus, en classe de trafic "batch". Les
+    réponses synthétisées sont ajoutées au cache des réponses (CACHE/answer_cache.py).
+
+    Args:
+        questions (Sequence[str]): Questions à traiter
+        batch_size (int): Nombre maximal de questions d'un lot de synthèse
+        search_kwargs (Optional[Dict[str, Any]]): Options de search_call
+
+    Returns:
+        List[str]: La réponse de chaque question, dans l'ordre
+    """
+    from CACHE.answer_cache import ANSWER_CACHE_ENABLED, answer_sources, get_answer_cache
+    from PERF.scheduler import BATCH, use_traffic_class
+    from SEARCH.metadata import build_metadata_list
+
+    with use_traffic_class(BATCH):
+        with ThreadPoolExecutor(max_workers=SERVICE_CAPACITY["legifrance"]) as executor:
+            futures = [submit_in_context(executor, _gather, question, search_kwargs or {}) for question in questions]
+            gathered = []
+            for question, future in zip(questions, futures):
+                try:
+                    gathered.append(future.result())
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    print(f"ERREUR: Recherche impossible pour « {question} »: {e}")
+                    gathered.append(([], f"Impossible de générer une synthèse. Erreur: {e}"))
+
+        to_synthesize = [position for position, (_, message) in enumerate(gathered) if message is None]
+        syntheses = synthesize_batch(
+            [(questions[position], build_metadata_list(gathered[position][0])) for position in to_synthesize],
+            batch_size=batch_size,
+        )
+
+    answers = [message or "" for _, message in gathered]
+    answer_cache = get_answer_cache() if ANSWER_CACHE_ENABLED else None
+    for position, synthesis in zip(to_synthesize, syntheses):
+        answers[position] = synthesis
+        if answer_cache is not None:
+            answer_cache.put(questions[position], synthesis, answer_sources(gathered[position][0]))
+    return answers
+
+
+def _fake_command(args: argparse.Namespace) -> int:
+    """Compare synthèses individuelles et groupées sur un modèle local simulé."""
+    from SEARCH.metadata import build_metadata_list
+    from SEARCH.search_call import normalize_search_result
+
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(os.path.join(root, "resultats_legifrance.json"), "r", encoding="utf-8") as file:
+        metadata_list = build_metadata_list([normalize_search_result(result) for result in json.load(file)["results"]])
+    items = [(f"Question simulée numéro {number}", metadata_list) for number in range(1, args.questions + 1)]
+
+    report = {}
+    for mode, batch_size in (("individuel", 1), ("groupe", args.batch_size)):
+        fake = FakeBatchLLM(latency=args.latency, split_failure_rate=args.split_failure_rate, seed=args.seed)
+        synthetize_response.llm = fake
+        start = time.perf_counter()
+        answers = synthesize_batch(items, batch_size=batch_size)
+        misattributed = sum(f"« {question} »" not in answer for (question, _), answer in zip(items, answers))
+        report[mode] = {
+            "questions": len(items),
+            "appels": fake.calls,
+            "questions_par_appel": round(len(items) / max(1, fake.calls), 2),
+            "tokens_prompt": fake.prompt_tokens,
+            "duree_s": round(time.perf_counter() - start, 3),
+            "reponses_mal_attribuees": misattributed,
+        }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if any(mode["reponses_mal_attribuees"] for mode in report.values()) else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Synthèse groupée de plusieurs questions")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Répondre aux questions d'un fichier (une par ligne)")
+    run.add_argument("--questions", required=True, help="Fichier des questions")
+    run.add_argument("--output", default=None, help="Réponses au format JSONL (défaut: sortie standard)")
+    run.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Questions par appel de synthèse")
+    run.add_argument("--relax", action="store_true", help="Recherches assouplies, comme l'application Streamlit")
+
+    fake = commands.add_parser("fake", help="Mesurer le gain sur un modèle local simulé")
+    fake.add_argument("--questions", type=int, default=12, help="Nombre de questions simulées")
+    fake.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Questions par appel de synthèse")
+    fake.add_argument("--latency", type=float, default=0.0, help="Durée simulée d'un appel (secondes)")
+    fake.add_argument("--split-failure-rate", type=float, default=0.25,
+                      help="Probabilité qu'un lot contienne une réponse mal formée")
+    fake.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "fake":
+        return _fake_command(args)
+
+    with open(args.questions, "r", encoding="utf-8") as file:
+        questions = [line.strip() for line in file if line.strip()]
+    answers = answer_questions(questions, batch_size=args.batch_size,
+                               search_kwargs={"relax": True} if args.relax else None)
+    lines = [json.dumps({"question": question, "reponse": answer}, ensure_ascii=False)
+             for question, answer in zip(questions, answers)]
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        print(f"INFO: {len(lines)} réponses écrites dans {args.output}")
+    else:
+        print("\n".join(lines))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
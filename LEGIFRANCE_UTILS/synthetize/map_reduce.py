@@ -0,0 +1,278 @@
+"""
+Synthèse map-reduce des ensembles de documents volumineux.
+
+Lorsque les documents ne tiennent pas dans un seul prompt, synthesize_legal_response
+délègue à ce module :
+1. Map : les documents sont répartis en paquets d'au plus `chunk_tokens` tokens (un
+   document trop long est découpé par extraits) ; un modèle rapide extrait de chaque
+   paquet, en parallèle, les passages utiles à la question avec leurs sources
+2. Reduce : un dernier appel rédige la réponse à partir de ces notes, au format
+   "## RÉPONSE :" / "## SOURCES:" attendu par l'application Streamlit ; si les notes
+   dépassent REDUCE_INPUT_TOKENS, elles sont d'abord regroupées et condensées par étapes
+
+Aucun document n'est écarté : `fan_out` borne le nombre de paquets résumés
+simultanément. Jusqu'à `fan_out` paquets, tous partent dans la même vague et la durée
+de la synthèse ne croît pas avec le nombre de documents ; au-delà, les paquets sont
+résumés par vagues successives.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from LEGIFRANCE_UTILS.synthetize.synthetize_response import (
+    CHARS_PER_TOKEN, MODEL_NAME, SYSTEM_PROMPT, conversation_prompt, estimate_tokens, format_document, llm
+)
+from PERF.deadline import DeadlineExceeded, submit_in_context
+from PERF.scheduler import SERVICE_CAPACITY
+
+# Modèle rapide utilisé pour résumer chaque paquet
+MAP_MODEL_NAME = os.getenv("JERRY_MAP_MODEL", "gemini-2.0-flash-lite-001")
+
+# Taille maximale (en tokens estimés) des documents d'un paquet
+CHUNK_TOKENS = int(os.getenv("JERRY_SYNTHESIS_CHUNK_TOKENS", "6000"))
+
+# Nombre maximal de paquets résumés simultanément (par défaut la capacité de
+# l'ordonnanceur "gemini", pour que les paquets d'une vague partent ensemble)
+MAP_FAN_OUT = int(os.getenv("JERRY_SYNTHESIS_FAN_OUT", str(SERVICE_CAPACITY["gemini"])))
+
+# Longueur maximale des notes d'un paquet (borne la taille du prompt final)
+MAP_MAX_OUTPUT_TOKENS = 1024
+
+# Taille maximale (en tokens estimés) des notes transmises au dernier appel ; au-delà,
+# les notes sont condensées par groupes avant la rédaction de la réponse
+REDUCE_INPUT_TOKENS = int(os.getenv("JERRY_SYNTHESIS_REDUCE_TOKENS", "8000"))
+
+# Réponse d'un paquet sans élément utile (note ignorée lors du reduce)
+NO_RELEVANT_ELEMENT = "AUCUN ÉLÉMENT PERTINENT"
+
+MAP_PROMPT = f"""Tu es un assistant juridique chargé de préparer la réponse à une question.
+Tu reçois une partie des documents juridiques trouvés ; une autre étape rédigera la réponse finale
+à partir de tes notes et de celles des autres parties.
+
+INSTRUCTIONS:
+- Relève tous les éléments des documents utiles pour répondre à la question : définitions,
+  conditions, éléments constitutifs, exceptions, sanctions, solutions jurisprudentielles.
+- Cite textuellement les passages pertinents entre guillemets.
+- Indique pour chaque élément sa source la plus précise possible : titre du texte, chapitre ou
+  section, article ou extrait (par exemple Article L.123-45).
+- Ne rédige pas la réponse à la question et n'ajoute aucune information absente des documents.
+- Si aucun document n'est utile pour la question, réponds exactement : "{NO_RELEVANT_ELEMENT}"
+"""
+
+Chunk = List[Tuple[int, Dict[str, Any]]]
+
+
+def _document_tokens(number: int, metadata: Dict[str, Any]) -> int:
+    return estimate_tokens(format_document(number, metadata))
+
+
+def _split_document(number: int, metadata: Dict[str, Any], chunk_tokens: int) -> List[Dict[str, Any]]:
+    """
+    Découpe un document plus long qu'un paquet en parties ayant chacune une partie de ses extraits
+
+    Un extrait qui dépasse à lui seul la taille d'un paquet est tronqué.
+    """
+    if _document_tokens(number, metadata) <= chunk_tokens or not metadata.get("extracts"):
+        return [metadata]
+
+    header = {key: value for key, value in metadata.items() if key != "extracts"}
+    budget = max(1, chunk_tokens - _document_tokens(number, {**header, "extracts": []}))
+    max_chars = budget * CHARS_PER_TOKEN
+    parts: List[Dict[str, Any]] = []
+    extracts: List[Dict[str, Any]] = []
+    size = 0
+    for extract in metadata["extracts"]:
+        if len(extract.get("text", "")) > max_chars:
+            extract = {**extract, "text": extract["text"][:max_chars] + "..."}
+        extract_tokens = estimate_tokens(str(extract))
+        if extracts and size + extract_tokens > budget:
+            parts.append({**header, "extracts": extracts})
+            extracts, size = [], 0
+        extracts.append(extract)
+        size += extract_tokens
+    if extracts:
+        parts.append({**header, "extracts": extracts})
+    return parts
+
+
+def chunk_documents(metadata_list: List[Dict[str, Any]], chunk_tokens: int = CHUNK_TOKENS) -> List[Chunk]:
+    """
+    Répartit les documents en paquets d'au plus `chunk_tokens` tokens estimés
+
+    Les documents sont placés dans l'ordre (les plus pertinents dans les premiers paquets)
+    et gardent leur numéro d'origine, repris dans les notes et les sources.
+
+    Args:
+        metadata_list (List[Dict[str, Any]]): Métadonnées des documents (voir build_metadata_list)
+        chunk_tokens (int): Taille maximale d'un paquet
+
+    Returns:
+        List[Chunk]: Paquets de (numéro du document, métadonnées)
+    """
+    chunks: List[Chunk] = []
+    current: Chunk = []
+    size = 0
+    for number, metadata in enumerate(metadata_list, 1):
+        for part in _split_document(number, metadata, chunk_tokens):
+            tokens = _document_tokens(number, part)
+            if current and size + tokens > chunk_tokens:
+                chunks.append(current)
+                current, size = [], 0
+            current.append((number, part))
+            size += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _extract_notes(user_prompt: str) -> Optional[str]:
+    """Notes extraites par le modèle de map pour `user_prompt` (None si aucun élément n'est utile)."""
+    messages = [
+        {"role": "model", "parts": [{"text": MAP_PROMPT}]},
+        {"role": "user", "parts": [{"text": user_prompt}]},
+    ]
+    response = llm.models.generate_content(
+        model=MAP_MODEL_NAME,
+        contents=messages,
+        config={"max_output_tokens": MAP_MAX_OUTPUT_TOKENS},
+    )
+    notes = (response.text or "").strip()
+    if not notes or notes.strip('"').startswith(NO_RELEVANT_ELEMENT):
+        return None
+    return notes
+
+
+def _map_chunk(question: str, chunk: Chunk) -> Optional[str]:
+    """Notes d'un paquet (None si aucun élément n'est utile)."""
+    user_prompt = f"Question: {question}\n\nDocuments:\n"
+    user_prompt += "".join(format_document(number, metadata) for number, metadata in chunk)
+    return _extract_notes(user_prompt)
+
+
+def _condense_notes(question: str, group: List[Tuple[int, str]]) -> Optional[str]:
+    """Notes d'un groupe de paquets, condensées en une seule note (None si aucun élément n'est utile)."""
+    user_prompt = f"Question: {question}\n\nDocuments (notes déjà extraites des documents juridiques):\n"
+    for position, chunk_notes in group:
+        user_prompt += f"\n--- NOTES DU PAQUET {position} ---\n{chunk_notes}\n" + "-" * 50 + "\n"
+    return _extract_notes(user_prompt)
+
+
+def _reduce_notes(question: str, notes: List[Tuple[int, str]], fan_out: int,
+                  max_tokens: int = REDUCE_INPUT_TOKENS) -> List[Tuple[int, str]]:
+    """
+    Condense les notes par étapes jusqu'à ce qu'elles tiennent dans `max_tokens` tokens estimés
+
+    Les notes sont regroupées dans l'ordre en groupes d'au plus `max_tokens` tokens ; chaque
+    groupe est condensé en une note (groupes traités en parallèle, par vagues de `fan_out`).
+    Un groupe dont la condensation échoue garde ses notes d'origine, tronquées à sa part.
+    """
+    while len(notes) > 1 and sum(estimate_tokens(chunk_notes) for _, chunk_notes in notes) > max_tokens:
+        groups: List[List[Tuple[int, str]]] = [[]]
+        size = 0
+        for note in notes:
+            tokens = estimate_tokens(note[1])
+            if groups[-1] and size + tokens > max_tokens:
+                groups.append([])
+                size = 0
+            groups[-1].append(note)
+            size += tokens
+        if len(groups) == len(notes):
+            # Chaque note dépasse déjà seule la taille d'un groupe : regroupement par deux
+            groups = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+        print(f"INFO: Condensation de {len(notes)} notes en {len(groups)} groupes.")
+        condensed: List[Tuple[int, str]] = []
+        with ThreadPoolExecutor(max_workers=max(1, min(fan_out, len(groups)))) as executor:
+            futures = [submit_in_context(executor, _condense_notes, question, group) for group in groups]
+            for group, future in zip(groups, futures):
+                try:
+                    group_notes = future.result()
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    print(f"ERREUR: Condensation des notes impossible: {e}")
+                    share = max(1, max_tokens // len(groups)) * CHARS_PER_TOKEN
+                    group_notes = "\n\n".join(chunk_notes for _, chunk_notes in group)[:share]
+                if group_notes:
+                    condensed.append((group[0][0], group_notes))
+        notes = condensed
+    return notes
+
+
+def map_reduce_synthesis(
+    question: str,
+    metadata_list: List[Dict[str, Any]],
+    chunk_tokens: int = CHUNK_TOKENS,
+    fan_out: int = MAP_FAN_OUT,
+    context: Optional[str] = None
+) -> str:
+    """
+    Synthétise une réponse juridique en résumant les documents par paquets en parallèle
+
+    Args:
+        question (str): La question juridique posée par l'utilisateur
+        metadata_list (List[Dict[str, Any]]): Métadonnées des documents, par pertinence décroissante
+        chunk_tokens (int): Taille maximale (en tokens estimés) des documents d'un paquet
+        fan_out (int): Nombre maximal de paquets résumés simultanément (les autres attendent
+            la vague suivante ; aucun paquet n'est écarté)
+        context (Optional[str]): Échanges précédents d'une conversation, rappelés dans
+            le prompt de la réponse finale
+
+    Returns:
+        str: La réponse synthétisée ("## RÉPONSE :" ... "## SOURCES:")
+
+    Raises:
+        DeadlineExceeded: Si l'échéance de la requête expire (l'appelant fournit la réponse partielle)
+    """
+    chunks = chunk_documents(metadata_list, chunk_tokens)
+    waves = -(-len(chunks) // max(1, fan_out))
+    print(f"INFO: Synthèse map-reduce de {len(metadata_list)} documents en {len(chunks)} paquets "
+          f"({waves} vague(s) de {fan_out} au plus).")
+
+    # Map : les paquets en parallèle, par vagues de `fan_out`
+    notes: List[Tuple[int, str]] = []
+    errors: List[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(fan_out, len(chunks)))) as executor:
+        futures = [submit_in_context(executor, _map_chunk, question, chunk) for chunk in chunks]
+        for position, future in enumerate(futures, 1):
+            try:
+                chunk_notes = future.result()
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                print(f"ERREUR: Résumé du paquet {position} impossible: {e}")
+                errors.append(str(e))
+                continue
+            if chunk_notes:
+                notes.append((position, chunk_notes))
+
+    if errors and len(errors) == len(chunks):
+        return f"Impossible de générer une synthèse. Erreur: {errors[0]}"
+
+    # Les notes trop volumineuses pour le dernier appel sont condensées par étapes
+    notes = _reduce_notes(question, notes, fan_out)
+
+    # Reduce : réponse finale à partir des notes
+    user_prompt = conversation_prompt(context) + f"""Question: {question}
+
+Voici les notes extraites des documents juridiques pertinents (répartis en {len(chunks)} paquets).
+Chaque note cite textuellement les documents et indique leurs sources :
+
+"""
+    for position, chunk_notes in notes:
+        user_prompt += f"\n--- NOTES DU PAQUET {position} ---\n{chunk_notes}\n" + "-" * 50 + "\n"
+    if not notes:
+        user_prompt += "\nAucun document ne contient d'élément utile pour cette question.\n"
+    user_prompt += f"\nEn te basant sur ces notes, réponds à la question: {question}"
+
+    messages = [
+        {"role": "model", "parts": [{"text": SYSTEM_PROMPT}]},
+        {"role": "user", "parts": [{"text": user_prompt}]},
+    ]
+    try:
+        response = llm.models.generate_content(model=MODEL_NAME, contents=messages)
+        return response.text
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"Erreur lors de l'appel au LLM: {e}")
+        return f"Impossible de générer une synthèse. Erreur: {str(e)}"
@@ -6,8 +6,11 @@ Ce module fournit une fonction unique pour:
 - Générer une synthèse cohérente en réponse à une question juridique
 - Utiliser le modèle Gemini pour formuler des réponses précises
 """
-from typing import Dict, List, Any
+import os
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from LLM.init_gemini import initialize_gemini
+from LLM.usage import current_budget
+from PERF.deadline import DeadlineExceeded
 
 
 # Variable pour contrôler les limites du prompt
@@ -16,37 +19,13 @@ MAX_TEXT_LENGTH = 3000  # Longueur maximale du texte par document
 
 MODEL_NAME = "gemini-2.0-flash-001"
 
-# Initialiser le modèle LLM
-llm = initialize_gemini(MODEL_NAME)
+# Au-delà de ce nombre estimé de tokens de documents, la synthèse passe en map-reduce
+# (voir map_reduce.py) : les documents sont résumés par paquets en parallèle
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("JERRY_MAP_REDUCE_THRESHOLD_TOKENS", "12000"))
+CHARS_PER_TOKEN = 4  # Estimation du nombre de caractères par token
 
-def synthesize_legal_response(question: str, metadata_list: List[Dict[str, Any]]) -> str:
-    """
-    Fonction unique qui synthétise une réponse juridique à partir des métadonnées des documents
-    
-    Args:
-        question (str): La question juridique posée par l'utilisateur
-        metadata_list (List[Dict[str, Any]]): Liste des métadonnées des documents JURI
-    
-    Returns:
-        str: La réponse synthétisée par le LLM
-    """
-    # Vérification des entrées
-    if not metadata_list or len(metadata_list) == 0:
-        return "Aucun document juridique trouvé pour répondre à cette question."
-    
-    # Filtrer les métadonnées avec erreur
-    valid_metadata = [meta for meta in metadata_list if "error" not in meta]
-    
-    # Vérifier si des métadonnées valides ont été récupérées
-    if not valid_metadata:
-        return "Aucun document juridique valide trouvé parmi les documents fournis."
-    
-    # Limiter à un maximum de documents pour éviter de surcharger le contexte
-    
-    metadata_list = valid_metadata
-    
-    # Construction du prompt pour le LLM
-    system_prompt = """Tu es un assistant juridique spécialisé qui fournit des réponses précises et factuelles.
+# Prompt système de la synthèse
+SYSTEM_PROMPT = """Tu es un assistant juridique spécialisé qui fournit des réponses précises et factuelles.
 Ton rôle est d'analyser attentivement les documents juridiques fournis pour répondre à la question posée.
 
 IMPORTANT: Les documents contiennent les extraits dans la clé extract. 
@@ -82,43 +61,223 @@ INSTRUCTIONS D'ANALYSE ET DE RÉPONSE:
 
 IMPORTANT: Ne commence JAMAIS ta réponse par "Les documents fournis ne contiennent pas" ou toute autre formulation signalant l'insuffisance des documents. Réponds directement à la question avec tes connaissances juridiques si les documents sont insuffisants.
 """
-    
-    user_prompt = f"""Question: {question}
 
-Voici les documents juridiques pertinents:
+# Initialiser le modèle LLM
+llm = initialize_gemini(MODEL_NAME)
 
-"""
+
+def estimate_tokens(text: str) -> int:
+    """Estimation du nombre de tokens d'un texte (CHARS_PER_TOKEN caractères par token)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_document(index: int, metadata: Dict[str, Any]) -> str:
+    """
+    Formate un document pour le prompt de synthèse
     
-    # Formater les métadonnées pour le prompt
-    for i, metadata in enumerate(metadata_list, 1):
-        user_prompt += f"\n--- DOCUMENT {i} ---\n"
-        
-        # Ajouter d'abord les métadonnées descriptives
-        meta_descriptives = {k: v for k, v in metadata.items() if k != "texte"}
-        for key, value in meta_descriptives.items():
-            user_prompt += f"{key}: {value}\n"
+    Args:
+        index (int): Numéro du document dans le prompt
+        metadata (Dict[str, Any]): Métadonnées du document
+    
+    Returns:
+        str: Bloc "--- DOCUMENT i ---" (métadonnées puis contenu)
+    """
+    block = f"\n--- DOCUMENT {index} ---\n"
+    
+    # Ajouter d'abord les métadonnées descriptives
+    meta_descriptives = {k: v for k, v in metadata.items() if k != "texte"}
+    for key, value in meta_descriptives.items():
+        block += f"{key}: {value}\n"
+    
+    # Ajouter ensuite le texte avec une indication claire
+    if "texte" in metadata and metadata["texte"]:
+        text_content = metadata["texte"]
         
-        # Ajouter ensuite le texte avec une indication claire
-        if "texte" in metadata and metadata["texte"]:
-            text_content = metadata["texte"]
+        # Limiter le texte pour éviter de dépasser les limites du contexte
+        if len(text_content) > MAX_TEXT_LENGTH:
+            text_content = text_content[:MAX_TEXT_LENGTH] + "..."
             
-            # Limiter le texte pour éviter de dépasser les limites du contexte
-            if len(text_content) > MAX_TEXT_LENGTH:
-                text_content = text_content[:MAX_TEXT_LENGTH] + "..."
-                
-            user_prompt += f"\nCONTENU DU DOCUMENT:\n{text_content}\n"
-        else:
-            user_prompt += "\nAucun contenu textuel disponible pour ce document.\n"
-            
-        user_prompt += "\n" + "-" * 50 + "\n"
+        block += f"\nCONTENU DU DOCUMENT:\n{text_content}\n"
+    else:
+        block += "\nAucun contenu textuel disponible pour ce document.\n"
+        
+    block += "\n" + "-" * 50 + "\n"
+    return block
+
+
+def format_documents(metadata_list: List[Dict[str, Any]]) -> str:
+    """Formate tous les documents pour le prompt de synthèse (numérotés à partir de 1)."""
+    return "".join(format_document(i, metadata) for i, metadata in enumerate(metadata_list, 1))
+
+
+def _shortened(text: str, build: Callable[[str], Dict[str, Any]], index: int, max_tokens: int) -> Optional[Dict[str, Any]]:
+    """Document construit par `build` avec le plus long début de `text` qui tient dans le budget (None si aucun)."""
+    length = len(text)
+    while length > 0:
+        document = build(text[:length] + "...")
+        overflow = estimate_tokens(format_document(index, document)) - max_tokens
+        if overflow <= 0:
+            return document
+        length -= max(overflow, 1) * CHARS_PER_TOKEN
+    return None
+
+
+def truncate_document(index: int, metadata: Dict[str, Any], max_tokens: int) -> Dict[str, Any]:
+    """
+    Copie du document réduite pour tenir dans `max_tokens` tokens estimés
+    
+    Les extraits (voir SEARCH.metadata.build_metadata_list) sont retenus dans l'ordre, le
+    premier qui dépasse le budget étant tronqué (comme dans map_reduce._split_document) et
+    les suivants écartés ; le texte complet éventuel (clé "texte") est tronqué de même.
+    Si les métadonnées seules dépassent le budget, extraits et texte sont retirés.
+    
+    Args:
+        index (int): Numéro du document dans le prompt
+        metadata (Dict[str, Any]): Métadonnées du document (non modifiées)
+        max_tokens (int): Budget de tokens estimés du document
+    
+    Returns:
+        Dict[str, Any]: Le document tronqué
+    """
+    truncated = dict(metadata)
+    if metadata.get("extracts"):
+        kept: List[Dict[str, Any]] = []
+        for extract in metadata["extracts"]:
+            candidate = {**truncated, "extracts": kept + [extract]}
+            if estimate_tokens(format_document(index, candidate)) <= max_tokens:
+                kept.append(extract)
+                continue
+            shortened = _shortened(
+                extract.get("text") or "",
+                lambda text: {**truncated, "extracts": kept + [{**extract, "text": text}]},
+                index, max_tokens
+            )
+            if shortened is not None:
+                kept = shortened["extracts"]
+            break
+        truncated["extracts"] = kept
+    
+    if truncated.get("texte") and estimate_tokens(format_document(index, truncated)) > max_tokens:
+        base = truncated
+        truncated = _shortened(
+            base["texte"][:MAX_TEXT_LENGTH], lambda text: {**base, "texte": text}, index, max_tokens
+        ) or {**base, "texte": ""}
+    return truncated
+
+
+def cap_documents(metadata_list: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
+    """
+    Documents les plus pertinents tenant dans `max_tokens` tokens estimés
+    
+    Les documents sont retenus dans l'ordre jusqu'au premier qui dépasse le budget ;
+    le premier document est toujours retenu, ses extraits étant tronqués (sur une copie,
+    voir truncate_document) s'il dépasse à lui seul le budget.
+    
+    Args:
+        metadata_list (List[Dict[str, Any]]): Métadonnées des documents, par pertinence décroissante
+        max_tokens (int): Budget de tokens estimés des documents
     
+    Returns:
+        List[Dict[str, Any]]: Les documents retenus
+    """
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for index, metadata in enumerate(metadata_list, 1):
+        tokens = estimate_tokens(format_document(index, metadata))
+        if kept and used + tokens > max_tokens:
+            break
+        if not kept and tokens > max_tokens:
+            metadata = truncate_document(index, metadata, max_tokens)
+            tokens = estimate_tokens(format_document(index, metadata))
+        kept.append(metadata)
+        used += tokens
+    return kept
+
+
+def select_documents(metadata_list: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Documents transmis à la synthèse : sans erreur et, si le budget LLM de la requête limite
+    les tokens d'entrée de la synthèse (voir LLM/usage.py), dans la limite de ce budget
+    
+    Args:
+        metadata_list (List[Dict[str, Any]]): Métadonnées des documents, par pertinence décroissante
+    
+    Returns:
+        Tuple[List[Dict[str, Any]], Optional[str]]: Les documents retenus, et la réponse à
+            fournir à la place de la synthèse s'il n'en reste aucun
+    """
+    # Vérification des entrées
+    if not metadata_list or len(metadata_list) == 0:
+        return [], "Aucun document juridique trouvé pour répondre à cette question."
+    
+    # Filtrer les métadonnées avec erreur
+    valid_metadata = [meta for meta in metadata_list if "error" not in meta]
+    
+    # Vérifier si des métadonnées valides ont été récupérées
+    if not valid_metadata:
+        return [], "Aucun document juridique valide trouvé parmi les documents fournis."
+    
+    metadata_list = valid_metadata
+    
+    # Limiter les documents au budget de tokens d'entrée de la requête
+    budget = current_budget()
+    if budget is not None and budget.max_synthesis_input_tokens:
+        kept = cap_documents(metadata_list, budget.max_synthesis_input_tokens)
+        if len(kept) < len(metadata_list):
+            print(f"INFO: Budget de synthèse : {len(kept)} document(s) retenus sur {len(metadata_list)} "
+                  f"({budget.max_synthesis_input_tokens} tokens)")
+        metadata_list = kept
+    return metadata_list, None
+
+
+def conversation_prompt(context: Optional[str]) -> str:
+    """Début du prompt de synthèse rappelant les échanges précédents (vide sans contexte)."""
+    if not context:
+        return ""
+    return f"Échanges précédents de la conversation :\n{context}\n\n"
+
+
+def synthesize_legal_response(question: str, metadata_list: List[Dict[str, Any]], context: Optional[str] = None) -> str:
+    """
+    Fonction unique qui synthétise une réponse juridique à partir des métadonnées des documents
+    
+    Si les documents dépassent MAP_REDUCE_THRESHOLD_TOKENS, ils sont résumés par paquets
+    en parallèle puis synthétisés en une réponse finale (voir map_reduce.py). Si le budget
+    LLM de la requête limite les tokens d'entrée de la synthèse (voir LLM/usage.py), les
+    documents les moins pertinents au-delà de cette limite sont écartés.
+    
+    Args:
+        question (str): La question juridique posée par l'utilisateur
+        metadata_list (List[Dict[str, Any]]): Liste des métadonnées des documents JURI
+        context (Optional[str]): Échanges précédents d'une conversation, placés avant la
+            question pour qu'une question de suivi ("Et s'il est émancipé ?") soit comprise
+    
+    Returns:
+        str: La réponse synthétisée par le LLM
+    """
+    metadata_list, message = select_documents(metadata_list)
+    if message is not None:
+        return message
+    
+    # Les documents trop volumineux pour un seul prompt sont traités en map-reduce
+    documents = format_documents(metadata_list)
+    if estimate_tokens(documents) > MAP_REDUCE_THRESHOLD_TOKENS:
+        from LEGIFRANCE_UTILS.synthetize.map_reduce import map_reduce_synthesis
+        return map_reduce_synthesis(question, metadata_list, context=context)
+    
+    user_prompt = conversation_prompt(context) + f"""Question: {question}
+
+Voici les documents juridiques pertinents:
+
+"""
+    user_prompt += documents
     user_prompt += f"\nEn te basant sur ces documents juridiques, réponds à la question: {question}"
     
     # Créer les messages pour l'appel au LLM
     messages = [
         {
             "role": "model",
-            "parts": [{"text": system_prompt}]
+            "parts": [{"text": SYSTEM_PROMPT}]
         },
         {
             "role": "user", 
@@ -133,11 +292,45 @@ Voici les documents juridiques pertinents:
             contents=messages
         )
         return response.text
+    except DeadlineExceeded:
+        # L'appelant décide de la réponse partielle à fournir
+        raise
     except Exception as e:
         print(f"Erreur lors de l'appel au LLM: {e}")
         return f"Impossible de générer une synthèse. Erreur: {str(e)}"
 
 
+def format_unsynthesized_response(metadata_list: List[Dict[str, Any]], max_extracts: int = 2) -> str:
+    """
+    Réponse partielle sans synthèse : liste des documents trouvés et de leurs premiers extraits
+    
+    Utilisée lorsque l'échéance de la requête ne laisse pas le temps de générer la synthèse.
+    
+    Args:
+        metadata_list (List[Dict[str, Any]]): Métadonnées des documents (voir build_metadata_list)
+        max_extracts (int): Nombre maximal d'extraits affichés par document
+    
+    Returns:
+        str: Réponse au format Markdown
+    """
+    lines = [
+        "## RÉPONSE PARTIELLE :",
+        "La synthèse n'a pas pu être générée dans le délai imparti. Voici les documents trouvés :",
+        "",
+    ]
+    for metadata in metadata_list:
+        lines.append(f"* **{metadata.get('title', 'Titre non disponible')}** ({metadata.get('origin') or 'origine inconnue'})")
+        for extract in metadata.get("extracts", [])[:max_extracts]:
+            text = extract.get("text", "")
+            if len(text) > 300:
+                text = text[:300] + "..."
+            label = extract.get("title") or extract.get("section_title") or "Extrait"
+            lines.append(f"    * {label} : {text}")
+    lines += ["", "## SOURCES:"]
+    lines += [f"* {metadata.get('title', 'Titre non disponible')}" for metadata in metadata_list]
+    return "\n".join(lines)
+
+
 if __name__ == "__main__":
     # Exemple d'utilisation
     test_question = "Quels sont les droits d'un locataire en cas de préavis réduit?"
@@ -0,0 +1,4 @@
+"""
+Questions portant sur le droit applicable à une date ("quelle était la règle en 2015")
+et filtrage des extraits selon leur vigueur, avant la synthèse.
+"""
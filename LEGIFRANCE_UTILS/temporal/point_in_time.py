@@ -0,0 +1,157 @@
+"""
+Droit applicable à une date.
+
+Ce module fournit:
+- La détection de la période visée par une question : un jour ("au 1er janvier 2015",
+  "le 12/03/2015"), un mois ("en mars 2015") ou une année ("en 2015", "avant 2015"
+  s'entend de l'année qui précède) ; sans période, la question porte sur le droit actuel
+- Le filtrage des extraits de recherche par l'index local des versions
+  (CACHE/version_index.py) : /search renvoie le plus souvent la version actuelle d'un
+  article ; un extrait qui n'était pas en vigueur pendant la période (aujourd'hui par
+  défaut) est remplacé par la version de l'article en vigueur pendant la période, et
+  n'est écarté que si aucune version connue ne la couvre
+"""
+import datetime
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from CACHE.process_cache import cached_fetch_article
+from CACHE.version_index import ArticleVersionIndex, get_version_index
+from PERF.deadline import DeadlineExceeded, submit_in_context
+from SEARCH.text_utils import normalize_text
+
+Period = Tuple[datetime.date, datetime.date]
+
+MONTHS = {
+    "janvier": 1, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6, "juillet": 7,
+    "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11, "decembre": 12,
+}
+_MONTHS = "|".join(MONTHS)
+_YEAR = r"(1[89]\d\d|20\d\d)(?![\d-])"
+
+# Formes reconnues, de la plus précise à la moins précise (texte normalisé). Un jour doit
+# suivre une préposition temporelle : "la loi du 6 aout 2015" désigne un texte, pas une date
+_DAY_PREFIX = r"\b(?:au|le|a la date du|en date du|jusqu'au) "
+_DAY_NUMERIC_RE = re.compile(_DAY_PREFIX + r"(\d{1,2})[/.-](\d{1,2})[/.-]" + _YEAR)
+_DAY_RE = re.compile(_DAY_PREFIX + r"(\d{1,2})(?:er)? (" + _MONTHS + r") " + _YEAR)
+_MONTH_RE = re.compile(r"\b(?:en|de|au mois de|courant|fin|debut) (" + _MONTHS + r") " + _YEAR)
+_BEFORE_YEAR_RE = re.compile(r"\bavant (?:l'annee )?" + _YEAR)
+_YEAR_RE = re.compile(r"\b(?:en|au cours de|courant|durant|pendant|vers|jusqu'en|de l'annee|l'annee) " + _YEAR)
+
+
+# Récupérations simultanées des versions de remplacement
+MAX_VERSION_FETCHES = 4
+
+
+def _month_period(year: int, month: int) -> Period:
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + (month == 12), month % 12 + 1, 1)
+    return start, end
+
+
+def question_period(question: str) -> Optional[Period]:
+    """
+    Période visée par une question
+
+    Args:
+        question (str): Question de l'utilisateur
+
+    Returns:
+        Optional[Period]: (début, fin exclue), ou None si la question porte sur le droit actuel
+    """
+    text = normalize_text(question)
+    try:
+        match = _DAY_NUMERIC_RE.search(text)
+        if match:
+            start = datetime.date(int(match.group(3)), int(match.group(2)), int(match.group(1)))
+            return start, start + datetime.timedelta(days=1)
+        match = _DAY_RE.search(text)
+        if match:
+            start = datetime.date(int(match.group(3)), MONTHS[match.group(2)], int(match.group(1)))
+            return start, start + datetime.timedelta(days=1)
+    except ValueError:
+        return None
+    match = _MONTH_RE.search(text)
+    if match:
+        return _month_period(int(match.group(2)), MONTHS[match.group(1)])
+    match = _BEFORE_YEAR_RE.search(text)
+    if match:
+        year = int(match.group(1)) - 1
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    match = _YEAR_RE.search(text)
+    if match and int(match.group(1)) < datetime.date.today().year:
+        year = int(match.group(1))
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    return None
+
+
+def version_extract(extract: dict, version: Dict[str, Optional[str]]) -> Optional[dict]:
+    """
+    Extrait de recherche portant le texte de `version` (récupéré par /consult/getArticle, en cache)
+
+    Returns:
+        Optional[dict]: L'extrait de remplacement, ou None si le texte de la version est indisponible
+    """
+    article_data = cached_fetch_article(version["id"])
+    article = (article_data or {}).get("article") or {}
+    if not article.get("texte"):
+        return None
+    return {
+        **extract,
+        "id": article.get("id") or version["id"],
+        "num": article.get("num") or extract.get("num"),
+        "legalStatus": article.get("etat") or version["etat"],
+        "values": [article["texte"]],
+    }
+
+
+def _prefetch_versions(version_ids: List[str]) -> None:
+    """Récupère en parallèle des versions d'articles (cache des articles et index des versions)."""
+    if not version_ids:
+        return
+    with ThreadPoolExecutor(max_workers=min(MAX_VERSION_FETCHES, len(version_ids))) as executor:
+        futures = [submit_in_context(executor, cached_fetch_article, version_id) for version_id in version_ids]
+        for version_id, future in zip(version_ids, futures):
+            try:
+                future.result()
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                print(f"ERREUR: Récupération de la version {version_id} impossible: {e}")
+
+
+def filter_for_question(api_results: List[dict], question: str,
+                        index: Optional[ArticleVersionIndex] = None) -> List[dict]:
+    """
+    Enregistre l'état et l'intervalle de vigueur des extraits dans l'index des versions
+    (voir ArticleVersionIndex.record_results) puis remplace ceux qui n'étaient
+    pas en vigueur pendant la période visée par la question par la version alors en vigueur
+    (écartés si aucune version connue ne couvre la période)
+
+    Args:
+        api_results (List[dict]): Documents normalisés renvoyés par search_call
+        question (str): Question de l'utilisateur
+        index (Optional[ArticleVersionIndex]): Index des versions (défaut: index du processus)
+
+    Returns:
+        List[dict]: Documents filtrés (copiés si leurs extraits ont changé)
+    """
+    index = index or get_version_index()
+    index.record_results(api_results)
+    period = question_period(question)
+    start, end = period if period else (None, None)
+    # Articles jamais récupérés : /consult/getArticle fait connaître leurs autres versions
+    _prefetch_versions(index.unknown_versions(api_results, start, end))
+    _prefetch_versions(index.replacements_needed(api_results, start, end))
+    filtered, removed, replaced = index.filter_results(api_results, start, end, replace=version_extract)
+    if removed or replaced:
+        if period is None:
+            when = "aujourd'hui"
+        elif end - start == datetime.timedelta(days=1):
+            when = f"au {start.isoformat()}"
+        else:
+            when = f"du {start.isoformat()} au {(end - datetime.timedelta(days=1)).isoformat()}"
+        print(f"INFO: Extraits hors vigueur {when} : {replaced} remplacé(s) par la version alors en vigueur, "
+              f"{removed} écarté(s), {len(filtered)} document(s) conservé(s)")
+    return filtered
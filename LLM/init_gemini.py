@@ -1,16 +1,84 @@
 import os 
+import time
 from dotenv import load_dotenv
 from google import genai
 from LLM.env_variable_loader import load_var_env
-from typing import Optional
+from PERF.cassette import get_active_cassette, is_replaying
+from PERF.deadline import DeadlineExceeded, current_stage, deadline_expired, llm_timeout
+from PERF.scheduler import get_scheduler
+from LLM.usage import record_call, select_model
+from typing import Any, Optional
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get the Google API key from environment variables
-GEMINI_API_KEY = load_var_env("GEMINI_API_KEY")
+# Get the Google API key from environment variables (inutile lors du rejeu d'une cassette)
+if is_replaying() and os.getenv("GEMINI_API_KEY") is None:
+    GEMINI_API_KEY = "cassette-replay"
+else:
+    GEMINI_API_KEY = load_var_env("GEMINI_API_KEY")
 
-def initialize_gemini(model: str,GOOGLE_API_KEY:Optional[str] = GEMINI_API_KEY) -> genai.Client:
+
+class _GeminiModels:
+    """
+    Proxy de client.models : enregistre ou rejoue generate_content si une cassette est active,
+    et borne chaque appel par le budget restant de l'échéance courante (voir PERF/deadline.py).
+    Les appels attendent un créneau de l'ordonnanceur "gemini" (voir PERF/scheduler.py).
+    Les tokens et la durée de chaque appel sont comptabilisés, et le modèle est rétrogradé
+    si la requête courante a dépassé son budget (voir LLM/usage.py).
+    """
+    def __init__(self, models: Any):
+        self._models = models
+
+    def generate_content(self, model: str, contents: Any, **kwargs: Any) -> Any:
+        model = select_model(model)
+        with get_scheduler("gemini").slot():
+            start = time.perf_counter()
+            response = self._generate_content(model, contents, **kwargs)
+            record_call(model, response, time.perf_counter() - start, current_stage())
+            return response
+
+    def _generate_content(self, model: str, contents: Any, **kwargs: Any) -> Any:
+        timeout = llm_timeout()
+        config = kwargs.get("config")
+        if config is None or (isinstance(config, dict) and "http_options" not in config):
+            # Timeout de la requête HTTP sous-jacente, en millisecondes
+            kwargs["config"] = {**(config or {}), "http_options": {"timeout": int(timeout * 1000)}}
+        try:
+            cassette = get_active_cassette()
+            if cassette is None:
+                return self._models.generate_content(model=model, contents=contents, **kwargs)
+            return cassette.gemini(
+                model, contents,
+                lambda: self._models.generate_content(model=model, contents=contents, **kwargs),
+                timeout=timeout
+            )
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            # Un échec survenu après l'échéance est un dépassement, quelle que soit sa forme
+            if deadline_expired():
+                raise DeadlineExceeded(current_stage()) from e
+            raise
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._models, name)
+
+
+class GeminiClient:
+    """
+    Client Gemini utilisé par le projet : délègue à genai.Client, à l'exception de
+    models.generate_content qui passe par la cassette active (voir PERF/cassette.py).
+    """
+    def __init__(self, client: genai.Client):
+        self._client = client
+        self.models = _GeminiModels(client.models)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+def initialize_gemini(model: str,GOOGLE_API_KEY:Optional[str] = GEMINI_API_KEY) -> GeminiClient:
     """
     Initialisez le modèle Gemini avec les paramètres spécifiés.
     """
@@ -18,7 +86,7 @@ def initialize_gemini(model: str,GOOGLE_API_KEY:Optional[str] = GEMINI_API_KEY)
     client = genai.Client(
         api_key=GEMINI_API_KEY)
     
-    return client
+    return GeminiClient(client)
 
 if __name__ == "__main__":
     """Exemple d'utilisation de la fonction initialize_gemini."""
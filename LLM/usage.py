@@ -0,0 +1,289 @@
+"""
+Comptabilité des tokens Gemini et budgets par requête.
+
+Chaque appel generate_content fait par le client du projet (LLM.init_gemini) est
+enregistré : modèle, étape du pipeline, tokens d'entrée, de sortie et lus depuis le
+cache de contexte, durée de l'appel et coût estimé. Les consommations sont agrégées:
+- par requête : `RequestUsage`, actif pour le contexte courant (use_request_usage) et
+  transmis aux threads lancés avec submit_in_context
+- par session utilisateur et par jour : `usage_metrics()` (barre latérale Streamlit,
+  rapport du test de charge, commande :tokens du mode interactif)
+
+Un budget (`UsageBudget`) peut être associé à la requête:
+- `max_synthesis_input_tokens` : les documents les moins pertinents sont écartés de la
+  synthèse au-delà de ce nombre de tokens estimés, et le texte du plus pertinent est tronqué
+  s'il le dépasse à lui seul (voir synthesize_legal_response)
+- `max_request_tokens` / `max_request_cost` : une fois dépassés, les appels suivants de
+  la requête utilisent le modèle moins coûteux `fallback_model`
+
+Usage:
+    usage = RequestUsage(UsageBudget(max_synthesis_input_tokens=8000), session="cli")
+    search_legifrance(question, llm_usage=usage)
+    print(usage.as_dict())
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Prix indicatifs en dollars par million de tokens : (entrée, sortie, entrée lue en cache).
+# JERRY_LLM_PRICES (JSON, même format) complète ou remplace ces valeurs.
+PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gemini-2.0-flash-001": (0.10, 0.40, 0.025),
+    "gemini-2.0-flash-lite-001": (0.075, 0.30, 0.01875),
+}
+PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("JERRY_LLM_PRICES", "{}")).items()})
+
+# Budget par défaut des requêtes (0 : pas de limite)
+MAX_SYNTHESIS_INPUT_TOKENS = int(os.getenv("JERRY_MAX_SYNTHESIS_INPUT_TOKENS", "0"))
+MAX_REQUEST_TOKENS = int(os.getenv("JERRY_LLM_MAX_REQUEST_TOKENS", "0"))
+MAX_REQUEST_COST = float(os.getenv("JERRY_LLM_MAX_REQUEST_COST", "0"))
+FALLBACK_MODEL = os.getenv("JERRY_LLM_FALLBACK_MODEL", "gemini-2.0-flash-lite-001")
+
+# Nombre maximal de sessions et de jours conservés dans les agrégats
+MAX_SESSIONS = 1000
+MAX_DAYS = 31
+
+
+def call_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """Coût estimé d'un appel, en dollars (None si le prix du modèle est inconnu)."""
+    price = PRICES.get(model)
+    if price is None:
+        return None
+    fresh_input = max(0, input_tokens - cached_tokens)
+    return (fresh_input * price[0] + output_tokens * price[1] + cached_tokens * price[2]) / 1_000_000
+
+
+class UsageTotals:
+    """Cumul des appels : nombre, tokens, durée et coût estimé."""
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.latency = 0.0
+        self.cost = 0.0
+        self.unpriced_calls = 0
+
+    def add(self, call: Dict[str, Any]) -> None:
+        self.calls += 1
+        self.input_tokens += call["input_tokens"]
+        self.output_tokens += call["output_tokens"]
+        self.cached_tokens += call["cached_tokens"]
+        self.latency += call["latency"]
+        if call["cost"] is None:
+            self.unpriced_calls += 1
+        else:
+            self.cost += call["cost"]
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "appels": self.calls,
+            "tokens_entree": self.input_tokens,
+            "tokens_sortie": self.output_tokens,
+            "tokens_cache": self.cached_tokens,
+            "duree_s": round(self.latency, 3),
+            "cout_usd": round(self.cost, 6),
+            "appels_sans_prix": self.unpriced_calls,
+        }
+
+
+class UsageBudget:
+    """
+    Budget LLM d'une requête (None ou 0 : pas de limite).
+
+    Args:
+        max_synthesis_input_tokens (Optional[int]): Tokens estimés des documents transmis à la synthèse
+        max_request_tokens (Optional[int]): Tokens (entrée et sortie) au-delà desquels le modèle est rétrogradé
+        max_request_cost (Optional[float]): Coût estimé (en dollars) au-delà duquel le modèle est rétrogradé
+        fallback_model (Optional[str]): Modèle moins coûteux utilisé une fois le budget dépassé
+    """
+
+    def __init__(self, max_synthesis_input_tokens: Optional[int] = None, max_request_tokens: Optional[int] = None,
+                 max_request_cost: Optional[float] = None, fallback_model: Optional[str] = FALLBACK_MODEL):
+        self.max_synthesis_input_tokens = max_synthesis_input_tokens or None
+        self.max_request_tokens = max_request_tokens or None
+        self.max_request_cost = max_request_cost or None
+        self.fallback_model = fallback_model
+
+    @classmethod
+    def from_env(cls) -> Optional["UsageBudget"]:
+        """Budget défini par les variables JERRY_* (None si aucune limite n'est fixée)."""
+        if not (MAX_SYNTHESIS_INPUT_TOKENS or MAX_REQUEST_TOKENS or MAX_REQUEST_COST):
+            return None
+        return cls(MAX_SYNTHESIS_INPUT_TOKENS, MAX_REQUEST_TOKENS, MAX_REQUEST_COST)
+
+
+class RequestUsage:
+    """
+    Consommation LLM d'une requête, appel par appel.
+
+    Args:
+        budget (Optional[UsageBudget]): Budget de la requête
+        session (Optional[str]): Session utilisateur à laquelle la consommation est imputée
+    """
+
+    def __init__(self, budget: Optional[UsageBudget] = None, session: Optional[str] = None):
+        self.budget = budget
+        self.session = session
+        self.calls: List[Dict[str, Any]] = []
+        self.totals = UsageTotals()
+        self.downgraded = False
+        self._lock = threading.Lock()
+
+    def add(self, call: Dict[str, Any]) -> None:
+        with self._lock:
+            self.calls.append(call)
+            self.totals.add(call)
+
+    def over_budget(self) -> bool:
+        """True si la requête a dépassé son budget de tokens ou de coût."""
+        if self.budget is None:
+            return False
+        with self._lock:
+            return (
+                (self.budget.max_request_tokens is not None
+                 and self.totals.total_tokens >= self.budget.max_request_tokens)
+                or (self.budget.max_request_cost is not None and self.totals.cost >= self.budget.max_request_cost)
+            )
+
+    def by_stage(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stages: Dict[str, UsageTotals] = {}
+            for call in self.calls:
+                stages.setdefault(call["stage"] or "autre", UsageTotals()).add(call)
+        return {stage: totals.as_dict() for stage, totals in stages.items()}
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = self.totals.as_dict()
+        return {**totals, "retrogradation": self.downgraded, "etapes": self.by_stage()}
+
+
+_current_usage: contextvars.ContextVar = contextvars.ContextVar("request_usage", default=None)
+
+_metrics_lock = threading.Lock()
+_daily: "OrderedDict[str, UsageTotals]" = OrderedDict()
+_sessions: "OrderedDict[str, UsageTotals]" = OrderedDict()
+
+
+def current_usage() -> Optional[RequestUsage]:
+    return _current_usage.get()
+
+
+def current_budget() -> Optional[UsageBudget]:
+    usage = _current_usage.get()
+    return usage.budget if usage is not None else None
+
+
+@contextlib.contextmanager
+def use_request_usage(usage: Optional[RequestUsage]) -> Iterator[Optional[RequestUsage]]:
+    """Impute les appels LLM du contexte courant à `usage` (None : aucune requête suivie)."""
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def _bounded_totals(table: "OrderedDict[str, UsageTotals]", key: str, limit: int) -> UsageTotals:
+    totals = table.get(key)
+    if totals is None:
+        totals = table[key] = UsageTotals()
+        while len(table) > limit:
+            table.popitem(last=False)
+    table.move_to_end(key)
+    return totals
+
+
+def select_model(model: str) -> str:
+    """Modèle à utiliser pour un appel : `fallback_model` si la requête courante a dépassé son budget."""
+    usage = _current_usage.get()
+    if usage is None or usage.budget is None or not usage.budget.fallback_model:
+        return model
+    if model == usage.budget.fallback_model or not usage.over_budget():
+        return model
+    if not usage.downgraded:
+        usage.downgraded = True
+        print(f"INFO: Budget LLM de la requête dépassé, {usage.budget.fallback_model} remplace {model}")
+    return usage.budget.fallback_model
+
+
+def _token_count(usage_metadata: Any, name: str) -> int:
+    if usage_metadata is None:
+        return 0
+    value = usage_metadata.get(name) if isinstance(usage_metadata, dict) else getattr(usage_metadata, name, None)
+    return int(value or 0)
+
+
+def record_call(model: str, response: Any, latency: float, stage: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Enregistre un appel generate_content (appelé par le client Gemini du projet)
+
+    Args:
+        model (str): Modèle appelé
+        response (Any): Réponse exposant `usage_metadata`
+        latency (float): Durée de l'appel, en secondes (hors attente de l'ordonnanceur)
+        stage (Optional[str]): Étape du pipeline en cours
+
+    Returns:
+        Dict[str, Any]: L'appel enregistré
+    """
+    usage_metadata = getattr(response, "usage_metadata", None)
+    input_tokens = _token_count(usage_metadata, "prompt_token_count")
+    output_tokens = (_token_count(usage_metadata, "candidates_token_count")
+                     + _token_count(usage_metadata, "thoughts_token_count"))
+    cached_tokens = _token_count(usage_metadata, "cached_content_token_count")
+    call = {
+        "model": model,
+        "stage": stage,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cached_tokens": cached_tokens,
+        "latency": latency,
+        "cost": call_cost(model, input_tokens, output_tokens, cached_tokens),
+    }
+
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add(call)
+    with _metrics_lock:
+        _bounded_totals(_daily, time.strftime("%Y-%m-%d"), MAX_DAYS).add(call)
+        if usage is not None and usage.session:
+            _bounded_totals(_sessions, usage.session, MAX_SESSIONS).add(call)
+    return call
+
+
+def usage_metrics(session: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Consommation LLM agrégée depuis le démarrage du processus
+
+    Args:
+        session (Optional[str]): Limite les sessions retournées à celle-ci
+
+    Returns:
+        Dict[str, Any]: {"jours": {date: cumul}, "sessions": {session: cumul}}
+    """
+    with _metrics_lock:
+        sessions = _sessions if session is None else {
+            key: totals for key, totals in _sessions.items() if key == session
+        }
+        return {
+            "jours": {day: totals.as_dict() for day, totals in _daily.items()},
+            "sessions": {key: totals.as_dict() for key, totals in sessions.items()},
+        }
+
+
+def reset_usage_metrics() -> None:
+    with _metrics_lock:
+        _daily.clear()
+        _sessions.clear()
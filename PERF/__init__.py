@@ -0,0 +1,4 @@
+"""
+Outils de mesure et de reproductibilité des performances : enregistrement et
+rejeu des appels externes (cassettes), génération de charge et profilage.
+"""
@@ -0,0 +1,414 @@
+"""
+Enregistrement et rejeu des appels externes (cassettes).
+
+Ce module fournit:
+- Un format de cassette compact : une interaction par ligne JSON (gzip si le
+  fichier se termine par .gz), avec l'empreinte de la requête, la réponse et
+  la durée mesurée de l'appel
+- L'enregistrement des appels HTTP à Légifrance (via LEGIFRANCE_UTILS.http_client)
+  et des appels Gemini (via LLM.init_gemini)
+- Le rejeu hors ligne, à la latence d'origine ou sans latence
+- La conversion de resultats_legifrance.json en cassette de référence
+
+Sélection par exécution (variables d'environnement):
+    LEGIFRANCE_CASSETTE=PERF/cassettes/resultats_legifrance.jsonl.gz
+    LEGIFRANCE_CASSETTE_MODE=replay        # record | replay | replay_fast
+"""
+import atexit
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Modes de fonctionnement
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"  # Rejeu à la latence d'origine
+MODE_REPLAY_FAST = "replay_fast"  # Rejeu sans latence
+MODES = (MODE_RECORD, MODE_REPLAY, MODE_REPLAY_FAST)
+
+CASSETTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes")
+FIXTURE_PATH = os.path.join(CASSETTE_DIR, "resultats_legifrance.jsonl.gz")
+
+# Jeton substitué aux vrais jetons OAuth dans les cassettes
+REPLAY_TOKEN = "cassette-token"
+
+
+class CassetteMissError(Exception):
+    """Aucune interaction enregistrée ne correspond à la requête rejouée."""
+
+
+def _digest(*parts: Any) -> str:
+    text = "|".join(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str) for part in parts)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def http_fingerprints(method: str, url: str, json_body: Any = None) -> Dict[str, str]:
+    """
+    Empreintes d'une requête HTTP : stricte (méthode, URL, corps JSON) et large (méthode, URL)
+
+    Les formulaires (OAuth) ne sont jamais pris en compte : ils contiennent les secrets.
+    """
+    return {
+        "fp": _digest(method.upper(), url, json_body),
+        "loose": _digest(method.upper(), url),
+    }
+
+
+def gemini_fingerprints(model: str, contents: Any) -> Dict[str, str]:
+    """
+    Empreintes d'un appel Gemini : stricte (modèle, messages) et large (modèle, premier message)
+
+    Le premier message est le prompt système : l'empreinte large distingue la
+    génération de payload de la synthèse, quelle que soit la question.
+    """
+    first = contents
+    if isinstance(contents, list) and contents:
+        first = contents[0]
+    return {
+        "fp": _digest(model, contents),
+        "loose": _digest(model, first),
+    }
+
+
+class ReplayedResponse:
+    """Réponse HTTP reconstituée depuis une cassette (sous-ensemble de requests.Response)."""
+
+    def __init__(self, status_code: int, text: str, headers: Optional[Dict[str, str]] = None, elapsed: float = 0.0):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.elapsed_seconds = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode("utf-8")
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size: int = 1024, decode_unicode: bool = False) -> Iterator[bytes]:
+        content = self.content
+        for start in range(0, len(content), chunk_size or len(content) or 1):
+            yield content[start:start + chunk_size]
+
+    def close(self) -> None:
+        pass
+
+
+def _usage_to_dict(usage: Any) -> Optional[Dict[str, Any]]:
+    if usage is None:
+        return None
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump(exclude_none=True)
+    if isinstance(usage, dict):
+        return usage
+    return {key: value for key, value in vars(usage).items() if not key.startswith("_")}
+
+
+class Cassette:
+    """
+    Ensemble d'interactions enregistrées, rejouées par empreinte.
+
+    En rejeu, une requête est d'abord recherchée par empreinte stricte puis par
+    empreinte large ; les interactions de même empreinte sont rejouées dans
+    l'ordre d'enregistrement (la dernière est répétée).
+
+    Args:
+        path (str): Fichier de la cassette (.jsonl ou .jsonl.gz)
+        mode (str): MODE_RECORD, MODE_REPLAY ou MODE_REPLAY_FAST
+    """
+
+    def __init__(self, path: str, mode: str = MODE_REPLAY):
+        if mode not in MODES:
+            raise ValueError(f"Mode de cassette inconnu: {mode} (attendu: {', '.join(MODES)})")
+        self.path = path
+        self.mode = mode
+        self.entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._cursors: Dict[str, int] = {}
+        self._by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._dirty = False
+        if mode != MODE_RECORD and not os.path.exists(path):
+            raise FileNotFoundError(f"Cassette introuvable: {path}")
+        if os.path.exists(path) and mode != MODE_RECORD:
+            self.load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode in (MODE_REPLAY, MODE_REPLAY_FAST)
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            # mtime=0 : une cassette inchangée produit un fichier identique
+            return io.TextIOWrapper(gzip.GzipFile(self.path, mode + "b", mtime=0), encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def load(self) -> None:
+        with self._open("r") as file:
+            self.entries = [json.loads(line) for line in file if line.strip()]
+        self._by_key = {}
+        for entry in self.entries:
+            self._by_key.setdefault(f"{entry['k']}:{entry['fp']}", []).append(entry)
+            self._by_key.setdefault(f"{entry['k']}~{entry['loose']}", []).append(entry)
+
+    def save(self) -> None:
+        """Écrit la cassette (une interaction par ligne)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self._open("w") as file:
+                for entry in self.entries:
+                    file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._dirty = False
+        print(f"INFO: Cassette enregistrée ({len(self.entries)} interactions) : {self.path}")
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries.append(entry)
+            self._dirty = True
+
+    def _find(self, kind: str, fingerprints: Dict[str, str], description: str) -> Dict[str, Any]:
+        with self._lock:
+            for key in (f"{kind}:{fingerprints['fp']}", f"{kind}~{fingerprints['loose']}"):
+                candidates = self._by_key.get(key)
+                if candidates:
+                    cursor = self._cursors.get(key, 0)
+                    self._cursors[key] = cursor + 1
+                    return candidates[min(cursor, len(candidates) - 1)]
+        raise CassetteMissError(f"Aucune interaction enregistrée pour {description} dans {self.path}")
+
+    def _wait(self, entry: Dict[str, Any], timeout: Optional[float] = None) -> None:
+        """Reproduit la latence enregistrée ; lève TimeoutError si elle dépasse `timeout`."""
+        if self.mode == MODE_REPLAY and entry.get("t"):
+            if timeout is not None and entry["t"] > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"Rejeu : délai de {timeout:.2f}s dépassé ({entry['t']:.2f}s enregistrées)")
+            time.sleep(entry["t"])
+
+    def http(self, method: str, url: str, kwargs: Dict[str, Any], send: Callable[[], Any]) -> Any:
+        """
+        Exécute (enregistrement) ou rejoue une requête HTTP
+
+        Args:
+            method (str): Méthode HTTP
+            url (str): URL appelée
+            kwargs (Dict[str, Any]): Arguments passés à requests (json, data, headers...)
+            send (Callable[[], Any]): Envoi réel de la requête
+
+        Returns:
+            Any: Réponse réelle lue en entier, ou ReplayedResponse
+        """
+        json_body = kwargs.get("json")
+        fingerprints = http_fingerprints(method, url, json_body)
+
+        if self.replaying:
+            entry = self._find("http", fingerprints, f"{method} {url}")
+            timeout = kwargs.get("timeout")
+            self._wait(entry, timeout[1] if isinstance(timeout, tuple) else timeout)
+            res = entry["res"]
+            return ReplayedResponse(res["status"], res["body"], {"Content-Type": res.get("ct", "")}, entry.get("t", 0.0))
+
+        start = time.perf_counter()
+        response = send()
+        text = response.text  # Lit le corps (y compris en mode stream)
+        elapsed = time.perf_counter() - start
+
+        body = text
+        is_oauth = "oauth" in url
+        if is_oauth and response.status_code == 200:
+            data = json.loads(text)
+            data["access_token"] = REPLAY_TOKEN
+            body = json.dumps(data)
+        self.add({
+            "k": "http",
+            **fingerprints,
+            "req": {"method": method.upper(), "url": url, "json": None if is_oauth else json_body},
+            "res": {"status": response.status_code, "body": body, "ct": response.headers.get("Content-Type", "")},
+            "t": round(elapsed, 4),
+        })
+        return ReplayedResponse(response.status_code, text, dict(response.headers), elapsed)
+
+    def gemini(self, model: str, contents: Any, send: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Exécute (enregistrement) ou rejoue un appel generate_content
+
+        Args:
+            timeout (Optional[float]): Délai maximal d'un rejeu à la latence d'origine
+
+        Returns:
+            Any: Réponse réelle, ou objet exposant `text` et `usage_metadata`
+        """
+        fingerprints = gemini_fingerprints(model, contents)
+
+        if self.replaying:
+            entry = self._find("gemini", fingerprints, f"l'appel Gemini {model}")
+            self._wait(entry, timeout)
+            usage = entry["res"].get("usage")
+            return SimpleNamespace(
+                text=entry["res"]["text"],
+                usage_metadata=SimpleNamespace(**usage) if usage else None,
+            )
+
+        start = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - start
+        self.add({
+            "k": "gemini",
+            **fingerprints,
+            "req": {"model": model},
+            "res": {"text": response.text, "usage": _usage_to_dict(getattr(response, "usage_metadata", None))},
+            "t": round(elapsed, 4),
+        })
+        return response
+
+
+# Cassette active pour le processus
+_active: Optional[Cassette] = None
+
+
+def get_active_cassette() -> Optional[Cassette]:
+    return _active
+
+
+def is_replaying() -> bool:
+    """True si les appels externes sont rejoués (aucune clé d'API n'est alors nécessaire)."""
+    if _active is not None:
+        return _active.replaying
+    return os.getenv("LEGIFRANCE_CASSETTE_MODE", MODE_REPLAY) in (MODE_REPLAY, MODE_REPLAY_FAST) \
+        and bool(os.getenv("LEGIFRANCE_CASSETTE"))
+
+
+def activate(path: str, mode: str = MODE_REPLAY) -> Cassette:
+    """Active une cassette pour tout le processus (enregistrée à la sortie en mode record)."""
+    global _active
+    _active = Cassette(path, mode)
+    if mode == MODE_RECORD:
+        atexit.register(_active.save)
+    print(f"INFO: Cassette {path} active (mode {mode})")
+    return _active
+
+
+def deactivate() -> None:
+    global _active
+    if _active is not None and _active.mode == MODE_RECORD:
+        _active.save()
+    _active = None
+
+
+@contextlib.contextmanager
+def use_cassette(path: str, mode: str = MODE_REPLAY) -> Iterator[Cassette]:
+    """
+    Active une cassette le temps d'un bloc
+
+    Usage:
+        with use_cassette(FIXTURE_PATH, MODE_REPLAY_FAST):
+            search_call(payload)
+    """
+    global _active
+    previous = _active
+    cassette = Cassette(path, mode)
+    _active = cassette
+    try:
+        yield cassette
+    finally:
+        if mode == MODE_RECORD:
+            cassette.save()
+        _active = previous
+
+
+def activate_from_env() -> Optional[Cassette]:
+    """Active la cassette désignée par LEGIFRANCE_CASSETTE / LEGIFRANCE_CASSETTE_MODE."""
+    path = os.getenv("LEGIFRANCE_CASSETTE")
+    if not path or _active is not None:
+        return _active
+    return activate(path, os.getenv("LEGIFRANCE_CASSETTE_MODE", MODE_REPLAY))
+
+
+def build_fixture_from_search_results(
+    results_path: str = "resultats_legifrance.json",
+    cassette_path: str = FIXTURE_PATH,
+    payload: Optional[dict] = None
+) -> Cassette:
+    """
+    Construit une cassette à partir d'une réponse /search sauvegardée
+
+    La cassette contient l'obtention du token, le ping, la recherche (rejouée pour
+    tout payload) et la génération du payload par Gemini. La durée de la recherche
+    est celle indiquée par "executionTime". La synthèse n'est pas incluse.
+
+    Args:
+        results_path (str): Réponse brute sauvegardée par search_call
+        cassette_path (str): Cassette à écrire
+        payload (Optional[dict]): Payload associé (défaut: exemple de SEARCH/search_call.py)
+    """
+    from LEGIFRANCE_UTILS.payload.payload_prompt.create_payload import system_prompt
+
+    base_url = "https://sandbox-api.piste.gouv.fr/dila/legifrance/lf-engine-app"
+    oauth_url = "https://sandbox-oauth.piste.gouv.fr/api/oauth/token"
+    payload = payload or {
+        "recherche": {
+            "champs": [{
+                "typeChamp": "ARTICLE",
+                "criteres": [{
+                    "typeRecherche": "TOUS_LES_MOTS_DANS_UN_CHAMP",
+                    "valeur": "droit peut",
+                    "operateur": "ET",
+                    "proximité": 5
+                }],
+                "operateur": "ET"
+            }],
+            "pageNumber": 1,
+            "pageSize": 8,
+            "sort": "PERTINENCE"
+        },
+        "fond": "ALL"
+    }
+    with open(results_path, "r", encoding="utf-8") as file:
+        resultats = json.load(file)
+
+    cassette = Cassette(cassette_path, MODE_RECORD)
+    token = {"access_token": REPLAY_TOKEN, "token_type": "Bearer", "expires_in": 3600, "scope": "openid"}
+    cassette.add({
+        "k": "http", **http_fingerprints("POST", oauth_url),
+        "req": {"method": "POST", "url": oauth_url, "json": None},
+        "res": {"status": 200, "body": json.dumps(token), "ct": "application/json"}, "t": 0.15,
+    })
+    cassette.add({
+        "k": "http", **http_fingerprints("GET", f"{base_url}/search/ping"),
+        "req": {"method": "GET", "url": f"{base_url}/search/ping", "json": None},
+        "res": {"status": 500, "body": "", "ct": ""}, "t": 0.05,
+    })
+    cassette.add({
+        "k": "http", **http_fingerprints("POST", f"{base_url}/search", payload),
+        "req": {"method": "POST", "url": f"{base_url}/search", "json": payload},
+        "res": {"status": 200, "body": json.dumps(resultats, ensure_ascii=False), "ct": "application/json"},
+        "t": resultats.get("executionTime", 0) / 1000,
+    })
+    model = "gemini-2.0-flash-001"
+    cassette.add({
+        "k": "gemini", **gemini_fingerprints(model, {"role": "model", "parts": [{"text": system_prompt}]}),
+        "req": {"model": model},
+        "res": {"text": json.dumps(payload, ensure_ascii=False), "usage": None}, "t": 1.0,
+    })
+    cassette.save()
+    return cassette
+
+
+# Sélection de la cassette par variables d'environnement, dès l'import
+activate_from_env()
+
+
+if __name__ == "__main__":
+    # Régénère la cassette de référence à partir de resultats_legifrance.json
+    build_fixture_from_search_results()
@@ -0,0 +1,206 @@
+"""
+Échéances de bout en bout des requêtes.
+
+Ce module fournit:
+- Un objet Deadline créé pour chaque question, dont chaque étape (payload, search,
+  synthesis...) consomme le budget restant
+- L'échéance courante, propagée par contextvars jusqu'aux appels HTTP
+  (LEGIFRANCE_UTILS.http_client) et Gemini (LLM.init_gemini), qui en déduisent leur timeout
+- Des timeouts par défaut pour les appels faits sans échéance
+- Le décompte des dépassements d'échéance par étape
+
+Usage:
+    deadline = Deadline(30.0)
+    with use_deadline(deadline):
+        with deadline_stage("payload"):
+            payload = create_payload(question)
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from PERF.profiling import profiled_thread
+
+# Timeouts appliqués aux appels externes (en secondes), avec ou sans échéance
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_READ_TIMEOUT = 30.0
+LLM_TIMEOUT = 60.0
+
+# Budget par défaut d'une question complète
+DEFAULT_BUDGET = 90.0
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("deadline_stage", default=None)
+
+_overruns: Dict[str, int] = {}
+_overruns_lock = threading.Lock()
+
+
+class DeadlineExceeded(Exception):
+    """Le budget de la requête est épuisé."""
+
+    def __init__(self, stage: Optional[str] = None, message: Optional[str] = None):
+        self.stage = stage
+        super().__init__(message or f"Échéance dépassée pendant l'étape {stage or 'inconnue'}")
+
+
+class Deadline:
+    """
+    Échéance d'une requête : un instant limite fixé à la création.
+
+    Args:
+        budget (float): Durée totale accordée à la requête, en secondes
+    """
+
+    def __init__(self, budget: float = DEFAULT_BUDGET):
+        self.budget = budget
+        self.start = time.monotonic()
+        self.expires_at = self.start + budget
+        self.overruns: Dict[str, int] = {}
+
+    def remaining(self) -> float:
+        """Budget restant en secondes (0 si l'échéance est passée)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """
+        Timeout à appliquer à un appel : le budget restant, plafonné par `cap`
+
+        Raises:
+            DeadlineExceeded: Si l'échéance est déjà passée
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(_current_stage.get())
+        return remaining if cap is None else min(cap, remaining)
+
+    def check(self) -> None:
+        """Lève DeadlineExceeded si l'échéance est passée."""
+        if self.expired():
+            raise DeadlineExceeded(_current_stage.get())
+
+    def __repr__(self) -> str:
+        return f"Deadline(budget={self.budget}, remaining={self.remaining():.2f})"
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def current_stage() -> Optional[str]:
+    return _current_stage.get()
+
+
+@contextlib.contextmanager
+def use_deadline(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Active une échéance pour le contexte courant (None : aucune échéance)."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def record_overrun(stage: Optional[str]) -> None:
+    stage = stage or "inconnue"
+    with _overruns_lock:
+        _overruns[stage] = _overruns.get(stage, 0) + 1
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.overruns[stage] = deadline.overruns.get(stage, 0) + 1
+
+
+def overrun_counts() -> Dict[str, int]:
+    """Nombre de dépassements d'échéance par étape depuis le démarrage du processus."""
+    with _overruns_lock:
+        return dict(_overruns)
+
+
+def reset_overrun_counts() -> None:
+    with _overruns_lock:
+        _overruns.clear()
+
+
+@contextlib.contextmanager
+def deadline_stage(stage: str) -> Iterator[None]:
+    """
+    Exécute une étape sous l'échéance courante
+
+    L'étape ne démarre pas si le budget est épuisé. Un dépassement est compté
+    pour l'étape si DeadlineExceeded est levée pendant son exécution, ou si elle
+    se termine après l'échéance. Sans échéance active, seul le nom de l'étape est suivi.
+
+    Raises:
+        DeadlineExceeded: Si l'échéance est passée avant ou pendant l'étape
+    """
+    deadline = current_deadline()
+    token = _current_stage.set(stage)
+    try:
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded(stage)
+        yield
+    except DeadlineExceeded as e:
+        record_overrun(stage)
+        if e.stage is None:
+            e.stage = stage
+        raise
+    else:
+        if deadline is not None and deadline.expired():
+            record_overrun(stage)
+    finally:
+        _current_stage.reset(token)
+
+
+def http_timeout() -> Tuple[float, float]:
+    """
+    Timeout (connexion, lecture) d'un appel HTTP selon l'échéance courante
+
+    Raises:
+        DeadlineExceeded: Si l'échéance courante est passée
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+    return deadline.timeout(HTTP_CONNECT_TIMEOUT), deadline.timeout(HTTP_READ_TIMEOUT)
+
+
+def llm_timeout() -> float:
+    """
+    Timeout d'un appel Gemini selon l'échéance courante
+
+    Raises:
+        DeadlineExceeded: Si l'échéance courante est passée
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return LLM_TIMEOUT
+    return deadline.timeout(LLM_TIMEOUT)
+
+
+def deadline_expired() -> bool:
+    deadline = current_deadline()
+    return deadline is not None and deadline.expired()
+
+
+def _run_profiled(fn: Callable[..., Any], *args: Any) -> Any:
+    with profiled_thread():
+        return fn(*args)
+
+
+def submit_in_context(executor: Executor, fn: Callable[..., Any], *args: Any) -> Future:
+    """
+    Soumet une tâche à un pool de threads en lui transmettant l'échéance et l'étape courantes
+
+    Le thread qui exécute la tâche est inscrit auprès du profileur de la requête, le cas
+    échéant (voir PERF/profiling.py).
+    """
+    return executor.submit(contextvars.copy_context().run, _run_profiled, fn, *args)
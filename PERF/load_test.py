@@ -0,0 +1,424 @@
+"""
+Générateur de charge pour tool.search_legifrance.
+
+Ce module simule N utilisateurs virtuels et produit un rapport JSON:
+- Débit (questions par seconde) et taux d'erreur
+- Latences p50 / p95 / p99 de bout en bout et par étape (payload, search, synthesis...)
+- Mémoire résidente maximale du processus (peak RSS)
+- Dépassements d'échéance par étape (avec --budget, voir PERF/deadline.py)
+- Utilisation de chaque identifiant Legifrance (backends live et cassette)
+- Files d'attente de l'ordonnanceur des appels sortants, par service et par classe
+- Consommation Gemini (appels, tokens, durée, coût estimé ; backends live et cassette)
+
+Deux modes de charge:
+- closed : chaque utilisateur enchaîne ses questions (avec un temps de réflexion)
+- open   : les questions arrivent à un débit fixe, indépendamment des réponses ;
+           la latence est mesurée depuis l'arrivée prévue (file d'attente comprise)
+
+Trois backends:
+- live     : appels réels à Gemini et à Légifrance
+- cassette : rejeu d'une cassette (voir PERF/cassette.py), à la latence d'origine ou sans latence
+- fake     : doublures locales avec latence injectée, sans aucun appel réseau
+
+Usage:
+    python -m PERF.load_test run --backend fake --users 8 --duration 30 --output rapport.json
+    python -m PERF.load_test run --backend cassette --mode open --rate 5 --requests 200
+    python -m PERF.load_test diff ancien.json nouveau.json --threshold 0.10
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+REPORT_VERSION = 1
+
+DEFAULT_QUESTIONS = [
+    "Est-ce qu'un enfant peut être commerçant ?",
+    "Quelles sont les conditions du licenciement économique ?",
+    "Quelle est la durée du préavis de départ d'un locataire ?",
+    "Qu'est-ce que le lien de subordination ?",
+    "Est-il possible de vendre des animaux vivants ?",
+    "Quels sont les droits du créancier hypothécaire ?",
+]
+
+# Métriques comparées par la commande diff : (chemin, sens de l'amélioration)
+DIFF_METRICS = [
+    ("throughput_rps", "higher"),
+    ("error_rate", "lower"),
+    ("peak_rss_mb", "lower"),
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentile par rang le plus proche (None si aucune valeur)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """Résumé d'une série de durées, en millisecondes."""
+    if not values:
+        return {"count": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3),
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3),
+        "max_ms": round(1000 * max(values), 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Mémoire résidente maximale du processus, en Mo."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets sous Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _sleep_latency(mean_ms: float, jitter: float) -> None:
+    """Simule la latence d'un appel externe, interrompu comme lui par l'échéance courante."""
+    from PERF.deadline import DeadlineExceeded, current_deadline, current_stage
+
+    if mean_ms <= 0:
+        return
+    latency = max(0.0, random.gauss(mean_ms, mean_ms * jitter)) / 1000
+    deadline = current_deadline()
+    if deadline is not None and latency > deadline.remaining():
+        time.sleep(deadline.remaining())
+        raise DeadlineExceeded(current_stage())
+    time.sleep(latency)
+
+
+def install_fake_backend(tool_module: Any, latencies: Dict[str, float], jitter: float, error_rate: float) -> None:
+    """
+    Remplace les appels externes de tool par des doublures locales à latence injectée
+
+    Les résultats de recherche sont ceux de resultats_legifrance.json ; le calcul
+    local (métadonnées, construction des prompts côté appelant) reste réel.
+
+    Args:
+        tool_module (Any): Module tool dont les fonctions sont remplacées
+        latencies (Dict[str, float]): Latence moyenne (ms) de "payload", "search" et "synthesis"
+        jitter (float): Écart-type relatif de la latence
+        error_rate (float): Probabilité qu'une recherche échoue
+    """
+    from SEARCH.search_call import normalize_search_result
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "resultats_legifrance.json"), "r", encoding="utf-8") as file:
+        raw_results = json.load(file)["results"]
+    payload = json.dumps({"recherche": {"champs": [], "pageNumber": 1, "pageSize": 8}, "fond": "ALL"})
+
+    def fake_create_payload(user_input: str, context: Optional[str] = None) -> str:
+        _sleep_latency(latencies["payload"], jitter)
+        return payload
+
+    def fake_search_call(Payload: dict, **kwargs: Any):
+        _sleep_latency(latencies["search"], jitter)
+        if random.random() < error_rate:
+            return [], "Échec de la requête à Legifrance: code 503"
+        return [normalize_search_result(resultat) for resultat in raw_results], ""
+
+    def fake_synthesize(question: str, metadata_list: List[Dict[str, Any]]) -> str:
+        _sleep_latency(latencies["synthesis"], jitter)
+        return f"## RÉPONSE :\nRéponse simulée ({len(metadata_list)} documents).\n## SOURCES:\n* Code civil"
+
+    tool_module.create_payload = fake_create_payload
+    tool_module.search_call = fake_search_call
+    tool_module.synthesize_legal_response = fake_synthesize
+
+
+class LoadTest:
+    """
+    Exécution d'un test de charge et collecte des mesures.
+
+    Args:
+        run_question (Callable): Fonction (question, timings) -> réponse ou None
+        questions (List[str]): Questions posées à tour de rôle
+        users (int): Nombre d'utilisateurs virtuels (threads)
+        mode (str): "closed" ou "open"
+        rate (float): Débit d'arrivée en mode open (questions par seconde)
+        duration (Optional[float]): Durée du test en secondes
+        requests (Optional[int]): Nombre total de questions
+        think_time (float): Pause (secondes) entre deux questions d'un utilisateur en mode closed
+    """
+
+    def __init__(self, run_question, questions, users=4, mode="closed", rate=1.0,
+                 duration=None, requests=None, think_time=0.0):
+        self.run_question = run_question
+        self.questions = questions
+        self.users = users
+        self.mode = mode
+        self.rate = rate
+        self.duration = duration
+        self.requests = requests
+        self.think_time = think_time
+        self.latencies: List[float] = []
+        self.stage_latencies: Dict[str, List[float]] = {}
+        self.errors = 0
+        self.partial = 0
+        self.completed = 0
+        self._issued = 0
+        self._lock = threading.Lock()
+
+    def _next_question(self) -> Optional[str]:
+        with self._lock:
+            if self.requests is not None and self._issued >= self.requests:
+                return None
+            question = self.questions[self._issued % len(self.questions)]
+            self._issued += 1
+            return question
+
+    def _execute(self, question: str, scheduled: float) -> None:
+        timings: Dict[str, float] = {}
+        try:
+            response = self.run_question(question, timings)
+            failed = response is None or response.startswith("Impossible de générer")
+            partial = not failed and response.startswith("## RÉPONSE PARTIELLE")
+        except Exception:
+            failed, partial = True, False
+        elapsed = time.perf_counter() - scheduled
+        with self._lock:
+            self.completed += 1
+            self.latencies.append(elapsed)
+            if failed:
+                self.errors += 1
+            if partial:
+                self.partial += 1
+            for stage, duration in timings.items():
+                self.stage_latencies.setdefault(stage, []).append(duration)
+
+    def _closed_user(self, deadline: Optional[float]) -> None:
+        while deadline is None or time.perf_counter() < deadline:
+            question = self._next_question()
+            if question is None:
+                return
+            self._execute(question, time.perf_counter())
+            if self.think_time:
+                time.sleep(self.think_time)
+
+    def run(self) -> Dict[str, Any]:
+        """Lance le test et retourne le rapport."""
+        start = time.perf_counter()
+        deadline = start + self.duration if self.duration else None
+
+        if self.mode == "closed":
+            threads = [threading.Thread(target=self._closed_user, args=(deadline,)) for _ in range(self.users)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            with ThreadPoolExecutor(max_workers=self.users) as executor:
+                arrival = start
+                while deadline is None or arrival < deadline:
+                    question = self._next_question()
+                    if question is None:
+                        break
+                    time.sleep(max(0.0, arrival - time.perf_counter()))
+                    executor.submit(self._execute, question, arrival)
+                    arrival += random.expovariate(self.rate)
+
+        wall_time = time.perf_counter() - start
+        return {
+            "completed": self.completed,
+            "errors": self.errors,
+            "partial": self.partial,
+            "error_rate": round(self.errors / self.completed, 4) if self.completed else 0.0,
+            "duration_s": round(wall_time, 3),
+            "throughput_rps": round(self.completed / wall_time, 3) if wall_time else 0.0,
+            "latency": {
+                "total": summarize(self.latencies),
+                **{stage: summarize(values) for stage, values in sorted(self.stage_latencies.items())},
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def run_command(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.backend == "cassette":
+        from PERF import cassette
+        # Activation explicite : PERF.cassette a pu être importé avant la définition des variables
+        cassette.activate(args.cassette, cassette.MODE_REPLAY_FAST if args.zero_latency else cassette.MODE_REPLAY)
+    elif args.backend == "fake":
+        # Aucun appel réel : une clé factice suffit à construire les clients
+        os.environ.setdefault("GEMINI_API_KEY", "fake")
+
+    import tool
+
+    if args.backend == "fake":
+        install_fake_backend(
+            tool,
+            {"payload": args.payload_latency, "search": args.search_latency, "synthesis": args.synthesis_latency},
+            args.jitter, args.error_rate,
+        )
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as file:
+            questions = [line.strip() for line in file if line.strip()]
+
+    from PERF.deadline import Deadline, overrun_counts, reset_overrun_counts
+    reset_overrun_counts()
+
+    from PERF.scheduler import scheduler_metrics, use_traffic_class
+    from LLM.usage import reset_usage_metrics, usage_metrics
+    reset_usage_metrics()
+
+    def run_question(question: str, timings: Dict[str, float]) -> Optional[str]:
+        deadline = Deadline(args.budget) if args.budget else None
+        with use_traffic_class(args.traffic_class):
+            return tool.search_legifrance(question, timings=timings, deadline=deadline)
+
+    if args.duration is None and args.requests is None:
+        args.requests = 10 * args.users
+
+    load_test = LoadTest(
+        run_question, questions, users=args.users, mode=args.mode, rate=args.rate,
+        duration=args.duration, requests=args.requests, think_time=args.think_time,
+    )
+    # Les messages INFO du pipeline sont masqués pendant la mesure
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if args.quiet else sys.stdout):
+        results = load_test.run()
+    results["deadline_overruns"] = overrun_counts()
+    results["scheduler"] = scheduler_metrics()
+    results["llm_usage"] = usage_metrics()["jours"]
+    if args.backend != "fake":
+        from LEGIFRANCE_UTILS.credential_pool import get_credential_pool
+        results["credentials"] = get_credential_pool().report()
+
+    return {
+        "version": REPORT_VERSION,
+        "config": {
+            "backend": args.backend,
+            "mode": args.mode,
+            "users": args.users,
+            "rate": args.rate if args.mode == "open" else None,
+            "duration": args.duration,
+            "requests": args.requests,
+            "think_time": args.think_time,
+            "budget": args.budget,
+            "traffic_class": args.traffic_class,
+            "cassette": args.cassette if args.backend == "cassette" else None,
+            "zero_latency": args.zero_latency if args.backend == "cassette" else None,
+            "fake_latency_ms": {
+                "payload": args.payload_latency, "search": args.search_latency, "synthesis": args.synthesis_latency,
+            } if args.backend == "fake" else None,
+        },
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **results,
+    }
+
+
+def _metric_paths(report: Dict[str, Any]) -> List[tuple]:
+    paths = list(DIFF_METRICS)
+    for stage in report.get("latency", {}):
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            paths.append((f"latency.{stage}.{key}", "lower"))
+    return paths
+
+
+def _get(report: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = report
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def diff_reports(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """
+    Compare deux rapports et signale les régressions au-delà du seuil relatif
+
+    Returns:
+        Dict[str, Any]: {"metrics": [...], "regressions": [...]}
+    """
+    metrics = []
+    regressions = []
+    for path, better in _metric_paths(new):
+        before, after = _get(old, path), _get(new, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+        worse = change > threshold if better == "lower" else change < -threshold
+        entry = {"metric": path, "old": before, "new": after, "change": round(change, 4), "regression": worse}
+        metrics.append(entry)
+        if worse:
+            regressions.append(path)
+    return {"threshold": threshold, "metrics": metrics, "regressions": regressions}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Test de charge de tool.search_legifrance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Lancer un test de charge")
+    run.add_argument("--backend", choices=["live", "cassette", "fake"], default="fake")
+    run.add_argument("--mode", choices=["closed", "open"], default="closed")
+    run.add_argument("--users", type=int, default=4, help="Utilisateurs virtuels (threads)")
+    run.add_argument("--rate", type=float, default=1.0, help="Débit d'arrivée en mode open (questions/s)")
+    run.add_argument("--duration", type=float, default=None, help="Durée du test (secondes)")
+    run.add_argument("--requests", type=int, default=None, help="Nombre total de questions")
+    run.add_argument("--think-time", type=float, default=0.0, help="Pause entre deux questions (mode closed)")
+    run.add_argument("--budget", type=float, default=None, help="Échéance de chaque question (secondes)")
+    run.add_argument("--traffic-class", choices=["interactif", "batch"], default="interactif",
+                     help="Classe de trafic des appels sortants (voir PERF/scheduler.py)")
+    run.add_argument("--questions", default=None, help="Fichier de questions (une par ligne)")
+    run.add_argument("--cassette", default=None, help="Cassette rejouée (backend cassette)")
+    run.add_argument("--zero-latency", action="store_true", help="Rejeu de la cassette sans latence")
+    run.add_argument("--payload-latency", type=float, default=800.0, help="Latence simulée du payload (ms)")
+    run.add_argument("--search-latency", type=float, default=600.0, help="Latence simulée de /search (ms)")
+    run.add_argument("--synthesis-latency", type=float, default=2500.0, help="Latence simulée de la synthèse (ms)")
+    run.add_argument("--jitter", type=float, default=0.2, help="Écart-type relatif des latences simulées")
+    run.add_argument("--error-rate", type=float, default=0.0, help="Taux d'échec simulé de /search")
+    run.add_argument("--output", default=None, help="Fichier du rapport JSON (défaut: sortie standard)")
+    run.add_argument("--verbose", dest="quiet", action="store_false", help="Afficher les messages du pipeline")
+
+    diff = commands.add_parser("diff", help="Comparer deux rapports")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--threshold", type=float, default=0.10, help="Variation relative tolérée")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "diff":
+        with open(args.old, "r", encoding="utf-8") as file:
+            old = json.load(file)
+        with open(args.new, "r", encoding="utf-8") as file:
+            new = json.load(file)
+        result = diff_reports(old, new, args.threshold)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return 1 if result["regressions"] else 0
+
+    if args.backend == "cassette" and not args.cassette:
+        from PERF.cassette import FIXTURE_PATH
+        args.cassette = FIXTURE_PATH
+
+    report = run_command(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+        print(f"INFO: Rapport écrit dans {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
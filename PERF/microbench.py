@@ -0,0 +1,423 @@
+"""
+Micro-benchmarks du travail local (CPU) effectué pour chaque requête.
+
+Ce module mesure, sans aucun appel réseau, les fonctions exécutées entre les appels
+à Gemini et à Légifrance :
+- parse_payload      : nettoyage de la sortie du modèle (parse_json_model_output) puis json.loads
+- stream_parse       : lecture incrémentale du corps /search (ResultsArrayParser)
+- normalize          : normalisation des résultats /search (normalize_search_result)
+- metadata           : métadonnées transmises à la synthèse (build_metadata_list)
+- synthesis_prompt   : assemblage du prompt de synthèse (format_documents)
+- format_results     : affichage des résultats de main.py (format_search_results)
+- response_format    : post-traitement regex de la réponse (streamlit_app/response_format.py)
+
+Les jeux de données sont générés à partir de resultats_legifrance.json, dupliqués
+jusqu'à 10, 100 et 1000 documents. Pour chaque fonction et chaque taille, le rapport
+donne la durée par appel (minimum et médiane des répétitions) et le pic de mémoire
+allouée pendant un appel (tracemalloc).
+
+Les mesures sont comparées à une référence (PERF/baselines/microbench.json) : le code
+de sortie est 1 si une durée ou une allocation se dégrade au-delà de son seuil.
+
+Usage:
+    python -m PERF.microbench run                      # mesure et compare à la référence
+    python -m PERF.microbench run --save-baseline      # remplace la référence
+    python -m PERF.microbench run --only metadata --sizes 1000
+    python -m PERF.microbench diff ancien.json nouveau.json
+"""
+import argparse
+import contextlib
+import copy
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPORT_VERSION = 1
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_FILE = os.path.join(ROOT_DIR, "resultats_legifrance.json")
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "PERF", "baselines", "microbench.json")
+
+DEFAULT_SIZES = (10, 100, 1000)
+
+# Seuils de régression (variation relative tolérée)
+TIME_THRESHOLD = 0.25
+ALLOC_THRESHOLD = 0.10
+
+# Durée visée (en secondes) de chaque répétition, et nombre de répétitions
+TARGET_REPEAT_TIME = 0.05
+REPEATS = 7
+
+# Nouvelles mesures d'une durée en régression avant de conclure (bruit de la machine)
+CONFIRM_ATTEMPTS = 2
+
+
+def load_raw_results() -> List[dict]:
+    """Éléments bruts du tableau "results" de resultats_legifrance.json."""
+    with open(FIXTURE_FILE, "r", encoding="utf-8") as file:
+        return json.load(file)["results"]
+
+
+def scale_results(raw_results: List[dict], size: int) -> List[dict]:
+    """
+    Duplique les résultats jusqu'à `size` documents, avec des identifiants distincts
+
+    Returns:
+        List[dict]: Éléments bruts de /search
+    """
+    scaled = []
+    for position in range(size):
+        resultat = copy.deepcopy(raw_results[position % len(raw_results)])
+        suffix = f"-{position}"
+        for titre in resultat.get("titles", []):
+            titre["id"] = f"{titre.get('id')}{suffix}"
+            titre["cid"] = f"{titre.get('cid')}{suffix}"
+        for section in resultat.get("sections", []):
+            for extract in section.get("extracts", []):
+                extract["id"] = f"{extract.get('id')}{suffix}"
+        scaled.append(resultat)
+    return scaled
+
+
+def build_fixtures(size: int, raw_results: Optional[List[dict]] = None) -> Dict[str, Any]:
+    """
+    Entrées de chaque benchmark pour `size` documents
+
+    Returns:
+        Dict[str, Any]: Corps /search (octets), résultats bruts et normalisés, métadonnées,
+            sortie du modèle pour le payload et réponse de synthèse citant chaque document
+    """
+    from SEARCH.metadata import build_metadata_list
+    from SEARCH.search_call import normalize_search_result
+
+    raw = scale_results(raw_results or load_raw_results(), size)
+    normalized = [normalize_search_result(resultat) for resultat in raw]
+    metadata = build_metadata_list(normalized)
+
+    criteres = [
+        {"typeRecherche": "UN_DES_MOTS", "valeur": f"terme {position}", "operateur": "ET"}
+        for position in range(max(1, size // 10))
+    ]
+    payload = {
+        "recherche": {"champs": [{"typeChamp": "ALL", "criteres": criteres, "operateur": "ET"}],
+                      "pageNumber": 1, "pageSize": 10, "operateur": "ET", "typePagination": "DEFAUT"},
+        "fond": "ALL",
+    }
+    model_output = "Voici le payload demandé :\n```json\n" + json.dumps(payload, indent=2, ensure_ascii=False) + "\n```\n"
+
+    sources = "\n".join(f"* {item['title']} - Article {position}" for position, item in enumerate(metadata, 1))
+    paragraphs = "\n".join(
+        f"* « {extract['text'][:200]} »" for item in metadata for extract in item["extracts"][:1]
+    )
+    response_text = (
+        "## RÉPONSE :\nDéfinition générale du concept.\n\n**Éléments constitutifs :**\n"
+        f"{paragraphs}\n\n## SOURCES:\n{sources}\nConnaissances juridiques générales\n# Documents insuffisants\n"
+    )
+    return {
+        "body": json.dumps({"executionTime": 1, "results": raw, "totalResultNumber": size}).encode("utf-8"),
+        "raw": raw,
+        "normalized": normalized,
+        "metadata": metadata,
+        "model_output": model_output,
+        "response_text": response_text,
+    }
+
+
+def _bench_parse_payload(fixtures: Dict[str, Any]) -> Callable[[], Any]:
+    from LEGIFRANCE_UTILS.payload.parse_payload import parse_json_model_output
+    model_output = fixtures["model_output"]
+    return lambda: json.loads(parse_json_model_output(model_output))
+
+
+def _bench_stream_parse(fixtures: Dict[str, Any]) -> Callable[[], Any]:
+    from SEARCH.stream_parser import ResultsArrayParser
+    body = fixtures["body"]
+    chunk_size = 65536
+
+    def run():
+        parser = ResultsArrayParser()
+        results = []
+        for start in range(0, len(body), chunk_size):
+            results.extend(parser.feed(body[start:start + chunk_size]))
+        return results
+    return run
+
+
+def _bench_normalize(fixtures: Dict[str, Any]) -> Callable[[], Any]:
+    from SEARCH.search_call import normalize_search_result
+    raw = fixtures["raw"]
+    return lambda: [normalize_search_result(resultat) for resultat in raw]
+
+
+def _bench_metadata(fixtures: Dict[str, Any]) -> Callable[[], Any]:
+    from SEARCH.metadata import build_metadata_list
+    normalized = fixtures["normalized"]
+    return lambda: build_metadata_list(normalized)
+
+
+def _bench_synthesis_prompt(fixtures: Dict[str, Any]) -> Callable[[], Any]:
+    from LEGIFRANCE_UTILS.synthetize.synthetize_response import format_documents
+    metadata = fixtures["metadata"]
+    return lambda: format_documents(metadata)
+
+
+def _bench_format_results(fixtures: Dict[str, Any]) -> Callable[[], Any]:
+    from SEARCH.search_call import format_search_results
+    normalized = fixtures["normalized"]
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            format_search_results(normalized)
+    return run
+
+
+def _bench_response_format(fixtures: Dict[str, Any]) -> Callable[[], Any]:
+    from streamlit_app.response_format import extract_response, extract_sources, format_sources_as_list
+    text = fixtures["response_text"]
+
+    def run():
+        response = extract_response(text)
+        sources, insufficient = extract_sources(text)
+        return response, format_sources_as_list(sources), insufficient
+    return run
+
+
+# Benchmarks disponibles : nom -> fabrique (jeu de données -> fonction mesurée)
+BENCHMARKS: Dict[str, Callable[[Dict[str, Any]], Callable[[], Any]]] = {
+    "parse_payload": _bench_parse_payload,
+    "stream_parse": _bench_stream_parse,
+    "normalize": _bench_normalize,
+    "metadata": _bench_metadata,
+    "synthesis_prompt": _bench_synthesis_prompt,
+    "format_results": _bench_format_results,
+    "response_format": _bench_response_format,
+}
+
+
+def measure(fn: Callable[[], Any], repeats: int = REPEATS, target: float = TARGET_REPEAT_TIME) -> Dict[str, float]:
+    """
+    Durée par appel et pic d'allocation d'une fonction
+
+    Le nombre d'appels par répétition est calibré pour que chaque répétition dure
+    environ `target` secondes ; comme avec timeit, le ramasse-miettes est suspendu
+    pendant les répétitions.
+
+    Returns:
+        Dict[str, float]: time_min_us, time_median_us, loops, peak_alloc_kb
+    """
+    fn()  # Préchauffage (imports paresseux, caches de regex)
+
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target / 5 or loops >= 1_000_000:
+            break
+        loops *= 10
+    loops = max(1, int(loops * target / max(elapsed, 1e-9)))
+
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            timings.append((time.perf_counter() - start) / loops)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "time_min_us": round(min(timings) * 1e6, 3),
+        "time_median_us": round(statistics.median(timings) * 1e6, 3),
+        "loops": loops,
+        "peak_alloc_kb": round((peak - baseline) / 1024, 2),
+    }
+
+
+def run_benchmarks(names: Optional[List[str]] = None, sizes: Tuple[int, ...] = DEFAULT_SIZES,
+                   repeats: int = REPEATS) -> Dict[str, Any]:
+    """
+    Exécute les benchmarks demandés pour chaque taille
+
+    Returns:
+        Dict[str, Any]: Rapport ({"results": {"<nom>[<taille>]": mesures}} et environnement)
+    """
+    names = names or list(BENCHMARKS)
+    raw_results = load_raw_results()
+    results: Dict[str, Dict[str, float]] = {}
+    for size in sizes:
+        fixtures = build_fixtures(size, raw_results)
+        for name in names:
+            key = f"{name}[{size}]"
+            results[key] = measure(BENCHMARKS[name](fixtures), repeats=repeats)
+            print(f"INFO: {key:<26} {results[key]['time_min_us']:>12.1f} µs  "
+                  f"{results[key]['peak_alloc_kb']:>10.1f} Ko", file=sys.stderr)
+    return {
+        "version": REPORT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "host": platform.node(),
+        "results": results,
+    }
+
+
+def confirm_time_regressions(report: Dict[str, Any], regressions: List[str], repeats: int = REPEATS) -> None:
+    """
+    Mesure à nouveau les durées en régression et conserve la meilleure durée minimale
+
+    Une régression réelle persiste ; un ralentissement passager de la machine disparaît.
+    """
+    keys = sorted({metric.rsplit(".", 1)[0] for metric in regressions if metric.endswith(".time_min_us")})
+    raw_results = load_raw_results()
+    fixtures_by_size: Dict[int, Dict[str, Any]] = {}
+    for key in keys:
+        name, size = key[:-1].split("[")
+        size = int(size)
+        if size not in fixtures_by_size:
+            fixtures_by_size[size] = build_fixtures(size, raw_results)
+        for _ in range(CONFIRM_ATTEMPTS):
+            retry = measure(BENCHMARKS[name](fixtures_by_size[size]), repeats=repeats)
+            entry = report["results"][key]
+            entry["time_min_us"] = min(entry["time_min_us"], retry["time_min_us"])
+        print(f"INFO: {key} mesuré à nouveau : {report['results'][key]['time_min_us']:.1f} µs", file=sys.stderr)
+
+
+def diff_reports(old: Dict[str, Any], new: Dict[str, Any], time_threshold: float = TIME_THRESHOLD,
+                 alloc_threshold: float = ALLOC_THRESHOLD, compare_time: bool = True) -> Dict[str, Any]:
+    """
+    Compare deux rapports et signale les régressions au-delà des seuils relatifs
+
+    La durée comparée est la durée minimale par appel, la moins sensible au bruit.
+    Les allocations ne dépendent que du code et de la version de Python ; les durées
+    ne sont comparables que sur la même machine (`compare_time`).
+
+    Returns:
+        Dict[str, Any]: {"metrics": [...], "regressions": [...]}
+    """
+    metrics = []
+    regressions = []
+    for key, after in new.get("results", {}).items():
+        before = old.get("results", {}).get(key)
+        if before is None:
+            continue
+        for metric, threshold in (("time_min_us", time_threshold), ("peak_alloc_kb", alloc_threshold)):
+            if metric == "time_min_us" and not compare_time:
+                continue
+            old_value, new_value = before.get(metric), after.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value if old_value else (0.0 if new_value == old_value else float("inf"))
+            worse = change > threshold
+            metrics.append({"metric": f"{key}.{metric}", "old": old_value, "new": new_value,
+                            "change": round(change, 4), "regression": worse})
+            if worse:
+                regressions.append(f"{key}.{metric}")
+    return {"time_threshold": time_threshold, "alloc_threshold": alloc_threshold,
+            "metrics": metrics, "regressions": regressions}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks du travail local par requête")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Mesurer et comparer à la référence")
+    run.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=None, help="Benchmarks à exécuter")
+    run.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="Nombres de documents")
+    run.add_argument("--repeats", type=int, default=REPEATS, help="Répétitions par mesure")
+    run.add_argument("--baseline", default=DEFAULT_BASELINE, help="Fichier de référence")
+    run.add_argument("--save-baseline", action="store_true", help="Écrire les mesures comme nouvelle référence")
+    run.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD, help="Dégradation de durée tolérée")
+    run.add_argument("--alloc-threshold", type=float, default=ALLOC_THRESHOLD, help="Dégradation d'allocation tolérée")
+    run.add_argument("--compare-time", action="store_true",
+                     help="Comparer les durées même si la référence vient d'une autre machine")
+    run.add_argument("--output", default=None, help="Fichier du rapport JSON")
+
+    diff = commands.add_parser("diff", help="Comparer deux rapports")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    diff.add_argument("--alloc-threshold", type=float, default=ALLOC_THRESHOLD)
+    return parser
+
+
+def _write_json(path: str, content: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(content, file, indent=2, ensure_ascii=False)
+        file.write("\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "diff":
+        with open(args.old, "r", encoding="utf-8") as file:
+            old = json.load(file)
+        with open(args.new, "r", encoding="utf-8") as file:
+            new = json.load(file)
+        result = diff_reports(old, new, args.time_threshold, args.alloc_threshold)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return 1 if result["regressions"] else 0
+
+    report = run_benchmarks(args.only, tuple(args.sizes), args.repeats)
+    if args.output:
+        _write_json(args.output, report)
+        print(f"INFO: Rapport écrit dans {args.output}")
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # Les benchmarks non exécutés conservent leur référence
+            with open(args.baseline, "r", encoding="utf-8") as file:
+                previous = json.load(file)
+            report = {**report, "results": {**previous.get("results", {}), **report["results"]}}
+        _write_json(args.baseline, report)
+        print(f"INFO: Référence écrite dans {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"INFO: Aucune référence ({args.baseline}) : relancer avec --save-baseline pour la créer.")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    compare_time = args.compare_time or baseline.get("host") == report["host"]
+    if not compare_time:
+        print(f"INFO: Référence mesurée sur une autre machine ({baseline.get('host')}) : seules les allocations "
+              "sont comparées (--compare-time pour forcer, --save-baseline pour une référence locale).")
+    result = diff_reports(baseline, report, args.time_threshold, args.alloc_threshold, compare_time)
+    if result["regressions"]:
+        confirm_time_regressions(report, result["regressions"], args.repeats)
+        result = diff_reports(baseline, report, args.time_threshold, args.alloc_threshold, compare_time)
+    for entry in result["metrics"]:
+        if entry["regression"]:
+            print(f"ERREUR: {entry['metric']} : {entry['old']} -> {entry['new']} ({entry['change']:+.1%})")
+    if result["regressions"]:
+        return 1
+    print(f"INFO: Aucune régression ({len(result['metrics'])} mesures comparées à {args.baseline}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
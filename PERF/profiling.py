@@ -0,0 +1,223 @@
+"""
+Profilage à la demande d'une requête.
+
+Ce module fournit:
+- Un profileur par échantillonnage (bibliothèque standard uniquement) : toutes les
+  `interval` secondes, la pile de chaque thread de la requête est relevée : le thread
+  qui la traite et ceux qui exécutent ses tâches (recherche répartie, synthèse
+  map-reduce...), inscrits par PERF.deadline.submit_in_context. Les threads des autres
+  requêtes traitées en même temps (application Streamlit) ne sont pas relevés
+- Le contexte `profile_request`, qui profile une exécution de search_legifrance,
+  de main() ou du pipeline Streamlit et écrit, par requête :
+    * `<horodatage>_<hash>.folded` : piles repliées ("thread;f1;f2 N"), lisibles par
+      flamegraph.pl, inferno ou speedscope
+    * `<horodatage>_<hash>.json` : empreinte de la question, durée, durées des étapes,
+      nombre d'échantillons et fonctions les plus échantillonnées
+- L'activation par la variable d'environnement JERRY_PROFILE, l'option --profile de
+  main.py / tool.py ou le paramètre d'URL ?profile=1 de l'application Streamlit
+
+Profilage désactivé, aucun thread n'est lancé ni aucune pile relevée.
+
+Usage:
+    JERRY_PROFILE=1 python tool.py
+    python main.py --profile
+    flamegraph.pl profiles/20240501-101500_3f2a9c1b7d4e.folded > flamegraph.svg
+"""
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Activation globale et répertoire des profils
+PROFILE_ENABLED = os.getenv("JERRY_PROFILE", "").lower() in ("1", "true", "oui", "yes")
+PROFILE_DIR = os.getenv("JERRY_PROFILE_DIR", "profiles")
+
+# Intervalle d'échantillonnage (en secondes)
+SAMPLE_INTERVAL = float(os.getenv("JERRY_PROFILE_INTERVAL", "0.005"))
+
+# Nombre de fonctions les plus échantillonnées reportées dans le fichier JSON
+TOP_FRAMES = 15
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Profileur de la requête en cours (None : requête non profilée)
+_active: contextvars.ContextVar = contextvars.ContextVar("profile_active", default=None)
+
+
+def question_hash(question: str) -> str:
+    """Empreinte courte et stable d'une question (la question n'est pas écrite dans les profils)."""
+    normalized = " ".join(question.split()).lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(ROOT_DIR):
+        filename = os.path.relpath(filename, ROOT_DIR)
+    else:
+        filename = os.path.basename(filename)
+    # Le point-virgule sépare les frames dans le format replié
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    Profileur par échantillonnage des piles des threads d'une requête.
+
+    Seuls les threads inscrits (`add_thread`, `remove_thread`) sont relevés.
+
+    Args:
+        interval (float): Intervalle entre deux échantillons (en secondes)
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._threads: Counter = Counter()
+        self._threads_lock = threading.Lock()
+
+    def add_thread(self, ident: int) -> None:
+        """Inscrit un thread qui travaille pour la requête (inscriptions imbriquées comptées)."""
+        with self._threads_lock:
+            self._threads[ident] += 1
+
+    def remove_thread(self, ident: int) -> None:
+        with self._threads_lock:
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="jerry-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                threads = set(self._threads)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident not in threads:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Piles repliées, une par ligne : "thread;frame;...;frame nombre"."""
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.stacks.items())) + "\n"
+
+    def top_frames(self, limit: int = TOP_FRAMES) -> List[Tuple[str, int]]:
+        """Fonctions en sommet de pile le plus souvent échantillonnées (temps propre)."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+def write_profile(profiler: SamplingProfiler, question: str, duration: float,
+                  timings: Optional[Dict[str, float]], output_dir: str = PROFILE_DIR) -> str:
+    """
+    Écrit le profil d'une requête (piles repliées et résumé JSON)
+
+    Returns:
+        str: Chemin du fichier .folded
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    digest = question_hash(question)
+    base = os.path.join(output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{digest}")
+    with open(base + ".folded", "w", encoding="utf-8") as file:
+        file.write(profiler.folded())
+    summary = {
+        "question_hash": digest,
+        "duration_s": round(duration, 4),
+        "timings": {stage: round(value, 4) for stage, value in (timings or {}).items()},
+        "interval_s": profiler.interval,
+        "samples": profiler.samples,
+        "top_frames": [{"frame": frame, "samples": count} for frame, count in profiler.top_frames()],
+        "folded": os.path.basename(base + ".folded"),
+    }
+    with open(base + ".json", "w", encoding="utf-8") as file:
+        json.dump(summary, file, ensure_ascii=False, indent=2)
+    return base + ".folded"
+
+
+@contextlib.contextmanager
+def profiled_thread() -> Iterator[None]:
+    """
+    Inscrit le thread courant auprès du profileur de la requête en cours (s'il y en a un)
+
+    Utilisé par PERF.deadline.submit_in_context : les tâches d'une requête profilée sont
+    relevées, quel que soit le thread du pool qui les exécute.
+    """
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+    ident = threading.get_ident()
+    profiler.add_thread(ident)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(ident)
+
+
+@contextlib.contextmanager
+def profile_request(
+    question: str,
+    timings: Optional[Dict[str, float]] = None,
+    enabled: Optional[bool] = None,
+    output_dir: Optional[str] = None
+) -> Iterator[Optional[Dict[str, float]]]:
+    """
+    Profile le bloc si le profilage est activé
+
+    Seuls le thread courant et les tâches soumises par submit_in_context sont relevés.
+
+    Args:
+        question (str): Question traitée (seule son empreinte est écrite)
+        timings (Optional[Dict[str, float]]): Durées des étapes, remplies par le bloc
+        enabled (Optional[bool]): Force l'activation ; None : variable JERRY_PROFILE
+        output_dir (Optional[str]): Répertoire des profils (défaut: JERRY_PROFILE_DIR)
+
+    Yields:
+        Optional[Dict[str, float]]: Les durées à remplir par le bloc (`timings`, ou un
+            dictionnaire créé pour le profil si le profilage est actif et `timings` est None)
+    """
+    if not (PROFILE_ENABLED if enabled is None else enabled) or _active.get() is not None:
+        yield timings
+        return
+
+    timings = timings if timings is not None else {}
+    profiler = SamplingProfiler()
+    token = _active.set(profiler)
+    start = time.perf_counter()
+    profiler.add_thread(threading.get_ident())
+    profiler.start()
+    try:
+        yield timings
+    finally:
+        profiler.stop()
+        profiler.remove_thread(threading.get_ident())
+        _active.reset(token)
+        path = write_profile(profiler, question, time.perf_counter() - start, timings, output_dir or PROFILE_DIR)
+        print(f"INFO: Profil écrit: {path} ({profiler.samples} échantillons)")
@@ -0,0 +1,117 @@
+"""
+Journal des requêtes : questions posées et articles consultés.
+
+Ce module fournit:
+- L'écriture, une ligne JSON par événement, des questions traitées (main.py, tool.py,
+  application Streamlit) et des articles consultés (articles cités, commande :article)
+- La lecture du journal et le classement des questions et des articles les plus
+  fréquents, utilisés par le préchargement des caches (voir CACHE/prefetch.py)
+
+Le journal contient les questions en clair : il n'est écrit que si la variable
+d'environnement JERRY_REQUEST_LOG désigne un fichier.
+
+Usage:
+    JERRY_REQUEST_LOG=logs/requests.jsonl streamlit run streamlit_app/app.py
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Fichier du journal (vide : journal désactivé)
+REQUEST_LOG_PATH = os.getenv("JERRY_REQUEST_LOG", "")
+
+# Ancienneté maximale (en secondes) des événements pris en compte à la lecture
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+# Types d'événements
+QUESTION = "question"
+ARTICLE = "article"
+
+_lock = threading.Lock()
+
+
+def _append(kind: str, value: str, path: Optional[str] = None) -> None:
+    path = REQUEST_LOG_PATH if path is None else path
+    if not path or not value:
+        return
+    line = json.dumps({"t": round(time.time(), 3), "k": kind, "v": value}, ensure_ascii=False) + "\n"
+    try:
+        with _lock:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(line)
+    except OSError as e:
+        # Le journal ne doit jamais faire échouer une requête
+        print(f"ERREUR: Écriture du journal des requêtes impossible: {e}")
+
+
+def log_question(question: str, path: Optional[str] = None) -> None:
+    """Ajoute une question au journal (espaces normalisés), si le journal est activé."""
+    _append(QUESTION, " ".join(question.split()), path)
+
+
+def log_article(article_id: str, path: Optional[str] = None) -> None:
+    """Ajoute un article consulté au journal, si le journal est activé."""
+    _append(ARTICLE, article_id, path)
+
+
+def read_request_log(path: Optional[str] = None, max_age: float = DEFAULT_MAX_AGE) -> List[Dict[str, Any]]:
+    """
+    Événements récents du journal
+
+    Args:
+        path (Optional[str]): Fichier du journal (défaut: JERRY_REQUEST_LOG)
+        max_age (float): Ancienneté maximale des événements retenus, en secondes
+
+    Returns:
+        List[Dict[str, Any]]: Événements {"t": horodatage, "k": type, "v": valeur} ; les lignes
+            illisibles sont ignorées
+    """
+    path = REQUEST_LOG_PATH if path is None else path
+    if not path or not os.path.exists(path):
+        return []
+    oldest = time.time() - max_age
+    events = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(event, dict) and event.get("v") and event.get("t", 0) >= oldest:
+                events.append(event)
+    return events
+
+
+def most_frequent(events: List[Dict[str, Any]], limit: int) -> List[Tuple[str, str, int]]:
+    """
+    Questions et articles les plus fréquents du journal, tous types confondus
+
+    À fréquence égale, l'événement le plus récent passe en premier.
+
+    Args:
+        events (List[Dict[str, Any]]): Événements lus par read_request_log
+        limit (int): Nombre maximal d'éléments par type
+
+    Returns:
+        List[Tuple[str, str, int]]: (type, valeur, nombre d'occurrences), par fréquence décroissante
+    """
+    counts: Dict[str, Counter] = {QUESTION: Counter(), ARTICLE: Counter()}
+    last_seen: Dict[Tuple[str, str], float] = {}
+    for event in events:
+        kind = event.get("k")
+        if kind in counts:
+            counts[kind][event["v"]] += 1
+            last_seen[(kind, event["v"])] = event.get("t", 0)
+
+    ranked = [
+        (kind, value, count)
+        for kind, counter in counts.items()
+        for value, count in counter.most_common(limit)
+    ]
+    ranked.sort(key=lambda item: (-item[2], -last_seen[(item[0], item[1])]))
+    return ranked
@@ -0,0 +1,254 @@
+"""
+Ordonnancement des appels sortants par classe de priorité.
+
+Ce module fournit:
+- Une capacité bornée (appels simultanés) par service externe : "legifrance"
+  (via LEGIFRANCE_UTILS.http_client) et "gemini" (via LLM.init_gemini)
+- Des classes de trafic : "interactif" (utilisateurs Streamlit, CLI) et "batch"
+  (traitements en masse), choisies par contexte d'exécution
+- Une file d'attente équitable pondérée (weighted fair queuing) : à capacité saturée,
+  chaque classe obtient une part des créneaux proportionnelle à son poids
+- Une réserve de créneaux pour le trafic interactif : le batch utilise la capacité
+  libre sans jamais occuper les derniers créneaux
+- Les métriques par classe : profondeur de file, temps d'attente, appels en cours
+
+Les appels de create_payload, search_call, fetch_article et synthesize_legal_response
+passent tous par ces deux points : ils sont ordonnancés sans modification.
+
+Usage:
+    with use_traffic_class(BATCH):
+        for question in questions:
+            search_legifrance(question)
+
+    # ou pour tout un processus
+    JERRY_TRAFFIC_CLASS=batch python regenerer_faq.py
+"""
+import contextlib
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional
+
+from PERF.deadline import DeadlineExceeded, current_deadline, current_stage
+
+# Classes de trafic
+INTERACTIF = "interactif"
+BATCH = "batch"
+
+# Poids de chaque classe à capacité saturée
+CLASS_WEIGHTS = {INTERACTIF: 8, BATCH: 1}
+
+# Créneaux que seules les classes listées peuvent occuper
+RESERVED_SLOTS = {INTERACTIF: 1}
+
+# Appels simultanés par service externe
+SERVICE_CAPACITY = {
+    "legifrance": int(os.getenv("JERRY_LEGIFRANCE_CONCURRENCY", "8")),
+    "gemini": int(os.getenv("JERRY_GEMINI_CONCURRENCY", "4")),
+}
+
+# Nombre de temps d'attente conservés par classe pour les percentiles
+WAIT_SAMPLES = 1000
+
+_traffic_class: contextvars.ContextVar = contextvars.ContextVar(
+    "traffic_class", default=os.getenv("JERRY_TRAFFIC_CLASS", INTERACTIF)
+)
+
+
+def current_traffic_class() -> str:
+    return _traffic_class.get()
+
+
+@contextlib.contextmanager
+def use_traffic_class(traffic_class: str) -> Iterator[str]:
+    """Classe de trafic des appels sortants faits dans le bloc (et dans les threads lancés avec submit_in_context)."""
+    if traffic_class not in CLASS_WEIGHTS:
+        raise ValueError(f"Classe de trafic inconnue: {traffic_class} (attendu: {', '.join(CLASS_WEIGHTS)})")
+    token = _traffic_class.set(traffic_class)
+    try:
+        yield traffic_class
+    finally:
+        _traffic_class.reset(token)
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class _Ticket:
+    __slots__ = ("traffic_class", "tag", "sequence", "enqueued_at")
+
+    def __init__(self, traffic_class: str, tag: float, sequence: int):
+        self.traffic_class = traffic_class
+        self.tag = tag
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+
+
+class PriorityScheduler:
+    """
+    Limite les appels simultanés vers un service et les ordonne par classe de trafic.
+
+    Chaque appel reçoit une étiquette de fin virtuelle (max(temps virtuel, dernière étiquette
+    de sa classe) + 1 / poids) ; un créneau libéré est attribué à l'appel en attente de plus
+    petite étiquette. Une classe seule en file dispose de toute la capacité non réservée.
+
+    Args:
+        name (str): Nom du service (pour les métriques)
+        capacity (int): Nombre maximal d'appels simultanés
+        weights (Optional[Dict[str, float]]): Poids par classe (défaut: CLASS_WEIGHTS)
+        reserved (Optional[Dict[str, int]]): Créneaux réservés par classe (défaut: RESERVED_SLOTS)
+    """
+
+    def __init__(self, name: str, capacity: int, weights: Optional[Dict[str, float]] = None,
+                 reserved: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.weights = weights or CLASS_WEIGHTS
+        self.reserved = reserved if reserved is not None else RESERVED_SLOTS
+        self._condition = threading.Condition()
+        self._waiting: List[_Ticket] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._last_tag = {traffic_class: 0.0 for traffic_class in self.weights}
+        self._in_flight = {traffic_class: 0 for traffic_class in self.weights}
+        self._stats = {
+            traffic_class: {"admitted": 0, "timeouts": 0, "max_depth": 0, "wait_total": 0.0}
+            for traffic_class in self.weights
+        }
+        self._waits: Dict[str, Deque[float]] = {
+            traffic_class: deque(maxlen=WAIT_SAMPLES) for traffic_class in self.weights
+        }
+
+    def _limit(self, traffic_class: str) -> int:
+        """Créneaux utilisables par une classe (capacité moins les réserves des autres classes)."""
+        reserved_for_others = sum(
+            slots for other, slots in self.reserved.items() if other != traffic_class
+        )
+        return max(1, self.capacity - reserved_for_others)
+
+    def _can_run(self, ticket: _Ticket) -> bool:
+        in_flight = sum(self._in_flight.values())
+        if in_flight >= self.capacity or in_flight >= self._limit(ticket.traffic_class):
+            return False
+        # Parmi les appels qui pourraient démarrer, le créneau revient à la plus petite étiquette
+        eligible = [
+            waiting for waiting in self._waiting
+            if in_flight < self._limit(waiting.traffic_class)
+        ]
+        first = min(eligible, key=lambda waiting: (waiting.tag, waiting.sequence))
+        return first is ticket
+
+    def _depth(self, traffic_class: str) -> int:
+        return sum(1 for ticket in self._waiting if ticket.traffic_class == traffic_class)
+
+    def acquire(self, traffic_class: Optional[str] = None) -> str:
+        """
+        Attend un créneau pour un appel de la classe donnée (défaut: classe courante)
+
+        Returns:
+            str: La classe de trafic retenue (à passer à release)
+
+        Raises:
+            DeadlineExceeded: Si l'échéance courante expire pendant l'attente
+        """
+        traffic_class = traffic_class or current_traffic_class()
+        if traffic_class not in self.weights:
+            traffic_class = INTERACTIF
+        deadline = current_deadline()
+
+        with self._condition:
+            tag = max(self._virtual_time, self._last_tag[traffic_class]) + 1.0 / self.weights[traffic_class]
+            self._last_tag[traffic_class] = tag
+            ticket = _Ticket(traffic_class, tag, next(self._sequence))
+            self._waiting.append(ticket)
+            stats = self._stats[traffic_class]
+            stats["max_depth"] = max(stats["max_depth"], self._depth(traffic_class))
+            try:
+                while not self._can_run(ticket):
+                    if deadline is not None:
+                        remaining = deadline.remaining()
+                        if remaining <= 0:
+                            stats["timeouts"] += 1
+                            raise DeadlineExceeded(current_stage())
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+            finally:
+                self._waiting.remove(ticket)
+                # Un autre appel peut être devenu prioritaire
+                self._condition.notify_all()
+
+            wait = time.monotonic() - ticket.enqueued_at
+            self._virtual_time = max(self._virtual_time, ticket.tag)
+            self._in_flight[traffic_class] += 1
+            stats["admitted"] += 1
+            stats["wait_total"] += wait
+            self._waits[traffic_class].append(wait)
+        return traffic_class
+
+    def release(self, traffic_class: str) -> None:
+        with self._condition:
+            self._in_flight[traffic_class] -= 1
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, traffic_class: Optional[str] = None) -> Iterator[str]:
+        """Occupe un créneau le temps d'un appel."""
+        traffic_class = self.acquire(traffic_class)
+        try:
+            yield traffic_class
+        finally:
+            self.release(traffic_class)
+
+    def metrics(self) -> Dict[str, Dict[str, object]]:
+        """
+        Métriques par classe de trafic
+
+        Returns:
+            Dict[str, Dict[str, object]]: Par classe : profondeur de file actuelle et maximale,
+                appels en cours, appels admis, attentes moyenne / p50 / p95 / max (ms),
+                abandons sur échéance
+        """
+        with self._condition:
+            result = {}
+            for traffic_class, stats in self._stats.items():
+                waits = list(self._waits[traffic_class])
+                admitted = stats["admitted"]
+                result[traffic_class] = {
+                    "file": self._depth(traffic_class),
+                    "file_max": stats["max_depth"],
+                    "en_cours": self._in_flight[traffic_class],
+                    "admis": admitted,
+                    "attente_moyenne_ms": round(1000 * stats["wait_total"] / admitted, 2) if admitted else None,
+                    "attente_p50_ms": round(1000 * _percentile(waits, 50), 2) if waits else None,
+                    "attente_p95_ms": round(1000 * _percentile(waits, 95), 2) if waits else None,
+                    "attente_max_ms": round(1000 * max(waits), 2) if waits else None,
+                    "abandons": stats["timeouts"],
+                }
+            return result
+
+
+_schedulers: Dict[str, PriorityScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(service: str) -> PriorityScheduler:
+    """Ordonnanceur du processus pour un service externe ("legifrance" ou "gemini")."""
+    with _schedulers_lock:
+        if service not in _schedulers:
+            _schedulers[service] = PriorityScheduler(service, SERVICE_CAPACITY.get(service, 4))
+        return _schedulers[service]
+
+
+def scheduler_metrics() -> Dict[str, Dict[str, Dict[str, object]]]:
+    """Métriques de tous les ordonnanceurs créés, par service puis par classe."""
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {service: scheduler.metrics() for service, scheduler in schedulers.items()}
@@ -0,0 +1,168 @@
+"""
+Préchauffage du processus au démarrage.
+
+Sans préchauffage, la première question après un déploiement ou un redémarrage paie
+les imports, la construction des prompts, l'initialisation des clients Gemini, le
+token OAuth et l'établissement des connexions TLS. `warm_up` effectue ces étapes
+d'avance :
+- prompts : lecture des fichiers de payload_prompt/utils et construction du prompt système
+- gemini : initialisation des clients Gemini (génération du payload, synthèse, map-reduce)
+  et connexion à l'API Gemini (lecture des informations du modèle, sans génération)
+- code_toc : chargement des tables des matières des codes (CACHE/code_toc.py)
+- token : un token OAuth par identifiant du pool
+- connexions : WARMUP_CONNECTIONS connexions TLS ouvertes en parallèle vers l'API
+  Légifrance (ping), conservées dans le pool de http_client
+
+`start_warm_up` ouvre d'abord l'instantané des caches s'il existe (CACHE/snapshot.py,
+quelques millisecondes : seul son index est lu), puis lance le préchauffage en
+arrière-plan, en classe de trafic "batch", et le préchargement des caches depuis le
+journal des requêtes (CACHE/prefetch.py).
+Il est appelé au démarrage de main.py, de tool.py et de l'application Streamlit ;
+un service qui importe tool.search_legifrance l'appelle à son démarrage.
+
+Une étape en échec est signalée sans interrompre les suivantes. JERRY_WARMUP=0
+désactive le préchauffage.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from PERF.cassette import is_replaying
+from PERF.deadline import submit_in_context
+from PERF.scheduler import BATCH, use_traffic_class
+
+WARMUP_ENABLED = os.getenv("JERRY_WARMUP", "1").lower() not in ("0", "false", "non", "no")
+
+# Connexions TLS ouvertes d'avance vers l'API Légifrance (recherche répartie par fond)
+WARMUP_CONNECTIONS = int(os.getenv("JERRY_WARMUP_CONNECTIONS", "4"))
+
+_started: Optional[threading.Thread] = None
+_start_lock = threading.Lock()
+
+
+def _warm_prompts() -> None:
+    from LEGIFRANCE_UTILS.payload.payload_prompt.create_payload import system_prompt  # noqa: F401
+
+
+def _warm_gemini() -> None:
+    from LEGIFRANCE_UTILS.payload.payload_generator import MODEL_NAME, llm
+    import LEGIFRANCE_UTILS.synthetize.map_reduce  # noqa: F401
+
+    # Pas de connexion à ouvrir lors du rejeu d'une cassette
+    if not is_replaying():
+        llm.models.get(model=MODEL_NAME)
+
+
+def _warm_code_toc() -> None:
+    from CACHE.code_toc import get_code_toc_index
+
+    get_code_toc_index()
+
+
+def _warm_tokens() -> None:
+    from LEGIFRANCE_UTILS.credential_pool import get_credential_pool
+
+    pool = get_credential_pool()
+    failed = [credential.name for credential in pool.credentials if not pool.token(credential)]
+    if failed:
+        raise RuntimeError(f"token non obtenu pour {', '.join(failed)}")
+
+
+def _warm_connections() -> None:
+    from LEGIFRANCE_UTILS.credential_pool import legifrance_request
+    from SEARCH.search_call import LEGIFRANCE_BASE_URL
+
+    def ping():
+        # L'endpoint répond 500 lorsqu'il est joignable
+        legifrance_request(
+            "GET", f"{LEGIFRANCE_BASE_URL}/search/ping",
+            headers={"accept": "application/json"}, tolerated_statuses=(500,)
+        ).close()
+
+    with ThreadPoolExecutor(max_workers=max(1, WARMUP_CONNECTIONS)) as executor:
+        futures = [submit_in_context(executor, ping) for _ in range(max(1, WARMUP_CONNECTIONS))]
+        for future in futures:
+            future.result()
+
+
+WARMUP_STEPS: Dict[str, Callable[[], None]] = {
+    "prompts": _warm_prompts,
+    "gemini": _warm_gemini,
+    "code_toc": _warm_code_toc,
+    "token": _warm_tokens,
+    "connexions": _warm_connections,
+}
+
+
+def warm_up(legifrance: bool = True) -> Dict[str, Optional[float]]:
+    """
+    Préchauffe le processus (prompts, clients Gemini, tables des matières, tokens, connexions)
+
+    Args:
+        legifrance (bool): Inclut les étapes qui appellent l'API Légifrance (token, connexions)
+
+    Returns:
+        Dict[str, Optional[float]]: Durée de chaque étape en secondes (None : étape en échec)
+    """
+    timings: Dict[str, Optional[float]] = {}
+    with use_traffic_class(BATCH):
+        for step, warm in WARMUP_STEPS.items():
+            if not legifrance and step in ("token", "connexions"):
+                continue
+            start = time.perf_counter()
+            try:
+                warm()
+                timings[step] = time.perf_counter() - start
+            except Exception as e:
+                print(f"ERREUR: Préchauffage ({step}) impossible: {e}")
+                timings[step] = None
+    summary = ", ".join(
+        f"{step} {duration:.2f}s" if duration is not None else f"{step} échec" for step, duration in timings.items()
+    )
+    print(f"INFO: Préchauffage terminé ({summary})")
+    return timings
+
+
+def start_warm_up(prefetch: bool = True, search_kwargs: Optional[Dict[str, Any]] = None,
+                  **prefetch_options: Any) -> Optional[threading.Thread]:
+    """
+    Ouvre l'instantané des caches puis lance, une seule fois par processus, le préchauffage
+    et le préchargement en arrière-plan
+
+    Args:
+        prefetch (bool): Précharge ensuite les caches depuis le journal des requêtes
+        search_kwargs (Optional[Dict[str, Any]]): Options de search_call du processus
+            (voir CACHE.prefetch.prefetch_from_log)
+        **prefetch_options: Budgets du préchargement (time_budget, max_gemini_calls,
+            max_legifrance_calls, top)
+
+    Returns:
+        Optional[threading.Thread]: Le thread de préchauffage (None si désactivé)
+    """
+    global _started
+    from CACHE.snapshot import attach_snapshot
+
+    attach_snapshot()
+    with _start_lock:
+        if not WARMUP_ENABLED:
+            return None
+        if _started is not None:
+            return _started
+
+        def run():
+            warm_up()
+            if prefetch:
+                from CACHE.prefetch import prefetch_from_log
+
+                prefetch_from_log(search_kwargs=search_kwargs, **prefetch_options)
+
+        _started = threading.Thread(target=run, name="jerry-warmup", daemon=True)
+        _started.start()
+        return _started
+
+
+if __name__ == "__main__":
+    # Mesure de chaque étape du préchauffage à froid
+    warm_up()
@@ -0,0 +1,49 @@
+"""
+Préparation des métadonnées transmises à la synthèse.
+
+Ce module transforme les documents normalisés renvoyés par search_call en
+une liste de métadonnées (titre, identifiants, extraits) au format attendu
+par synthesize_legal_response.
+"""
+from typing import Any, Dict, List
+
+
+def build_metadata_list(api_results: List[dict]) -> List[Dict[str, Any]]:
+    """
+    Extrait les métadonnées à partir des résultats structurés de search_call
+    
+    Args:
+        api_results (List[dict]): Documents normalisés renvoyés par search_call
+        
+    Returns:
+        List[Dict[str, Any]]: Métadonnées des documents, avec leurs extraits
+    """
+    metadata_list = []
+    
+    for result in api_results:
+        # Format standard pour tous les documents
+        result_metadata = {
+            "title": result["titles"][0]["title"] if result["titles"] else "Titre inconnu",
+            "id": result["titles"][0]["id"] if result["titles"] else "",
+            "cid": result["titles"][0]["cid"] if result["titles"] else "",
+            "type": result["type"],
+            "nature": result["nature"],
+            "origin": result["origin"],
+            "date": result["date"],
+            "extracts": []
+        }
+        
+        # Ajout des extraits pertinents
+        for section in result["sections"]:
+            for extract in section["extracts"]:
+                extract_data = {
+                    "id": extract["id"],
+                    "title": extract["title"] or extract["num"] or "Sans titre",
+                    "section_title": section["title"],
+                    "text": " ".join(extract["values"]) if extract["values"] else ""
+                }
+                result_metadata["extracts"].append(extract_data)
+        
+        metadata_list.append(result_metadata)
+    
+    return metadata_list
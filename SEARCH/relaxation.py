@@ -0,0 +1,145 @@
+"""
+Assouplissement local des payloads de recherche.
+
+Lorsqu'un payload généré par le LLM est trop strict (proximité serrée,
+"TOUS_LES_MOTS_DANS_UN_CHAMP" sur une longue expression...), /search ne renvoie
+aucun résultat. Ce module dérive du payload une échelle de variantes de plus en
+plus larges, sans nouvel appel au LLM :
+
+1. PROXIMITE_ELARGIE : proximités multipliées par PROXIMITY_FACTOR (plafonnées)
+2. CRITERES_SECONDAIRES_RETIRES : seuls les MAX_PRIMARY_CRITERIA premiers critères
+   de chaque champ sont conservés
+3. UN_DES_MOTS : les critères "TOUS_LES_MOTS_DANS_UN_CHAMP" et "EXACTE" deviennent "UN_DES_MOTS"
+4. CHAMP_ELARGI : la recherche porte sur tous les champs ("ALL") au lieu du champ ciblé
+
+Chaque palier part du précédent ; les paliers qui ne modifient pas le payload sont
+omis. L'exécution concurrente de l'échelle est faite par search_call (relax=True).
+"""
+import copy
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+# Noms des paliers, du plus strict au plus large
+ORIGINAL = "original"
+PROXIMITE_ELARGIE = "proximite_elargie"
+CRITERES_SECONDAIRES_RETIRES = "criteres_secondaires_retires"
+UN_DES_MOTS = "un_des_mots"
+CHAMP_ELARGI = "champ_elargi"
+
+PROXIMITY_FACTOR = 3
+MAX_PROXIMITY = 50
+MAX_PRIMARY_CRITERIA = 1
+
+# Types de recherche restrictifs remplacés par "UN_DES_MOTS"
+STRICT_SEARCH_TYPES = ("TOUS_LES_MOTS_DANS_UN_CHAMP", "EXACTE")
+# Types de recherche d'exclusion, jamais assouplis ni retirés
+EXCLUSION_SEARCH_TYPES = ("AUCUN_DES_MOTS", "AUCUNE_CORRESPONDANCE_A_CETTE_EXPRESSION")
+
+PROXIMITY_KEYS = ("proximité", "proximite")
+BROAD_FIELD_TYPE = "ALL"
+
+
+def _champs(payload: dict) -> List[dict]:
+    return payload.get("recherche", {}).get("champs", [])
+
+
+def _iter_criteres(criteres: List[dict]):
+    for critere in criteres or []:
+        yield critere
+        yield from _iter_criteres(critere.get("criteres"))
+
+
+def widen_proximity(payload: dict) -> None:
+    """Multiplie les proximités (des champs et des critères) par PROXIMITY_FACTOR."""
+    for champ in _champs(payload):
+        for element in [champ, *_iter_criteres(champ.get("criteres"))]:
+            for key in PROXIMITY_KEYS:
+                if isinstance(element.get(key), (int, float)):
+                    element[key] = min(MAX_PROXIMITY, max(element[key] + 1, int(element[key] * PROXIMITY_FACTOR)))
+
+
+def drop_secondary_criteria(payload: dict) -> None:
+    """Conserve les premiers critères de chaque champ (et les critères d'exclusion)."""
+    for champ in _champs(payload):
+        kept, primary = [], 0
+        for critere in champ.get("criteres", []):
+            if critere.get("typeRecherche") in EXCLUSION_SEARCH_TYPES:
+                kept.append(critere)
+            elif primary < MAX_PRIMARY_CRITERIA:
+                kept.append(critere)
+                primary += 1
+        champ["criteres"] = kept
+
+
+def use_any_word(payload: dict) -> None:
+    """Remplace les types de recherche restrictifs par "UN_DES_MOTS" (sans proximité)."""
+    for champ in _champs(payload):
+        for critere in _iter_criteres(champ.get("criteres")):
+            if critere.get("typeRecherche") in STRICT_SEARCH_TYPES:
+                critere["typeRecherche"] = "UN_DES_MOTS"
+                # La proximité n'a pas d'effet avec "UN_DES_MOTS"
+                for key in PROXIMITY_KEYS:
+                    critere.pop(key, None)
+
+
+def broaden_field_type(payload: dict) -> None:
+    """Étend la recherche à tous les champs ; les champs identiques sont fusionnés."""
+    champs, seen = [], set()
+    for champ in _champs(payload):
+        champ["typeChamp"] = BROAD_FIELD_TYPE
+        key = json.dumps(champ, sort_keys=True, ensure_ascii=False)
+        if key not in seen:
+            seen.add(key)
+            champs.append(champ)
+    if champs:
+        payload["recherche"]["champs"] = champs
+
+
+# Paliers de l'échelle, appliqués successivement
+RELAXATION_STEPS: List[Tuple[str, Callable[[dict], None]]] = [
+    (PROXIMITE_ELARGIE, widen_proximity),
+    (CRITERES_SECONDAIRES_RETIRES, drop_secondary_criteria),
+    (UN_DES_MOTS, use_any_word),
+    (CHAMP_ELARGI, broaden_field_type),
+]
+
+
+def relaxation_ladder(payload: dict) -> List[Tuple[str, dict]]:
+    """
+    Variantes de plus en plus larges d'un payload de recherche
+
+    Args:
+        payload (dict): Payload /search d'origine (non modifié)
+
+    Returns:
+        List[Tuple[str, dict]]: (nom du palier, payload), du plus strict au plus large,
+            sans le payload d'origine ni les variantes identiques à la précédente
+    """
+    ladder = []
+    current = copy.deepcopy(payload)
+    previous_key = json.dumps(current, sort_keys=True, ensure_ascii=False)
+    for name, step in RELAXATION_STEPS:
+        current = copy.deepcopy(current)
+        step(current)
+        key = json.dumps(current, sort_keys=True, ensure_ascii=False)
+        if key != previous_key:
+            ladder.append((name, current))
+            previous_key = key
+    return ladder
+
+
+def describe_ladder(payload: dict) -> Dict[str, Any]:
+    """Résumé des paliers d'un payload (nom et critères), pour l'affichage ou le débogage."""
+    return {
+        name: [
+            {
+                "typeChamp": champ.get("typeChamp"),
+                "criteres": [
+                    (critere.get("valeur"), critere.get("typeRecherche"), critere.get("proximité"))
+                    for critere in champ.get("criteres", [])
+                ],
+            }
+            for champ in _champs(variant)
+        ]
+        for name, variant in [(ORIGINAL, payload), *relaxation_ladder(payload)]
+    }
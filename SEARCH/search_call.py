@@ -1,110 +1,227 @@
 import requests
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, Iterator, List, Tuple, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+import copy
 import json
+import math
+import time
 
 # utilitaire api legifrance
-from LEGIFRANCE_UTILS.legifrance_init import obtain_legifrance_token
+from LEGIFRANCE_UTILS.credential_pool import NoCredentialAvailable, legifrance_request
+from PERF.deadline import DeadlineExceeded, current_deadline, submit_in_context
+from SEARCH.stream_parser import ResultsArrayParser
+from SEARCH.relaxation import ORIGINAL, relaxation_ladder
 
 
 # Configuration des identifiants API Legifrance Sandbox
 LEGIFRANCE_BASE_URL = "https://sandbox-api.piste.gouv.fr/dila/legifrance/lf-engine-app"
 
-# outil Langchain d'appel à l'endpoint search legifrance
-def search_call(Payload: dict) -> Tuple[List[dict], str]:
+# Fonds interrogés en parallèle lorsque le payload vise "ALL"
+DEFAULT_FAN_OUT_FONDS = ["CODE_ETAT", "LODA_ETAT", "JURI", "CETAT", "KALI"]
+FAN_OUT_MAX_WORKERS = 5
+FAN_OUT_MAX_WAIT = 20.0  # Temps d'attente maximal (en secondes) des fonds lents
+
+# Assouplissement des payloads sans résultat (voir SEARCH/relaxation.py)
+RELAXATION_MAX_WORKERS = 4
+NO_RESULT_ERROR = "Aucun résultat trouvé"
+
+# Taille des morceaux lus en mode streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def normalize_search_result(resultat: dict) -> dict:
     """
-    Appel à l'endpoint /search de l'api Legifrance
+    Normalise un élément de la liste "results" renvoyée par l'endpoint /search
     
     Args:
-        Payload (dict): Le payload de recherche à envoyer à l'API
+        resultat (dict): Élément brut de la réponse de l'API
         
     Returns:
-        Tuple[List[dict], str]: 
-            - Liste de dictionnaires contenant les informations détaillées des résultats
-            - Message d'erreur en cas d'échec ou chaîne vide si succès
+        dict: Document normalisé (titres, sections et extraits)
+    """
+    # Informations de base du document
+    doc_info = {
+        "titles": [],
+        "type": resultat.get('type'),
+        "nature": resultat.get('nature'),
+        "origin": resultat.get('origin'),
+        "date": resultat.get('date'),
+        "sections": []
+    }
+    
+    # Extraction des titres
+    for titre in resultat.get('titles', []):
+        doc_info["titles"].append({
+            "title": titre.get('title', 'Titre non disponible'),
+            "cid": titre.get('cid', 'CID non disponible'),
+            "id": titre.get('id', 'ID non disponible')
+        })
+    
+    # Extraction des sections et de leurs extraits
+    for section in resultat.get('sections', []):
+        section_info = {
+            "id": section.get('id'),
+            "title": section.get('title', 'Titre de section non disponible'),
+            "dateVersion": section.get('dateVersion'),
+            "legalStatus": section.get('legalStatus'),
+            "extracts": []
+        }
+        
+        # Extraction des extraits de la section
+        for extract in section.get('extracts', []):
+            extract_info = {
+                "id": extract.get('id'),
+                "title": extract.get('title', 'Titre d\'extrait non disponible'),
+                "num": extract.get('num'),
+                "legalStatus": extract.get('legalStatus'),
+                "dateVersion": extract.get('dateVersion'),
+                "dateDebut": extract.get('dateDebut'),
+                "dateFin": extract.get('dateFin'),
+                "values": extract.get('values', [])
+            }
+            section_info["extracts"].append(extract_info)
+        
+        doc_info["sections"].append(section_info)
+    
+    return doc_info
+
+
+def _authenticated_headers() -> Tuple[Optional[Dict[str, str]], str]:
     """
-    token = obtain_legifrance_token()
+    Construit les headers et vérifie la disponibilité de l'API
     
-    if not token:
-        return [], "Échec de connexion à Legifrance (échec d'obtention du token)"
+    Le token est ajouté à chaque appel par le pool d'identifiants (voir
+    LEGIFRANCE_UTILS/credential_pool.py), qui choisit l'identifiant le moins chargé.
     
+    Returns:
+        Tuple[Optional[Dict[str, str]], str]: Headers de la requête (ou None) et message d'erreur éventuel
+    """
     # Headers pour l'API
     headers = {
-        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
         "accept": "application/json"
     }
     
-    # Test de connexion à l'API
-    pong = requests.get(f"{LEGIFRANCE_BASE_URL}/search/ping", headers=headers)
+    # Test de connexion à l'API (l'endpoint répond 500 lorsqu'il est joignable)
+    try:
+        pong = legifrance_request(
+            "GET", f"{LEGIFRANCE_BASE_URL}/search/ping", headers=headers, tolerated_statuses=(500,)
+        )
+    except NoCredentialAvailable as e:
+        return None, f"Échec de connexion à Legifrance ({e})"
 
     if pong.status_code == 500:
         print("INFO: L'API Legifrance connectée !")
     else:
-        return [], "ERREUR: L'API Legifrance ne répond pas."
+        return None, "ERREUR: L'API Legifrance ne répond pas."
+    
+    return headers, ""
+
+
+class SearchStream:
+    """
+    Recherche /search dont la réponse est analysée au fil du téléchargement.
+    
+    Chaque document normalisé est émis dès que l'élément correspondant du tableau
+    "results" est complet : l'affichage, le reranking ou la récupération des articles
+    peuvent commencer avant la fin du téléchargement. La réponse brute n'est ni
+    conservée en mémoire ni sauvegardée dans resultats_legifrance.json.
+    
+    Usage:
+        stream = SearchStream(payload)
+        for document in stream:
+            ...
+        if stream.error:
+            print(stream.error)
+    
+    Attributes:
+        error (str): Message d'erreur en cas d'échec ou chaîne vide si succès
+        count (int): Nombre de documents émis
+    """
+    
+    def __init__(self, Payload: dict, headers: Optional[Dict[str, str]] = None, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.payload = Payload
+        self.headers = headers
+        self.chunk_size = chunk_size
+        self.error = ""
+        self.count = 0
+    
+    def __iter__(self) -> Iterator[dict]:
+        if self.headers is None:
+            self.headers, self.error = _authenticated_headers()
+            if self.error:
+                return
+        
+        response = legifrance_request(
+            "POST", f"{LEGIFRANCE_BASE_URL}/search", headers=self.headers, json=self.payload, stream=True
+        )
+        try:
+            if response.status_code != 200:
+                self.error = f"Échec de la requête à Legifrance: code {response.status_code}"
+                print(f"Erreur lors de la requête: {response.status_code} - {response.text}")
+                return
+            
+            parser = ResultsArrayParser()
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                for resultat in parser.feed(chunk):
+                    self.count += 1
+                    yield normalize_search_result(resultat)
+                if parser.results_complete:
+                    # Les facettes qui suivent "results" ne sont pas utiles
+                    break
+            for resultat in parser.close():
+                self.count += 1
+                yield normalize_search_result(resultat)
+            
+            if not parser.results_found:
+                print("INFO: Aucun résultat trouvé.")
+                self.error = NO_RESULT_ERROR
+            else:
+                print("INFO: Requête réussie !")
+        finally:
+            response.close()
+
+
+def _post_search(
+    Payload: dict,
+    headers: Dict[str, str],
+    save_raw: bool = True,
+    stream: bool = False
+) -> Tuple[List[dict], str]:
+    """
+    Envoie un payload à l'endpoint /search et normalise la réponse
+    
+    Args:
+        Payload (dict): Le payload de recherche à envoyer à l'API
+        headers (Dict[str, str]): Headers authentifiés de la requête
+        save_raw (bool): Si True, sauvegarde la réponse brute dans resultats_legifrance.json
+        stream (bool): Si True, analyse la réponse au fil du téléchargement (sans sauvegarde brute)
+        
+    Returns:
+        Tuple[List[dict], str]: Documents normalisés et message d'erreur éventuel
+    """
+    if stream:
+        search_stream = SearchStream(Payload, headers=headers)
+        results_details = list(search_stream)
+        return results_details, search_stream.error
     
-    # Appel à l'API de recherche
-    response = requests.post(f"{LEGIFRANCE_BASE_URL}/search", headers=headers, json=Payload)
+    response = legifrance_request("POST", f"{LEGIFRANCE_BASE_URL}/search", headers=headers, json=Payload)
     
     if response.status_code == 200:
         resultats = response.json()
         
         # Sauvegarde des résultats bruts dans un fichier JSON
-        with open("resultats_legifrance.json", "w", encoding="utf-8") as file:
-            json.dump(resultats, file, ensure_ascii=False, indent=4)
+        if save_raw:
+            with open("resultats_legifrance.json", "w", encoding="utf-8") as file:
+                json.dump(resultats, file, ensure_ascii=False, indent=4)
         
         # Vérification de la présence de résultats
         if resultats.get('results') is None:
             print("INFO: Aucun résultat trouvé.")
-            return [], "Aucun résultat trouvé"
+            return [], NO_RESULT_ERROR
         
         # Liste pour stocker les résultats détaillés
-        results_details = []
-        
-        for resultat in resultats.get('results', []):
-            #print("INFO: Résultats trouvés !")
-            
-            # Informations de base du document
-            doc_info = {
-                "titles": [],
-                "type": resultat.get('type'),
-                "nature": resultat.get('nature'),
-                "origin": resultat.get('origin'),
-                "date": resultat.get('date'),
-                "sections": []
-            }
-            
-            # Extraction des titres
-            for titre in resultat.get('titles', []):
-                doc_info["titles"].append({
-                    "title": titre.get('title', 'Titre non disponible'),
-                    "cid": titre.get('cid', 'CID non disponible'),
-                    "id": titre.get('id', 'ID non disponible')
-                })
-            
-            # Extraction des sections et de leurs extraits
-            for section in resultat.get('sections', []):
-                section_info = {
-                    "id": section.get('id'),
-                    "title": section.get('title', 'Titre de section non disponible'),
-                    "dateVersion": section.get('dateVersion'),
-                    "legalStatus": section.get('legalStatus'),
-                    "extracts": []
-                }
-                
-                # Extraction des extraits de la section
-                for extract in section.get('extracts', []):
-                    extract_info = {
-                        "id": extract.get('id'),
-                        "title": extract.get('title', 'Titre d\'extrait non disponible'),
-                        "num": extract.get('num'),
-                        "legalStatus": extract.get('legalStatus'),
-                        "values": extract.get('values', [])
-                    }
-                    section_info["extracts"].append(extract_info)
-                
-                doc_info["sections"].append(section_info)
-            
-            results_details.append(doc_info)
+        results_details = [normalize_search_result(resultat) for resultat in resultats.get('results', [])]
         
         print("INFO: Requête réussie !")
         return results_details, ""
@@ -114,6 +231,296 @@ def search_call(Payload: dict) -> Tuple[List[dict], str]:
         return [], error_msg
 
 
+def document_key(document: dict) -> Optional[str]:
+    """
+    Clé de déduplication d'un document normalisé : le cid du texte, à défaut son id
+    """
+    for titre in document.get("titles", []):
+        for cle in ("cid", "id"):
+            valeur = titre.get(cle)
+            if valeur and "non disponible" not in valeur:
+                return valeur
+    return None
+
+
+def merge_documents(document: dict, doublon: dict) -> None:
+    """
+    Fusionne dans `document` les sections d'un doublon qu'il ne contient pas encore
+    """
+    sections_connues = {section.get("id") for section in document["sections"]}
+    for section in doublon.get("sections", []):
+        if section.get("id") not in sections_connues:
+            document["sections"].append(section)
+            sections_connues.add(section.get("id"))
+
+
+def _fan_out_search(
+    Payload: dict,
+    headers: Dict[str, str],
+    fonds: List[str],
+    quotas: Optional[Dict[str, int]] = None,
+    max_wait: Optional[float] = FAN_OUT_MAX_WAIT,
+    stream: bool = False
+) -> Tuple[List[dict], str]:
+    """
+    Répartit une recherche sur plusieurs fonds interrogés en parallèle puis fusionne les résultats
+    
+    Chaque fond reçoit une copie du payload dont le "pageSize" est ramené à son quota.
+    La fusion s'arrête dès que le nombre de documents demandé par le payload est atteint :
+    les fonds encore en cours sont alors ignorés. Sous une échéance (voir PERF/deadline.py),
+    l'attente est bornée par le budget restant et les documents déjà reçus sont retournés.
+    
+    Args:
+        Payload (dict): Le payload de recherche d'origine
+        headers (Dict[str, str]): Headers authentifiés de la requête
+        fonds (List[str]): Fonds à interroger (ex: ["CODE_ETAT", "JURI"])
+        quotas (Optional[Dict[str, int]]): Nombre maximal de documents retenus par fond
+        max_wait (Optional[float]): Durée maximale d'attente des fonds, en secondes
+        stream (bool): Si True, chaque réponse est analysée au fil du téléchargement
+        
+    Returns:
+        Tuple[List[dict], str]: Documents fusionnés et dédupliqués, et message d'erreur éventuel :
+            NO_RESULT_ERROR si aucun fond ne renvoie de document, les erreurs des fonds
+            si tous les fonds interrogés ont échoué
+    """
+    page_size = Payload.get("recherche", {}).get("pageSize") or 10
+    quota_defaut = max(1, math.ceil(page_size / len(fonds)))
+    limites = {fond: (quotas or {}).get(fond, quota_defaut) for fond in fonds}
+    
+    def rechercher_fond(fond: str) -> Tuple[List[dict], str]:
+        sous_payload = copy.deepcopy(Payload)
+        sous_payload["fond"] = fond
+        sous_payload.setdefault("recherche", {})["pageSize"] = limites[fond]
+        return _post_search(sous_payload, headers, save_raw=False, stream=stream)
+    
+    debut = time.time()
+    resultats_par_fond: Dict[str, List[dict]] = {}
+    documents_par_cle: Dict[str, dict] = {}
+    erreurs = []
+    nb_documents = 0
+    
+    deadline = current_deadline()
+    if deadline is not None:
+        max_wait = deadline.timeout(max_wait)
+    
+    executor = ThreadPoolExecutor(max_workers=min(len(fonds), FAN_OUT_MAX_WORKERS))
+    futures = {submit_in_context(executor, rechercher_fond, fond): fond for fond in fonds}
+    try:
+        for future in as_completed(futures, timeout=max_wait):
+            fond = futures[future]
+            try:
+                documents, error = future.result()
+            except requests.RequestException as e:
+                documents, error = [], f"Erreur de connexion: {e}"
+            except DeadlineExceeded:
+                documents, error = [], "Échéance dépassée"
+            
+            # Un fond sans résultat n'est pas en échec : seules les erreurs d'appel sont retenues
+            if error and error != NO_RESULT_ERROR:
+                erreurs.append(f"{fond}: {error}")
+            
+            retenus = []
+            for document in documents[:limites[fond]]:
+                cle = document_key(document)
+                if cle and cle in documents_par_cle:
+                    merge_documents(documents_par_cle[cle], document)
+                    continue
+                if cle:
+                    documents_par_cle[cle] = document
+                retenus.append(document)
+            
+            resultats_par_fond[fond] = retenus
+            nb_documents += len(retenus)
+            print(f"INFO: Fond {fond} : {len(retenus)} document(s) en {time.time() - debut:.2f}s")
+            
+            if nb_documents >= page_size:
+                break
+    except FuturesTimeoutError:
+        ignores = [fond for future, fond in futures.items() if not future.done()]
+        print(f"INFO: Fonds ignorés après {max_wait:.2f}s : {', '.join(ignores)}")
+    finally:
+        # Ne pas attendre les fonds lents dont le résultat n'est plus utile
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Fusion dans l'ordre de priorité des fonds
+    results_details = []
+    for fond in fonds:
+        results_details.extend(resultats_par_fond.get(fond, []))
+    
+    if not results_details:
+        if erreurs and len(erreurs) == len(resultats_par_fond):
+            return [], "; ".join(erreurs)
+        return [], NO_RESULT_ERROR
+    
+    print(f"INFO: {len(results_details)} document(s) fusionnés depuis {len(resultats_par_fond)} fond(s)")
+    return results_details, ""
+
+
+def _run_search(
+    Payload: dict,
+    headers: Dict[str, str],
+    fonds: Optional[List[str]],
+    quotas: Optional[Dict[str, int]],
+    max_wait: Optional[float],
+    stream: bool,
+    save_raw: bool = True
+) -> Tuple[List[dict], str]:
+    """Recherche simple ou répartie par fond selon le payload."""
+    if fonds and Payload.get("fond", "ALL") == "ALL":
+        return _fan_out_search(Payload, headers, fonds, quotas, max_wait, stream=stream)
+    return _post_search(Payload, headers, save_raw=save_raw, stream=stream)
+
+
+def _is_zero_hit(results: List[dict], error: str) -> bool:
+    """Recherche aboutie mais sans document (les erreurs d'appel ne sont pas concernées)."""
+    return not results and error in ("", NO_RESULT_ERROR)
+
+
+def _relaxed_search(
+    Payload: dict,
+    headers: Dict[str, str],
+    fonds: Optional[List[str]],
+    quotas: Optional[Dict[str, int]],
+    max_wait: Optional[float],
+    stream: bool
+) -> Tuple[List[dict], str, str]:
+    """
+    Lance en parallèle les variantes assouplies d'un payload sans résultat
+    
+    Le résultat retenu est celui du palier le plus strict qui renvoie des documents :
+    il est retourné dès que tous les paliers plus stricts sont terminés sans résultat,
+    et les paliers plus larges encore en cours sont abandonnés. Si aucun palier ne renvoie
+    de document, la première erreur d'appel rencontrée est retournée (NO_RESULT_ERROR si
+    tous les paliers ont abouti sans résultat).
+    
+    Returns:
+        Tuple[List[dict], str, str]: Documents, message d'erreur éventuel et nom du palier retenu
+    """
+    ladder = relaxation_ladder(Payload)
+    if not ladder:
+        return [], NO_RESULT_ERROR, ORIGINAL
+    
+    deadline = current_deadline()
+    wait = deadline.timeout(max_wait) if deadline is not None else max_wait
+    
+    executor = ThreadPoolExecutor(max_workers=min(len(ladder), RELAXATION_MAX_WORKERS))
+    futures = [
+        submit_in_context(executor, _run_search, variant, headers, fonds, quotas, max_wait, stream, False)
+        for _, variant in ladder
+    ]
+    outcomes: List[Optional[Tuple[List[dict], str]]] = [None] * len(ladder)
+    first_error = ""
+    try:
+        for future in as_completed(futures, timeout=wait):
+            position = futures.index(future)
+            try:
+                outcomes[position] = future.result()
+            except (requests.RequestException, DeadlineExceeded) as e:
+                outcomes[position] = ([], f"Erreur de connexion: {e}")
+            results, error = outcomes[position]
+            if not results and not first_error and not _is_zero_hit(results, error):
+                first_error = error
+            
+            # Le palier le plus strict avec résultats l'emporte dès que les plus stricts ont échoué
+            for (name, _), outcome in zip(ladder, outcomes):
+                if outcome is None:
+                    break
+                if outcome[0]:
+                    return outcome[0], "", name
+    except FuturesTimeoutError:
+        print(f"INFO: Paliers d'assouplissement ignorés après {wait:.2f}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Attente écoulée : palier le plus strict parmi ceux qui ont abouti
+    for (name, _), outcome in zip(ladder, outcomes):
+        if outcome is not None and outcome[0]:
+            return outcome[0], "", name
+    return [], first_error or NO_RESULT_ERROR, ORIGINAL
+
+
+def search_with_relaxation(
+    Payload: dict,
+    fonds: Optional[List[str]] = None,
+    quotas: Optional[Dict[str, int]] = None,
+    max_wait: Optional[float] = FAN_OUT_MAX_WAIT,
+    stream: bool = False,
+    save_raw: bool = True
+) -> Tuple[List[dict], str, str]:
+    """
+    Recherche avec le payload d'origine puis, s'il ne renvoie aucun document, avec
+    ses variantes assouplies lancées en parallèle (sans nouvel appel au LLM)
+    
+    Args:
+        Payload (dict): Le payload de recherche à envoyer à l'API
+        fonds, quotas, max_wait, stream, save_raw: Voir search_call
+        
+    Returns:
+        Tuple[List[dict], str, str]:
+            - Documents normalisés
+            - Message d'erreur en cas d'échec ou chaîne vide si succès
+            - Nom du palier retenu ("original" si le payload d'origine a suffi, voir SEARCH/relaxation.py)
+    """
+    headers, error = _authenticated_headers()
+    
+    if error:
+        return [], error, ORIGINAL
+    
+    results, error = _run_search(Payload, headers, fonds, quotas, max_wait, stream, save_raw)
+    if not _is_zero_hit(results, error):
+        return results, error, ORIGINAL
+    
+    print("INFO: Aucun résultat, recherche avec les variantes assouplies du payload")
+    results, error, level = _relaxed_search(Payload, headers, fonds, quotas, max_wait, stream)
+    if results:
+        print(f"INFO: {len(results)} document(s) trouvés avec le palier {level}")
+    return results, error, level
+
+
+# outil Langchain d'appel à l'endpoint search legifrance
+def search_call(
+    Payload: dict,
+    fonds: Optional[List[str]] = None,
+    quotas: Optional[Dict[str, int]] = None,
+    max_wait: Optional[float] = FAN_OUT_MAX_WAIT,
+    stream: bool = False,
+    relax: bool = False,
+    save_raw: bool = True
+) -> Tuple[List[dict], str]:
+    """
+    Appel à l'endpoint /search de l'api Legifrance
+    
+    Args:
+        Payload (dict): Le payload de recherche à envoyer à l'API
+        fonds (Optional[List[str]]): Si fourni et que le payload vise le fond "ALL",
+            la recherche est répartie en parallèle sur ces fonds (voir DEFAULT_FAN_OUT_FONDS)
+        quotas (Optional[Dict[str, int]]): Nombre maximal de documents retenus par fond
+        max_wait (Optional[float]): Durée maximale d'attente des fonds lents, en secondes
+        stream (bool): Si True, la réponse est analysée au fil du téléchargement sans être
+            sauvegardée (voir SearchStream pour consommer les documents dès leur arrivée)
+        relax (bool): Si True et que le payload ne renvoie aucun document, ses variantes
+            assouplies sont recherchées (voir search_with_relaxation)
+        save_raw (bool): Si True, la réponse brute d'une recherche simple (ni répartie ni
+            en streaming) est sauvegardée dans resultats_legifrance.json (fixture des benchmarks)
+        
+    Returns:
+        Tuple[List[dict], str]: 
+            - Liste de dictionnaires contenant les informations détaillées des résultats
+            - Message d'erreur en cas d'échec ou chaîne vide si succès
+    """
+    if relax:
+        results, error, _ = search_with_relaxation(Payload, fonds, quotas, max_wait, stream, save_raw)
+        return results, error
+    
+    headers, error = _authenticated_headers()
+    
+    if error:
+        return [], error
+    
+    # Appel à l'API de recherche, éventuellement réparti par fond
+    return _run_search(Payload, headers, fonds, quotas, max_wait, stream, save_raw)
+
+
 def format_search_results(results: List[dict]) -> None:
     """
     Affiche les résultats de recherche de manière formatée
@@ -0,0 +1,153 @@
+"""
+Analyse incrémentale des réponses de l'endpoint /search.
+
+Ce module fournit un parseur qui reçoit le corps HTTP par morceaux et
+restitue chaque élément du tableau "results" dès qu'il est complet, sans
+attendre la fin du téléchargement ni construire l'objet JSON complet.
+Seul l'élément en cours de lecture est conservé en mémoire.
+"""
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Caractères structurants hors chaîne / dans une chaîne JSON
+_STRUCTURE_RE = re.compile(r'["{}\[\]]')
+_STRING_RE = re.compile(r'["\\]')
+
+
+class ResultsArrayParser:
+    """
+    Parseur incrémental du tableau "results" d'une réponse /search.
+
+    Usage:
+        parser = ResultsArrayParser()
+        for chunk in response.iter_content(65536):
+            for resultat in parser.feed(chunk):
+                ...
+
+    Attributes:
+        results_found (bool): True si une clé "results" de type tableau a été rencontrée
+        results_complete (bool): True une fois le tableau "results" refermé
+    """
+
+    def __init__(self, key: str = "results"):
+        self.key = key
+        self.results_found = False
+        self.results_complete = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start: Optional[int] = None
+        self._last_key: Optional[str] = None
+        self._in_results = False
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        """
+        Ajoute un morceau du corps HTTP et retourne les éléments complétés
+
+        Args:
+            chunk (bytes): Morceau brut du corps de la réponse
+
+        Returns:
+            List[Dict[str, Any]]: Éléments de "results" terminés dans ce morceau
+        """
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        self._buffer += chunk
+        items = self._scan()
+        self._compact()
+        return items
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        Termine l'analyse (fin du flux) et retourne les derniers éléments éventuels
+        """
+        return self.feed(self._decoder.decode(b"", final=True))
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        items = []
+        buffer = self._buffer
+        while not self.results_complete:
+            if self._in_string:
+                match = _STRING_RE.search(buffer, self._pos)
+                if not match:
+                    self._pos = len(buffer)
+                    break
+                if match.group() == "\\":
+                    # Échappement : le caractère suivant doit être disponible
+                    if match.end() >= len(buffer):
+                        self._pos = match.start()
+                        break
+                    self._pos = match.end() + 1
+                    continue
+                self._in_string = False
+                self._pos = match.end()
+                if self._depth == 1 and self._string_start is not None:
+                    self._last_key = buffer[self._string_start:match.start()]
+                self._string_start = None
+                continue
+
+            match = _STRUCTURE_RE.search(buffer, self._pos)
+            if not match:
+                self._pos = len(buffer)
+                break
+            char = match.group()
+            self._pos = match.end()
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = self._pos if self._depth == 1 else None
+            elif char in "{[":
+                if self._in_results and self._depth == 2 and char == "{":
+                    self._item_start = match.start()
+                if self._depth == 1 and char == "[" and self._last_key == self.key:
+                    self._in_results = True
+                    self.results_found = True
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._in_results and self._depth == 2 and char == "}" and self._item_start is not None:
+                    items.append(json.loads(buffer[self._item_start:self._pos]))
+                    self._item_start = None
+                elif self._in_results and self._depth == 1:
+                    self._in_results = False
+                    self.results_complete = True
+        return items
+
+    def _compact(self) -> None:
+        """Libère la partie du tampon déjà analysée."""
+        if self._item_start is not None:
+            start = self._item_start
+        elif self._string_start is not None:
+            start = self._string_start
+        else:
+            start = self._pos
+        if start <= 0:
+            return
+        self._buffer = self._buffer[start:]
+        self._pos -= start
+        if self._item_start is not None:
+            self._item_start -= start
+        if self._string_start is not None:
+            self._string_start -= start
+
+
+def iter_results(chunks: Iterable[bytes], key: str = "results") -> Iterator[Dict[str, Any]]:
+    """
+    Itère sur les éléments du tableau "results" à partir d'un flux de morceaux bruts
+
+    Args:
+        chunks (Iterable[bytes]): Morceaux successifs du corps de la réponse
+        key (str): Clé du tableau à extraire (défaut: "results")
+
+    Returns:
+        Iterator[Dict[str, Any]]: Éléments bruts, dans l'ordre de la réponse
+    """
+    parser = ResultsArrayParser(key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
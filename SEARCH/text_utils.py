@@ -0,0 +1,52 @@
+"""
+Outils de traitement de texte partagés par la recherche.
+
+Ce module fournit:
+- Le nettoyage des extraits renvoyés par /search (balises <mark>)
+- La normalisation (minuscules, sans accents) et le découpage en termes
+- Une liste de mots vides du français juridique courant
+"""
+import re
+import unicodedata
+from typing import List
+
+# Mots vides ignorés lors du découpage en termes
+STOPWORDS = {
+    "les", "des", "une", "est", "que", "qui", "quoi", "dans", "pour", "par", "sur", "aux",
+    "avec", "sans", "son", "ses", "leur", "leurs", "cette", "ces", "cet", "mais", "donc",
+    "car", "pas", "plus", "peut", "etre", "avoir", "quel", "quelle", "quels", "quelles",
+    "comment", "pourquoi", "quand", "elle", "ils", "elles", "nous", "vous", "tout", "tous",
+    "toute", "toutes", "faire", "fait", "sont", "ont", "aussi", "alors", "entre", "selon",
+    "ceux", "celle", "celui", "lui", "meme", "autre", "autres", "dit", "dire", "the",
+    "cas", "est-ce",
+}
+
+_MARK_RE = re.compile(r"</?mark>")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def strip_marks(text: str) -> str:
+    """Supprime les balises <mark> ajoutées par Legifrance autour des termes trouvés."""
+    return _MARK_RE.sub("", text or "")
+
+
+def normalize_text(text: str) -> str:
+    """Met le texte en minuscules et supprime les accents."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte en termes significatifs (normalisés, hors mots vides)
+    
+    Args:
+        text (str): Texte à découper
+        
+    Returns:
+        List[str]: Termes, dans l'ordre du texte
+    """
+    return [
+        token for token in _TOKEN_RE.findall(normalize_text(strip_marks(text)))
+        if len(token) > 2 and token not in STOPWORDS
+    ]
@@ -0,0 +1,5 @@
+"""
+Sessions de conversation : conservation des documents, extraits et articles
+récupérés au fil des questions afin d'éviter de relancer la recherche
+Légifrance pour les questions de suivi.
+"""
@@ -0,0 +1,353 @@
+"""
+Session de conversation multi-tours.
+
+Ce module fournit une session qui conserve, d'une question à l'autre:
+- Les documents normalisés renvoyés par /search (dédupliqués par cid/id)
+- Les extraits de ces documents
+- Les articles consultés (get_article), joints aux synthèses des questions qui les concernent
+
+Les synthèses des questions de suivi reçoivent les échanges précédents, afin qu'une
+question elliptique ("Et s'il est émancipé ?") soit comprise.
+
+Pour une question de suivi, la session choisit entre:
+- REUTILISER : les éléments déjà récupérés couvrent la question, aucune recherche
+- NOUVEAUX_CRITERES : seule la partie nouvelle du payload est recherchée
+- PAGE_SUIVANTE : le payload ne contient rien de nouveau, on lit la page suivante
+- NOUVELLE_RECHERCHE : changement de sujet, la recherche repart de zéro
+"""
+import copy
+import json
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from CACHE.process_cache import cached_fetch_article, cached_search_call
+from LEGIFRANCE_UTILS.citation.cited_articles import article_metadata
+from LEGIFRANCE_UTILS.payload.payload_generator import create_payload
+from LEGIFRANCE_UTILS.synthetize.synthetize_response import synthesize_legal_response
+from LEGIFRANCE_UTILS.temporal.point_in_time import filter_for_question
+from SEARCH.search_call import document_key, merge_documents
+from SEARCH.metadata import build_metadata_list
+from SEARCH.text_utils import normalize_text, tokenize
+
+# Part des termes de la question présents dans les extraits au-delà de laquelle
+# les éléments déjà récupérés suffisent
+SUFFICIENT_COVERAGE = 0.7
+# En dessous de cette couverture, et sans critère commun, on change de sujet
+WIDEN_COVERAGE = 0.3
+# Nombre maximal de documents transmis à la synthèse
+MAX_DOCUMENTS = 10
+# Tours précédents rappelés à la synthèse, et longueur maximale de chaque réponse rappelée
+CONTEXT_TURNS = 3
+CONTEXT_ANSWER_CHARS = 1500
+
+# Décisions possibles pour une question de suivi
+REUTILISER = "reutiliser"
+NOUVEAUX_CRITERES = "nouveaux_criteres"
+PAGE_SUIVANTE = "page_suivante"
+NOUVELLE_RECHERCHE = "nouvelle_recherche"
+
+
+def _iter_criteres(criteres: List[dict]):
+    for critere in criteres or []:
+        yield critere
+        yield from _iter_criteres(critere.get("criteres"))
+
+
+def criteria_values(payload: dict) -> Set[str]:
+    """
+    Valeurs recherchées par un payload (normalisées), tous champs confondus
+
+    Args:
+        payload (dict): Payload /search
+
+    Returns:
+        Set[str]: Valeurs des critères, en minuscules et sans accents
+    """
+    values = set()
+    for champ in payload.get("recherche", {}).get("champs", []):
+        for critere in _iter_criteres(champ.get("criteres")):
+            if critere.get("valeur"):
+                values.add(normalize_text(str(critere["valeur"])).strip())
+    return values
+
+
+def _new_criteres(criteres: List[dict], known_values: Set[str]) -> List[dict]:
+    """Critères (modifiés sur place) dont la valeur, ou celle d'un sous-critère, est nouvelle."""
+    kept = []
+    for critere in criteres or []:
+        nested = critere.get("criteres")
+        if nested:
+            critere["criteres"] = _new_criteres(nested, known_values)
+        is_new = normalize_text(str(critere.get("valeur", ""))).strip() not in known_values
+        if critere.get("criteres") or (is_new and (critere.get("valeur") or not nested)):
+            kept.append(critere)
+    return kept
+
+
+def restrict_to_new_criteria(payload: dict, known_values: Set[str]) -> Optional[dict]:
+    """
+    Copie du payload limitée aux critères dont la valeur n'a pas encore été recherchée
+
+    Les sous-critères (clé "criteres" d'un critère) sont filtrés de la même façon, comme
+    dans criteria_values ; un critère est conservé si sa valeur ou celle d'un de ses
+    sous-critères est nouvelle.
+
+    Args:
+        payload (dict): Payload /search généré pour la question de suivi
+        known_values (Set[str]): Valeurs déjà recherchées lors des tours précédents
+
+    Returns:
+        Optional[dict]: Payload restreint, ou None s'il ne reste aucun critère
+    """
+    restricted = copy.deepcopy(payload)
+    champs = []
+    for champ in restricted.get("recherche", {}).get("champs", []):
+        champ["criteres"] = _new_criteres(champ.get("criteres"), known_values)
+        if champ["criteres"]:
+            champs.append(champ)
+    if not champs:
+        return None
+    restricted["recherche"]["champs"] = champs
+    return restricted
+
+
+class ConversationSession:
+    """
+    Conversation dont les questions de suivi réutilisent les résultats des tours précédents.
+
+    Usage:
+        session = ConversationSession()
+        print(session.ask("Un mineur peut-il être commerçant ?"))
+        print(session.ask("Et s'il est émancipé ?"))
+
+    Args:
+        fonds (Optional[List[str]]): Fonds interrogés en parallèle (voir search_call)
+        sufficient_coverage (float): Couverture à partir de laquelle aucune recherche n'est faite
+        widen_coverage (float): Couverture en dessous de laquelle le sujet est considéré nouveau
+        max_documents (int): Nombre maximal de documents transmis à la synthèse
+    """
+
+    def __init__(
+        self,
+        fonds: Optional[List[str]] = None,
+        sufficient_coverage: float = SUFFICIENT_COVERAGE,
+        widen_coverage: float = WIDEN_COVERAGE,
+        max_documents: int = MAX_DOCUMENTS
+    ):
+        self.fonds = fonds
+        self.sufficient_coverage = sufficient_coverage
+        self.widen_coverage = widen_coverage
+        self.max_documents = max_documents
+        self.documents: Dict[str, dict] = {}
+        self.extracts: Dict[str, Dict[str, Any]] = {}
+        self.articles: Dict[str, dict] = {}
+        self._article_terms: Dict[str, Set[str]] = {}
+        self.turns: List[Dict[str, Any]] = []
+        self.searched_values: Set[str] = set()
+        self.last_payload: Optional[dict] = None
+        self._terms: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Oublie les éléments récupérés (changement de sujet)."""
+        self.documents.clear()
+        self.extracts.clear()
+        self._terms.clear()
+        self.searched_values.clear()
+        self.last_payload = None
+
+    def add_documents(self, documents: List[dict]) -> int:
+        """
+        Ajoute des documents normalisés à la session
+
+        Returns:
+            int: Nombre de documents nouveaux (les doublons sont fusionnés)
+        """
+        added = 0
+        for document in documents:
+            key = document_key(document) or f"document-{len(self.documents)}"
+            if key in self.documents:
+                merge_documents(self.documents[key], document)
+            else:
+                self.documents[key] = document
+                added += 1
+
+            metadata = build_metadata_list([self.documents[key]])[0]
+            terms = set(tokenize(metadata["title"]))
+            for extract in metadata["extracts"]:
+                self.extracts[extract["id"]] = dict(extract, document_title=metadata["title"])
+                terms.update(tokenize(f"{extract['section_title']} {extract['title']} {extract['text']}"))
+            self._terms[key] = terms
+        return added
+
+    def get_article(self, article_id: str) -> Optional[dict]:
+        """
+        Récupère un article, une seule fois par session
+
+        L'article consulté est ensuite joint à la synthèse des questions dont il partage des termes.
+        """
+        if article_id not in self.articles:
+            article = cached_fetch_article(article_id)
+            if not article or not article.get("article"):
+                return None
+            self.articles[article_id] = article
+            metadata = article_metadata(article)
+            extract = metadata["extracts"][0]
+            self._article_terms[article_id] = set(tokenize(f"{metadata['title']} {extract['title']} {extract['text']}"))
+        return self.articles[article_id]
+
+    def select_articles(self, question: str) -> List[Dict[str, Any]]:
+        """Métadonnées des articles consultés qui partagent des termes avec la question."""
+        question_terms = set(tokenize(question))
+        return [
+            article_metadata(self.articles[article_id])
+            for article_id, terms in self._article_terms.items() if question_terms & terms
+        ]
+
+    def coverage(self, question: str) -> float:
+        """
+        Part des termes de la question présents dans les éléments déjà récupérés
+        """
+        question_terms = set(tokenize(question))
+        if not question_terms or not self._terms:
+            return 0.0
+        known_terms = set().union(*self._terms.values())
+        return len(question_terms & known_terms) / len(question_terms)
+
+    def _context(self) -> str:
+        """Contexte transmis à create_payload pour les questions de suivi."""
+        questions = "\n".join(f"- {turn['question']}" for turn in self.turns)
+        values = ", ".join(sorted(self.searched_values))
+        return (
+            f"Questions précédentes de la conversation :\n{questions}\n"
+            f"Termes déjà recherchés : {values}\n"
+            "Génère un payload pour la nouvelle question en privilégiant les termes non encore recherchés."
+        )
+
+    def _synthesis_context(self) -> Optional[str]:
+        """Derniers échanges de la conversation, transmis à la synthèse (None au premier tour)."""
+        if not self.turns:
+            return None
+        exchanges = []
+        for turn in self.turns[-CONTEXT_TURNS:]:
+            answer = turn["synthesis"] or ""
+            if len(answer) > CONTEXT_ANSWER_CHARS:
+                answer = answer[:CONTEXT_ANSWER_CHARS] + "..."
+            exchanges.append(f"Question : {turn['question']}\nRéponse : {answer}")
+        return "\n\n".join(exchanges)
+
+    def plan(self, question: str) -> Tuple[str, Optional[dict]]:
+        """
+        Choisit la stratégie pour une question et prépare le payload éventuel
+
+        Args:
+            question (str): Question posée
+
+        Returns:
+            Tuple[str, Optional[dict]]: Décision et payload à rechercher (None pour REUTILISER)
+
+        Raises:
+            json.JSONDecodeError: Si le LLM ne génère pas de JSON valide
+        """
+        if not self.documents:
+            return NOUVELLE_RECHERCHE, json.loads(create_payload(user_input=question))
+
+        coverage = self.coverage(question)
+        if coverage >= self.sufficient_coverage:
+            return REUTILISER, None
+
+        payload = json.loads(create_payload(user_input=question, context=self._context()))
+        values = criteria_values(payload)
+        new_values = values - self.searched_values
+
+        if not new_values and self.last_payload is not None:
+            next_page = copy.deepcopy(self.last_payload)
+            recherche = next_page.setdefault("recherche", {})
+            recherche["pageNumber"] = recherche.get("pageNumber", 1) + 1
+            return PAGE_SUIVANTE, next_page
+
+        if new_values != values or coverage >= self.widen_coverage:
+            restricted = restrict_to_new_criteria(payload, self.searched_values)
+            if restricted is not None:
+                return NOUVEAUX_CRITERES, restricted
+
+        return NOUVELLE_RECHERCHE, payload
+
+    def select_documents(self, question: str) -> List[dict]:
+        """
+        Documents de la session les plus proches de la question, pour la synthèse
+        """
+        question_terms = set(tokenize(question))
+        scored = [
+            (len(question_terms & self._terms.get(key, set())), index, document)
+            for index, (key, document) in enumerate(self.documents.items())
+        ]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        relevant = [document for score, _, document in scored if score > 0]
+        return (relevant or [document for _, _, document in scored])[:self.max_documents]
+
+    def ask(self, question: str) -> Optional[str]:
+        """
+        Répond à une question en réutilisant autant que possible les tours précédents
+
+        Args:
+            question (str): La question juridique (initiale ou de suivi)
+
+        Returns:
+            Optional[str]: La synthèse, ou None en cas d'erreur
+        """
+        # Une question à la fois par session : les tours s'appuient sur les précédents
+        with self._lock:
+            return self._ask(question)
+
+    def _ask(self, question: str) -> Optional[str]:
+        try:
+            decision, payload = self.plan(question)
+        except json.JSONDecodeError:
+            print("ERREUR: Le LLM n'a pas généré de JSON valide pour l'appel à l'API.")
+            return None
+
+        print(f"INFO: Stratégie pour la question : {decision}")
+
+        if payload is not None:
+            if decision == NOUVELLE_RECHERCHE:
+                self.reset()
+
+            api_results, error = cached_search_call(payload, fonds=self.fonds)
+            if error and not self.documents and not self.select_articles(question):
+                print(f"ERREUR: {error}")
+                return None
+
+            # Extraits en vigueur à la date visée par la question
+            api_results = filter_for_question(api_results, question) if api_results else []
+            added = self.add_documents(api_results)
+            print(f"INFO: {added} nouveau(x) document(s) ajouté(s) à la session")
+            self.searched_values |= criteria_values(payload)
+            if decision != NOUVEAUX_CRITERES:
+                self.last_payload = payload
+
+        documents = self.select_documents(question)
+        metadata_list = self.select_articles(question) + build_metadata_list(documents)
+        if not metadata_list:
+            print("INFO: Aucun résultat trouvé.")
+            synthesis = "Aucun résultat juridique trouvé pour cette question."
+        else:
+            synthesis = synthesize_legal_response(question, metadata_list, context=self._synthesis_context())
+
+        self.turns.append({
+            "question": question,
+            "decision": decision,
+            "documents": len(metadata_list),
+            "synthesis": synthesis,
+        })
+        return synthesis
+
+
+if __name__ == "__main__":
+    # Exemple d'utilisation : une question initiale puis des questions de suivi
+    session = ConversationSession()
+    while True:
+        user_question = input("Entrez votre question (vide pour quitter) : ").strip()
+        if not user_question:
+            break
+        print(session.ask(user_question))
@@ -1,31 +1,206 @@
 # -*- coding: utf-8 -*-
+import argparse
 import json
 import os
 
 from LEGIFRANCE_UTILS.payload.payload_generator import create_payload
 from LEGIFRANCE_UTILS.payload.parse_payload import parse_json_model_output
 from SEARCH.search_call import search_call, format_search_results
+from SEARCH.metadata import build_metadata_list
 from LEGIFRANCE_UTILS.display_article.get_article_from_id import print_article
 from LEGIFRANCE_UTILS.synthetize.synthetize_response import synthesize_legal_response
+from LEGIFRANCE_UTILS.temporal.point_in_time import filter_for_question
+from PERF.profiling import profile_request
+from PERF.request_log import log_article, log_question
+from PERF.warmup import start_warm_up
+from LLM.usage import RequestUsage, UsageBudget, usage_metrics, use_request_usage
+from CACHE.answer_cache import ANSWER_CACHE_ENABLED, answer_sources, get_answer_cache
+from CACHE.process_cache import cache_stats, cached_create_payload, cached_fetch_article, cached_search_call
+from CACHE.vector_index import get_vector_index
+from CACHE.version_index import get_version_index
+from SESSION.conversation import ConversationSession
+from tool import timed_stage
 
+# Commandes du mode interactif
+REPL_HELP = """Commandes :
+  :temps           durées des étapes de la dernière question
+  :tokens          consommation Gemini de la dernière question et de la session
+  :relancer        reposer la dernière question
+  :article <id>    afficher un article (ex: :article LEGIARTI000006419292)
+  :caches          statistiques des caches du processus
+  :nouveau         nouvelle conversation (avec --conversation)
+  :aide            afficher cette aide
+  :quitter         quitter (ou Ctrl-D)
+Toute autre saisie est traitée comme une question."""
 
-def main():
+# Session à laquelle la consommation LLM du mode interactif est imputée
+REPL_SESSION = "cli"
+
+
+def main(profile=None, index=None):
+    # Préchauffage (token, connexions) pendant la saisie de la question
+    start_warm_up(prefetch=False)
+    
     # Le payload_generator demande déjà la question à l'utilisateur
     # Générer le payload pour la recherche
     user_input = input("Entrez votre question : ")
     
+    # Profil de la requête si demandé (--profile ou JERRY_PROFILE=1)
+    with use_request_usage(RequestUsage(UsageBudget.from_env())), \
+            profile_request(user_input, enabled=profile) as timings:
+        _run(user_input, timings, index=index)
+
+
+def interactive(profile=None, index=None, conversation=False):
+    """
+    Mode interactif : les questions s'enchaînent dans le même processus.
+    
+    Les clients Gemini, les prompts, les tokens OAuth et les connexions HTTP restent
+    initialisés d'une question à l'autre ; les payloads, les recherches et les articles
+    sont conservés dans les caches du processus (CACHE/process_cache.py), préchargés au
+    démarrage depuis le journal des requêtes (JERRY_REQUEST_LOG). Une question déjà
+    traitée est servie depuis le cache des réponses tant que ses sources n'ont pas changé.
+    Avec l'index vectoriel (--index ou JERRY_VECTOR_INDEX), les extraits déjà récupérés
+    proches de la question évitent le payload et la recherche.
+    
+    Avec --conversation, les questions forment une conversation (SESSION/conversation.py) :
+    une question de suivi réutilise les documents et les articles consultés (:article) des
+    tours précédents, et sa synthèse reçoit les échanges précédents.
+    """
+    start_warm_up(prefetch=True)
+    print(REPL_HELP)
+    session = ConversationSession() if conversation else None
+    last_question = None
+    last_timings = {}
+    last_usage = None
+    
+    while True:
+        try:
+            line = input("\njerry> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not line:
+            continue
+        
+        command, _, argument = line.partition(" ")
+        if command in (":quitter", ":q", "quit", "exit"):
+            break
+        elif command == ":aide":
+            print(REPL_HELP)
+        elif command == ":nouveau":
+            if session is None:
+                print("Mode conversation inactif (--conversation).")
+                continue
+            session = ConversationSession()
+            print("Nouvelle conversation.")
+        elif command == ":temps":
+            if not last_timings:
+                print("Aucune question traitée.")
+                continue
+            for stage, duration in last_timings.items():
+                print(f"  {stage:<10} {duration:.2f} s")
+            print(f"  {'total':<10} {sum(last_timings.values()):.2f} s")
+        elif command == ":tokens":
+            if last_usage is None:
+                print("Aucune question traitée.")
+                continue
+            print(f"  question : {json.dumps(last_usage.as_dict(), ensure_ascii=False)}")
+            session = usage_metrics(session=REPL_SESSION)["sessions"].get(REPL_SESSION)
+            print(f"  session  : {json.dumps(session, ensure_ascii=False)}")
+        elif command == ":caches":
+            for name, stats in cache_stats().items():
+                print(f"  {name:<8} {stats}")
+            if ANSWER_CACHE_ENABLED:
+                print(f"  {'reponses':<8} {get_answer_cache().stats()}")
+            print(f"  {'versions':<8} {get_version_index().stats()}")
+            if index is not None:
+                print(f"  {'index':<8} {index.stats()}")
+        elif command == ":article":
+            if not argument.strip():
+                print("Usage : :article <identifiant>")
+                continue
+            article_id = argument.strip()
+            log_article(article_id)
+            article_data = session.get_article(article_id) if session is not None else cached_fetch_article(article_id)
+            print_article(article_id, article_data=article_data)
+        elif command == ":relancer":
+            if last_question is None:
+                print("Aucune question à relancer.")
+                continue
+            last_timings, last_usage = _ask(last_question, profile, index, session)
+        elif command.startswith(":"):
+            print(f"Commande inconnue : {command} (:aide pour la liste)")
+        else:
+            last_question = line
+            last_timings, last_usage = _ask(line, profile, index, session)
+
+
+def _ask(question, profile=None, index=None, session=None):
+    """Traite une question du mode interactif et retourne les durées de ses étapes et sa consommation LLM."""
+    timings = {}
+    usage = RequestUsage(UsageBudget.from_env(), session=REPL_SESSION)
+    try:
+        with use_request_usage(usage), profile_request(question, timings, enabled=profile):
+            if session is not None:
+                _converse(session, question, timings)
+            else:
+                _run(question, timings, cached=True, index=index)
+    except KeyboardInterrupt:
+        print("\nQuestion interrompue.")
+    except Exception as e:
+        # Une question en échec ne doit pas interrompre la session (clients et caches conservés)
+        print(f"ERREUR: Question non traitée : {e}")
+    return timings, usage
 
-    payload = create_payload(user_input=user_input)
-    print(f"INFO: Payload généré \n ")
 
+def _converse(session, question, timings=None):
+    """Question posée dans la conversation : les tours précédents sont réutilisés et rappelés à la synthèse."""
+    log_question(question)
+    with timed_stage(timings, "conversation"):
+        synthesis = session.ask(question)
+    if synthesis:
+        print(synthesis)
+
+
+def _run(user_input, timings=None, cached=False, index=None):
+    log_question(user_input)
     try:
+        answer_cache = get_answer_cache() if cached and ANSWER_CACHE_ENABLED else None
+        if answer_cache is not None:
+            with timed_stage(timings, "answer_cache"):
+                synthesis = answer_cache.get(user_input)
+            if synthesis is not None:
+                print("INFO: Réponse servie depuis le cache des réponses, sources inchangées.\n")
+                print(synthesis)
+                return
+        
+        # Extraits déjà récupérés et proches de la question (en vigueur à la date visée)
+        if index is not None:
+            with timed_stage(timings, "index"):
+                api_results = index.lookup_results(user_input) or []
+            if api_results:
+                with timed_stage(timings, "versions"):
+                    api_results = filter_for_question(api_results, user_input)
+            if api_results:
+                print("INFO: Extraits trouvés dans l'index local, recherche Legifrance évitée.\n")
+                with timed_stage(timings, "synthesis"):
+                    synthesis = synthesize_legal_response(user_input, build_metadata_list(api_results))
+                print(synthesis)
+                return
+        
+        with timed_stage(timings, "payload"):
+            payload = cached_create_payload(user_input) if cached else create_payload(user_input=user_input)
+        print(f"INFO: Payload généré \n ")
+
         # Tenter de convertir la chaîne en objet JSON
         json_payload = json.loads(payload)
                 
         # Si un payload valide est détecté, appeler l'API Legifrance
         if json_payload:
             # Appel de l'API une seule fois
-            api_results, error = search_call(json_payload)
+            with timed_stage(timings, "search"):
+                api_results, error = cached_search_call(json_payload) if cached else search_call(json_payload)
             
             # Vérification de l'erreur
             if error:
@@ -36,42 +211,35 @@ def main():
                 print("Aucun résultat trouvé.\n")
                 return
             
+            if answer_cache is not None:
+                answer_cache.observe(api_results)
+            
             #  affichage des documents formattés
             format_search_results(api_results)
+            
+            # Extraits en vigueur à la date visée par la question
+            with timed_stage(timings, "versions"):
+                api_results = filter_for_question(api_results, user_input)
+            if not api_results:
+                print("Aucun texte en vigueur trouvé pour cette question.\n")
+                return
+            
+            # Mesure du rappel de l'index puis indexation des extraits en vigueur
+            if index is not None:
+                with timed_stage(timings, "index"):
+                    index.record_recall(user_input, api_results)
+                    index.add_documents(api_results)
+                    index.schedule_save()
 
             # Préparation des métadonnées pour la synthèse
-            metadata_list = []
-            
-            # Extraction des métadonnées à partir des résultats structurés
-            for result in api_results:
-                    # Pour les autres documents, utiliser le format standard
-                    result_metadata = {
-                        "title": result["titles"][0]["title"] if result["titles"] else "Titre inconnu",
-                        "id": result["titles"][0]["id"] if result["titles"] else "",
-                        "cid": result["titles"][0]["cid"] if result["titles"] else "",
-                        "type": result["type"],
-                        "nature": result["nature"],
-                        "origin": result["origin"],
-                        "date": result["date"],
-                        "extracts": []
-                    }
-                    
-                    # Ajout des extraits pertinents
-                    for section in result["sections"]:
-                        for extract in section["extracts"]:
-                            extract_data = {
-                                "id": extract["id"],
-                                "title": extract["title"] or extract["num"] or "Sans titre",
-                                "section_title": section["title"],
-                                "text": " ".join(extract["values"]) if extract["values"] else ""
-                            }
-                            result_metadata["extracts"].append(extract_data)
-                    
-                    metadata_list.append(result_metadata)
+            metadata_list = build_metadata_list(api_results)
             
             # Génération de la synthèse
             #print("\nSynthèse des résultats :")
-            synthesis = synthesize_legal_response(user_input, metadata_list)
+            with timed_stage(timings, "synthesis"):
+                synthesis = synthesize_legal_response(user_input, metadata_list)
+            if answer_cache is not None:
+                answer_cache.put(user_input, synthesis, answer_sources(api_results))
             print(synthesis)
         else:
             print("Le payload JSON n'est pas valide.")
@@ -82,4 +250,19 @@ def main():
         print(f"Erreur lors de l'appel à l'API : {str(e)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Recherche juridique Légifrance")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="Profile la requête (piles repliées et résumé dans JERRY_PROFILE_DIR)")
+    parser.add_argument("-i", "--interactive", action="store_true",
+                        help="Enchaîner les questions sans quitter (clients, tokens et caches conservés)")
+    parser.add_argument("--index", metavar="REPERTOIRE", default=None,
+                        help="Index vectoriel des extraits déjà récupérés (défaut: JERRY_VECTOR_INDEX, "
+                             "vide : désactivé)")
+    parser.add_argument("--conversation", action="store_true",
+                        help="Mode interactif : les questions de suivi s'appuient sur les tours précédents")
+    args = parser.parse_args()
+    vector_index = get_vector_index(args.index)
+    if args.interactive:
+        interactive(profile=args.profile, index=vector_index, conversation=args.conversation)
+    else:
+        main(profile=args.profile, index=vector_index)
\ No newline at end of file
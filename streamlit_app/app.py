@@ -1,19 +1,53 @@
 import streamlit as st
+import functools
 import json
 import time
-import re
 import sys
 import os
+import uuid
 
 # Déterminer le chemin absolu du répertoire racine du projet
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Ajouter le dossier racine au sys.path
 sys.path.append(ROOT_DIR)
 
-# Importer les modules du projet principal
-from LEGIFRANCE_UTILS.payload.payload_generator import create_payload
-from SEARCH.search_call import search_call
-from LEGIFRANCE_UTILS.synthetize.synthetize_response import synthesize_legal_response
+from streamlit_app.worker_pool import WorkerPool, EN_ATTENTE, ANNULE, ERREUR
+from streamlit_app.speculation import SPECULATION_ENABLED, Speculator
+from streamlit_app.response_format import extract_sources, extract_response
+from LLM.usage import RequestUsage, UsageBudget, usage_metrics, use_request_usage
+from PERF.deadline import Deadline, DeadlineExceeded, overrun_counts, use_deadline
+from PERF.profiling import profile_request
+from PERF.request_log import log_question
+from PERF.warmup import start_warm_up
+from SEARCH.metadata import build_metadata_list
+
+# Durée de vie (en secondes) des résultats mis en cache
+PAYLOAD_CACHE_TTL = 24 * 3600
+SEARCH_CACHE_TTL = 6 * 3600
+SYNTHESIS_CACHE_TTL = 6 * 3600
+CACHE_MAX_ENTRIES = 500
+
+# Pool de workers partagé par toutes les sessions
+MAX_WORKERS = int(os.getenv("JERRY_MAX_WORKERS", "4"))
+POLL_INTERVAL = 0.3  # Intervalle (en secondes) de rafraîchissement de l'avancement
+
+# Budget (en secondes) accordé au traitement d'une question
+REQUEST_BUDGET = float(os.getenv("JERRY_REQUEST_BUDGET", "90"))
+
+# Libellés des étapes du pipeline (affichés dans la chronologie)
+STAGE_LABELS = {
+    "answer_cache": "Recherche d'une réponse déjà produite",
+    "conversation": "Réponse dans le fil de la conversation",
+    "citation": "Récupération des articles cités",
+    "index": "Recherche dans l'index local des extraits",
+    "decomposition": "Décomposition de la question",
+    "payload": "Génération du payload de recherche",
+    "search": "Recherche dans la base de données juridique",
+    "versions": "Vérification des versions en vigueur",
+    "indexation": "Indexation des extraits trouvés",
+    "metadata": "Analyse des documents juridiques",
+    "synthesis": "Génération de la réponse juridique",
+}
 
 # Configuration de la page Streamlit
 st.set_page_config(
@@ -22,174 +56,530 @@ st.set_page_config(
     layout="wide"
 )
 
+
+@st.cache_resource(show_spinner="Initialisation des clients Gemini et des prompts...")
+def load_pipeline():
+    """
+    Importe une seule fois par processus les modules du pipeline.
+    
+    L'import initialise les clients Gemini et charge les prompts depuis
+    payload_prompt/utils : ces ressources sont partagées entre toutes les
+    sessions et ne sont pas reconstruites à chaque rerun. Le payload et la
+    recherche passent par les caches du processus, que le préchargement remplit.
+    L'index vectoriel des extraits n'est chargé que si JERRY_VECTOR_INDEX est défini.
+    """
+    from CACHE.answer_cache import ANSWER_CACHE_ENABLED, answer_sources, get_answer_cache
+    from CACHE.vector_index import get_vector_index
+    from CACHE.process_cache import cached_create_payload as create_payload
+    from CACHE.process_cache import cached_search_call as search_call
+    from LEGIFRANCE_UTILS.citation.cited_articles import fetch_cited_articles
+    from LEGIFRANCE_UTILS.citation.detect_citation import detect_citations
+    from LEGIFRANCE_UTILS.decomposition.decompose_question import DECOMPOSE_ENABLED, decompose_question, looks_compound
+    from LEGIFRANCE_UTILS.decomposition.sub_searches import search_sub_questions
+    from LEGIFRANCE_UTILS.synthetize.synthetize_response import synthesize_legal_response, format_unsynthesized_response
+    from LEGIFRANCE_UTILS.temporal.point_in_time import filter_for_question
+    
+    return {
+        "answer_cache": get_answer_cache() if ANSWER_CACHE_ENABLED else None,
+        "answer_sources": answer_sources,
+        "vector_index": get_vector_index(),
+        "create_payload": create_payload,
+        "search_call": search_call,
+        "fetch_cited_articles": fetch_cited_articles,
+        "detect_citations": detect_citations,
+        "decompose_enabled": DECOMPOSE_ENABLED,
+        "decompose_question": decompose_question,
+        "looks_compound": looks_compound,
+        "search_sub_questions": search_sub_questions,
+        "filter_for_question": filter_for_question,
+        "synthesize_legal_response": synthesize_legal_response,
+        "format_unsynthesized_response": format_unsynthesized_response,
+    }
+
+
+@st.cache_resource
+def start_process_warm_up():
+    """
+    Préchauffage du processus (token, connexions, clients Gemini) puis préchargement
+    des caches depuis le journal des requêtes, une seule fois, en arrière-plan.
+    """
+    return start_warm_up(prefetch=True, search_kwargs={"relax": True})
+
+
+@st.cache_resource
+def get_worker_pool():
+    """Pool de workers unique pour le processus (concurrence globale bornée)."""
+    return WorkerPool(max_workers=MAX_WORKERS)
+
+
+@st.cache_resource
+def get_speculator():
+    """Préparation anticipée du payload et de la recherche, partagée par les sessions."""
+    return Speculator(load_pipeline, search_kwargs={"relax": True})
+
+
+def on_question_change():
+    """Programme la préparation de la question saisie (mode facultatif de la barre latérale)."""
+    if st.session_state.get("speculation") and st.session_state.get("question") \
+            and not st.session_state.get("conversation_mode"):
+        get_speculator().speculate(st.session_state["session_id"], st.session_state["question"])
+
+
+class SearchError(Exception):
+    """Erreur de recherche : levée pour que le résultat ne soit pas mis en cache."""
+
+
+class SynthesisError(Exception):
+    """Échec de la synthèse : levé pour que le message d'erreur ne soit pas mis en cache."""
+
+
+# Début des réponses de synthesize_legal_response en cas d'échec de l'appel au LLM
+SYNTHESIS_FAILURE_PREFIX = "Impossible de générer une synthèse"
+
+
+def normalize_question(question):
+    """Normalise la question pour en faire une clé de cache stable."""
+    return " ".join(question.split())
+
+
+@st.cache_data(ttl=PAYLOAD_CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_create_payload(question):
+    return load_pipeline()["create_payload"](question)
+
+
+@st.cache_data(ttl=SEARCH_CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_search_call(payload_key):
+    # Le payload est passé sous forme de JSON canonique (clé de cache hashable) ;
+    # s'il ne renvoie rien, ses variantes assouplies sont recherchées
+    api_results, error = load_pipeline()["search_call"](json.loads(payload_key), relax=True)
+    if error:
+        raise SearchError(error)
+    return api_results
+
+
+@st.cache_data(ttl=PAYLOAD_CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_decompose_question(question):
+    return load_pipeline()["decompose_question"](question)
+
+
+def search_sub_questions(sub_questions):
+    # Payloads et recherches des sous-questions via les caches du processus
+    pipeline = load_pipeline()
+    api_results, error = pipeline["search_sub_questions"](
+        sub_questions, create_payload=pipeline["create_payload"], search=pipeline["search_call"], relax=True
+    )
+    if error:
+        raise SearchError(error)
+    return api_results
+
+
+@st.cache_data(ttl=SYNTHESIS_CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_synthesis(question, metadata_key):
+    synthesis = load_pipeline()["synthesize_legal_response"](question, json.loads(metadata_key))
+    if synthesis.startswith(SYNTHESIS_FAILURE_PREFIX):
+        raise SynthesisError(synthesis)
+    return synthesis
+
+
 # Titre et description de l'application
 st.title("🔍 JERRY - Assistant de recherche juridique")
 st.markdown("""
 Posez une question juridique pour obtenir une réponse basée sur les textes légaux et la jurisprudence française.
 """)
 
-# Fonction pour extraire les sources du texte de la réponse
-def extract_sources(text):
-    # Chercher la section des sources
-    sources_section = re.search(r'## SOURCES:(.*?)(?=##|$)', text, re.DOTALL)
-    if sources_section:
-        sources_text = sources_section.group(1).strip()
-        # Supprimer les mentions de documents insuffisants
-        sources_text = re.sub(r'# Documents insuffisants', '', sources_text)
-        sources_text = re.sub(r'#documents insuffisants', '', sources_text)
-        # Vérifier si les documents étaient insuffisants
-        insufficient = "Connaissances juridiques générales" in text
-        return sources_text, insufficient
-    return "", False
-
-# Fonction pour extraire la réponse principale
-def extract_response(text):
-    response_section = re.search(r'## RÉPONSE :(.*?)(?=## SOURCES:|$)', text, re.DOTALL)
-    if response_section:
-        response_text = response_section.group(1).strip()
-        # Ajouter un espace après "Éléments constitutifs :"
-        response_text = re.sub(r'\*\*Éléments constitutifs :\*\*', '<strong>Éléments constitutifs :</strong>', response_text)
-        return response_text
-    return text
-
-# Fonction pour formater les sources en liste
-def format_sources_as_list(sources_text):
+# Chronologie des étapes, mise à jour en direct
+def render_timeline(container, timings, current=None):
+    lines = []
+    for stage, duration in timings.items():
+        lines.append(f"✅ {STAGE_LABELS[stage]} — {duration:.2f} s")
+    if current:
+        lines.append(f"⏳ {STAGE_LABELS[current]}...")
+    container.markdown("  \n".join(lines))
+
+
+# Fonction principale pour traiter la question juridique (exécutée par un worker du pool)
+def process_juridical_question(job, profile=None):
     """
-    Transforme un texte contenant des sources en liste formatée Markdown
+    Exécute le pipeline étape par étape hors du thread du script.
+    
+    Aucun élément Streamlit n'est appelé ici : l'avancement est suivi à travers
+    le Job (étape courante, durées) et l'annulation est vérifiée entre les étapes.
+    Le traitement dispose de REQUEST_BUDGET secondes : si la synthèse ne peut pas
+    aboutir à temps, les documents trouvés sont retournés sans synthèse. Les appels
+    Gemini sont comptabilisés dans job.usage et imputés à la session.
+    
+    Args:
+        job (Job): Question soumise au pool
+        profile (Optional[bool]): Profile le traitement (paramètre d'URL ?profile=1) ;
+            None : selon JERRY_PROFILE
+    
+    Returns:
+        dict: {"synthesis": synthèse ou None, "warning": message éventuel}
     """
-    # Nettoyer le texte des sources
-    sources_text = sources_text.replace("Connaissances juridiques générales", "")
+    job.usage = RequestUsage(UsageBudget.from_env(), session=job.session_id)
+    with use_deadline(Deadline(REQUEST_BUDGET)), use_request_usage(job.usage), \
+            profile_request(job.question, job.timings, enabled=profile):
+        return _process_juridical_question(job)
+
+
+def _process_juridical_question(job):
+    question_key = normalize_question(job.question)
+    log_question(question_key)
+    
+    # Réponse déjà produite, servie tant que ses sources n'ont été ni modifiées ni abrogées
+    answer_cache = load_pipeline()["answer_cache"]
+    if answer_cache is not None:
+        try:
+            synthesis = job.run_stage("answer_cache", answer_cache.get, question_key)
+        except DeadlineExceeded:
+            synthesis = None
+        if synthesis is not None:
+            return {"synthesis": synthesis, "warning": None}
+    
+    # Articles cités explicitement : récupération directe, sans payload ni recherche
+    try:
+        metadata_list = job.run_stage("citation", load_pipeline()["fetch_cited_articles"], question_key)
+    except DeadlineExceeded:
+        raise RuntimeError("Le délai de traitement a été dépassé lors de la récupération des articles cités.")
+    if metadata_list:
+        return _synthesize(job, question_key, metadata_list)
+    
+    # Extraits déjà récupérés et proches de la question, s'ils sont en vigueur à la date visée
+    index = load_pipeline()["vector_index"]
+    if index is not None:
+        try:
+            api_results = job.run_stage("index", index.lookup_results, question_key) or []
+            if api_results:
+                api_results = job.run_stage("versions", load_pipeline()["filter_for_question"], api_results, question_key)
+        except DeadlineExceeded:
+            api_results = []
+        if api_results:
+            return _synthesize(job, question_key, build_metadata_list(api_results))
+    
+    # Question composée (JERRY_DECOMPOSE=1) : une recherche par sous-question, en parallèle
+    sub_questions = [question_key]
+    if load_pipeline()["decompose_enabled"]:
+        try:
+            sub_questions = job.run_stage("decomposition", cached_decompose_question, question_key)
+        except DeadlineExceeded:
+            raise RuntimeError("Le délai de traitement a été dépassé lors de la préparation de la recherche.")
+    
+    if len(sub_questions) > 1:
+        search_stage = (search_sub_questions, sub_questions)
+    else:
+        try:
+            # Générer le payload pour la recherche
+            payload = job.run_stage("payload", cached_create_payload, question_key)
+            
+            # Convertir la chaîne en objet JSON
+            json_payload = json.loads(payload)
+            payload_key = json.dumps(json_payload, sort_keys=True, ensure_ascii=False)
+        except json.JSONDecodeError:
+            raise RuntimeError("Une erreur est survenue lors de la préparation de la recherche.")
+        except DeadlineExceeded:
+            raise RuntimeError("Le délai de traitement a été dépassé lors de la préparation de la recherche.")
+        search_stage = (cached_search_call, payload_key)
+    
+    # Appel de l'API Legifrance
+    try:
+        api_results = job.run_stage("search", *search_stage)
+    except SearchError as e:
+        raise RuntimeError(f"Erreur lors de la recherche: {e}")
+    except DeadlineExceeded:
+        raise RuntimeError("Le délai de traitement a été dépassé lors de la recherche.")
     
-    # Repérer les différentes sources (séparées par des astérisques)
-    sources = sources_text.split('*')
+    if not api_results:
+        return {"synthesis": None, "warning": "Aucun résultat juridique trouvé pour cette question."}
+    if answer_cache is not None:
+        answer_cache.observe(api_results)
     
-    # Filtrer les entrées vides
-    sources = [s.strip() for s in sources if s.strip()]
+    # Extraits en vigueur à la date visée par la question (aujourd'hui par défaut)
+    try:
+        api_results = job.run_stage("versions", load_pipeline()["filter_for_question"], api_results, question_key)
+    except DeadlineExceeded:
+        raise RuntimeError("Le délai de traitement a été dépassé lors de la vérification des versions.")
+    if not api_results:
+        return {"synthesis": None, "warning": "Aucun texte en vigueur trouvé pour cette question."}
     
-    # Formater chaque source comme un élément de liste avec des points (•)
-    formatted_sources = ["• " + source for source in sources]
+    # Mesure du rappel de l'index puis indexation des extraits en vigueur
+    if index is not None:
+        job.run_stage("indexation", _index_results, index, question_key, api_results)
     
-    return "\n".join(formatted_sources)
+    # Préparation des métadonnées puis génération de la synthèse
+    try:
+        metadata_list = job.run_stage("metadata", build_metadata_list, api_results)
+    except DeadlineExceeded:
+        metadata_list = build_metadata_list(api_results)
+    return _synthesize(job, question_key, metadata_list, api_results)
 
-# Fonction principale pour traiter la question juridique
-def process_juridical_question(user_question):
-    with st.spinner("Génération du payload de recherche..."):
-        # Générer le payload pour la recherche
-        payload = create_payload(user_input=user_question)
-        
+
+def _index_results(index, question_key, api_results):
+    """Mesure le rappel de l'index vectoriel puis y ajoute les extraits (sauvegarde en arrière-plan)."""
+    index.record_recall(question_key, api_results)
+    index.add_documents(api_results)
+    index.schedule_save()
+
+
+def get_conversation():
+    """Conversation de la session Streamlit, créée à la première question de suivi."""
+    if st.session_state.get("conversation") is None:
+        load_pipeline()
+        from SESSION.conversation import ConversationSession
+        st.session_state["conversation"] = ConversationSession()
+    return st.session_state["conversation"]
+
+
+def process_conversation_question(job, conversation, profile=None):
+    """
+    Traite une question dans le fil de la conversation (exécutée par un worker du pool).
+    
+    Les documents et articles des tours précédents sont réutilisés et les échanges
+    précédents sont transmis à la synthèse ; la réponse dépend de la conversation, elle
+    n'est donc pas conservée dans le cache des réponses.
+    """
+    job.usage = RequestUsage(UsageBudget.from_env(), session=job.session_id)
+    with use_deadline(Deadline(REQUEST_BUDGET)), use_request_usage(job.usage), \
+            profile_request(job.question, job.timings, enabled=profile):
+        question_key = normalize_question(job.question)
+        log_question(question_key)
+        try:
+            synthesis = job.run_stage("conversation", conversation.ask, question_key)
+        except DeadlineExceeded:
+            raise RuntimeError("Le délai de traitement a été dépassé.")
+    if synthesis is None:
+        raise RuntimeError("Une erreur est survenue lors de la recherche.")
+    return {"synthesis": synthesis, "warning": None}
+
+
+def _synthesize(job, question_key, metadata_list, api_results=None):
+    """
+    Synthèse des documents ; si le délai est dépassé, ils sont affichés sans synthèse.
+    
+    La synthèse issue d'une recherche (`api_results`) est conservée dans le cache des réponses.
+    """
+    pipeline = load_pipeline()
     try:
-        # Convertir la chaîne en objet JSON
-        json_payload = json.loads(payload)
+        metadata_key = json.dumps(metadata_list, sort_keys=True, ensure_ascii=False)
+        synthesis = job.run_stage("synthesis", cached_synthesis, question_key, metadata_key)
+    except SynthesisError as e:
+        # L'échec est affiché mais pas conservé : la question suivante retente la synthèse
+        return {"synthesis": str(e), "warning": None}
+    except DeadlineExceeded:
+        synthesis = pipeline["format_unsynthesized_response"](metadata_list)
+        return {"synthesis": synthesis, "warning": None}
+    if api_results and pipeline["answer_cache"] is not None:
+        pipeline["answer_cache"].put(question_key, synthesis, pipeline["answer_sources"](api_results))
+    return {"synthesis": synthesis, "warning": None}
+
+
+# Suivi d'une question soumise au pool, jusqu'à la fin de son traitement
+def wait_for_job(job):
+    """
+    Affiche la position en file puis la chronologie des étapes jusqu'à la fin du traitement.
+    
+    Returns:
+        Optional[str]: La synthèse, ou None (annulation, erreur ou aucun résultat)
+    """
+    pool = get_worker_pool()
+    
+    with st.status("Traitement de la question...", expanded=True) as status:
+        timeline = st.empty()
+        while not job.wait(timeout=POLL_INTERVAL):
+            if job.status == EN_ATTENTE:
+                timeline.markdown(f"⏳ En file d'attente (position {pool.queue_position(job)})")
+            else:
+                render_timeline(timeline, dict(job.timings), current=job.stage)
+        render_timeline(timeline, dict(job.timings))
         
-        with st.spinner("Recherche dans la base de données juridique..."):
-            # Appel de l'API Legifrance
-            api_results, error = search_call(json_payload)
-            
-            # Vérification de l'erreur
-            if error:
-                st.error(f"Erreur lors de la recherche: {error}")
-                return
-            
-            if not api_results:
-                st.warning("Aucun résultat juridique trouvé pour cette question.")
-                return
+        if job.status == ANNULE:
+            status.update(label="Question annulée", state="error", expanded=False)
+            return None
+        if job.status == ERREUR:
+            status.update(label="Échec du traitement", state="error")
+            st.error(job.error)
+            return None
+        if job.result["warning"]:
+            status.update(label="Aucun résultat", state="complete")
+            st.warning(job.result["warning"])
+            return None
         
-        # Préparation des métadonnées pour la synthèse
-        metadata_list = []
+        status.update(label=f"Réponse générée en {sum(job.timings.values()):.2f} s", state="complete", expanded=False)
+        return job.result["synthesis"]
+
+
+# Affichage d'une réponse (nouvelle ou issue de l'historique)
+def render_response(response, timings, usage=None):
+    # Extraire la réponse et les sources
+    main_response = extract_response(response)
+    sources_text, insufficient_docs = extract_sources(response)
+    
+    # Afficher la réponse principale dans un cadre
+    st.markdown("### Réponse:")
+    st.markdown(f"""
+    <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; border-left: 5px solid #b0302c;">
+        {main_response}
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # N'afficher la section des sources que si elle n'est pas vide
+    if sources_text.strip():
+        st.markdown("### Sources:")
         
-        with st.spinner("Analyse des documents juridiques..."):
-            # Extraction des métadonnées à partir des résultats
-            for result in api_results:
-                # Utiliser le format standard (comme dans main.py)
-                result_metadata = {
-                    "title": result["titles"][0]["title"] if result.get("titles") else "Titre inconnu",
-                    "id": result["titles"][0]["id"] if result.get("titles") else "",
-                    "cid": result["titles"][0]["cid"] if result.get("titles") else "",
-                    "type": result.get("type", ""),
-                    "nature": result.get("nature", ""),
-                    "origin": result.get("origin", ""),
-                    "date": result.get("date", ""),
-                    "extracts": []
-                }
-                
-                # Ajout des extraits pertinents comme liste d'objets
-                for section in result.get("sections", []):
-                    for extract in section.get("extracts", []):
-                        extract_data = {
-                            "id": extract.get("id", ""),
-                            "title": extract.get("title", "") or extract.get("num", "") or "Sans titre",
-                            "section_title": section.get("title", ""),
-                            "text": " ".join(extract.get("values", [])) if extract.get("values") else ""
-                        }
-                        result_metadata["extracts"].append(extract_data)
-                
-                metadata_list.append(result_metadata)
+        # Extraire les sources individuelles
+        sources = [src.strip() for src in sources_text.split('*') if src.strip()]
         
-        with st.spinner("Génération de la réponse juridique..."):
-            # Génération de la synthèse
-            synthesis = synthesize_legal_response(user_question, metadata_list)
-            return synthesis
-            
-    except json.JSONDecodeError:
-        st.error("Une erreur est survenue lors de la préparation de la recherche.")
-    except Exception as e:
-        st.error(f"Erreur: {str(e)}")
+        # Afficher chaque source comme un élément séparé avec des points
+        for source in sources:
+            if source and not "documents insuffisants" in source.lower():
+                st.markdown(f"""
+        <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; border-left: 5px solid #4361ee;">
+            • {source}
+        </div>
+        """, unsafe_allow_html=True)
+    
+    if insufficient_docs:
+        st.warning("Note: Les documents trouvés ne fournissent pas d'information spécifique sur ce sujet.")
     
-    return None
+    # Afficher le temps d'exécution de chaque étape
+    if timings:
+        stages = " · ".join(f"{STAGE_LABELS[stage]}: {duration:.2f}s" for stage, duration in timings.items())
+        st.caption(f"⏱️ Temps d'exécution: {sum(timings.values()):.2f} secondes ({stages})")
+    if usage and usage["appels"]:
+        st.caption(
+            f"🔢 Gemini : {usage['appels']} appel(s), {usage['tokens_entree']} tokens en entrée "
+            f"({usage['tokens_cache']} en cache), {usage['tokens_sortie']} en sortie, "
+            f"≈ {usage['cout_usd']:.4f} $" + (" · modèle rétrogradé (budget dépassé)" if usage["retrogradation"] else "")
+        )
+
+
+# Historique des réponses de la session
+if "historique" not in st.session_state:
+    st.session_state["historique"] = []
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+
+start_process_warm_up()
+pool = get_worker_pool()
+pool_stats = pool.stats()
+st.sidebar.caption(
+    f"Questions en cours : {pool_stats['en_cours']}/{pool_stats['max_workers']} · "
+    f"en attente : {pool_stats['en_attente']}"
+)
+overruns = overrun_counts()
+if overruns:
+    st.sidebar.caption(
+        "Délais dépassés : " + " · ".join(f"{STAGE_LABELS.get(stage, stage)} : {count}" for stage, count in overruns.items())
+    )
+with st.sidebar.expander("Files d'attente des appels externes"):
+    from PERF.scheduler import scheduler_metrics
+    for service, classes in scheduler_metrics().items():
+        st.caption(service)
+        st.dataframe(
+            [{"classe": traffic_class, **values} for traffic_class, values in classes.items()],
+            hide_index=True
+        )
+with st.sidebar.expander("Caches du processus"):
+    from CACHE.process_cache import cache_stats
+    from CACHE.version_index import get_version_index
+    cache_rows = [{"cache": name, **stats} for name, stats in cache_stats().items()]
+    pipeline = load_pipeline()
+    if pipeline["answer_cache"] is not None:
+        cache_rows.append({"cache": "reponses", **pipeline["answer_cache"].stats()})
+    st.dataframe(cache_rows, hide_index=True)
+    st.caption(f"Versions : {get_version_index().stats()}")
+    if pipeline["vector_index"] is not None:
+        index_stats = pipeline["vector_index"].stats()
+        st.caption(
+            f"Index des extraits : {index_stats['extraits']} extrait(s) · "
+            f"{index_stats['hits']}/{index_stats['lookups']} recherche(s) évitée(s) "
+            f"({index_stats['hit_rate']:.0%})"
+            + (f" · rappel {index_stats['recall']:.0%}" if index_stats["recall"] is not None else "")
+        )
+with st.sidebar.expander("Consommation Gemini"):
+    llm_usage = usage_metrics(session=st.session_state["session_id"])
+    for label, totals in [("Cette session", llm_usage["sessions"].get(st.session_state["session_id"])),
+                          ("Aujourd'hui", llm_usage["jours"].get(time.strftime("%Y-%m-%d")))]:
+        if totals:
+            st.caption(
+                f"{label} : {totals['appels']} appel(s), {totals['tokens_entree']} + {totals['tokens_sortie']} tokens, "
+                f"≈ {totals['cout_usd']:.4f} $"
+            )
+st.sidebar.toggle(
+    "Préparer la recherche pendant la saisie", value=SPECULATION_ENABLED, key="speculation",
+    help="Le payload et la recherche sont lancés dès que la question est saisie : "
+         "au clic, seule la synthèse reste à faire."
+)
+st.sidebar.toggle(
+    "Questions de suivi", value=False, key="conversation_mode",
+    help="Les questions forment une conversation : une question de suivi réutilise les documents "
+         "des questions précédentes, et la réponse tient compte des échanges précédents."
+)
+if st.session_state["conversation_mode"] and st.sidebar.button("Nouvelle conversation"):
+    st.session_state["conversation"] = None
+if st.session_state["speculation"]:
+    speculation_stats = get_speculator().stats(st.session_state["session_id"])
+    st.sidebar.caption(
+        f"Recherches préparées : {speculation_stats['preparees']} · abandonnées : {speculation_stats['abandonnees']} · "
+        f"{speculation_stats['appels']} appel(s) Gemini, {speculation_stats['tokens']} tokens"
+        + (" · plafond atteint" if speculation_stats["plafond_atteint"] else "")
+    )
+with st.sidebar.expander("Identifiants Legifrance"):
+    from LEGIFRANCE_UTILS.credential_pool import get_credential_pool
+    st.dataframe(get_credential_pool().report(), hide_index=True)
 
 # Interface utilisateur principale
-question = st.text_area("Votre question juridique:", height=100, 
+question = st.text_area("Votre question juridique:", height=100, key="question", on_change=on_question_change,
                          placeholder="Exemple : Est-il possible de vendre des animaux vivants?")
 
+col_search, col_cancel = st.columns([1, 6])
+
 # Bouton de soumission
-if st.button("Rechercher", type="primary"):
+if col_search.button("Rechercher", type="primary"):
     if not question:
         st.warning("Veuillez saisir une question.")
     else:
-        # Stocker l'heure de début pour calculer le temps d'exécution
-        start_time = time.time()
-        
-        # Traiter la question
-        response = process_juridical_question(question)
-        
-        # Calculer le temps d'exécution
-        execution_time = time.time() - start_time
-        
-        if response:
-            # Extraire la réponse et les sources
-            main_response = extract_response(response)
-            sources_text, insufficient_docs = extract_sources(response)
-            
-            # Afficher la réponse principale dans un cadre
-            st.markdown("### Réponse:")
-            st.markdown(f"""
-            <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; border-left: 5px solid #b0302c;">
-                {main_response}
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # N'afficher la section des sources que si elle n'est pas vide
-            if sources_text.strip():
-                st.markdown("### Sources:")
-                
-                # Extraire les sources individuelles
-                sources = [src.strip() for src in sources_text.split('*') if src.strip()]
-                
-                # Afficher chaque source comme un élément séparé avec des points
-                for source in sources:
-                    if source and not "documents insuffisants" in source.lower():
-                        st.markdown(f"""
-                <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; border-left: 5px solid #4361ee;">
-                    • {source}
-                </div>
-                """, unsafe_allow_html=True)
-            
-            if insufficient_docs:
-                st.warning("Note: Les documents trouvés ne fournissent pas d'information spécifique sur ce sujet.")
-            
-            # Afficher le temps d'exécution
-            st.caption(f"⏱️ Temps d'exécution: {execution_time:.2f} secondes")
-            
+        # Une nouvelle question annule celle encore en cours dans cette session, ainsi que
+        # les préparations d'autres questions (celle de la question soumise est conservée,
+        # et celle déjà lancée est reprise par les caches)
+        pool.cancel_session(st.session_state["session_id"])
+        get_speculator().cancel(st.session_state["session_id"], keep=question)
+        # ?profile=1 dans l'URL : profil de la requête écrit dans JERRY_PROFILE_DIR
+        profile = True if st.query_params.get("profile") == "1" else None
+        if st.session_state["conversation_mode"]:
+            process = functools.partial(process_conversation_question, conversation=get_conversation(), profile=profile)
+        else:
+            process = functools.partial(process_juridical_question, profile=profile)
+        st.session_state["job"] = pool.submit(st.session_state["session_id"], question, process)
+
+# Question en cours : suivie à chaque rerun jusqu'à la fin de son traitement
+answered_now = False
+job = st.session_state.get("job")
+if job is not None:
+    if not job.done and col_cancel.button("Annuler"):
+        pool.cancel(job)
+    
+    response = wait_for_job(job)
+    del st.session_state["job"]
+    
+    if response:
+        usage = job.usage.as_dict() if job.usage is not None else None
+        render_response(response, job.timings, usage)
+        st.session_state["historique"].insert(0, {
+            "question": job.question,
+            "response": response,
+            "timings": job.timings,
+            "usage": usage,
+        })
+        answered_now = True
+
+# Réponses précédentes : affichées sans nouvel appel
+previous_entries = st.session_state["historique"][1:] if answered_now else st.session_state["historique"]
+if previous_entries:
+    st.markdown("### Historique")
+    for entry in previous_entries:
+        with st.expander(entry["question"]):
+            render_response(entry["response"], entry["timings"], entry.get("usage"))
+
 # Pied de page avec des informations sur l'application
 st.markdown("---")
 st.markdown("""
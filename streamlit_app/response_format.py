@@ -0,0 +1,52 @@
+"""
+Mise en forme des réponses de synthèse pour l'affichage Streamlit.
+
+Ce module fournit les traitements de texte (sans dépendance à Streamlit) appliqués
+à la réponse du LLM : extraction de la réponse principale et des sources, puis mise
+en forme des sources en liste.
+"""
+import re
+
+
+# Fonction pour extraire les sources du texte de la réponse
+def extract_sources(text):
+    # Chercher la section des sources
+    sources_section = re.search(r'## SOURCES:(.*?)(?=##|$)', text, re.DOTALL)
+    if sources_section:
+        sources_text = sources_section.group(1).strip()
+        # Supprimer les mentions de documents insuffisants
+        sources_text = re.sub(r'# Documents insuffisants', '', sources_text)
+        sources_text = re.sub(r'#documents insuffisants', '', sources_text)
+        # Vérifier si les documents étaient insuffisants
+        insufficient = "Connaissances juridiques générales" in text
+        return sources_text, insufficient
+    return "", False
+
+# Fonction pour extraire la réponse principale
+def extract_response(text):
+    response_section = re.search(r'## RÉPONSE :(.*?)(?=## SOURCES:|$)', text, re.DOTALL)
+    if response_section:
+        response_text = response_section.group(1).strip()
+        # Ajouter un espace après "Éléments constitutifs :"
+        response_text = re.sub(r'\*\*Éléments constitutifs :\*\*', '<strong>Éléments constitutifs :</strong>', response_text)
+        return response_text
+    return text
+
+# Fonction pour formater les sources en liste
+def format_sources_as_list(sources_text):
+    """
+    Transforme un texte contenant des sources en liste formatée Markdown
+    """
+    # Nettoyer le texte des sources
+    sources_text = sources_text.replace("Connaissances juridiques générales", "")
+    
+    # Repérer les différentes sources (séparées par des astérisques)
+    sources = sources_text.split('*')
+    
+    # Filtrer les entrées vides
+    sources = [s.strip() for s in sources if s.strip()]
+    
+    # Formater chaque source comme un élément de liste avec des points (•)
+    formatted_sources = ["• " + source for source in sources]
+    
+    return "\n".join(formatted_sources)
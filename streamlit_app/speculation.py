@@ -0,0 +1,218 @@
+"""
+Préparation anticipée de la recherche pendant la saisie de la question (mode facultatif).
+
+Lorsque la question saisie change, et après un délai sans nouvelle modification
+(DEBOUNCE), le payload est généré puis la recherche /search effectuée en
+arrière-plan, dans les caches du processus (CACHE/process_cache.py). Au clic sur
+"Rechercher", le payload et la recherche sont servis depuis ces caches (ou attendus
+s'ils sont encore en cours) : seule la synthèse reste à faire.
+
+Ce module fournit:
+- L'abandon des préparations périmées : une nouvelle saisie annule la préparation en
+  attente de la session, et celle déjà lancée s'arrête avant la recherche
+- Un plafond de dépense LLM par session (appels et tokens Gemini des préparations)
+- L'exécution en classe de trafic "batch", sous une échéance propre : les préparations
+  ne retardent pas les questions soumises
+
+Comme le traitement des questions, la préparation n'appelle aucun élément Streamlit.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from LLM.usage import RequestUsage, use_request_usage
+from PERF.deadline import Deadline, DeadlineExceeded, use_deadline
+from PERF.scheduler import BATCH, use_traffic_class
+
+SPECULATION_ENABLED = os.getenv("JERRY_SPECULATION", "").lower() in ("1", "true", "oui", "yes")
+
+# Délai (en secondes) sans modification de la question avant de lancer la préparation
+DEBOUNCE = float(os.getenv("JERRY_SPECULATION_DEBOUNCE", "0.8"))
+
+# Durée maximale d'une préparation
+SPECULATION_BUDGET = float(os.getenv("JERRY_SPECULATION_BUDGET", "30"))
+
+# Dépense LLM maximale des préparations d'une session
+MAX_SESSION_CALLS = int(os.getenv("JERRY_SPECULATION_MAX_CALLS", "10"))
+MAX_SESSION_TOKENS = int(os.getenv("JERRY_SPECULATION_MAX_TOKENS", "50000"))
+
+# Longueur minimale (en mots) d'une question préparée
+MIN_WORDS = 4
+
+# Nombre maximal de sessions suivies
+MAX_SESSIONS = 1000
+
+
+class SessionSpeculation:
+    """État des préparations d'une session : dernière question, préparation en attente, dépense."""
+
+    def __init__(self):
+        self.generation = 0
+        self.question: Optional[str] = None
+        self.timer: Optional[threading.Timer] = None
+        self.calls = 0
+        self.tokens = 0
+        self.prepared = 0
+        self.abandoned = 0
+
+
+class Speculator:
+    """
+    Prépare en arrière-plan le payload et la recherche de la question en cours de saisie.
+
+    Args:
+        pipeline (Callable[[], Dict[str, Any]]): Modules du pipeline (load_pipeline de app.py) :
+            "create_payload", "search_call", "detect_citations", "decompose_enabled",
+            "looks_compound", "answer_cache"
+        search_kwargs (Optional[Dict[str, Any]]): Options de search_call, identiques à celles de
+            l'application pour que les clés de cache correspondent
+        debounce (float): Délai sans modification avant de lancer une préparation
+        max_session_calls (int): Appels Gemini maximaux des préparations d'une session
+        max_session_tokens (int): Tokens Gemini maximaux des préparations d'une session
+    """
+
+    def __init__(self, pipeline: Callable[[], Dict[str, Any]], search_kwargs: Optional[Dict[str, Any]] = None,
+                 debounce: float = DEBOUNCE, max_session_calls: int = MAX_SESSION_CALLS,
+                 max_session_tokens: int = MAX_SESSION_TOKENS):
+        self.pipeline = pipeline
+        self.search_kwargs = search_kwargs or {}
+        self.debounce = debounce
+        self.max_session_calls = max_session_calls
+        self.max_session_tokens = max_session_tokens
+        self._sessions: "OrderedDict[str, SessionSpeculation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id: str) -> SessionSpeculation:
+        """État de la session (appelant : verrou tenu)."""
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = SessionSpeculation()
+            while len(self._sessions) > MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return state
+
+    def over_budget(self, session_id: str) -> bool:
+        """True si les préparations de la session ont atteint leur plafond de dépense LLM."""
+        with self._lock:
+            state = self._session(session_id)
+            return state.calls >= self.max_session_calls or state.tokens >= self.max_session_tokens
+
+    def speculate(self, session_id: str, question: str) -> None:
+        """
+        Programme la préparation de `question` après le délai DEBOUNCE
+
+        La préparation précédente de la session est annulée si elle n'a pas commencé ;
+        si elle est en cours, elle s'arrête avant sa recherche.
+        """
+        question = " ".join(question.split())
+        with self._lock:
+            state = self._session(session_id)
+            if question == state.question:
+                return
+            self._cancel_pending(state)
+            state.generation += 1
+            state.question = question
+            if len(question.split()) < MIN_WORDS:
+                return
+            timer = threading.Timer(self.debounce, self._run, args=(session_id, state.generation, question))
+            timer.daemon = True
+            state.timer = timer
+        timer.start()
+
+    def _cancel_pending(self, state: SessionSpeculation) -> None:
+        """Annule la préparation programmée et non commencée (appelant : verrou tenu)."""
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+            state.abandoned += 1
+
+    def cancel(self, session_id: str, keep: Optional[str] = None) -> None:
+        """
+        Abandonne les préparations de la session (question soumise)
+
+        Une préparation déjà lancée termine son étape en cours : la question soumise
+        attend son résultat dans les caches du processus au lieu de refaire l'appel.
+
+        Args:
+            session_id (str): Identifiant de la session
+            keep (Optional[str]): Question soumise ; sa préparation, en attente ou en cours,
+                est conservée (la saisie et le clic arrivent souvent dans le même rerun)
+        """
+        with self._lock:
+            state = self._session(session_id)
+            if keep is not None and " ".join(keep.split()) == state.question:
+                return
+            self._cancel_pending(state)
+            state.generation += 1
+            state.question = None
+
+    def _current(self, session_id: str, generation: int) -> bool:
+        """True si la préparation `generation` porte toujours sur la dernière saisie de la session."""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            current = state is not None and state.generation == generation
+            if not current and state is not None:
+                state.abandoned += 1
+            return current
+
+    def _run(self, session_id: str, generation: int, question: str) -> None:
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None or state.generation != generation:
+                return
+            # Préparation commencée : elle n'est plus annulable avant son étape en cours
+            state.timer = None
+        if self.over_budget(session_id):
+            print("INFO: Préparation anticipée ignorée, plafond LLM de la session atteint")
+            return
+        pipeline = self.pipeline()
+        usage = RequestUsage(session=session_id)
+        try:
+            with use_traffic_class(BATCH), use_deadline(Deadline(SPECULATION_BUDGET)), use_request_usage(usage):
+                self._prepare(session_id, generation, question, pipeline)
+        except DeadlineExceeded:
+            print("INFO: Préparation anticipée interrompue (délai dépassé)")
+        except Exception as e:
+            print(f"ERREUR: Préparation anticipée impossible: {e}")
+        finally:
+            with self._lock:
+                state = self._session(session_id)
+                state.calls += usage.totals.calls
+                state.tokens += usage.totals.total_tokens
+
+    def _prepare(self, session_id: str, generation: int, question: str, pipeline: Dict[str, Any]) -> None:
+        """Payload puis recherche de la question, tant qu'elle est la dernière saisie de la session."""
+        answer_cache = pipeline.get("answer_cache")
+        if answer_cache is not None and question in answer_cache:
+            return
+        # Les questions citant des articles ne passent ni par le payload ni par la recherche,
+        # et les questions composées sont recherchées par sous-question
+        if pipeline["detect_citations"](question):
+            return
+        if pipeline["decompose_enabled"] and pipeline["looks_compound"](question):
+            return
+        payload = pipeline["create_payload"](question)
+        if not self._current(session_id, generation):
+            return
+        json_payload = json.loads(payload)
+        if not json_payload:
+            return
+        pipeline["search_call"](json_payload, **self.search_kwargs)
+        with self._lock:
+            self._session(session_id).prepared += 1
+        print(f"INFO: Recherche préparée pour « {question} »")
+
+    def stats(self, session_id: str) -> Dict[str, Any]:
+        """Préparations, abandons et dépense LLM de la session."""
+        with self._lock:
+            state = self._session(session_id)
+            return {
+                "preparees": state.prepared,
+                "abandonnees": state.abandoned,
+                "appels": state.calls,
+                "tokens": state.tokens,
+                "plafond_atteint": state.calls >= self.max_session_calls or state.tokens >= self.max_session_tokens,
+            }
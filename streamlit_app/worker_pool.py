@@ -0,0 +1,250 @@
+"""
+File d'attente et pool de workers partagés par toutes les sessions Streamlit.
+
+Ce module fournit:
+- Une limite globale du nombre de questions traitées simultanément par le processus
+- Un ordonnancement équitable entre sessions (tourniquet sur les sessions en attente)
+- Le suivi de l'avancement de chaque question (étape courante, durées)
+- L'annulation d'une question en attente ou en cours de traitement
+
+Le traitement d'une question ne doit appeler aucun élément Streamlit : il
+s'exécute hors du thread du script et ne communique qu'à travers son Job.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from PERF.deadline import deadline_stage
+
+# États possibles d'une question
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ANNULE = "annule"
+ERREUR = "erreur"
+
+
+class JobCancelled(Exception):
+    """Levée par Job.check_cancelled() lorsque la question a été annulée."""
+
+
+class Job:
+    """
+    Question soumise au pool, lue par l'interface pour suivre son avancement.
+
+    Attributes:
+        id (str): Identifiant unique de la question
+        session_id (str): Session Streamlit à l'origine de la question
+        question (str): Question juridique posée
+        status (str): EN_ATTENTE, EN_COURS, TERMINE, ANNULE ou ERREUR
+        stage (Optional[str]): Étape en cours d'exécution
+        timings (Dict[str, float]): Durée (en secondes) de chaque étape terminée
+        usage (Any): Consommation LLM de la question (voir LLM/usage.py), si suivie
+        result (Any): Résultat du traitement une fois terminé
+        error (Optional[str]): Message d'erreur éventuel
+    """
+
+    def __init__(self, session_id: str, question: str, fn: Callable[["Job"], Any]):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.question = question
+        self.fn = fn
+        self.status = EN_ATTENTE
+        self.stage: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.usage: Any = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done_event.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """Demande l'annulation ; le traitement s'arrête à la prochaine étape."""
+        self._cancel_event.set()
+
+    def check_cancelled(self) -> None:
+        """À appeler entre deux étapes du traitement."""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def run_stage(self, stage: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Exécute une étape en enregistrant sa durée, après vérification de l'annulation
+
+        L'étape s'exécute sous l'échéance courante éventuelle (voir PERF/deadline.py).
+        """
+        self.check_cancelled()
+        self.stage = stage
+        start = time.time()
+        try:
+            with deadline_stage(stage):
+                return fn(*args)
+        finally:
+            self.timings[stage] = time.time() - start
+            self.stage = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done_event.wait(timeout)
+
+    def _finish(self, status: str) -> None:
+        self.status = status
+        self.finished_at = time.time()
+        self._done_event.set()
+
+
+class WorkerPool:
+    """
+    Pool de workers à concurrence globale bornée et équitable entre sessions.
+
+    Les questions en attente sont rangées dans une file par session ; les workers
+    servent les sessions à tour de rôle, et une session ne peut pas occuper plus de
+    `max_running_per_session` workers à la fois.
+
+    Args:
+        max_workers (int): Nombre maximal de questions traitées simultanément
+        max_running_per_session (int): Nombre maximal de questions en cours par session
+    """
+
+    def __init__(self, max_workers: int = 4, max_running_per_session: int = 1):
+        self.max_workers = max_workers
+        self.max_running_per_session = max_running_per_session
+        self._queues: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+        self._running: Dict[str, int] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._condition = threading.Condition()
+        self._completed = 0
+        self._cancelled = 0
+        self._workers = []
+        for index in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"jerry-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, session_id: str, question: str, fn: Callable[[Job], Any]) -> Job:
+        """
+        Place une question dans la file de sa session
+
+        Args:
+            session_id (str): Identifiant de la session Streamlit
+            question (str): Question juridique
+            fn (Callable[[Job], Any]): Traitement à exécuter ; reçoit le Job pour
+                signaler son avancement et vérifier l'annulation
+
+        Returns:
+            Job: La question soumise
+        """
+        job = Job(session_id, question, fn)
+        with self._condition:
+            self._jobs[job.id] = job
+            self._queues.setdefault(session_id, deque()).append(job)
+            self._condition.notify()
+        return job
+
+    def cancel(self, job: Job) -> None:
+        """Annule une question : retirée de la file si elle n'a pas démarré."""
+        job.cancel()
+        with self._condition:
+            queue = self._queues.get(job.session_id)
+            if queue and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.session_id]
+                self._cancelled += 1
+                self._jobs.pop(job.id, None)
+                job._finish(ANNULE)
+
+    def cancel_session(self, session_id: str) -> None:
+        """Annule toutes les questions en attente ou en cours d'une session."""
+        with self._condition:
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id and not job.done]
+        for job in jobs:
+            self.cancel(job)
+
+    def queue_position(self, job: Job) -> int:
+        """
+        Nombre de questions servies avant celle-ci (0 si elle est en cours ou terminée)
+        """
+        with self._condition:
+            if job.status != EN_ATTENTE:
+                return 0
+            queue = self._queues.get(job.session_id)
+            if not queue or job not in queue:
+                return 0
+            rank = list(queue).index(job)
+            # Tourniquet : chaque autre session passe au plus rank + 1 fois avant
+            position = rank
+            for session_id, other in self._queues.items():
+                if session_id != job.session_id:
+                    position += min(len(other), rank + 1)
+            return position + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Métriques du pool (questions en attente, en cours, terminées, annulées)."""
+        with self._condition:
+            return {
+                "max_workers": self.max_workers,
+                "en_attente": sum(len(queue) for queue in self._queues.values()),
+                "en_cours": sum(self._running.values()),
+                "sessions_en_attente": len(self._queues),
+                "terminees": self._completed,
+                "annulees": self._cancelled,
+            }
+
+    def _next_job(self) -> Optional[Job]:
+        """Choisit la prochaine question (appelé avec le verrou détenu)."""
+        for session_id in list(self._queues.keys()):
+            if self._running.get(session_id, 0) >= self.max_running_per_session:
+                continue
+            queue = self._queues.pop(session_id)
+            job = queue.popleft()
+            if queue:
+                # La session repasse en fin de tourniquet
+                self._queues[session_id] = queue
+            return job
+        return None
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                self._running[job.session_id] = self._running.get(job.session_id, 0) + 1
+                job.status = EN_COURS
+                job.started_at = time.time()
+
+            status = TERMINE
+            try:
+                job.check_cancelled()
+                job.result = job.fn(job)
+            except JobCancelled:
+                status = ANNULE
+            except Exception as e:
+                job.error = str(e)
+                status = ERREUR
+
+            with self._condition:
+                self._running[job.session_id] -= 1
+                if not self._running[job.session_id]:
+                    del self._running[job.session_id]
+                if status == ANNULE:
+                    self._cancelled += 1
+                else:
+                    self._completed += 1
+                self._jobs.pop(job.id, None)
+                job._finish(status)
+                self._condition.notify_all()
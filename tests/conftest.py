@@ -0,0 +1,138 @@
+"""
+Fixtures communes des tests.
+
+Les appels à Légifrance (OAuth, ping, /search, /consult) et à Gemini sont rejoués
+sans latence depuis une cassette construite par chaque test (voir PERF/cassette.py) :
+aucun accès réseau ni aucune clé d'API n'est nécessaire.
+"""
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GEMINI_API_KEY", "cassette-replay")
+
+from PERF import cassette as cassette_module  # noqa: E402
+from PERF.cassette import Cassette, MODE_RECORD, MODE_REPLAY_FAST, REPLAY_TOKEN  # noqa: E402
+
+LEGIFRANCE_BASE_URL = "https://sandbox-api.piste.gouv.fr/dila/legifrance/lf-engine-app"
+LEGIFRANCE_OAUTH_URL = "https://sandbox-oauth.piste.gouv.fr/api/oauth/token"
+SEARCH_URL = f"{LEGIFRANCE_BASE_URL}/search"
+GET_ARTICLE_URL = f"{LEGIFRANCE_BASE_URL}/consult/getArticle"
+
+# Réponse /search de référence (5 documents du Code civil et de la jurisprudence)
+FIXTURE_RESULTS = os.path.join(ROOT, "resultats_legifrance.json")
+
+
+def load_search_fixture() -> Dict[str, Any]:
+    with open(FIXTURE_RESULTS, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+class ReplayBuilder:
+    """
+    Construit la cassette d'un test puis la rejoue sans latence.
+
+    Les interactions sans corps JSON (`json_body=None`) répondent à toute requête de même
+    méthode et URL ; les interactions de même URL sont rejouées dans l'ordre d'ajout
+    (la dernière est répétée). Chaque requête rejouée est notée dans `calls`, chaque
+    appel Gemini rejoué dans `prompts` (messages envoyés).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.cassette = Cassette(path, MODE_RECORD)
+        self.calls: List[Dict[str, Any]] = []
+        self.prompts: List[Any] = []
+        self.http("POST", LEGIFRANCE_OAUTH_URL, {"access_token": REPLAY_TOKEN, "expires_in": 3600})
+        self.http("GET", f"{LEGIFRANCE_BASE_URL}/search/ping", "", status=500)
+
+    def http(self, method: str, url: str, body: Any, status: int = 200, json_body: Any = None) -> "ReplayBuilder":
+        self.cassette.add({
+            "k": "http", **cassette_module.http_fingerprints(method, url, json_body),
+            "req": {"method": method, "url": url, "json": json_body},
+            "res": {"status": status, "body": body if isinstance(body, str) else json.dumps(body, ensure_ascii=False),
+                    "ct": "application/json"},
+            "t": 0.0,
+        })
+        return self
+
+    def search(self, results: Optional[List[dict]], json_body: Any = None) -> "ReplayBuilder":
+        """Réponse /search contenant `results` (None : aucun résultat)."""
+        return self.http("POST", SEARCH_URL, {"results": results, "totalResultNumber": len(results or [])},
+                         json_body=json_body)
+
+    def article(self, article: Dict[str, Any]) -> "ReplayBuilder":
+        """Réponse /consult/getArticle pour l'article `article` (clés id, texte...)."""
+        return self.http("POST", GET_ARTICLE_URL, {"article": article}, json_body={"id": article["id"]})
+
+    def gemini(self, text: str, system_prompt: str, model: str = "gemini-2.0-flash-001") -> "ReplayBuilder":
+        """Réponse Gemini à tout appel du modèle dont le premier message est `system_prompt`."""
+        contents = [{"role": "model", "parts": [{"text": system_prompt}]}]
+        self.cassette.add({
+            "k": "gemini", **cassette_module.gemini_fingerprints(model, contents),
+            "req": {"model": model},
+            "res": {"text": text, "usage": None},
+            "t": 0.0,
+        })
+        return self
+
+    def start(self) -> Cassette:
+        self.cassette._dirty = True
+        self.cassette.save()
+        replay = Cassette(self.path, MODE_REPLAY_FAST)
+        http = replay.http
+
+        def recorded_http(method, url, kwargs, send):
+            self.calls.append({"method": method, "url": url, "json": kwargs.get("json")})
+            return http(method, url, kwargs, send)
+
+        gemini = replay.gemini
+
+        def recorded_gemini(model, contents, send, timeout=None):
+            self.prompts.append(contents)
+            return gemini(model, contents, send, timeout=timeout)
+
+        replay.http = recorded_http
+        replay.gemini = recorded_gemini
+        cassette_module._active = replay
+        return replay
+
+    def searches(self) -> List[dict]:
+        """Corps des appels /search rejoués."""
+        return [call["json"] for call in self.calls if call["url"] == SEARCH_URL]
+
+
+@pytest.fixture
+def replay(tmp_path, monkeypatch):
+    """Cassette du test (voir ReplayBuilder), désactivée à la fin du test."""
+    from LEGIFRANCE_UTILS import credential_pool
+
+    # Les réponses brutes sauvegardées par search_call ne remplacent pas la fixture du dépôt
+    monkeypatch.chdir(tmp_path)
+
+    from CACHE.process_cache import article_cache, payload_cache, search_cache
+
+    # Pool d'identifiants et caches du processus neufs : rien n'est hérité d'un autre test
+    credential_pool._pool = None
+    for cache in (payload_cache, search_cache, article_cache):
+        cache.clear()
+    previous = cassette_module._active
+    builder = ReplayBuilder(str(tmp_path / "cassette.jsonl"))
+    yield builder
+    cassette_module._active = previous
+    credential_pool._pool = None
+
+
+@pytest.fixture
+def version_index(monkeypatch):
+    """Index des versions du processus (get_version_index), en mémoire et vide le temps du test."""
+    from CACHE import version_index as version_index_module
+
+    index = version_index_module.ArticleVersionIndex(path=None)
+    monkeypatch.setattr(version_index_module, "_index", index)
+    return index
@@ -0,0 +1,87 @@
+"""
+Tests de la conversation multi-tours : questions de suivi, échanges précédents et articles consultés.
+"""
+import json
+
+from LEGIFRANCE_UTILS.payload.payload_prompt.create_payload import system_prompt as PAYLOAD_PROMPT
+from LEGIFRANCE_UTILS.synthetize.synthetize_response import SYSTEM_PROMPT
+from SESSION.conversation import REUTILISER, ConversationSession, criteria_values, restrict_to_new_criteria
+
+from conftest import load_search_fixture
+
+PAYLOAD = {
+    "recherche": {
+        "champs": [{
+            "typeChamp": "ALL",
+            "criteres": [{
+                "typeRecherche": "EXACTE",
+                "valeur": "mineur émancipé",
+                "operateur": "ET",
+                "criteres": [
+                    {"typeRecherche": "UN_DES_MOTS", "valeur": "commerçant", "operateur": "OU"},
+                    {"typeRecherche": "UN_DES_MOTS", "valeur": "tutelle", "operateur": "OU"},
+                ],
+            }],
+            "operateur": "ET",
+        }],
+        "pageNumber": 1,
+        "pageSize": 10,
+    },
+    "fond": "CODE_DATE",
+}
+FIRST_ANSWER = "## RÉPONSE :\nOui, sur autorisation du juge des tutelles.\n## SOURCES:\nCode de commerce, article L121-2"
+
+
+def _synthesis_prompts(replay):
+    return [contents[1]["parts"][0]["text"] for contents in replay.prompts
+            if contents[0]["parts"][0]["text"] == SYSTEM_PROMPT]
+
+
+def test_nested_criteria_are_restricted_to_new_values():
+    restricted = restrict_to_new_criteria(PAYLOAD, {"mineur emancipe", "tutelle"})
+
+    critere = restricted["recherche"]["champs"][0]["criteres"][0]
+    assert [nested["valeur"] for nested in critere["criteres"]] == ["commerçant"]
+    assert criteria_values(PAYLOAD) == {"mineur emancipe", "commercant", "tutelle"}
+    assert restrict_to_new_criteria(PAYLOAD, criteria_values(PAYLOAD)) is None
+
+
+def test_follow_up_synthesis_receives_the_previous_turns(replay, version_index):
+    replay.gemini(json.dumps(PAYLOAD, ensure_ascii=False), PAYLOAD_PROMPT)
+    replay.search(load_search_fixture()["results"])
+    replay.gemini(FIRST_ANSWER, SYSTEM_PROMPT).start()
+    session = ConversationSession()
+
+    assert session.ask("Un mineur émancipé peut-il être commerçant ?") == FIRST_ANSWER
+    session.ask("Et le mineur émancipé commerçant, sous quelles conditions ?")
+
+    assert session.turns[1]["decision"] == REUTILISER
+    assert len(replay.searches()) == 1
+    first_prompt, follow_up_prompt = _synthesis_prompts(replay)
+    assert "Échanges précédents" not in first_prompt
+    assert "Échanges précédents de la conversation" in follow_up_prompt
+    assert "Question : Un mineur émancipé peut-il être commerçant ?" in follow_up_prompt
+    assert "Oui, sur autorisation du juge des tutelles." in follow_up_prompt
+
+
+def test_consulted_article_is_joined_to_related_questions(replay, version_index):
+    article = {
+        "id": "LEGIARTI000006219154",
+        "cid": "LEGIARTI000006219154",
+        "num": "L121-2",
+        "etat": "VIGUEUR",
+        "texte": "Le mineur émancipé peut être commerçant sur autorisation du juge des tutelles.",
+    }
+    replay.article(article)
+    replay.gemini(json.dumps(PAYLOAD, ensure_ascii=False), PAYLOAD_PROMPT)
+    replay.search(None)
+    replay.gemini(FIRST_ANSWER, SYSTEM_PROMPT).start()
+    session = ConversationSession()
+
+    assert session.get_article(article["id"])["article"]["num"] == "L121-2"
+    assert session.get_article(article["id"]) is session.articles[article["id"]]
+    session.ask("Un mineur émancipé peut-il être commerçant ?")
+
+    assert len([call for call in replay.calls if call["json"] == {"id": article["id"]}]) == 1
+    assert article["texte"] in _synthesis_prompts(replay)[0]
+    assert session.select_articles("Quelle est la durée du préavis de licenciement ?") == []
@@ -0,0 +1,82 @@
+"""
+Tests de la recherche répartie par fond et de l'assouplissement des payloads sans résultat.
+"""
+from CACHE.process_cache import cached_search_call
+from SEARCH.relaxation import ORIGINAL
+from SEARCH.search_call import DEFAULT_FAN_OUT_FONDS, NO_RESULT_ERROR, search_call, search_with_relaxation
+
+from conftest import load_search_fixture
+
+PAYLOAD = {
+    "recherche": {
+        "champs": [{
+            "typeChamp": "ARTICLE",
+            "criteres": [
+                {"typeRecherche": "TOUS_LES_MOTS_DANS_UN_CHAMP", "valeur": "mineur émancipé", "operateur": "ET", "proximité": 2},
+                {"typeRecherche": "EXACTE", "valeur": "commerçant", "operateur": "ET"},
+            ],
+            "operateur": "ET",
+        }],
+        "pageNumber": 1,
+        "pageSize": 10,
+        "sort": "PERTINENCE",
+    },
+    "fond": "ALL",
+}
+
+
+def test_fan_out_without_hits_runs_the_relaxation_ladder(replay):
+    replay.search(None).start()
+
+    results, error = search_call(PAYLOAD, fonds=DEFAULT_FAN_OUT_FONDS, relax=True)
+
+    assert results == []
+    assert error == NO_RESULT_ERROR
+    searches = replay.searches()
+    assert len(searches) > len(DEFAULT_FAN_OUT_FONDS)
+    assert any(search["recherche"] != searches[0]["recherche"] for search in searches)
+
+
+def test_fan_out_returns_the_first_relaxed_rung_with_documents(replay):
+    for _ in DEFAULT_FAN_OUT_FONDS:
+        replay.search(None)
+    replay.search(load_search_fixture()["results"]).start()
+
+    results, error, level = search_with_relaxation(PAYLOAD, fonds=DEFAULT_FAN_OUT_FONDS)
+
+    assert error == ""
+    assert results
+    assert level != ORIGINAL
+
+
+def test_fan_out_reports_call_errors_without_relaxing(replay):
+    replay.http("POST", "https://sandbox-api.piste.gouv.fr/dila/legifrance/lf-engine-app/search", "refusé", status=400)
+    replay.start()
+
+    results, error = search_call(PAYLOAD, fonds=DEFAULT_FAN_OUT_FONDS, relax=True)
+
+    assert results == []
+    assert error != NO_RESULT_ERROR
+    assert "code 400" in error
+    assert len(replay.searches()) == len(DEFAULT_FAN_OUT_FONDS)
+
+
+def test_relaxed_search_reports_call_errors_instead_of_no_result(replay):
+    from conftest import SEARCH_URL
+
+    replay.search(None).http("POST", SEARCH_URL, "refusé", status=400).start()
+
+    results, error, level = search_with_relaxation({**PAYLOAD, "fond": "CODE_ETAT"})
+
+    assert results == []
+    assert "code 400" in error
+    assert level == ORIGINAL
+
+
+def test_cached_search_does_not_overwrite_the_raw_results_fixture(replay, tmp_path):
+    replay.search(load_search_fixture()["results"]).start()
+
+    results, error = cached_search_call(PAYLOAD)
+
+    assert results and not error
+    assert not (tmp_path / "resultats_legifrance.json").exists()
@@ -0,0 +1,53 @@
+"""
+Tests de la préparation anticipée : la question soumise conserve sa préparation.
+"""
+import threading
+
+from streamlit_app.speculation import Speculator
+
+SESSION = "session"
+QUESTION = "Un mineur émancipé peut-il être commerçant ?"
+
+
+class FakePipeline:
+    """Pipeline de l'application réduit au payload et à la recherche, qui notent les questions préparées."""
+
+    def __init__(self):
+        self.searched = []
+        self.done = threading.Event()
+
+    def __call__(self):
+        return {
+            "detect_citations": lambda question: [],
+            "decompose_enabled": False,
+            "looks_compound": lambda question: False,
+            "create_payload": lambda question: '{"question": "%s"}' % question,
+            "search_call": self._search,
+        }
+
+    def _search(self, payload, **kwargs):
+        self.searched.append(payload["question"])
+        self.done.set()
+
+
+def test_submitted_question_keeps_its_pending_speculation():
+    pipeline = FakePipeline()
+    speculator = Speculator(pipeline, debounce=0.05)
+
+    speculator.speculate(SESSION, QUESTION)
+    speculator.cancel(SESSION, keep=f"  {QUESTION} ")
+
+    assert pipeline.done.wait(timeout=2)
+    assert pipeline.searched == [QUESTION]
+    assert speculator.stats(SESSION)["abandonnees"] == 0
+
+
+def test_submitting_another_question_cancels_the_speculation():
+    pipeline = FakePipeline()
+    speculator = Speculator(pipeline, debounce=0.05)
+
+    speculator.speculate(SESSION, QUESTION)
+    speculator.cancel(SESSION, keep="Un mineur non émancipé peut-il être commerçant ?")
+
+    assert not pipeline.done.wait(timeout=0.3)
+    assert speculator.stats(SESSION)["abandonnees"] == 1
@@ -0,0 +1,61 @@
+"""
+Tests du budget de tokens d'entrée de la synthèse (LLM/usage.py, cap_documents).
+"""
+import copy
+
+from LEGIFRANCE_UTILS.synthetize.synthetize_response import (
+    SYSTEM_PROMPT, cap_documents, estimate_tokens, format_document, synthesize_legal_response
+)
+from LLM.usage import RequestUsage, UsageBudget, use_request_usage
+from SEARCH.metadata import build_metadata_list
+from SEARCH.search_call import normalize_search_result
+
+from conftest import load_search_fixture
+
+BUDGET = 500
+
+
+def _metadata_list(extract_words: int = 70000):
+    """Métadonnées du pipeline dont le premier document a un extrait d'environ `extract_words` mots."""
+    results = load_search_fixture()["results"]
+    first = copy.deepcopy(results[0])
+    first["sections"][0]["extracts"][0]["values"] = ["droit " * extract_words]
+    return build_metadata_list([normalize_search_result(result) for result in [first, *results[1:]]])
+
+
+def test_first_document_extracts_are_truncated_to_the_budget():
+    metadata_list = _metadata_list()
+    original = copy.deepcopy(metadata_list)
+    assert estimate_tokens(format_document(1, metadata_list[0])) > 50 * BUDGET
+
+    kept = cap_documents(metadata_list, BUDGET)
+
+    assert len(kept) == 1
+    assert estimate_tokens(format_document(1, kept[0])) <= BUDGET
+    assert kept[0]["extracts"][0]["text"].endswith("...")
+    assert kept[0]["title"] == original[0]["title"]
+    assert metadata_list == original
+
+
+def test_extracts_beyond_the_budget_are_dropped():
+    metadata_list = build_metadata_list([normalize_search_result(result) for result in load_search_fixture()["results"]])
+    first = metadata_list[0]
+    budget = estimate_tokens(format_document(1, {**first, "extracts": first["extracts"][:1]})) + 10
+
+    kept = cap_documents(metadata_list, budget)
+
+    assert len(kept) == 1
+    assert [extract["id"] for extract in kept[0]["extracts"]] == [first["extracts"][0]["id"]]
+    assert estimate_tokens(format_document(1, kept[0])) <= budget
+
+
+def test_synthesis_prompt_respects_the_request_budget(replay):
+    replay.gemini("## RÉPONSE :\\nRéponse.\\n## SOURCES:\\nCode civil", SYSTEM_PROMPT).start()
+
+    usage = RequestUsage(UsageBudget(max_synthesis_input_tokens=BUDGET))
+    with use_request_usage(usage):
+        response = synthesize_legal_response("Un mineur peut-il être commerçant ?", _metadata_list())
+
+    assert response.startswith("## RÉPONSE :")
+    user_prompt = replay.prompts[0][1]["parts"][0]["text"]
+    assert estimate_tokens(user_prompt) < 2 * BUDGET
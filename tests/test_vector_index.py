@@ -0,0 +1,34 @@
+"""
+Tests du seuil de l'index vectoriel : seul le plus proche voisin doit le dépasser.
+"""
+from CACHE.vector_index import SIMILARITY_THRESHOLD, ExtractVectorIndex
+from SEARCH.search_call import normalize_search_result
+
+from conftest import load_search_fixture
+
+
+def _fixture_index():
+    index = ExtractVectorIndex()
+    index.add_documents([normalize_search_result(result) for result in load_search_fixture()["results"]])
+    return index
+
+
+def test_natural_question_on_indexed_extracts_is_a_hit():
+    index = _fixture_index()
+    question = "Hypothèque légale des mineurs en tutelle"
+    scores = [score for score, _ in index.search(question)]
+    assert scores[0] >= SIMILARITY_THRESHOLD > scores[-1]
+
+    results = index.lookup_results(question)
+
+    assert results is not None
+    extract_ids = {extract["id"] for result in results for section in result["sections"] for extract in section["extracts"]}
+    assert extract_ids == {record["id"] for score, record in index.search(question) if score > 0}
+    assert index.stats()["hits"] == 1
+
+
+def test_unrelated_question_is_a_miss():
+    index = _fixture_index()
+
+    assert index.lookup_results("Quelle est la durée du préavis de licenciement d'un salarié ?") is None
+    assert index.stats() == dict(index.stats(), lookups=1, hits=0)
@@ -0,0 +1,108 @@
+"""
+Tests de l'index des versions et du filtrage des extraits selon la date visée par la question.
+"""
+import copy
+import datetime
+
+from CACHE.vector_index import ExtractVectorIndex
+from CACHE.version_index import NOT_IN_FORCE_NOTE
+from LEGIFRANCE_UTILS.synthetize.synthetize_response import SYSTEM_PROMPT
+from LEGIFRANCE_UTILS.temporal.point_in_time import filter_for_question
+from SEARCH.search_call import normalize_search_result
+from conftest import GET_ARTICLE_URL, load_search_fixture
+
+# Deux versions d'un même article : OLD (2010-2016, modifiée) puis NEW (en vigueur depuis 2016)
+OLD = "LEGIARTI990000000001"
+NEW = "LEGIARTI990000000002"
+MS_2010 = 1262304000000
+MS_2016 = 1451606400000
+MS_2999 = 32472144000000
+
+
+def _results(extract_id: str, **dates):
+    """Résultats normalisés du fixture dont le premier extrait est remplacé par `extract_id`."""
+    raw = copy.deepcopy(load_search_fixture()["results"][:1])
+    extract = raw[0]["sections"][0]["extracts"][0]
+    extract.update({"id": extract_id, "legalStatus": "VIGUEUR", **dates})
+    return [normalize_search_result(result) for result in raw]
+
+
+def _article(article_id: str, texte: str, etat: str, debut: int, fin: int, versions=()):
+    return {"id": article_id, "cid": OLD, "num": "879", "etat": etat, "texte": texte,
+            "dateDebut": debut, "dateFin": fin, "articleVersions": list(versions)}
+
+
+def _extract_ids(api_results):
+    return [extract["id"] for document in api_results for section in document["sections"]
+            for extract in section["extracts"]]
+
+
+def test_search_intervals_answer_in_force_without_fetch(version_index):
+    api_results = [normalize_search_result(result) for result in load_search_fixture()["results"]]
+
+    version_index.record_results(api_results)
+
+    # Article 2399 du Code civil et sa section : versions en vigueur depuis le 1er janvier 2022
+    year_2015 = (datetime.date(2015, 1, 1), datetime.date(2016, 1, 1))
+    assert version_index.in_force("LEGIARTI000044072163", *year_2015) is False
+    assert version_index.in_force("LEGISCTA000044058898", *year_2015) is False
+    assert version_index.in_force("LEGIARTI000044072163") is True
+    assert version_index.versions["LEGIARTI000044072163"]["fin"] == "2999-01-01"
+
+
+def test_out_of_force_extract_is_replaced_by_the_version_in_force(replay, version_index):
+    versions = [{"id": OLD, "numero": "879", "etat": "MODIFIE", "dateDebut": MS_2010, "dateFin": MS_2016},
+                {"id": NEW, "numero": "879", "etat": "VIGUEUR", "dateDebut": MS_2016, "dateFin": MS_2999}]
+    replay.article(_article(NEW, "Texte en vigueur depuis 2016.", "VIGUEUR", MS_2016, MS_2999, versions))
+    replay.article(_article(OLD, "Texte en vigueur en 2015.", "MODIFIE", MS_2010, MS_2016, versions))
+    replay.start()
+    api_results = _results(NEW, dateDebut="2016-01-01T00:00:00.000+0000", dateFin="2999-01-01T00:00:00.000+0000")
+    original = copy.deepcopy(api_results)
+
+    filtered = filter_for_question(api_results, "Que prévoyait le Code civil en 2015 sur le droit de préférence ?")
+
+    extract = filtered[0]["sections"][0]["extracts"][0]
+    assert extract["id"] == OLD
+    assert extract["values"] == ["Texte en vigueur en 2015."]
+    assert NEW not in _extract_ids(filtered)
+    assert api_results == original
+    # Sans date, la version actuelle est conservée telle quelle
+    assert filter_for_question(api_results, "Que prévoit le Code civil sur le droit de préférence ?") == original
+
+
+def test_out_of_force_extract_is_tagged_when_its_text_is_unavailable(replay, version_index):
+    versions = [{"id": OLD, "numero": "879", "etat": "MODIFIE", "dateDebut": MS_2010, "dateFin": MS_2016}]
+    replay.article(_article(NEW, "Texte en vigueur depuis 2016.", "VIGUEUR", MS_2016, MS_2999, versions))
+    replay.http("POST", GET_ARTICLE_URL, "introuvable", status=404, json_body={"id": OLD})
+    replay.start()
+    api_results = _results(NEW, dateDebut="2016-01-01T00:00:00.000+0000", dateFin="2999-01-01T00:00:00.000+0000")
+
+    filtered = filter_for_question(api_results, "Que prévoyait le Code civil en 2015 sur le droit de préférence ?")
+
+    extract = filtered[0]["sections"][0]["extracts"][0]
+    assert extract["id"] == NEW
+    assert extract["title"].endswith(NOT_IN_FORCE_NOTE)
+    assert extract["inForce"] is False
+
+
+def test_index_hits_are_filtered_before_the_synthesis(replay, version_index):
+    from tool import search_legifrance
+
+    repealed = "LEGIARTI990000000003"
+    api_results = _results(repealed, dateDebut="2010-01-01T00:00:00.000+0000", dateFin="2020-01-01T00:00:00.000+0000")
+    api_results[0]["sections"][0]["extracts"][0]["values"] = ["Texte abrogé en 2020."]
+    # État connu d'une recherche précédente ; l'extrait a été indexé avant le filtrage
+    version_index.record_results(api_results)
+    index = ExtractVectorIndex(threshold=0.0)
+    index.add_documents(api_results)
+    index.top_k = len(index)  # Tous les extraits indexés sont voisins de la question
+    replay.http("POST", GET_ARTICLE_URL, "introuvable", status=404, json_body={"id": repealed})
+    replay.gemini("## RÉPONSE :\nRéponse.\n## SOURCES:\nCode civil", SYSTEM_PROMPT).start()
+
+    response = search_legifrance("Quelles sont les règles du droit de préférence des créanciers ?", index=index)
+
+    assert response.startswith("## RÉPONSE :")
+    assert replay.searches() == []
+    user_prompt = replay.prompts[0][1]["parts"][0]["text"]
+    assert "Texte abrogé en 2020." not in user_prompt
+    assert repealed not in user_prompt
@@ -1,42 +1,174 @@
 # -*- coding: utf-8 -*-
+import contextlib
 import json
+import time
 from typing import Dict, List, Tuple, Any, Optional, Union
 
 from LEGIFRANCE_UTILS.payload.payload_generator import create_payload
 from LEGIFRANCE_UTILS.payload.parse_payload import parse_json_model_output
 from SEARCH.search_call import search_call
+from SEARCH.metadata import build_metadata_list
+from CACHE.vector_index import ExtractVectorIndex
+from CACHE.answer_cache import ANSWER_CACHE_ENABLED, answer_sources, get_answer_cache
 from LEGIFRANCE_UTILS.display_article.get_article_from_id import print_article
-from LEGIFRANCE_UTILS.synthetize.synthetize_response import synthesize_legal_response
+from LEGIFRANCE_UTILS.citation.cited_articles import fetch_cited_articles
+from LEGIFRANCE_UTILS.decomposition.decompose_question import DECOMPOSE_ENABLED, decompose_question
+from LEGIFRANCE_UTILS.decomposition.sub_searches import search_sub_questions
+from LEGIFRANCE_UTILS.temporal.point_in_time import filter_for_question
+from LEGIFRANCE_UTILS.synthetize.synthetize_response import synthesize_legal_response, format_unsynthesized_response
+from LLM.usage import RequestUsage, UsageBudget, use_request_usage
+from PERF.deadline import Deadline, DeadlineExceeded, deadline_stage, use_deadline
+from PERF.profiling import profile_request
+from PERF.request_log import log_question
 
 
-def search_legifrance(question: str) -> Optional[str]:
+@contextlib.contextmanager
+def timed_stage(timings: Optional[Dict[str, float]], stage: str):
+    """
+    Mesure la durée d'une étape du pipeline et l'ajoute à `timings` (si fourni)
+    
+    L'étape s'exécute sous l'échéance courante : ses dépassements sont comptés par étape.
+    """
+    start = time.perf_counter()
+    try:
+        with deadline_stage(stage):
+            yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def search_legifrance(
+    question: str,
+    fonds: Optional[List[str]] = None,
+    index: Optional[ExtractVectorIndex] = None,
+    timings: Optional[Dict[str, float]] = None,
+    deadline: Optional[Deadline] = None,
+    profile: Optional[bool] = None,
+    decompose: Optional[bool] = None,
+    llm_usage: Optional[RequestUsage] = None
+) -> Optional[str]:
     """
     Effectue une recherche dans la base de données Légifrance à partir d'une question juridique
     et retourne une synthèse des résultats.
     
+    Une question déjà traitée est servie depuis le cache des réponses tant que les articles
+    dont sa réponse est issue n'ont été ni modifiés ni abrogés (voir CACHE/answer_cache.py).
+    
+    Les questions citant directement des articles de code ("article 1240 du Code civil")
+    sont traitées sans payload ni recherche : les articles sont résolus par la table des
+    matières locale du code puis récupérés par /consult/getArticle.
+    
+    Avant la synthèse, les extraits qui n'étaient pas en vigueur à la date visée par la
+    question (aujourd'hui par défaut : articles abrogés ou modifiés) sont remplacés par la
+    version alors en vigueur, ou écartés, grâce à l'index local des versions (voir
+    CACHE/version_index.py) ; cela vaut aussi pour les extraits servis par l'index vectoriel,
+    qui n'indexe que des extraits filtrés.
+    
+    Avec la décomposition, une question composée est découpée en sous-questions dont
+    les payloads et les recherches sont exécutés en parallèle ; les documents sont
+    fusionnés avant une synthèse unique.
+    
     Args:
         question (str): La question juridique posée par l'utilisateur
+        fonds (Optional[List[str]]): Fonds à interroger en parallèle lorsque le payload vise "ALL"
+            (ex: SEARCH.search_call.DEFAULT_FAN_OUT_FONDS)
+        index (Optional[ExtractVectorIndex]): Index local des extraits déjà récupérés ; si les
+            voisins de la question sont assez proches, la synthèse est faite sans payload ni recherche
+        timings (Optional[Dict[str, float]]): Si fourni, reçoit la durée (en secondes) de chaque
+            étape : "answer_cache", "citation", "index", "decomposition", "payload", "search", "versions",
+            "metadata", "synthesis" (avec la décomposition, "search" comprend les payloads des sous-questions)
+        deadline (Optional[Deadline]): Échéance de la question ; chaque étape dispose du budget
+            restant. Si la synthèse n'a plus le temps d'aboutir, les documents trouvés sont
+            retournés sans synthèse
+        profile (Optional[bool]): Profile l'exécution et écrit un profil (piles repliées et
+            durées des étapes) dans JERRY_PROFILE_DIR ; None : selon JERRY_PROFILE
+        decompose (Optional[bool]): Découpe les questions composées en sous-questions
+            recherchées en parallèle ; None : selon JERRY_DECOMPOSE
+        llm_usage (Optional[RequestUsage]): Reçoit les tokens, durées et coûts des appels
+            Gemini de la question, et porte son budget ; None : budget des variables JERRY_*
+            (voir LLM/usage.py)
         
     Returns:
-        Optional[str]: La synthèse des résultats juridiques ou None en cas d'erreur
+        Optional[str]: La synthèse des résultats juridiques (ou une réponse partielle)
+            ou None en cas d'erreur
     """
     print(f"INFO: Traitement de la question: {question}")
+    log_question(question)
     
+    usage = llm_usage if llm_usage is not None else RequestUsage(UsageBudget.from_env())
+    with use_deadline(deadline), use_request_usage(usage), \
+            profile_request(question, timings, enabled=profile) as timings:
+        return _search_legifrance(question, fonds, index, timings, DECOMPOSE_ENABLED if decompose is None else decompose)
+
+
+def _search_legifrance(
+    question: str,
+    fonds: Optional[List[str]],
+    index: Optional[ExtractVectorIndex],
+    timings: Optional[Dict[str, float]],
+    decompose: bool = False
+) -> Optional[str]:
+    api_results: List[dict] = []
+    metadata_list: List[Dict[str, Any]] = []
     try:
-        # Générer le payload pour la recherche
-        payload = create_payload(user_input=question)
-        print("INFO: Payload généré")
+        # Réponse déjà produite pour cette question, à partir de sources inchangées
+        if ANSWER_CACHE_ENABLED:
+            with timed_stage(timings, "answer_cache"):
+                synthesis = get_answer_cache().get(question)
+            if synthesis is not None:
+                print("INFO: Réponse servie depuis le cache des réponses, sources inchangées.")
+                return synthesis
         
-        # Convertir la chaîne en objet JSON
-        json_payload = json.loads(payload)
+        # Articles cités explicitement : récupération directe, sans recherche
+        with timed_stage(timings, "citation"):
+            metadata_list = fetch_cited_articles(question) or []
+        if metadata_list:
+            print(f"INFO: {len(metadata_list)} article(s) cité(s) récupéré(s), recherche Legifrance évitée.")
+            with timed_stage(timings, "synthesis"):
+                return synthesize_legal_response(question, metadata_list)
         
-        # Si un payload valide est détecté, appeler l'API Legifrance
-        if not json_payload:
-            print("ERREUR: Le payload JSON n'est pas valide.")
-            return None
+        # Réponse directe depuis l'index local si les extraits connus suffisent
+        # (et sont en vigueur à la date visée par la question)
+        if index is not None:
+            with timed_stage(timings, "index"):
+                api_results = index.lookup_results(question) or []
+            if api_results:
+                with timed_stage(timings, "versions"):
+                    api_results = filter_for_question(api_results, question)
+            if api_results:
+                print("INFO: Extraits trouvés dans l'index local, recherche Legifrance évitée.")
+                with timed_stage(timings, "metadata"):
+                    metadata_list = build_metadata_list(api_results)
+                with timed_stage(timings, "synthesis"):
+                    return synthesize_legal_response(question, metadata_list)
+        
+        # Question composée : une recherche par sous-question, en parallèle
+        sub_questions = [question]
+        if decompose:
+            with timed_stage(timings, "decomposition"):
+                sub_questions = decompose_question(question)
+        
+        if len(sub_questions) > 1:
+            with timed_stage(timings, "search"):
+                api_results, error = search_sub_questions(sub_questions, fonds=fonds, relax=True)
+        else:
+            # Générer le payload pour la recherche
+            with timed_stage(timings, "payload"):
+                payload = create_payload(user_input=question)
+            print("INFO: Payload généré")
+            
+            # Convertir la chaîne en objet JSON
+            json_payload = json.loads(payload)
             
-        # Appel de l'API Legifrance
-        api_results, error = search_call(json_payload)
+            # Si un payload valide est détecté, appeler l'API Legifrance
+            if not json_payload:
+                print("ERREUR: Le payload JSON n'est pas valide.")
+                return None
+                
+            # Appel de l'API Legifrance (payload assoupli localement s'il ne renvoie rien)
+            with timed_stage(timings, "search"):
+                api_results, error = search_call(json_payload, fonds=fonds, relax=True)
         
         # Vérification de l'erreur
         if error:
@@ -48,53 +180,60 @@ def search_legifrance(question: str) -> Optional[str]:
             return "Aucun résultat juridique trouvé pour cette question."
         
         print(f"INFO: {len(api_results)} résultats trouvés.")
+        if ANSWER_CACHE_ENABLED:
+            get_answer_cache().observe(api_results)
         
-        # Préparation des métadonnées pour la synthèse
-        metadata_list = []
+        # Extraits en vigueur à la date visée par la question
+        with timed_stage(timings, "versions"):
+            api_results = filter_for_question(api_results, question)
+        if not api_results:
+            print("INFO: Aucun extrait en vigueur à la date visée.")
+            return "Aucun texte en vigueur trouvé pour cette question."
         
-        # Extraction des métadonnées à partir des résultats structurés
-        for result in api_results:
-            # Format standard pour tous les documents
-            result_metadata = {
-                "title": result["titles"][0]["title"] if result["titles"] else "Titre inconnu",
-                "id": result["titles"][0]["id"] if result["titles"] else "",
-                "cid": result["titles"][0]["cid"] if result["titles"] else "",
-                "type": result["type"],
-                "nature": result["nature"],
-                "origin": result["origin"],
-                "date": result["date"],
-                "extracts": []
-            }
-            
-            # Ajout des extraits pertinents
-            for section in result["sections"]:
-                for extract in section["extracts"]:
-                    extract_data = {
-                        "id": extract["id"],
-                        "title": extract["title"] or extract["num"] or "Sans titre",
-                        "section_title": section["title"],
-                        "text": " ".join(extract["values"]) if extract["values"] else ""
-                    }
-                    result_metadata["extracts"].append(extract_data)
-            
-            metadata_list.append(result_metadata)
+        # Mesure du rappel de l'index puis indexation des nouveaux extraits (en vigueur uniquement)
+        if index is not None:
+            with timed_stage(timings, "index"):
+                index.record_recall(question, api_results)
+                index.add_documents(api_results)
+                index.schedule_save()
+        
+        # Préparation des métadonnées pour la synthèse
+        with timed_stage(timings, "metadata"):
+            metadata_list = build_metadata_list(api_results)
         
         # Génération de la synthèse
-        synthesis = synthesize_legal_response(question, metadata_list)
+        with timed_stage(timings, "synthesis"):
+            synthesis = synthesize_legal_response(question, metadata_list)
+        if ANSWER_CACHE_ENABLED:
+            get_answer_cache().put(question, synthesis, answer_sources(api_results))
         return synthesis
         
     except json.JSONDecodeError:
         print("ERREUR: Le LLM n'a pas généré de JSON valide pour l'appel à l'API.")
         return None
+    except DeadlineExceeded as e:
+        print(f"ERREUR: {e}")
+        if not metadata_list and api_results:
+            metadata_list = build_metadata_list(api_results)
+        if metadata_list:
+            print("INFO: Réponse partielle : documents trouvés sans synthèse.")
+            return format_unsynthesized_response(metadata_list)
+        return None
     except Exception as e:
         print(f"ERREUR: Exception lors de la recherche juridique: {str(e)}")
         return None
 
 
 if __name__ == "__main__":
-    # Exemple d'utilisation de la fonction search_legifrance
+    import sys
+    from PERF.warmup import start_warm_up
+    
+    # Préchauffage (token, connexions, clients) pendant la saisie de la question
+    start_warm_up(prefetch=False)
+    
+    # Exemple d'utilisation de la fonction search_legifrance (--profile : profil de la requête)
     user_question = input("Entrez votre question juridique : ")
-    result = search_legifrance(user_question)
+    result = search_legifrance(user_question, profile=True if "--profile" in sys.argv[1:] else None)
     
     if result:
         print("\n" + "=" * 80)